@@ -43,6 +43,10 @@ def create_app():
     with app.app_context():
         # Import models
         from app import models
+
+        # Keep the tenant context cache coherent with local writes
+        from app.services.tenant_cache import TenantCache
+        TenantCache.register_hooks()
         
         # Create tables if they don't exist
         # Wrapped in try-except to handle race conditions when multiple instances start
@@ -128,6 +132,24 @@ def create_app():
                             migrations_run = True
                         except Exception as col_err:
                             app.logger.error(f"Failed to add customer.broadcast_reply_count: {col_err}")
+
+                    # Daily store stats: new customers per day
+                    if 'created_at' not in cust_cols:
+                        app.logger.info("Adding missing column: customer.created_at")
+                        try:
+                            db.session.execute(text("ALTER TABLE customer ADD COLUMN created_at TIMESTAMP NULL"))
+                            migrations_run = True
+                        except Exception as col_err:
+                            app.logger.error(f"Failed to add customer.created_at: {col_err}")
+
+                    # Sales engine claim lease
+                    if 'followup_claimed_at' not in cust_cols:
+                        app.logger.info("Adding missing column: customer.followup_claimed_at")
+                        try:
+                            db.session.execute(text("ALTER TABLE customer ADD COLUMN followup_claimed_at TIMESTAMP NULL"))
+                            migrations_run = True
+                        except Exception as col_err:
+                            app.logger.error(f"Failed to add customer.followup_claimed_at: {col_err}")
                 
                 # Check Toko table
                 if 'toko' in inspector.get_table_names():
@@ -177,6 +199,14 @@ def create_app():
                     except Exception as col_err:
                         app.logger.error(f"Failed to add toko.shipping_couriers: {col_err}")
 
+                if 'menu_version' not in toko_cols:
+                    app.logger.info("Adding missing column: toko.menu_version")
+                    try:
+                        db.session.execute(text("ALTER TABLE toko ADD COLUMN menu_version VARCHAR(32)"))
+                        migrations_run = True
+                    except Exception as col_err:
+                        app.logger.error(f"Failed to add toko.menu_version: {col_err}")
+
                 if 'setup_step' not in toko_cols:
                     app.logger.info("Adding missing column: toko.setup_step")
                     try:
@@ -259,6 +289,44 @@ def create_app():
                         except Exception as col_err:
                             app.logger.error(f"Failed to add scheduled_broadcast.target_list: {col_err}")
                 
+                # Payment proof hashes
+                if 'transaction' in inspector.get_table_names():
+                    trx_cols = [col['name'] for col in inspector.get_columns('transaction')]
+                    for col_name, col_type in [('proof_hash', 'VARCHAR(16)'), ('proof_hash_b0', 'INTEGER'),
+                                               ('proof_hash_b1', 'INTEGER'), ('proof_hash_b2', 'INTEGER'),
+                                               ('proof_hash_b3', 'INTEGER'), ('proof_sha256', 'VARCHAR(64)')]:
+                        if col_name not in trx_cols:
+                            app.logger.info(f"Adding missing column: transaction.{col_name}")
+                            try:
+                                db.session.execute(text(f'ALTER TABLE "transaction" ADD COLUMN {col_name} {col_type}'))
+                                migrations_run = True
+                            except Exception as col_err:
+                                app.logger.error(f"Failed to add transaction.{col_name}: {col_err}")
+
+                if 'payment_verification_job' in inspector.get_table_names():
+                    job_cols = [col['name'] for col in inspector.get_columns('payment_verification_job')]
+                    if 'proof_hash' not in job_cols:
+                        app.logger.info("Adding missing column: payment_verification_job.proof_hash")
+                        try:
+                            db.session.execute(text("ALTER TABLE payment_verification_job ADD COLUMN proof_hash VARCHAR(16)"))
+                            migrations_run = True
+                        except Exception as col_err:
+                            app.logger.error(f"Failed to add payment_verification_job.proof_hash: {col_err}")
+                    if 'proof_sha256' not in job_cols:
+                        app.logger.info("Adding missing column: payment_verification_job.proof_sha256")
+                        try:
+                            db.session.execute(text("ALTER TABLE payment_verification_job ADD COLUMN proof_sha256 VARCHAR(64)"))
+                            migrations_run = True
+                        except Exception as col_err:
+                            app.logger.error(f"Failed to add payment_verification_job.proof_sha256: {col_err}")
+                    if 'claimed_at' not in job_cols:
+                        app.logger.info("Adding missing column: payment_verification_job.claimed_at")
+                        try:
+                            db.session.execute(text("ALTER TABLE payment_verification_job ADD COLUMN claimed_at TIMESTAMP NULL"))
+                            migrations_run = True
+                        except Exception as col_err:
+                            app.logger.error(f"Failed to add payment_verification_job.claimed_at: {col_err}")
+
                 # Check for AuditLog table
                 if 'audit_log' not in inspector.get_table_names():
                     app.logger.info("Creating missing table: audit_log")
@@ -273,6 +341,26 @@ def create_app():
                     app.logger.info("=== Database migrations committed successfully ===")
                 else:
                     app.logger.info("=== Database schema is up to date ===")
+
+                # ChatLog partitions ahead of time (composite indexes: scripts/create_chat_log_indexes.py)
+                try:
+                    from app.services.chatlog_maintenance import ChatLogMaintenance
+                    ChatLogMaintenance.ensure_partitions()
+                except Exception as idx_err:
+                    app.logger.error(f"Failed to ensure chat_log partitions: {idx_err}")
+                    db.session.rollback()
+
+                # Composite indexes on existing tables (sales engine candidates, pending orders, proof hashes)
+                from app.models import Customer, Transaction
+                for model in (Customer, Transaction):
+                    table_indexes = {ix['name'] for ix in inspect(db.engine).get_indexes(model.__tablename__)}
+                    for index in model.__table__.indexes:
+                        if index.name not in table_indexes:
+                            app.logger.info(f"Adding missing index: {index.name}")
+                            try:
+                                index.create(bind=db.engine)
+                            except Exception as idx_err:
+                                app.logger.error(f"Failed to add index {index.name}: {idx_err}")
                  
         except Exception as e:
             app.logger.error(f"Migration error (non-fatal): {e}")
@@ -310,6 +398,9 @@ def create_app():
         if not SystemConfig.query.get('panic_mode'):
              db.session.add(SystemConfig(key='panic_mode', value='false'))
              db.session.commit()
+        if not SystemConfig.query.get('blacklist_version'):
+             db.session.add(SystemConfig(key='blacklist_version', value='0'))
+             db.session.commit()
 
     # Register Blueprints
     from app.routes.webhook import webhook_bp
@@ -356,6 +447,14 @@ def create_app():
         threading.Thread(target=worker_broadcast, args=(app,), name="BroadcastWorker", daemon=True).start()
         threading.Thread(target=worker_sales_engine, args=(app,), name="SalesEngine", daemon=True).start()
         threading.Thread(target=worker_scheduler, args=(app,), name="Scheduler", daemon=True).start()
+
+        from app.services.payment_pipeline import worker_payment_pipeline
+        threading.Thread(target=worker_payment_pipeline, args=(app,), name="PaymentPipeline", daemon=True).start()
+
+        from app.feature_flags import FeatureFlags
+        if FeatureFlags.is_webhook_queue_enabled():
+            from app.services.inbound_queue import worker_inbound
+            threading.Thread(target=worker_inbound, args=(app,), name="InboundDispatcher", daemon=True).start()
     
     # Run the safest worker startup
     start_workers_safe()
@@ -19,6 +19,20 @@ class Config:
     WAHA_API_KEY = os.environ.get('WAHA_API_KEY', '')  # Required for SUMOPOD API access
     CRON_SECRET = os.environ.get('CRON_SECRET', 'RahasiaNegara123')
 
+    # WAHA HTTP Client (pooled keep-alive session, read timeouts in seconds)
+    WAHA_POOL_SIZE = int(os.environ.get('WAHA_POOL_SIZE', '20'))
+    WAHA_CONNECT_TIMEOUT = float(os.environ.get('WAHA_CONNECT_TIMEOUT', '5'))
+    WAHA_TIMEOUTS = {
+        'send': float(os.environ.get('WAHA_TIMEOUT_SEND', '60')),
+        'seen': float(os.environ.get('WAHA_TIMEOUT_SEEN', '10')),
+        'presence': float(os.environ.get('WAHA_TIMEOUT_PRESENCE', '10')),
+        'check_exists': float(os.environ.get('WAHA_TIMEOUT_CHECK_EXISTS', '15')),
+        'status': float(os.environ.get('WAHA_TIMEOUT_STATUS', '10')),
+        'session': float(os.environ.get('WAHA_TIMEOUT_SESSION', '30')),
+        'qr': float(os.environ.get('WAHA_TIMEOUT_QR', '10')),
+        'media': float(os.environ.get('WAHA_TIMEOUT_MEDIA', '30')),
+    }
+
     
     # Session Configuration
     MASTER_SESSION = os.environ.get('MASTER_SESSION', 'default')
@@ -28,6 +42,112 @@ class Config:
     # Webhook Security
     WEBHOOK_SECRET = os.environ.get('WEBHOOK_SECRET', '') 
 
+    # Inbound Queue (ingest mode, see FEATURE_WEBHOOK_QUEUE)
+    INBOUND_WORKERS = int(os.environ.get('INBOUND_WORKERS', '4'))
+    INBOUND_MAX_ATTEMPTS = int(os.environ.get('INBOUND_MAX_ATTEMPTS', '3'))
+
+    # Webhook Deduplication (WAHA retries the same message id when we are slow)
+    DEDUP_TTL_SECONDS = int(os.environ.get('DEDUP_TTL_SECONDS', '3600'))
+    DEDUP_LOCAL_MAX = int(os.environ.get('DEDUP_LOCAL_MAX', '10000'))
+
+    # Broadcast Scheduler (one lane per WAHA session)
+    BROADCAST_MAX_ACTIVE_SESSIONS = int(os.environ.get('BROADCAST_MAX_ACTIVE_SESSIONS', '10'))
+    BROADCAST_SESSION_MAX_PER_HOUR = int(os.environ.get('BROADCAST_SESSION_MAX_PER_HOUR', '120'))
+
+    # Blacklist cache: seconds between checks of the shared blacklist_version counter
+    BLACKLIST_CHECK_INTERVAL = float(os.environ.get('BLACKLIST_CHECK_INTERVAL', '10'))
+
+    # WhatsApp existence cache (check-exists results) and broadcast pre-check
+    WA_EXISTS_TTL_HOURS = float(os.environ.get('WA_EXISTS_TTL_HOURS', '168'))
+    WA_EXISTS_PRECHECK_CONCURRENCY = int(os.environ.get('WA_EXISTS_PRECHECK_CONCURRENCY', '5'))
+
+    # Tenant context cache (Toko / Subscription / SystemConfig on the webhook path)
+    TENANT_CACHE_TTL = float(os.environ.get('TENANT_CACHE_TTL', '30'))
+
+    # Gemini clients kept alive per API key (global key + per-store keys)
+    GEMINI_CLIENT_POOL_SIZE = int(os.environ.get('GEMINI_CLIENT_POOL_SIZE', '32'))
+
+    # Compiled per-store prompt prefix (menu, style guide, KB) and Gemini context caching
+    PROMPT_CACHE_TTL = float(os.environ.get('PROMPT_CACHE_TTL', '600'))
+    GEMINI_CONTEXT_CACHE_ENABLED = os.environ.get('GEMINI_CONTEXT_CACHE_ENABLED', 'true').lower() == 'true'
+    GEMINI_CONTEXT_CACHE_TTL = int(os.environ.get('GEMINI_CONTEXT_CACHE_TTL', '3600'))
+    # Gemini rejects caches below a minimum token count (~1-4k tokens depending on model)
+    GEMINI_CONTEXT_CACHE_MIN_CHARS = int(os.environ.get('GEMINI_CONTEXT_CACHE_MIN_CHARS', '8000'))
+
+    # Knowledge-base retrieval (BM25 over chunks, index stored next to the KB file)
+    KB_CHUNK_CHARS = int(os.environ.get('KB_CHUNK_CHARS', '800'))
+    KB_TOP_K = int(os.environ.get('KB_TOP_K', '3'))
+
+    # Menu search index: catalogs above MENU_PROMPT_FULL_LIMIT items only send matching products
+    MENU_INDEX_TTL = float(os.environ.get('MENU_INDEX_TTL', '600'))
+    MENU_PROMPT_FULL_LIMIT = int(os.environ.get('MENU_PROMPT_FULL_LIMIT', '50'))
+    MENU_PROMPT_MATCH_LIMIT = int(os.environ.get('MENU_PROMPT_MATCH_LIMIT', '15'))
+    MENU_PROMPT_TOP_SELLERS = int(os.environ.get('MENU_PROMPT_TOP_SELLERS', '5'))
+    MENU_LIST_PAGE_SIZE = int(os.environ.get('MENU_LIST_PAGE_SIZE', '30'))
+
+    # Conversation memory: recent messages kept verbatim, older ones folded into a summary in batches
+    CONVERSATION_RECENT_MESSAGES = int(os.environ.get('CONVERSATION_RECENT_MESSAGES', '10'))
+    CONVERSATION_SUMMARY_BATCH = int(os.environ.get('CONVERSATION_SUMMARY_BATCH', '6'))
+    CONVERSATION_SUMMARY_MAX_CHARS = int(os.environ.get('CONVERSATION_SUMMARY_MAX_CHARS', '1200'))
+
+    # ChatLog retention (daily cron): 0 keeps history forever; archive=false drops instead of archiving
+    CHATLOG_RETENTION_DAYS = int(os.environ.get('CHATLOG_RETENTION_DAYS', '0'))
+    CHATLOG_ARCHIVE = os.environ.get('CHATLOG_ARCHIVE', 'true').lower() == 'true'
+    # Monthly partitions created ahead of time (PostgreSQL, after scripts/partition_chat_log.py)
+    CHATLOG_PARTITION_MONTHS_AHEAD = int(os.environ.get('CHATLOG_PARTITION_MONTHS_AHEAD', '2'))
+
+    # Dashboard rollups (daily_store_stats): days recomputed by the daily cron to repair missed increments
+    STORE_STATS_REPAIR_DAYS = int(os.environ.get('STORE_STATS_REPAIR_DAYS', '3'))
+
+    # Ping-pong protection: max bot messages per customer per window
+    BURST_LIMIT = int(os.environ.get('BURST_LIMIT', '3'))
+    BURST_WINDOW_SECONDS = float(os.environ.get('BURST_WINDOW_SECONDS', '60'))
+    # 'memory' (per process) or a local SQLite file shared by all gunicorn workers
+    BURST_LIMITER_STORE = os.environ.get('BURST_LIMITER_STORE', '/tmp/saas_burst.db')
+
+    # Buffered ChatLog writer: multi-row INSERT every N rows or T ms
+    CHATLOG_ASYNC = os.environ.get('CHATLOG_ASYNC', 'true').lower() == 'true'
+    CHATLOG_FLUSH_ROWS = int(os.environ.get('CHATLOG_FLUSH_ROWS', '50'))
+    CHATLOG_FLUSH_MS = int(os.environ.get('CHATLOG_FLUSH_MS', '500'))
+    CHATLOG_BUFFER_MAX = int(os.environ.get('CHATLOG_BUFFER_MAX', '10000'))
+
+    # Debounce: merge a burst of customer texts into one AI turn (0 = reply to every message)
+    MESSAGE_DEBOUNCE_SECONDS = float(os.environ.get('MESSAGE_DEBOUNCE_SECONDS', '3'))
+    MESSAGE_DEBOUNCE_MAX_SECONDS = float(os.environ.get('MESSAGE_DEBOUNCE_MAX_SECONDS', '10'))
+    MESSAGE_DEBOUNCE_STORE = os.environ.get('MESSAGE_DEBOUNCE_STORE', '/tmp/saas_debounce.db')
+
+    # Sales engine: incoming messages "kick" an early follow-up run (shared across workers via file mtime)
+    SALES_ENGINE_KICK_FILE = os.environ.get('SALES_ENGINE_KICK_FILE', '/tmp/saas_sales_kick')
+    SALES_ENGINE_KICK_MIN_INTERVAL = float(os.environ.get('SALES_ENGINE_KICK_MIN_INTERVAL', '60'))
+    SALES_ENGINE_KICK_POLL_SECONDS = float(os.environ.get('SALES_ENGINE_KICK_POLL_SECONDS', '15'))
+    # Follow-up pass: candidates per keyset page, stores nudged in parallel, max nudges per run
+    SALES_ENGINE_PAGE_SIZE = int(os.environ.get('SALES_ENGINE_PAGE_SIZE', '500'))
+    SALES_ENGINE_WORKERS = int(os.environ.get('SALES_ENGINE_WORKERS', '4'))
+    SALES_ENGINE_MAX_PER_RUN = int(os.environ.get('SALES_ENGINE_MAX_PER_RUN', '5000'))
+    # A SENDING claim older than this (process died mid-nudge) goes back to NONE on the next run
+    SALES_ENGINE_CLAIM_TIMEOUT_MINUTES = int(os.environ.get('SALES_ENGINE_CLAIM_TIMEOUT_MINUTES', '15'))
+
+    # Payment proof verification pipeline (false = run all stages in the webhook thread)
+    PAYMENT_PIPELINE_ASYNC = os.environ.get('PAYMENT_PIPELINE_ASYNC', 'true').lower() == 'true'
+    PAYMENT_MEDIA_DIR = os.environ.get('PAYMENT_MEDIA_DIR', '/tmp/saas_payment_media')
+    PAYMENT_MAX_ATTEMPTS = int(os.environ.get('PAYMENT_MAX_ATTEMPTS', '3'))
+    PAYMENT_MAX_IN_FLIGHT = int(os.environ.get('PAYMENT_MAX_IN_FLIGHT', '50'))
+    # A PROCESSING job whose lease is not renewed for this long is taken over by another dispatcher
+    PAYMENT_LEASE_SECONDS = int(os.environ.get('PAYMENT_LEASE_SECONDS', '600'))
+    # Thread pool size per stage
+    PAYMENT_DOWNLOAD_WORKERS = int(os.environ.get('PAYMENT_DOWNLOAD_WORKERS', '4'))
+    PAYMENT_PREPROCESS_WORKERS = int(os.environ.get('PAYMENT_PREPROCESS_WORKERS', '2'))
+    PAYMENT_VISION_WORKERS = int(os.environ.get('PAYMENT_VISION_WORKERS', '4'))
+    PAYMENT_MATCH_WORKERS = int(os.environ.get('PAYMENT_MATCH_WORKERS', '2'))
+    PAYMENT_NOTIFY_WORKERS = int(os.environ.get('PAYMENT_NOTIFY_WORKERS', '2'))
+    # Screenshot preprocessing before Gemini Vision (requires Pillow)
+    PAYMENT_IMAGE_PREPROCESS = os.environ.get('PAYMENT_IMAGE_PREPROCESS', 'true').lower() == 'true'
+    PAYMENT_IMAGE_MAX_EDGE = int(os.environ.get('PAYMENT_IMAGE_MAX_EDGE', '1600'))
+    PAYMENT_IMAGE_GRAYSCALE = os.environ.get('PAYMENT_IMAGE_GRAYSCALE', 'true').lower() == 'true'
+    PAYMENT_IMAGE_JPEG_QUALITY = int(os.environ.get('PAYMENT_IMAGE_JPEG_QUALITY', '85'))
+    # Reused/resent proof detection: max dHash Hamming distance (0-3, 0 = exact only)
+    PAYMENT_PHASH_MAX_DISTANCE = int(os.environ.get('PAYMENT_PHASH_MAX_DISTANCE', '3'))
+
     # Webhook URL (set in SUMOPOD to point to Cloud Run)
     WAHA_WEBHOOK_URL = os.environ.get('WAHA_WEBHOOK_URL', 'https://saas-bot-643221888510.asia-southeast2.run.app/webhook')
     WEBHOOK_URL = os.environ.get('WEBHOOK_URL', 'https://saas-bot-643221888510.asia-southeast2.run.app/webhook')
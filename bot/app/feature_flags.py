@@ -19,6 +19,9 @@ class FeatureFlags:
     FEATURE_ANALYTICS = os.getenv('FEATURE_ANALYTICS', 'false').lower() == 'true'
     FEATURE_ALERTS = os.getenv('FEATURE_ALERTS', 'false').lower() == 'true'
     
+    # Performance: Webhook ingest mode (ack fast, process on durable queue)
+    FEATURE_WEBHOOK_QUEUE = os.getenv('FEATURE_WEBHOOK_QUEUE', 'false').lower() == 'true'
+    
     # Safety Limits
     BROADCAST_MAX_TARGETS = int(os.getenv('BROADCAST_MAX_TARGETS', '500'))
     BROADCAST_DAILY_LIMIT = int(os.getenv('BROADCAST_DAILY_LIMIT', '1000'))
@@ -47,6 +50,10 @@ class FeatureFlags:
     def is_alerts_enabled():
         return FeatureFlags.FEATURE_ALERTS
     
+    @staticmethod
+    def is_webhook_queue_enabled():
+        return FeatureFlags.FEATURE_WEBHOOK_QUEUE
+    
     @classmethod
     def get_status(cls):
         """Get status of all feature flags"""
@@ -16,6 +16,7 @@ class Toko(db.Model):
     payment_qris = db.Column(db.String(500), default="https://via.placeholder.com/300")
     timezone = db.Column(db.String(50), default="Asia/Jakarta") # WIB, WITA, WIT
     last_reset = db.Column(db.String(20))
+    menu_version = db.Column(db.String(32), nullable=True)  # New token on every Menu write (prompt cache, menu index)
     
     # Knowledge Base (RAG)
     knowledge_base_file_id = db.Column(db.String(100), nullable=True)
@@ -46,6 +47,11 @@ class Menu(db.Model):
     description = db.Column(db.Text, nullable=True) # NEW
 
 class Customer(db.Model):
+    __table_args__ = (
+        # Sales engine candidates (status = 'NONE' AND last_interaction < threshold, keyset order)
+        db.Index('ix_customer_followup_status_last_interaction', 'followup_status', 'last_interaction'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     toko_id = db.Column(db.String(50), db.ForeignKey('toko.id'), index=True)
     nomor_hp = db.Column(db.String(50))
@@ -56,6 +62,7 @@ class Customer(db.Model):
     # Sales Engine Fields
     last_interaction = db.Column(db.DateTime, default=datetime.now)
     followup_status = db.Column(db.String(20), default="NONE")
+    followup_claimed_at = db.Column(db.DateTime, nullable=True)  # SENDING claim lease (stale claims are re-queued)
     last_context = db.Column(db.Text, default="")
     
     # Broadcast flow state
@@ -64,8 +71,17 @@ class Customer(db.Model):
     last_broadcast_msg = db.Column(db.Text, nullable=True)
     last_broadcast_at = db.Column(db.DateTime, nullable=True)
     broadcast_reply_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=True)  # NULL for pre-rollup customers
 
 class ChatLog(db.Model):
+    __table_args__ = (
+        # Conversation history / follow-up context (toko, customer ORDER BY created_at DESC),
+        # also the ping-pong burst check (role is filtered on the few rows of the last minute)
+        db.Index('ix_chat_log_toko_customer_created', 'toko_id', 'customer_hp', 'created_at'),
+        # Dashboard volume per day (created_at range per toko)
+        db.Index('ix_chat_log_toko_created', 'toko_id', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     toko_id = db.Column(db.String(50), db.ForeignKey('toko.id'), index=True)
     customer_hp = db.Column(db.String(50), index=True)
@@ -73,11 +89,35 @@ class ChatLog(db.Model):
     message = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.now)
 
+class ChatLogArchive(db.Model):
+    """ChatLog rows moved out by the retention job (CHATLOG_RETENTION_DAYS)"""
+    __tablename__ = 'chat_log_archive'
+
+    id = db.Column(db.Integer, primary_key=True)  # Same id as in chat_log
+    toko_id = db.Column(db.String(50), index=True)
+    customer_hp = db.Column(db.String(50))
+    role = db.Column(db.String(10))
+    message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, index=True)
+    archived_at = db.Column(db.DateTime, default=datetime.now)
+
 class Transaction(db.Model):
     """
     Transaction/Order model for tracking customer purchases and payment verification.
     Enhanced with AI payment verification fields for order matching.
     """
+    __table_args__ = (
+        # find_pending_order: store + customer + PENDING, newest first
+        db.Index('ix_transaction_pending_lookup', 'toko_id', 'customer_hp', 'status', 'created_at'),
+        # Reused/resent proof lookup: any band equal within the store (see services/proof_hash.py)
+        db.Index('ix_transaction_toko_proof_b0', 'toko_id', 'proof_hash_b0'),
+        db.Index('ix_transaction_toko_proof_b1', 'toko_id', 'proof_hash_b1'),
+        db.Index('ix_transaction_toko_proof_b2', 'toko_id', 'proof_hash_b2'),
+        db.Index('ix_transaction_toko_proof_b3', 'toko_id', 'proof_hash_b3'),
+        # Exact resend lookup (same image bytes)
+        db.Index('ix_transaction_toko_proof_sha256', 'toko_id', 'proof_sha256'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     toko_id = db.Column(db.String(50), db.ForeignKey('toko.id'), index=True)
     customer_hp = db.Column(db.String(50), index=True)
@@ -102,6 +142,14 @@ class Transaction(db.Model):
     verified_by = db.Column(db.String(20), nullable=True)  # 'AI', 'MANUAL', or admin phone
     verification_notes = db.Column(db.Text, nullable=True)  # Notes from merchant
     fraud_hints_json = db.Column(db.Text, nullable=True)  # JSON list of fraud hints
+
+    # Perceptual hash of the verified proof (64-bit dHash hex + four 16-bit bands for lookup)
+    proof_hash = db.Column(db.String(16), nullable=True)
+    proof_hash_b0 = db.Column(db.Integer, nullable=True)
+    proof_hash_b1 = db.Column(db.Integer, nullable=True)
+    proof_hash_b2 = db.Column(db.Integer, nullable=True)
+    proof_hash_b3 = db.Column(db.Integer, nullable=True)
+    proof_sha256 = db.Column(db.String(64), nullable=True)  # SHA-256 of the original image bytes
     
     # Timestamps
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
@@ -120,6 +168,23 @@ class BroadcastJob(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     locked_until = db.Column(db.DateTime, nullable=True)
 
+class BroadcastTarget(db.Model):
+    """One recipient of a BroadcastJob (per-target status lives here, not in target_list JSON)"""
+    __tablename__ = 'broadcast_target'
+    __table_args__ = (
+        db.Index('ix_broadcast_target_job_status', 'job_id', 'status'),
+        db.Index('ix_broadcast_target_job_idx', 'job_id', 'idx'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('broadcast_job.id'), nullable=False)
+    idx = db.Column(db.Integer, nullable=False)  # Position in the original target list
+    phone = db.Column(db.String(50))
+    name = db.Column(db.String(150))
+    status = db.Column(db.String(20), default='pending')  # pending, sending, success, failed, skipped
+    error = db.Column(db.String(255))
+    sent_at = db.Column(db.DateTime)
+
 class SystemConfig(db.Model):
     key = db.Column(db.String(50), primary_key=True)
     value = db.Column(db.String(200))
@@ -246,3 +311,140 @@ class AuditLog(db.Model):
 
     def __repr__(self):
         return f'<AuditLog {self.action} by {self.admin_hp}>'
+
+
+class InboundEvent(db.Model):
+    """
+    Durable inbound webhook queue (ingest mode)
+    Raw WAHA events are persisted here by /webhook and processed by InboundWorker threads
+    """
+    __tablename__ = 'inbound_event'
+
+    id = db.Column(db.Integer, primary_key=True)
+    session_name = db.Column(db.String(50))
+    chat_key = db.Column(db.String(120))  # session:chat_id - ordering key
+    event_type = db.Column(db.String(30))
+    payload = db.Column(db.Text)  # Raw JSON body as received
+    status = db.Column(db.String(20), default='PENDING')  # PENDING, PROCESSING, DONE, FAILED
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_inbound_event_status_id', 'status', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<InboundEvent {self.id} {self.status}>'
+
+
+class ProcessedMessage(db.Model):
+    """
+    Seen WAHA message ids (webhook idempotency)
+    Primary key insert is the cross-worker claim; rows older than DEDUP_TTL_SECONDS are purged
+    """
+    __tablename__ = 'processed_message'
+
+    message_id = db.Column(db.String(150), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
+
+
+class WaExistence(db.Model):
+    """
+    Cached WAHA check-exists results (is this number on WhatsApp?)
+    Rows older than WA_EXISTS_TTL_HOURS are treated as unknown and re-checked
+    """
+    __tablename__ = 'wa_existence'
+
+    phone = db.Column(db.String(20), primary_key=True)  # Normalized 628...
+    on_whatsapp = db.Column(db.Boolean, nullable=False)
+    checked_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ConversationState(db.Model):
+    """
+    Prompt history of one customer conversation: a rolling summary of older turns
+    plus a ring buffer of the most recent messages (replaces re-reading ChatLog per message)
+    """
+    __tablename__ = 'conversation_state'
+    __table_args__ = (
+        db.UniqueConstraint('toko_id', 'customer_hp', name='uq_conversation_state_toko_customer'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    toko_id = db.Column(db.String(50), nullable=False)
+    customer_hp = db.Column(db.String(50), nullable=False)
+    summary = db.Column(db.Text, default="")
+    summary_upto = db.Column(db.Integer, default=0)  # Messages with seq < summary_upto are in the summary
+    recent_json = db.Column(db.Text, default="[]")  # [{"seq", "role", "text"}], oldest first
+    message_count = db.Column(db.Integer, default=0)  # Next seq
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class PaymentVerificationJob(db.Model):
+    """
+    Payment proof verification job (staged pipeline: DOWNLOAD -> PREPROCESS -> VISION -> MATCH -> NOTIFY)
+    Persisted so an interrupted job resumes at its last completed stage.
+    """
+    __tablename__ = 'payment_verification_job'
+
+    id = db.Column(db.Integer, primary_key=True)
+    toko_id = db.Column(db.String(50), index=True)
+    customer_hp = db.Column(db.String(50))
+    chat_id = db.Column(db.String(100))
+    session_name = db.Column(db.String(50))
+    media_url = db.Column(db.String(500))
+    caption = db.Column(db.String(500))
+    mime = db.Column(db.String(100), nullable=True)
+
+    stage = db.Column(db.String(20), default='DOWNLOAD')
+    status = db.Column(db.String(20), default='PENDING')  # PENDING, PROCESSING, DONE, FAILED
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(500), nullable=True)
+    available_at = db.Column(db.DateTime, nullable=True)  # Retry backoff
+    claimed_at = db.Column(db.DateTime, nullable=True)  # Dispatcher lease, renewed before every stage
+
+    # Stage results
+    order_id = db.Column(db.String(50), nullable=True)  # Pending order used as context
+    expected_amount = db.Column(db.Integer, nullable=True)
+    analysis_json = db.Column(db.Text, nullable=True)  # analisa_bukti_transfer() output
+    result = db.Column(db.String(20), nullable=True)  # VERIFIED, MANUAL_REVIEW, UNCLEAR
+    proof_hash = db.Column(db.String(16), nullable=True)  # dHash of the original image
+    proof_sha256 = db.Column(db.String(64), nullable=True)  # SHA-256 of the original image bytes
+
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_payment_verification_job_status_id', 'status', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<PaymentVerificationJob {self.id} {self.stage} {self.status}>'
+
+
+class DailyStoreStats(db.Model):
+    """
+    Per-store daily rollup for the merchant dashboard, updated at write time
+    (services/store_stats.py) and repaired by the daily cron backfill
+    """
+    __tablename__ = 'daily_store_stats'
+    __table_args__ = (
+        db.UniqueConstraint('toko_id', 'day', name='uq_daily_store_stats_toko_day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    toko_id = db.Column(db.String(50), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    revenue = db.Column(db.BigInteger, default=0)  # Sum of PAID orders (by verified_at)
+    orders = db.Column(db.Integer, default=0)  # PAID orders
+    chats_in = db.Column(db.Integer, default=0)  # Customer messages (ChatLog USER)
+    chats_out = db.Column(db.Integer, default=0)  # Bot messages (ChatLog AI/BOT)
+    new_customers = db.Column(db.Integer, default=0)
+    first_buyers = db.Column(db.Integer, default=0)  # Customers whose first PAID order fell on this day
+    repeat_buyers = db.Column(db.Integer, default=0)  # Customers whose second PAID order fell on this day
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f'<DailyStoreStats {self.toko_id} {self.day}>'
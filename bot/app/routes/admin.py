@@ -293,7 +293,7 @@ def health_check():
     """System health check endpoint for monitoring"""
     from app.extensions import db
     from app.config import Config
-    import requests
+    from app.services.waha import get_http
     
     checks = {}
     all_healthy = True
@@ -310,7 +310,7 @@ def health_check():
     # 2. WAHA API Check
     try:
         headers = {'X-Api-Key': Config.WAHA_API_KEY}
-        res = requests.get(f"{Config.WAHA_BASE_URL}/api/sessions", headers=headers, timeout=5)
+        res = get_http().get(f"{Config.WAHA_BASE_URL}/api/sessions", headers=headers, timeout=5)
         checks['waha_api'] = 'healthy' if res.status_code == 200 else f'status_{res.status_code}'
         if res.status_code != 200:
             all_healthy = False
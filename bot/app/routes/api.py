@@ -1,12 +1,12 @@
 from flask import Blueprint, jsonify, send_file, request, session
 import threading
-import requests
 import io
 import time
 import logging
 from app.config import Config
 from app.models import Toko, Subscription
 from app.extensions import db
+from app.services.waha import get_http
 
 
 api_bp = Blueprint('api', __name__)
@@ -26,12 +26,12 @@ def create_and_start_session_bg():
             
             # 1. Delete existing (if any)
             try:
-                requests.delete(f"{WAHA_BASE_URL}/api/sessions/{MASTER_SESSION}", headers=headers, timeout=10)
+                get_http().delete(f"{WAHA_BASE_URL}/api/sessions/{MASTER_SESSION}", headers=headers, timeout=10)
                 time.sleep(1)
             except: pass
 
             # 2. Create (Minimal payload, relies on global config)
-            res = requests.post(
+            res = get_http().post(
                 f"{WAHA_BASE_URL}/api/sessions",
                 json={"name": MASTER_SESSION},
                 headers=headers,
@@ -44,7 +44,7 @@ def create_and_start_session_bg():
             
             # 3. Start
             logging.info("BG: Starting session...")
-            res2 = requests.post(f"{WAHA_BASE_URL}/api/sessions/{MASTER_SESSION}/start", headers=headers, timeout=30)
+            res2 = get_http().post(f"{WAHA_BASE_URL}/api/sessions/{MASTER_SESSION}/start", headers=headers, timeout=30)
             logging.info(f"BG: Start Res: {res2.status_code}")
             res2.raise_for_status()
         except Exception as e:
@@ -89,18 +89,18 @@ def api_qr():
         
         # Check if session exists and its status
         try:
-            chk = requests.get(f"{WAHA_BASE_URL}/api/sessions/{target_session}", headers=headers, timeout=5)
+            chk = get_http().get(f"{WAHA_BASE_URL}/api/sessions/{target_session}", headers=headers, timeout=5)
             if chk.status_code == 200:
                 status = chk.json().get('status')
                 if status in ['STOPPED', 'FAILED']:
                     logging.info(f"Session {target_session} is {status}. Restarting...")
-                    requests.post(f"{WAHA_BASE_URL}/api/sessions/{target_session}/start", headers=headers, timeout=10)
+                    get_http().post(f"{WAHA_BASE_URL}/api/sessions/{target_session}/start", headers=headers, timeout=10)
                     return jsonify({"error": "Restarting session... Wait 5s"}), 503
             else:
                 # Session doesn't exist at all, create it
                 logging.info(f"Session {target_session} not found. Creating...")
-                requests.post(f"{WAHA_BASE_URL}/api/sessions", json={"name": target_session}, headers=headers, timeout=10)
-                requests.post(f"{WAHA_BASE_URL}/api/sessions/{target_session}/start", headers=headers, timeout=10)
+                get_http().post(f"{WAHA_BASE_URL}/api/sessions", json={"name": target_session}, headers=headers, timeout=10)
+                get_http().post(f"{WAHA_BASE_URL}/api/sessions/{target_session}/start", headers=headers, timeout=10)
                 return jsonify({"error": "Creating session... Wait 10s"}), 503
         except Exception as sess_err:
             logging.error(f"Sess check error: {sess_err}")
@@ -113,7 +113,7 @@ def api_qr():
         
         for url in qr_urls:
             try:
-                response = requests.get(url, headers=headers, timeout=5)
+                response = get_http().get(url, headers=headers, timeout=5)
                 if response.status_code == 200 and 'image' in response.headers.get('content-type', ''):
                     return send_file(io.BytesIO(response.content), mimetype='image/png')
             except: continue
@@ -146,7 +146,7 @@ def api_status():
         api_key = Config.WAHA_API_KEY
         headers = {'X-Api-Key': api_key}
         
-        response = requests.get(f"{WAHA_BASE_URL}/api/sessions/{target_session}", headers=headers, timeout=5)
+        response = get_http().get(f"{WAHA_BASE_URL}/api/sessions/{target_session}", headers=headers, timeout=5)
         if response.status_code == 200:
             data = response.json()
             status = data.get('status', 'UNKNOWN')
@@ -167,11 +167,11 @@ def reset_session():
     try:
         api_key = Config.WAHA_API_KEY
         headers = {'X-Api-Key': api_key}
-        try: requests.post(f"{WAHA_BASE_URL}/api/sessions/{MASTER_SESSION}/logout", headers=headers, timeout=5)
+        try: get_http().post(f"{WAHA_BASE_URL}/api/sessions/{MASTER_SESSION}/logout", headers=headers, timeout=5)
         except: pass
-        requests.delete(f"{WAHA_BASE_URL}/api/sessions/{MASTER_SESSION}", headers=headers, timeout=5)
+        get_http().delete(f"{WAHA_BASE_URL}/api/sessions/{MASTER_SESSION}", headers=headers, timeout=5)
         time.sleep(2)
-        requests.post(f"{WAHA_BASE_URL}/api/sessions", json={"name": MASTER_SESSION}, headers=headers, timeout=30)
+        get_http().post(f"{WAHA_BASE_URL}/api/sessions", json={"name": MASTER_SESSION}, headers=headers, timeout=30)
         return jsonify({"status": "success"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -255,6 +255,9 @@ def send_broadcast():
             status='PENDING'
         )
         db.session.add(job)
+        db.session.flush()
+        from app.services.broadcast_manager import BroadcastManager
+        BroadcastManager.add_targets(job.id, targets)
         db.session.commit()
         return jsonify({"status": "queued", "job_id": job.id})
     except Exception as e:
@@ -42,8 +42,28 @@ def daily_checks():
         from app.services.broadcast_manager import BroadcastManager
         rescued_count = BroadcastManager.rescue_stuck_jobs()
         
+        # 4. ChatLog retention (archive old history) + next months' partitions
+        from app.services.chatlog_maintenance import ChatLogMaintenance
+        try:
+            chatlog_results = ChatLogMaintenance.apply_retention(dry_run=dry_run)
+            if not dry_run:
+                ChatLogMaintenance.ensure_partitions()
+        except Exception as retention_err:
+            logging.error(f"ChatLog retention failed: {retention_err}")
+            chatlog_results = {'error': str(retention_err)}
+        
+        # 5. Dashboard rollups: repair recent days (full backfill on first run)
+        from app.services.store_stats import StoreStats
+        try:
+            store_stats_results = StoreStats.nightly(dry_run=dry_run)
+        except Exception as stats_err:
+            logging.error(f"Store stats rebuild failed: {stats_err}")
+            store_stats_results = {'error': str(stats_err)}
+        
         # Merge results
         results['grace_cleanup'] = grace_results
+        results['chatlog_retention'] = chatlog_results
+        results['store_stats'] = store_stats_results
         
         logging.info(f"✅ Daily Cron Finished. {results}")
         
@@ -70,9 +90,14 @@ def heartbeat():
     worker_health = {
         "BroadcastWorker": "BroadcastWorker" in active_threads,
         "SalesEngine": "SalesEngine" in active_threads,
-        "Scheduler": "Scheduler" in active_threads
+        "Scheduler": "Scheduler" in active_threads,
+        "PaymentPipeline": "PaymentPipeline" in active_threads
     }
     
+    from app.feature_flags import FeatureFlags
+    if FeatureFlags.is_webhook_queue_enabled():
+        worker_health["InboundDispatcher"] = "InboundDispatcher" in active_threads
+    
     all_workers_alive = all(worker_health.values())
 
     # Ensure BroadcastManager is available for the return statement
@@ -95,6 +120,18 @@ def heartbeat():
             from app.services.sales_engine import worker_sales_engine
             real_app = current_app._get_current_object()
             threading.Thread(target=worker_sales_engine, args=(real_app,), name="SalesEngine", daemon=True).start()
+        
+        if not worker_health["PaymentPipeline"]:
+            logging.warning("⚠️ PaymentPipeline DEAD. Restarting...")
+            from app.services.payment_pipeline import worker_payment_pipeline
+            real_app = current_app._get_current_object()
+            threading.Thread(target=worker_payment_pipeline, args=(real_app,), name="PaymentPipeline", daemon=True).start()
+
+        if worker_health.get("InboundDispatcher") is False:
+            logging.warning("⚠️ InboundDispatcher DEAD. Restarting...")
+            from app.services.inbound_queue import worker_inbound
+            real_app = current_app._get_current_object()
+            threading.Thread(target=worker_inbound, args=(real_app,), name="InboundDispatcher", daemon=True).start()
             
     return jsonify({
         "status": "alive" if all_workers_alive else "recovering",
@@ -108,3 +145,27 @@ def heartbeat():
     }), 200
 
 
+
+@cron_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Performance metrics for this process (queues, caches, latencies).
+    Access: GET /api/cron/metrics?key=SECRET
+    Or Header: X-App-Cron-Secret: SECRET
+    """
+    secret = request.headers.get('X-App-Cron-Secret') or request.args.get('key')
+    if secret != Config.CRON_SECRET:
+        logging.warning(f"⛔ Unauthorized Metrics Access Attempt from {request.remote_addr}")
+        return jsonify({"error": "Unauthorized", "message": "Invalid Cron Secret"}), 401
+    
+    from app.services.metrics import Metrics
+    from app.services.inbound_queue import get_queue_depth
+    
+    # Refresh DB-backed gauges so any process can answer
+    Metrics.set_gauge('inbound.queue_depth', get_queue_depth())
+    
+    return jsonify({
+        "status": "ok",
+        "timestamp": datetime.now().isoformat(),
+        "metrics": Metrics.snapshot()
+    }), 200
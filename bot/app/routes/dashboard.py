@@ -1,5 +1,5 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, jsonify
-from app.models import Toko, ChatLog, Customer, Transaction, SystemConfig
+from app.models import Toko, ChatLog, Customer, Transaction, SystemConfig, ConversationState
 from app.config import Config
 from app.extensions import db
 from datetime import datetime, timedelta
@@ -167,19 +167,19 @@ def index():
 @login_required
 def api_stats():
     toko_id = session['toko_id']
-    # Example: Chat volume last 7 days
+    # Chat volume last 7 days from the daily rollup (7 rows)
+    from app.services.store_stats import StoreStats
+    today = datetime.now().date()
+    start = today - timedelta(days=6)
+    daily = StoreStats.series(toko_id, start, today)
+
     dates = []
     counts = []
-    now = datetime.now()
-    for i in range(6, -1, -1):
-        d = now - timedelta(days=i)
-        d_str = d.strftime("%Y-%m-%d")
-        c = ChatLog.query.filter(
-            ChatLog.toko_id == toko_id, 
-            db.func.date(ChatLog.created_at) == d.date()
-        ).count()
-        dates.append(d_str)
-        counts.append(c)
+    for i in range(7):
+        d = start + timedelta(days=i)
+        row = daily.get(d)
+        dates.append(d.strftime("%Y-%m-%d"))
+        counts.append((row.chats_in or 0) + (row.chats_out or 0) if row else 0)
         
     return jsonify({"labels": dates, "data": counts})
 
@@ -234,6 +234,7 @@ def delete_data():
     try:
         # Delete Chat Logs
         ChatLog.query.filter_by(toko_id=toko_id).delete()
+        ConversationState.query.filter_by(toko_id=toko_id).delete()
         
         # Reset Customer statuses but keep the customers
         customers = Customer.query.filter_by(toko_id=toko_id).all()
@@ -276,6 +277,35 @@ def orders():
     
     return render_template('dashboard/orders.html', toko=toko, orders=orders, filter=status_filter)
 
+@dashboard_bp.route('/orders/reconcile', methods=['POST'])
+@login_required
+def reconcile_orders():
+    """Match a list of received amounts (e.g. bank statement) to pending orders"""
+    toko_id = session['toko_id']
+    data = request.json or {}
+    try:
+        amounts = [int(a) for a in data.get('amounts', [])]
+        tolerance = int(data.get('tolerance', 1000))
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "amounts must be numbers"}), 400
+    if len(amounts) > 1000:
+        return jsonify({"status": "error", "message": "Max 1000 amounts per request"}), 400
+    
+    from app.services.order_service import match_pending_orders
+    matches = match_pending_orders(toko_id, amounts, tolerance=tolerance)
+    return jsonify({
+        "status": "success",
+        "matches": [
+            {
+                "amount": amount,
+                "order_id": order.order_id if order else None,
+                "customer_hp": order.customer_hp if order else None,
+                "nominal": order.nominal if order else None
+            }
+            for amount, order in zip(amounts, matches)
+        ]
+    })
+
 @dashboard_bp.route('/orders/<order_id>/verify', methods=['POST'])
 @login_required
 def verify_order_manual(order_id):
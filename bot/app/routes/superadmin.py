@@ -262,19 +262,20 @@ def broadcast_history():
     jobs = BroadcastJob.query.order_by(BroadcastJob.created_at.desc()).limit(50).all()
     
     # Process jobs data
+    from app.services.broadcast_manager import BroadcastManager
+    totals = BroadcastManager.get_total_targets(jobs)
     jobs_data = []
     for job in jobs:
-        import json
-        target_list = json.loads(job.target_list) if job.target_list else []
+        total = totals.get(job.id, 0)
         
         jobs_data.append({
             'id': job.id,
             'created_at': job.created_at,
             'status': job.status,
-            'total_targets': len(target_list),
+            'total_targets': total,
             'processed': job.processed_count,
             'message_preview': job.pesan[:50] + '...' if len(job.pesan) > 50 else job.pesan,
-            'success_rate': (job.processed_count / len(target_list) * 100) if target_list else 0
+            'success_rate': (job.processed_count / total * 100) if total else 0
         })
     
     return render_template('superadmin/history.html', jobs=jobs_data)
@@ -436,9 +437,10 @@ def api_active_jobs():
         BroadcastJob.status.in_(['PENDING', 'RUNNING', 'PAUSED'])
     ).count()
 
+    from app.services.broadcast_manager import BroadcastManager
     jobs_data = []
     for job in jobs:
-        target_list = json.loads(job.target_list) if job.target_list else []
+        target_list = BroadcastManager.get_targets(job)
         jobs_data.append({
             'id': job.id,
             'status': job.status,
@@ -484,12 +486,10 @@ def api_update_broadcast_status(job_id):
         else:
             return jsonify({'status': 'error', 'message': 'Hanya job dipause yang bisa diresume'}), 400
     elif action == 'retry':
-        # Reset counters but keep status and processed_count=0 so worker skips successes
+        # Requeue undelivered targets; successes are kept and not resent
+        from app.services.broadcast_manager import BroadcastManager
+        BroadcastManager.reset_for_retry(job)
         job.status = 'PENDING'
-        job.processed_count = 0
-        job.success_count = 0
-        job.failed_count = 0
-        job.skipped_count = 0
         job.locked_until = None
     else:
         return jsonify({'status': 'error', 'message': 'Aksi tidak valid'}), 400
@@ -507,8 +507,9 @@ def download_failed_csv(job_id):
     from io import StringIO
     from flask import make_response
     
+    from app.services.broadcast_manager import BroadcastManager
     job = BroadcastJob.query.get_or_404(job_id)
-    targets = json.loads(job.target_list) if job.target_list else []
+    targets = BroadcastManager.get_targets(job)
     
     # Filter failed
     failed_targets = [t for t in targets if t.get('status') == 'failed']
@@ -596,7 +597,10 @@ def api_blacklist():
 @superadmin_required
 def api_unblock_phone(phone):
     from app.models import BroadcastBlacklist
+    from app.services.opt_out_manager import BlacklistCache
     b = BroadcastBlacklist.query.get_or_404(phone)
     db.session.delete(b)
+    BlacklistCache.bump_version()
     db.session.commit()
+    BlacklistCache.remove_local(phone)
     return jsonify({'status': 'success'})
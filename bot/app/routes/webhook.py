@@ -1,14 +1,16 @@
 import json
 import logging
-import threading
-import requests
 from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify, current_app
 from app.models import Toko, Subscription, Customer, ChatLog
+from app.services.tenant_cache import TenantCache
+from app.services.burst_limiter import BurstLimiter
+from app.services.message_debouncer import MessageDebouncer
 from app.extensions import db
 from app.services.waha import kirim_waha, mark_seen
 from app.services.gemini import get_gemini_response
-from app.services.sales_engine import check_and_send_followups
+from app.services.sales_engine import kick_followups
+from app.services.store_stats import StoreStats
 from app.config import Config
 
 from app.utils import should_ignore_message, get_parsed_number
@@ -57,6 +59,63 @@ def handle_global_opt_out(cmd, nomor_murni, chat_id, session_id):
         
     return False
 
+def reply_with_ai(toko_id, nomor_murni, chat_id, session_id, body, toko=None, customer=None):
+    """
+    Generate and send the AI reply for a customer text.
+    Called inline by the webhook, or by MessageDebouncer with the merged burst.
+    """
+    if toko is None:
+        toko = TenantCache.get_toko(toko_id)
+        customer = Customer.query.filter_by(toko_id=toko_id, nomor_hp=nomor_murni).first()
+        if not toko:
+            return
+
+    if TenantCache.is_enabled('panic_mode', toko_id):
+        logging.info("Panic Mode Active: Silencing AI response")
+        return
+
+    logging.info(f"Calling Gemini for: '{body}'")
+    try:
+        ai_response = get_gemini_response(body, toko, customer)
+        logging.info(f"Gemini Response: '{ai_response[:50] if ai_response else 'None'}...'")
+    except Exception as e:
+        logging.error(f"Gemini Execution Error: {e}", exc_info=True)
+        
+        # Track error for monitoring & alerts
+        try:
+            from app.services.error_monitoring import ErrorMonitor
+            ErrorMonitor.log_error(
+                "GEMINI_FAILURE",
+                f"Failed for toko {toko.id}: {str(e)}",
+                severity="CRITICAL"
+            )
+        except:
+            pass  # Don't let monitoring break the app
+        
+        # Enhanced fallback messages based on error type
+        error_msg = str(e).lower()
+        
+        if "quota" in error_msg or "rate limit" in error_msg:
+            ai_response = (
+                "Maaf kak, saat ini sistem sedang ramai sekali 😅\n"
+                "Bisa dicoba lagi sebentar lagi ya! 🙏"
+            )
+        elif "api key" in error_msg or "authentication" in error_msg:
+            ai_response = (
+                "Mohon maaf ada gangguan teknis sebentar.\n"
+                "Tim kami sudah diberitahu. Terima kasih ya! 🙏"
+            )
+        else:
+            ai_response = "Maaf, ada gangguan teknis sebentar ya kak 🙏"
+
+    if ai_response:
+        logging.info(f"Sending AI response to WAHA: {chat_id}")
+        kirim_waha(chat_id, ai_response, session_id)
+        BurstLimiter.record_send(toko_id, nomor_murni)
+    else:
+        logging.warning("Gemini returned empty response, skipping send.")
+
+
 @webhook_bp.route('/webhook', methods=['POST'])
 def webhook():
     # Force rebuild: v1.0.2 - Global unreg handler
@@ -88,6 +147,49 @@ def webhook():
     if not data:
         return jsonify({"status": "ignored", "reason": "empty"}), 200
 
+    # IDEMPOTENCY: Drop WAHA retries of a message we already accepted
+    from app.services.dedup import MessageDedup
+    message_id = MessageDedup.get_message_id(data)
+    if MessageDedup.is_duplicate(message_id):
+        logging.info(f"♻️ Duplicate webhook ignored: {message_id}")
+        return jsonify({"status": "ignored", "reason": "duplicate"}), 200
+
+    # INGEST MODE: Persist raw event and ack immediately (InboundWorker does the rest)
+    from app.feature_flags import FeatureFlags
+    if FeatureFlags.is_webhook_queue_enabled():
+        try:
+            from app.services.inbound_queue import enqueue_event
+            event_id = enqueue_event(data)
+            return jsonify({"status": "queued", "id": event_id}), 200
+        except Exception as e:
+            # Fall back to inline processing rather than dropping the message
+            logging.error(f"Inbound enqueue failed, processing inline: {e}")
+            db.session.rollback()
+
+    try:
+        response = handle_webhook_event(data)
+    except Exception:
+        db.session.rollback()
+        MessageDedup.release(message_id)  # Let WAHA's retry through
+        raise
+    if response_status(response) >= 500:
+        MessageDedup.release(message_id)
+    return response
+
+
+def response_status(response) -> int:
+    """HTTP status of a view result (Response, (body, status) tuple or plain body)"""
+    if isinstance(response, tuple):
+        return response[1] if len(response) > 1 and isinstance(response[1], int) else 200
+    return getattr(response, 'status_code', 200)
+
+
+def handle_webhook_event(data):
+    """
+    Route a single WAHA event (commands, registration, AI reply, media).
+    Called inline by /webhook or by InboundWorker threads in ingest mode.
+    Requires an app context, not a request context.
+    """
     # Handle session.status webhook (for auto-configuration)
     event = data.get('event', '')
     if event == 'session.status':
@@ -125,12 +227,8 @@ def webhook():
     # Auto mark as read
     mark_seen(chat_id, session_id)
 
-    # 3. Trigger Sales Engine (Background)
-    try:
-        app_ctx = current_app._get_current_object()
-        threading.Thread(target=check_and_send_followups, args=(app_ctx,)).start()
-    except Exception as e:
-        logging.error(f"Scheduler Trigger Error: {e}")
+    # 3. Nudge the Sales Engine worker (runs follow-ups in its own thread)
+    kick_followups()
 
     # 3.5 GLOBAL COMMAND HANDLER (All Sessions)
     cmd = (body or "").lower().strip()
@@ -147,14 +245,14 @@ def webhook():
     if is_master or is_owner:
         if cmd in ['/help', '/bantuan', '/menu']:
             # Get Context for Merchant
-            sub = Subscription.query.filter_by(phone_number=toko_id).first()
+            sub = TenantCache.get_subscription(toko_id)
             status_info = f"\n📊 *Status:* {sub.status if sub else 'Unknown'} | s/d: {sub.expired_at.strftime('%d %b %Y') if sub and sub.expired_at else '-'}"
             
             help_msg = (
                 f"🤖 *WALI AI - MERCHANT HUB*{status_info}\n\n"
                 "Gunakan perintah berikut untuk mengelola bot Anda:\n\n"
                 "🛠️ *Manajemen Produk:*\n"
-                "- `/list_menu` - Daftar semua produk\n"
+                "- `/list_menu [Kategori] [Halaman]` - Daftar produk\n"
                 "- `/tambah_menu [Nama] [Harga] [Stok]`\n"
                 "- `/hapus_menu [ID]`\n\n"
                 "⚙️ *Akun & Koneksi:*\n"
@@ -382,7 +480,7 @@ def webhook():
         # B. Registration Flow
         body_text = (body or "").upper()
         is_submitting_reg = any(x in body_text for x in ["/DAFTAR", "REG_AUTO", "/UNREG", "/PINTU", "UPGRADE", "BELI", "PERPANJANG"])
-        is_registered_owner = Subscription.query.filter_by(phone_number=nomor_murni).first() is not None
+        is_registered_owner = TenantCache.get_subscription(nomor_murni) is not None
         
         if is_registered_owner or is_submitting_reg:
             # Upgrade / Payment Flow
@@ -412,7 +510,7 @@ def webhook():
                     from app.services.transaction_service import create_subscription_transaction
                     
                     # We need name from Subscription if possible, or use "Pelanggan"
-                    sub = Subscription.query.filter_by(phone_number=nomor_murni).first()
+                    sub = TenantCache.get_subscription(nomor_murni)
                     name = sub.name if sub else "Pelanggan"
                     
                     kirim_waha(chat_id, "⏳ Mohon tunggu, sedang membuat link pembayaran...", session_id)
@@ -442,9 +540,10 @@ def webhook():
     # 5. AI RESPONDER LOGIC (Store Sessions)
     with current_app.app_context():
         # Cleaned up imports
-        toko = Toko.query.get(toko_id)
+        toko = TenantCache.get_toko(toko_id)
         if not toko:
             return "Toko Not Found", 200
+        TenantCache.prefetch(toko_id)  # All hot SystemConfig keys in one query
             
         # --- IDENTITY GUARD ---
         # Bot should not be a customer of itself.
@@ -456,12 +555,16 @@ def webhook():
             logging.info(f"🚫 Identity Guard: Bot {toko_id} chatting with itself. Skipping customer logic.")
         else:
             customer = Customer.query.filter_by(toko_id=toko_id, nomor_hp=nomor_murni).first()
-            if not customer:
+            is_new_customer = customer is None
+            if is_new_customer:
                 customer = Customer(toko_id=toko_id, nomor_hp=nomor_murni)
                 db.session.add(customer)
                 
             customer.last_interaction = db.func.now()
             db.session.commit()
+            if is_new_customer:
+                StoreStats.record_new_customer(toko_id)
+            toko = TenantCache.get_toko(toko_id)  # Re-attach after commit (no refresh SELECT)
         
         # 3. Security (Fixed Identity Guard)
         is_owner = (nomor_murni == toko_id or nomor_murni == Config.SUPER_ADMIN_WA)
@@ -475,14 +578,14 @@ def webhook():
         if (body or "").lower() in ['/help', '/menu', '/bantuan']:
             if is_owner:
                 # Get Sub for context
-                sub = Subscription.query.filter_by(phone_number=toko_id).first()
+                sub = TenantCache.get_subscription(toko_id)
                 status_str = f"| Exp: {sub.expired_at.strftime('%d/%m/%y') if sub and sub.expired_at else '-'}"
                 
                 msg = (
                     f"🤖 *WALI AI - MERCHANT HUB*\n"
                     f"🏪 Toko: *{toko.nama}* {status_str}\n\n"
                     "🛠️ *Atur Menu & Produk:*\n"
-                    "- `/list_menu` - Daftar semua produk\n"
+                    "- `/list_menu [Kategori] [Halaman]` - Daftar produk\n"
                     "- `/tambah_menu [Nama] [Harga] [Stok]`\n"
                     "- `/hapus_menu [ID]`\n\n"
                     "⚙️ *System & Akun:*\n"
@@ -518,17 +621,9 @@ def webhook():
         
         # --- PING-PONG PROTECTION (BURST LIMIT) ---
         if not is_self and not is_owner:
-            # Check burst limit: count BOT/AI messages to this customer in the last 1 minute
-            one_minute_ago = datetime.now() - timedelta(minutes=1)
-            recent_bot_msgs = ChatLog.query.filter(
-                ChatLog.toko_id == toko_id,
-                ChatLog.customer_hp == nomor_murni,
-                ChatLog.role.in_(['AI', 'BOT']),
-                ChatLog.created_at >= one_minute_ago
-            ).count()
-            
-            if recent_bot_msgs >= 3:
-                logging.warning(f"⚠️ Ping-Pong Protection: Burst limit (3 msgs/min) for {nomor_murni}. Silencing bot.")
+            # Check burst limit: bot messages to this customer in the last minute (in-memory window)
+            if BurstLimiter.is_silenced(toko_id, nomor_murni):
+                logging.warning(f"⚠️ Ping-Pong Protection: Burst limit ({Config.BURST_LIMIT} msgs/{Config.BURST_WINDOW_SECONDS:g}s) for {nomor_murni}. Silencing bot.")
                 return "OK (Silenced)", 200
 
         # is_owner defined above
@@ -544,13 +639,30 @@ def webhook():
             message_body = (body or "").strip()
             
             # 1. LIST MENU (with IDs)
-            if message_body.lower() == '/list_menu':
-                menus = Menu.query.filter_by(toko_id=toko.id).all()
-                if not menus:
+            # Format: /list_menu [Kategori] [Halaman]
+            if message_body.lower() == '/list_menu' or message_body.lower().startswith('/list_menu '):
+                from app.services.menu_index import MenuIndex
+                args = message_body.split()[1:]
+                page = int(args.pop()) if args and args[-1].isdigit() else 1
+                category = " ".join(args) or None
+
+                index = MenuIndex.get(toko.id, fresh=True)  # Edits may come from another worker
+                if not index.items:
                     reply = "Belum ada menu. Gunakan format:\n/tambah_menu [Nama] [Harga] [Stok]"
+                elif category and not index.find_category(category):
+                    reply = f"Kategori '{category}' tidak ditemukan.\nKategori: " + ", ".join(index.categories)
                 else:
-                    reply = "*Daftar Menu (ID untuk Hapus/Edit):*\n"
+                    menus, page, total_pages = index.page(category, page, Config.MENU_LIST_PAGE_SIZE)
+                    label = f" {index.find_category(category)}" if category else ""
+                    reply = f"*Daftar Menu{label} (ID untuk Hapus/Edit):*\n"
                     reply += "\n".join([f"🆔 {m.id} | {m.item} | Rp{m.harga:,} | Stok: {m.stok}" for m in menus])
+                    if total_pages > 1:
+                        next_cmd = f"/list_menu {category + ' ' if category else ''}{page + 1}"
+                        reply += f"\n\nHalaman {page}/{total_pages}."
+                        if page < total_pages:
+                            reply += f" Ketik *{next_cmd}* untuk berikutnya."
+                        if not category and len(index.categories) > 1:
+                            reply += "\nFilter kategori: /list_menu [Kategori] — " + ", ".join(index.categories)
                 kirim_waha(chat_id, reply, session_id)
                 return "OK", 200
 
@@ -626,51 +738,14 @@ def webhook():
         if not (has_intent or is_owner):
             logging.info(f"Filtered (No Intent): '{body}' from {nomor_murni}")
 
-        # Call AI
-        from app.services.broadcast import get_panic_mode
-        if get_panic_mode():
-            logging.info("Panic Mode Active: Silencing AI response")
-            return "Panic Mode Active", 200
-
-        logging.info(f"Calling Gemini for: '{body}'")
-        try:
-            ai_response = get_gemini_response(body, toko, customer)
-            logging.info(f"Gemini Response: '{ai_response[:50] if ai_response else 'None'}...'")
-        except Exception as e:
-            logging.error(f"Gemini Execution Error: {e}", exc_info=True)
-            
-            # Track error for monitoring & alerts
-            try:
-                from app.services.error_monitoring import ErrorMonitor
-                ErrorMonitor.log_error(
-                    "GEMINI_FAILURE",
-                    f"Failed for toko {toko.id}: {str(e)}",
-                    severity="CRITICAL"
-                )
-            except:
-                pass  # Don't let monitoring break the app
-            
-            # Enhanced fallback messages based on error type
-            error_msg = str(e).lower()
-            
-            if "quota" in error_msg or "rate limit" in error_msg:
-                ai_response = (
-                    "Maaf kak, saat ini sistem sedang ramai sekali 😅\n"
-                    "Bisa dicoba lagi sebentar lagi ya! 🙏"
-                )
-            elif "api key" in error_msg or "authentication" in error_msg:
-                ai_response = (
-                    "Mohon maaf ada gangguan teknis sebentar.\n"
-                    "Tim kami sudah diberitahu. Terima kasih ya! 🙏"
-                )
-            else:
-                ai_response = "Maaf, ada gangguan teknis sebentar ya kak 🙏"
-
-        if ai_response:
-            logging.info(f"Sending AI response to WAHA: {chat_id}")
-            kirim_waha(chat_id, ai_response, session_id)
-        else:
-            logging.warning("Gemini returned empty response, skipping send.")
+        # Call AI (bursts of short messages are merged into one turn)
+        if MessageDebouncer.is_enabled():
+            if MessageDebouncer.submit(
+                toko_id, nomor_murni, body,
+                lambda merged: reply_with_ai(toko_id, nomor_murni, chat_id, session_id, merged)
+            ):
+                return "OK (Debounced)", 200
+        reply_with_ai(toko_id, nomor_murni, chat_id, session_id, body, toko, customer)
 
     # 6. MEDIA HANDLING (Bukti Transfer & CSV Upload)
     has_media = payload.get('hasMedia', False) or (data.get('media') is not None)
@@ -738,205 +813,14 @@ def webhook():
         if is_payment:
             logging.info(f"📸 Payment proof detected from {nomor_murni}: {caption}")
             kirim_waha(chat_id, "🔍 Sedang memverifikasi bukti transfer...", session_id)
-            
+
+            # Download, vision, order matching and replies run in the verification pipeline
             try:
-                # Download Media
-                media_url = media.get('url')
-                if not media_url:
-                    kirim_waha(chat_id, "❌ Gagal mengunduh gambar. Mohon kirim ulang.", session_id)
-                    return "OK", 200
-                
-                from app.services.waha import get_headers
-                m_res = requests.get(media_url, headers=get_headers(), timeout=30)
-                
-                if m_res.status_code != 200:
-                    logging.error(f"Failed to download media: {m_res.status_code}")
-                    kirim_waha(chat_id, "❌ Gagal mengunduh gambar. Coba lagi.", session_id)
-                    return "OK", 200
-                
-                mime = m_res.headers.get('Content-Type', 'image/jpeg')
-                
-                # Look up pending orders/transactions for this customer (contextual matching)
-                expected_amount = None
-                order_context = None
-                pending_order = None
-                
-                # Order Matching: Find pending transaction for this customer
-                try:
-                    from app.services.order_service import find_pending_order
-                    pending_order = find_pending_order(
-                        toko_id=toko.id,
-                        customer_hp=nomor_murni,
-                        amount=None  # Will match any pending order first
-                    )
-                    
-                    if pending_order:
-                        expected_amount = pending_order.nominal
-                        order_context = {
-                            'order_id': pending_order.order_id,
-                            'customer_phone': nomor_murni,
-                            'created_at': pending_order.tanggal
-                        }
-                        logging.info(f"Found pending order {pending_order.order_id} for {nomor_murni}: Rp{expected_amount:,}")
-                except Exception as order_err:
-                    logging.warning(f"Order lookup error (non-fatal): {order_err}")
-                
-                from app.services.gemini import analisa_bukti_transfer
-                
-                logging.info(f"Calling enhanced payment verification for {nomor_murni}")
-                analysis = analisa_bukti_transfer(
-                    m_res.content, 
-                    mime, 
-                    expected_amount=expected_amount,
-                    order_context=order_context,
-                    toko=toko
-                )
-                
-                # Log analysis result for debugging
-                logging.info(f"Payment verification result: {json.dumps(analysis)}")
-                
-                # Extract results
-                is_valid = analysis.get('is_valid', False)
-                confidence = analysis.get('confidence_score', 0)
-                detected_amount = analysis.get('detected_amount', 0)
-                bank_name = analysis.get('bank_name', 'Unknown')
-                match_status = analysis.get('match_status', 'NO_EXPECTED_AMOUNT')
-                fraud_hints = analysis.get('fraud_hints', [])
-                
-                # Store verification result in ChatLog for audit trail
-                try:
-                    # ChatLog and db already imported globally
-                    verification_log = ChatLog(
-                        toko_id=toko.id,
-                        customer_hp=customer.nomor_hp,
-                        role='SYSTEM',
-                        message=f"Payment Verification: {json.dumps(analysis)}"
-                    )
-                    db.session.add(verification_log)
-                    db.session.commit()
-                except Exception as log_err:
-                    logging.error(f"Failed to log verification: {log_err}")
-                
-                # Confidence-based response flow
-                if confidence >= 95 and is_valid:
-                    # HIGH CONFIDENCE - Auto-approve
-                    order_info = ""
-                    if pending_order:
-                        order_info = f"Order: #{pending_order.order_id}\n"
-                    
-                    reply = (
-                        f"✅ *Pembayaran Terverifikasi!*\n\n"
-                        f"{order_info}"
-                        f"Bank: {bank_name}\n"
-                        f"Nominal: Rp {detected_amount:,}\n"
-                        f"Kepercayaan: {confidence}%\n\n"
-                        f"Terima kasih! Pesanan Anda segera diproses. 🙏"
-                    )
-                    
-                    # Auto-update order status to PAID
-                    if pending_order and pending_order.order_id:
-                        try:
-                            from app.services.order_service import verify_order
-                            verify_order(
-                                order_id=pending_order.order_id,
-                                verification_status='VERIFIED',
-                                confidence_score=confidence,
-                                detected_amount=detected_amount,
-                                detected_bank=bank_name,
-                                verified_by='AI',
-                                fraud_hints=fraud_hints
-                            )
-                            logging.info(f"Order {pending_order.order_id} auto-verified by AI")
-                        except Exception as verify_err:
-                            logging.error(f"Failed to auto-verify order: {verify_err}")
-                    
-                elif confidence >= 70 and is_valid:
-                    # MEDIUM CONFIDENCE - Notify both parties, flag for manual review
-                    order_info = ""
-                    if pending_order:
-                        order_info = f"Order: #{pending_order.order_id}\n"
-                    
-                    reply = (
-                        f"⚠️ *Bukti Transfer Diterima*\n\n"
-                        f"{order_info}"
-                        f"Bank: {bank_name}\n"
-                        f"Nominal: Rp {detected_amount:,}\n"
-                        f"Kepercayaan: {confidence}%\n\n"
-                        f"Admin kami akan verifikasi manual segera. "
-                        f"Mohon tunggu konfirmasi ya Kak! 🙏"
-                    )
-                    
-                    # Flag order for manual review
-                    if pending_order and pending_order.order_id:
-                        try:
-                            from app.services.order_service import verify_order
-                            verify_order(
-                                order_id=pending_order.order_id,
-                                verification_status='MANUAL_REVIEW',
-                                confidence_score=confidence,
-                                detected_amount=detected_amount,
-                                detected_bank=bank_name,
-                                verified_by='AI',
-                                fraud_hints=fraud_hints,
-                                notes=f"Medium confidence ({confidence}%), needs manual review"
-                            )
-                            logging.info(f"Order {pending_order.order_id} flagged for manual review")
-                        except Exception as verify_err:
-                            logging.error(f"Failed to flag order for review: {verify_err}")
-                    
-                    # Notify merchant/owner
-                    if toko.remote_token:
-                        order_ref = f"\nOrder: #{pending_order.order_id}" if pending_order else ""
-                        merchant_notif = (
-                            f"🔔 *Bukti Transfer Perlu Review*\n\n"
-                            f"Dari: {nomor_murni}{order_ref}\n"
-                            f"Bank: {bank_name}\n"
-                            f"Nominal: Rp {detected_amount:,}\n"
-                            f"Confidence: {confidence}%\n"
-                            f"Match Status: {match_status}\n\n"
-                            f"⚠️ Mohon verifikasi manual via dashboard."
-                        )
-                        
-                        try:
-                            # Send to store owner's WhatsApp
-                            owner_chat_id = f"{toko.remote_token}@c.us"
-                            kirim_waha(owner_chat_id, merchant_notif, session_id)
-                        except Exception as e:
-                            logging.warning(f"Could not notify merchant {toko.remote_token}: {e}")
-                    
-                else:
-                    # LOW CONFIDENCE - Request clearer photo
-                    issues = ", ".join(fraud_hints[:3]) if fraud_hints else "unclear image"
-                    
-                    reply = (
-                        f"⚠️ *Bukti Transfer Kurang Jelas*\n\n"
-                        f"Kepercayaan: {confidence}%\n"
-                        f"Masalah: {issues}\n\n"
-                        f"Mohon kirim foto yang lebih jelas ya Kak:\n"
-                        f"✓ Pastikan status transfer 'BERHASIL'\n"
-                        f"✓ Nominal terlihat dengan jelas\n"
-                        f"✓ Tidak blur/buram\n\n"
-                        f"Terima kasih! 🙏"
-                    )
-                
-                kirim_waha(chat_id, reply, session_id)
-                
+                from app.services.payment_pipeline import PaymentPipeline
+                PaymentPipeline.submit(toko_id, nomor_murni, chat_id, session_id, media.get('url'), caption)
             except Exception as e:
-                logging.error(f"Media analysis error: {e}")
-                import traceback
-                logging.error(traceback.format_exc())
-                
-                # Track error for monitoring
-                try:
-                    from app.services.error_monitoring import ErrorMonitor
-                    ErrorMonitor.log_error(
-                        "PAYMENT_VERIFICATION_FAILURE",
-                        f"Failed for toko {toko.id}: {str(e)}",
-                        severity="ERROR"
-                    )
-                except:
-                    pass
-                
+                logging.error(f"Payment verification enqueue error: {e}")
+                db.session.rollback()
                 kirim_waha(
                     chat_id, 
                     "❌ Maaf, ada gangguan saat memverifikasi bukti transfer. "
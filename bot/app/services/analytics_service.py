@@ -1,41 +1,28 @@
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from app.extensions import db
 from app.models import Transaction, Customer, Menu
+from app.services.store_stats import StoreStats
 
 def get_sales_chart_data(toko_id: str, days: int = 30):
     """
-    Get sales revenue and order count for the last N days.
+    Get sales revenue and order count for the last N days (from daily_store_stats).
     """
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
     
-    # Query Revenue per day
-    revenue_data = db.session.query(
-        func.date(Transaction.verified_at).label('date'),
-        func.sum(Transaction.nominal).label('revenue'),
-        func.count(Transaction.id).label('orders')
-    ).filter(
-        Transaction.toko_id == toko_id,
-        Transaction.status == 'PAID',
-        Transaction.verified_at >= start_date
-    ).group_by(func.date(Transaction.verified_at)).all()
+    daily = StoreStats.series(toko_id, start_date.date(), end_date.date())
     
     # Fill missing dates
     dates = []
     revenues = []
     orders = []
     
-    revenue_map = {str(r.date): (r.revenue, r.orders) for r in revenue_data}
-    
     for i in range(days - 1, -1, -1):
         d = start_date + timedelta(days=i)
-        d_str = d.strftime("%Y-%m-%d")
         
-        rev, ord_count = revenue_map.get(d_str, (0, 0))
+        row = daily.get(d.date())
         dates.append(d.strftime("%d %b"))
-        revenues.append(int(rev or 0))
-        orders.append(ord_count)
+        revenues.append(int(row.revenue or 0) if row else 0)
+        orders.append(int(row.orders or 0) if row else 0)
         
     return {
         "labels": dates,
@@ -93,30 +80,21 @@ def get_top_products(toko_id: str, limit: int = 5):
 def get_key_metrics(toko_id: str):
     """
     Get overall key metrics: Total Revenue, Total Orders, Total Customers
+    (sums of daily_store_stats instead of scans over Transaction)
     """
-    total_revenue = db.session.query(func.sum(Transaction.nominal)).filter(
-        Transaction.toko_id == toko_id,
-        Transaction.status == 'PAID'
-    ).scalar() or 0
-    
-    total_orders = Transaction.query.filter_by(
-        toko_id=toko_id, 
-        status='PAID'
-    ).count()
+    totals = StoreStats.totals(toko_id)
+    total_revenue = totals['revenue']
+    total_orders = totals['orders']
     
     total_customers = Customer.query.filter_by(toko_id=toko_id).count()
     
     # Calculate Avg Order Value
     aov = total_revenue / total_orders if total_orders > 0 else 0
     
-    # Repeat Customers (Retention)
-    repeat_customers = db.session.query(Transaction.customer_hp).filter_by(
-        toko_id=toko_id, status='PAID'
-    ).group_by(Transaction.customer_hp).having(func.count(Transaction.id) > 1).count()
-    
-    paid_customers = db.session.query(Transaction.customer_hp).filter_by(
-        toko_id=toko_id, status='PAID'
-    ).distinct().count()
+    # Repeat Customers (Retention): each customer is counted once on the day of their
+    # first paid order and once on the day of their second
+    repeat_customers = totals['repeat_buyers']
+    paid_customers = totals['first_buyers']
     
     retention_rate = (repeat_customers / paid_customers * 100) if paid_customers > 0 else 0
     
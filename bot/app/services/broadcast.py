@@ -1,13 +1,17 @@
+import asyncio
 import time
+from collections import deque
 from datetime import datetime, timedelta
-import json
 import random
 import logging
-import requests
 from app.extensions import db
-from app.models import BroadcastJob, Toko, SystemConfig, BroadcastBlacklist
+from app.models import BroadcastJob, BroadcastTarget, Toko, SystemConfig
 from app.services.waha import kirim_waha_raw
 from app.services.humanizer import Humanizer
+from app.services.metrics import Metrics
+from app.services.broadcast_manager import BroadcastManager
+from app.services.opt_out_manager import BlacklistCache
+from app.services.wa_existence import WaExistenceCache
 
 def get_maintenance_mode():
     try:
@@ -48,325 +52,554 @@ def calculate_progressive_delay(message_count: int) -> float:
     return delay
 
 
-def send_with_retry(phone: str, message: str, session: str, max_retries: int = 3) -> bool:
+# Job lock held per pre-check chunk (renewed before each chunk, released when the pre-check ends)
+PRECHECK_LOCK_SECONDS = 120
+
+
+def _runnable_filter():
+    """PENDING/RUNNING jobs whose pacing lock has expired"""
+    return db.and_(
+        BroadcastJob.status.in_(['PENDING', 'RUNNING']),
+        (BroadcastJob.locked_until == None) | (BroadcastJob.locked_until <= datetime.utcnow())
+    )
+
+
+def _job_session_column():
+    """Session of a job: SUPERADMIN jobs use MASTER_SESSION, merchant jobs their Toko session (outer join to Toko)"""
+    from app.config import Config
+    return db.case(
+        (db.and_(BroadcastJob.toko_id != 'SUPERADMIN', Toko.session_name != None, Toko.session_name != ''),
+         Toko.session_name),
+        else_=Config.MASTER_SESSION
+    )
+
+
+def _runnable_jobs(*columns):
+    """Columns of runnable jobs, joined to their Toko in the same query"""
+    return db.session.query(*columns).select_from(BroadcastJob) \
+        .outerjoin(Toko, Toko.id == BroadcastJob.toko_id) \
+        .filter(_runnable_filter())
+
+
+def find_runnable_sessions() -> set:
+    """Session names that currently have at least one runnable job"""
+    if get_maintenance_mode() or get_panic_mode():
+        return set()
+    return {session_name for session_name, in _runnable_jobs(_job_session_column()).distinct()}
+
+
+def _notify_completion(job, total: int):
+    """Send completion alert to the job owner (Phase 8E: Alerts)"""
+    from app.feature_flags import FeatureFlags
+    if not FeatureFlags.is_alerts_enabled():
+        return
+    from app.config import Config
+    toko = Toko.query.get(job.toko_id)
+    completion_msg = (
+        f"✅ *Broadcast Selesai!*\n\n"
+        f"📊 Total: {total}\n"
+        f"✅ Terkirim: {job.processed_count}\n"
+        f"🕐 Job ID: #{job.id}"
+    )
+    try:
+        n_session = Config.MASTER_SESSION if job.toko_id == 'SUPERADMIN' else (toko.session_name if toko else Config.MASTER_SESSION)
+        kirim_waha_raw(job.toko_id, completion_msg, n_session)
+    except Exception as e:
+        logging.error(f"Failed to send completion notification: {e}")
+
+
+def pick_next_tenant(toko_ids: list, last_toko_id: str = None) -> str:
     """
-    Send message with retry logic and exponential backoff
-    
-    Args:
-        phone: Target phone number
-        message: Message to send
-        session: Session name
-        max_retries: Maximum retry attempts
-        
+    Round-robin over tenants: the first toko_id (sorted) after last_toko_id, wrapping around.
+    A merchant with many queued jobs gets the same share of a session as one with a single job.
+    """
+    ordered = sorted(set(toko_ids))
+    if not ordered:
+        return None
+    if last_toko_id is not None:
+        for toko_id in ordered:
+            if toko_id > last_toko_id:
+                return toko_id
+    return ordered[0]
+
+
+def _claim_order(candidates: list, last_toko_id: str = None) -> list:
+    """
+    Job ids in the order a session should try to claim them: tenants round-robin starting
+    after last_toko_id, each tenant's jobs oldest first.
+    """
+    first = pick_next_tenant([toko_id for _, toko_id in candidates], last_toko_id)
+    if first is None:
+        return []
+    tenants = sorted({toko_id for _, toko_id in candidates})
+    start = tenants.index(first)
+    rank = {toko_id: (i - start) % len(tenants) for i, toko_id in enumerate(tenants)}
+    return [job_id for job_id, toko_id in sorted(candidates, key=lambda c: (rank[c[1]], c[0]))]
+
+
+class SessionRateLimiter:
+    """
+    Sliding-window send cap for one WAHA session.
+    Hard ceiling on top of calculate_progressive_delay, which counts messages per job, not per session.
+    """
+
+    def __init__(self, max_per_window: int, window_seconds: float = 3600):
+        self.max_per_window = max(1, max_per_window)
+        self.window_seconds = window_seconds
+        self._sent = deque()
+
+    def wait_time(self, now: float = None) -> float:
+        """Seconds until the next send is allowed (0 if allowed now)"""
+        now = time.monotonic() if now is None else now
+        while self._sent and now - self._sent[0] >= self.window_seconds:
+            self._sent.popleft()
+        if len(self._sent) < self.max_per_window:
+            return 0.0
+        return self._sent[0] + self.window_seconds - now
+
+    def record(self, now: float = None):
+        self._sent.append(time.monotonic() if now is None else now)
+
+
+def prepare_next_target(session_name: str, variation_cache: dict, last_toko_id: str = None,
+                        prechecked: set = None) -> dict:
+    """
+    Claim the next runnable job for a session and prepare its next message.
+    Tenants sharing a session are served round-robin; jobs of one tenant in FIFO order.
+    Runs in a worker thread inside an app context (DB + blocking calls only).
+    Jobs missing from prechecked (when given) get an existence pre-check before their first send.
+
+    Returns a plan dict with 'action':
+        idle - no runnable job for this session
+        wait - retry after plan['seconds']
+        next - state changed (skip/complete), prepare again immediately
+        precheck - check plan['job_id']'s numbers, then prepare again
+        send - plan carries job_id, toko_id, idx, phone, message, total, lag
+    """
+    if get_maintenance_mode() or get_panic_mode():
+        return {'action': 'wait', 'seconds': 30}
+
+    # This session's runnable jobs (no locks), then lock only the one picked:
+    # oldest job of the next tenant in turn, or the following one if another worker holds it
+    candidates = _runnable_jobs(BroadcastJob.id, BroadcastJob.toko_id) \
+        .filter(_job_session_column() == session_name).all()
+    job = None
+    for job_id in _claim_order(candidates, last_toko_id):
+        job = BroadcastJob.query.filter(BroadcastJob.id == job_id, _runnable_filter()) \
+            .with_for_update(skip_locked=True).first()
+        if job:
+            break
+    if job is None:
+        db.session.rollback()
+        return {'action': 'idle'}
+
+    # Scheduling lag: how long the job has been runnable without being served
+    due_at = job.locked_until or job.created_at or datetime.utcnow()
+    lag = max(0.0, (datetime.utcnow() - due_at).total_seconds())
+
+    # Safety Bridge: Lock the job immediately so nothing else picks it up
+    job.locked_until = datetime.utcnow() + timedelta(minutes=1)
+
+    # Legacy jobs only have the target_list JSON until their first claim
+    BroadcastManager.ensure_targets(job)
+
+    # Mark as running if PENDING (new jobs and retries) and drop blacklisted targets in one pass
+    if job.status == 'PENDING':
+        job.status = 'RUNNING'
+        skipped = BroadcastManager.skip_blacklisted_targets(job)
+        logging.info(f"🚀 Job #{job.id} started ({skipped} blacklisted targets skipped)")
+
+    db.session.commit()  # Row lock released here, but logic lock (locked_until) keeps it safe
+
+    # Check if completed (successes from a previous run are never pending again)
+    has_pending = BroadcastTarget.query.filter_by(job_id=job.id, status='pending').first() is not None
+    if not has_pending:
+        job.status = 'COMPLETED'
+        job.updated_at = datetime.utcnow()
+        progress = BroadcastManager.sync_counters(job)
+        db.session.commit()
+        _notify_completion(job, progress['total'] if progress else 0)
+        variation_cache.pop(job.id, None)
+        return {'action': 'next', 'toko_id': job.toko_id, 'completed_job_id': job.id}
+
+    # 1. Verify Session Status before processing (Smart Guard)
+    from app.services.waha import check_session_status
+    sess_status = check_session_status(session_name)
+    if sess_status != 'WORKING':
+        logging.warning(f"⏸️ Job #{job.id} paused: Session {session_name} is {sess_status}")
+        job.status = 'PENDING'
+        db.session.commit()
+        return {'action': 'wait', 'seconds': 60}
+
+    # 2. Pre-flight: existence check of the job's numbers before its first send (job stays locked)
+    if prechecked is not None and job.id not in prechecked:
+        job.locked_until = datetime.utcnow() + timedelta(seconds=PRECHECK_LOCK_SECONDS)
+        db.session.commit()
+        return {'action': 'precheck', 'job_id': job.id, 'toko_id': job.toko_id}
+
+    # 3. Claim the next pending target row
+    target = BroadcastTarget.query.filter_by(job_id=job.id, status='pending') \
+        .order_by(BroadcastTarget.idx).with_for_update(skip_locked=True).first()
+    if not target:
+        db.session.rollback()
+        return {'action': 'next', 'toko_id': job.toko_id}
+    target.status = 'sending'
+    db.session.commit()
+
+    # 4. Generate variations (AI-powered) once per job
+    if job.id not in variation_cache:
+        from app.services.message_variation import generate_message_variations
+        try:
+            variation_cache[job.id] = generate_message_variations(job.pesan, count=10)
+        except Exception as ai_err:
+            logging.error(f"AI Variation Error: {ai_err}")
+            variation_cache[job.id] = [job.pesan]  # Fallback to original
+    variations = variation_cache[job.id] or [job.pesan]
+
+    from app.utils import normalize_phone_number
+    phone = normalize_phone_number(target.phone or '')
+    if BlacklistCache.contains(phone):  # Opt-outs that arrived after the job started
+        logging.info(f"Skipping {phone}: blacklisted")
+        target.status = 'skipped'
+        target.error = 'Blacklisted'
+        BroadcastManager.sync_counters(job)
+        db.session.commit()
+        return {'action': 'next', 'toko_id': job.toko_id}
+
+    # Render
+    variation_idx = target.idx % len(variations)
+    message_template = variations[variation_idx]
+    from app.services.message_variation import render_personalized_message
+    final_message = render_personalized_message(message_template, {'nama': target.name or ''})
+
+    # MANDATORY HUMANIZER (Anti-Block Shield)
+    # Apply physical variations (typos, invisible chars) to EVERY SINGLE MESSAGE
+    final_message = Humanizer.humanize_text(final_message)
+
+    # 5. Protective lock for the network calls
+    job.locked_until = datetime.utcnow() + timedelta(minutes=2)
+    total = BroadcastTarget.query.filter_by(job_id=job.id).count()
+    db.session.commit()
+
+    return {
+        'action': 'send',
+        'job_id': job.id,
+        'toko_id': job.toko_id,
+        'target_id': target.id,
+        'idx': target.idx,
+        'total': total,
+        'phone': phone,
+        'message': final_message,
+        'lag': lag,
+        'on_whatsapp': WaExistenceCache.get(phone),  # None = not cached, check live
+    }
+
+
+def hold_job_lock(job_id: int, seconds: float):
+    """Keep a job locked to this lane for another `seconds` (0 = runnable again now)"""
+    BroadcastJob.query.filter_by(id=job_id).update(
+        {'locked_until': datetime.utcnow() + timedelta(seconds=seconds)}, synchronize_session=False
+    )
+    db.session.commit()
+
+
+def pending_target_phones(job_id: int) -> list:
+    """Normalized numbers of a job's pending targets (input for the existence pre-check)"""
+    from app.utils import normalize_phone_number
+    rows = db.session.query(BroadcastTarget.phone).filter_by(job_id=job_id, status='pending').all()
+    return [normalize_phone_number(phone) for phone, in rows if phone]
+
+
+def record_not_on_whatsapp(plan: dict, consecutive_skips: int):
+    """Mark a target skipped after the WA existence check (Anti-Spam Shield)"""
+    from app.config import Config
+    job = BroadcastJob.query.get(plan['job_id'])
+    target = BroadcastTarget.query.get(plan['target_id'])
+    if not job or not target:
+        return
+
+    logging.warning(f"🛡️ Skipping {plan['phone']}: Not on WhatsApp. Protecting account.")
+    target.status = 'skipped'
+    target.error = 'Not on WhatsApp'
+    BroadcastManager.sync_counters(job)
+
+    if consecutive_skips >= 10:
+        job.status = 'PAUSED'  # LOCK IT
+        logging.critical("🚨 EMERGENCY PAUSE: 10 consecutive non-WA numbers detected!")
+        try:
+            kirim_waha_raw(job.toko_id, "🚨 *BROADCAST DI-PAUSE*: Terdeteksi 10 nomor non-WA berturut-turut. Mohon cek kualitas daftar kontak Anda demi keamanan akun.", Config.MASTER_SESSION)
+        except: pass
+
+    db.session.commit()
+
+
+def record_send_result(plan: dict, success: bool, final_message: str, consecutive_failures: int) -> float:
+    """
+    Persist the outcome of one send and set the pacing lock.
+
     Returns:
-        True if sent successfully, False otherwise
+        Seconds the session should wait before its next message
     """
-    for attempt in range(max_retries):
+    from app.config import Config
+    job = BroadcastJob.query.get(plan['job_id'])
+    target = BroadcastTarget.query.get(plan['target_id'])
+    if not job or not target:
+        return 0
+    idx = plan['idx']
+    phone = plan['phone']
+
+    # Granular Statistics (Phase 10A)
+    if success:
+        target.status = 'success'
+        target.error = None
+        target.sent_at = datetime.utcnow()
+
+        # Update Customer Context for AI Replies (Phase 10B)
+        try:
+            from app.models import Customer
+            customer = Customer.query.filter_by(toko_id=job.toko_id, nomor_hp=phone).first()
+            if customer:
+                customer.last_broadcast_msg = final_message
+                customer.last_broadcast_at = datetime.utcnow()
+                customer.broadcast_reply_count = 0  # Reset safety fuse
+        except Exception as context_err:
+            logging.error(f"Failed to update customer context: {context_err}")
+    else:
+        target.status = 'failed'
+        target.error = "Delivery Failed (WAHA Error or Network Issue)"
+
+        try:
+            from app.services.error_monitoring import ErrorMonitor
+            ErrorMonitor.log_error("WAHA_DELIVERY_FAILURE", f"Job #{job.id} -> {phone}", severity="ERROR")
+        except: pass
+
+    # IMMEDIATE PROGRESS UPDATE (Fixes UI Lag)
+    BroadcastManager.sync_counters(job)
+
+    # SMART CIRCUIT BREAKER: Pause after 5 consecutive failures (Limit Risk)
+    if not success and consecutive_failures >= 5:
+        job.status = 'PAUSED'  # LOCK IT
+        logging.critical(f"🚨 EMERGENCY PAUSE: 5 consecutive failures detected for Job #{job.id}!")
+        target.error = "Delivery Failed & Job Paused (Circuit Breaker Triggered)"
+
         try:
-            kirim_waha_raw(phone, message, session)
-            return True
-        except requests.exceptions.RequestException as e:
-            error_str = str(e).lower()
-            
-            # Check for rate limit
-            if '429' in error_str or 'rate limit' in error_str:
-                logging.warning(f"Rate limited! Pausing for 5 minutes...")
-                time.sleep(300)  # 5 minutes
-                continue
-            
-            # Check for ban
-            if 'banned' in error_str or '403' in error_str:
-                logging.critical(f"Account may be banned! Error: {e}")
-                return False
-            
-            # Regular retry with exponential backoff
-            if attempt < max_retries - 1:
-                wait_time = 2 ** attempt  # 1s, 2s, 4s
-                logging.warning(f"Retry {attempt + 1}/{max_retries} for {phone} in {wait_time}s. Error: {e}")
-                time.sleep(wait_time)
+            pause_msg = (
+                f"🚨 *BROADCAST DI-PAUSE OTOMATIS*\n"
+                f"Terdeteksi 5 kegagalan berturut-turut pada Job #{job.id}.\n"
+                f"Demi keamanan akun, broadcast dihentikan sementara.\n"
+                f"👉 Cek koneksi WAHA / Kualitas nomor tujuan."
+            )
+            kirim_waha_raw(job.toko_id, pause_msg, Config.MASTER_SESSION)
+        except: pass
+
+        # Add a 5-minute safety lock even if paused, just in case
+        job.locked_until = datetime.utcnow() + timedelta(minutes=5)
+        db.session.commit()
+        return 0
+
+    # Calculate safety delay and release the protective lock after it
+    delay_seconds = calculate_progressive_delay(idx + 1)
+    job.locked_until = datetime.utcnow() + timedelta(seconds=delay_seconds)
+    db.session.commit()
+
+    if success:
+        logging.info(f"✅ Sent {idx + 1}/{plan['total']} to {phone}")
+    else:
+        logging.error(f"❌ Failed to send to {phone}")
+
+    return delay_seconds
+
+
+class BroadcastEngine:
+    """
+    Asyncio broadcast scheduler: one event loop, one lane (coroutine) per WAHA session.
+    Lanes for different sessions run concurrently; each lane sends sequentially
+    with its own anti-ban pacing and rate limiter, serving its tenants round-robin.
+    At most BROADCAST_MAX_ACTIVE_SESSIONS lanes send at the same time (FIFO slots,
+    released during pacing sleeps). DB work runs via asyncio.to_thread inside an
+    app context, WAHA calls go through AsyncWahaClient.
+    """
+
+    POLL_INTERVAL = 5  # seconds between scans for new runnable sessions
+
+    def __init__(self, app):
+        self.app = app
+        self.client = None
+        self.slots = None
+        self.lanes = {}  # session_name -> asyncio.Task
+        self.limiters = {}  # session_name -> SessionRateLimiter
+        self.variation_cache = {}  # job_id -> list of message variations
+        self.prechecked = set()  # job ids whose pre-check ran (dropped when the job completes)
+
+    def _call_in_app(self, func, *args):
+        with self.app.app_context():
+            try:
+                return func(*args)
+            except Exception:
+                db.session.rollback()
+                raise
+
+    async def in_app(self, func, *args):
+        """Run a blocking DB function in a worker thread with an app context"""
+        return await asyncio.to_thread(self._call_in_app, func, *args)
+
+    async def run(self):
+        from app.config import Config
+        from app.services.waha_async import AsyncWahaClient
+        self.client = AsyncWahaClient()
+        self.slots = asyncio.Semaphore(max(1, Config.BROADCAST_MAX_ACTIVE_SESSIONS))
+        try:
+            while True:
+                try:
+                    sessions = await self.in_app(find_runnable_sessions)
+                    for session_name in sessions:
+                        lane = self.lanes.get(session_name)
+                        if lane is None or lane.done():
+                            self.lanes[session_name] = asyncio.create_task(
+                                self.run_lane(session_name), name=f"broadcast:{session_name}"
+                            )
+                    Metrics.set_gauge('broadcast.active_lanes', sum(1 for t in self.lanes.values() if not t.done()))
+                except Exception as e:
+                    logging.error(f"Broadcast engine loop error: {e}")
+                await asyncio.sleep(self.POLL_INTERVAL)
+        finally:
+            await self.client.aclose()
+
+    async def run_lane(self, session_name: str):
+        """Drive all jobs of one session until none is runnable"""
+        from app.config import Config
+        limiter = self.limiters.setdefault(
+            session_name, SessionRateLimiter(Config.BROADCAST_SESSION_MAX_PER_HOUR)
+        )
+        lane = {'last_toko_id': None, 'skips': 0, 'failures': 0}
+        logging.info(f"📡 Broadcast lane started for session {session_name}")
+
+        while True:
+            try:
+                # Session rate cap: wait without holding a send slot
+                wait = limiter.wait_time()
+                if wait > 0:
+                    logging.warning(f"⏳ Session {session_name} hit {limiter.max_per_window}/h cap, waiting {wait:.0f}s")
+                    Metrics.incr(f'broadcast.rate_limited.{session_name}')
+                    await asyncio.sleep(wait)
+                    continue
+
+                async with self.slots:
+                    pause = await self._serve_one(session_name, lane, limiter)
+
+                if pause is None:
+                    logging.info(f"📡 Broadcast lane idle for session {session_name}")
+                    return
+                if pause > 0:
+                    await asyncio.sleep(pause)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Broadcast lane error ({session_name}): {e}")
+                await asyncio.sleep(5)
+
+    async def _serve_one(self, session_name: str, lane: dict, limiter: SessionRateLimiter):
+        """
+        Prepare and send one message for a session.
+
+        Returns:
+            Seconds to pause before the next message, or None when the session is idle
+        """
+        plan = await self.in_app(
+            prepare_next_target, session_name, self.variation_cache, lane['last_toko_id'], self.prechecked
+        )
+        action = plan['action']
+
+        if action == 'idle':
+            return None
+        if action == 'wait':
+            return plan['seconds']
+        if action == 'precheck':
+            # Same job again right after (no tenant rotation): its first send finds the numbers cached
+            await self.precheck_job(plan['job_id'], session_name)
+            self.prechecked.add(plan['job_id'])
+            return 0
+        lane['last_toko_id'] = plan['toko_id']
+        if action == 'next':
+            self.prechecked.discard(plan.get('completed_job_id'))
+            return 0
+
+        Metrics.observe(f'broadcast.lag.{session_name}', plan['lag'])
+        Metrics.set_gauge(f'broadcast.lag_seconds.{session_name}', round(plan['lag'], 1))
+
+        # WA Existence Check (Anti-Spam Shield): cached by the pre-check, else live (fallback True on API errors)
+        on_whatsapp = plan['on_whatsapp']
+        if on_whatsapp is None:
+            on_whatsapp = await self.client.lookup_exists(plan['phone'], session_name)
+            if on_whatsapp is None:
+                on_whatsapp = True
             else:
-                logging.error(f"Failed to send to {phone} after {max_retries} attempts: {e}")
-                return False
-    
-    return False
+                await self.in_app(WaExistenceCache.store, {plan['phone']: on_whatsapp})
+
+        if not on_whatsapp:
+            lane['skips'] += 1
+            await self.in_app(record_not_on_whatsapp, plan, lane['skips'])
+            return 0
+        lane['skips'] = 0
+
+        # Typing delay (adaptive, capped at 8s like kirim_waha)
+        delay_info = Humanizer.get_adaptive_delay(plan['message'])
+        await asyncio.sleep(min(delay_info['latency'] + delay_info['typing'], 8.0))
+
+        success = await self.client.send_text(plan['phone'], plan['message'], session_name)
+        limiter.record()
+        Metrics.incr(f"broadcast.{'sent' if success else 'failed'}.{session_name}")
+        lane['failures'] = 0 if success else lane['failures'] + 1
+
+        delay_seconds = await self.in_app(record_send_result, plan, success, plan['message'], lane['failures'])
+        return max(delay_seconds, 0.5)
+
+    async def precheck_job(self, job_id: int, session_name: str):
+        """
+        Bulk existence check of a job's uncached numbers before its first send (results cached).
+        Runs in chunks with bounded concurrency, renewing the job lock before each chunk.
+        Not counted by SessionRateLimiter: check-exists sends nothing to the contact, and the
+        limiter caps outgoing messages (the ban risk), not WAHA reads.
+        """
+        from app.config import Config
+        concurrency = max(1, Config.WA_EXISTS_PRECHECK_CONCURRENCY)
+        chunk = concurrency * 10
+        try:
+            phones = await self.in_app(pending_target_phones, job_id)
+            uncached = await self.in_app(WaExistenceCache.get_uncached, phones)
+            if not uncached:
+                return
+            start = time.perf_counter()
+            not_on_wa = 0
+            for i in range(0, len(uncached), chunk):
+                await self.in_app(hold_job_lock, job_id, PRECHECK_LOCK_SECONDS)
+                results = await self.client.check_exists_many(uncached[i:i + chunk], session_name, concurrency=concurrency)
+                await self.in_app(WaExistenceCache.store, results)
+                not_on_wa += sum(1 for exists in results.values() if exists is False)
+            Metrics.observe('broadcast.precheck', time.perf_counter() - start)
+            logging.info(f"🔎 Job #{job_id} pre-check: {len(uncached)} numbers checked, {not_on_wa} not on WhatsApp")
+        except Exception as e:
+            logging.error(f"Existence pre-check failed for job #{job_id}: {e}")
+        finally:
+            try:
+                await self.in_app(hold_job_lock, job_id, 0)
+            except Exception as e:
+                logging.error(f"Failed to release job #{job_id} after pre-check: {e}")
 
 
 def worker_broadcast(app):
+    """Background worker entrypoint: runs the asyncio BroadcastEngine in this thread"""
     with app.app_context():
         # Reset stuck jobs on startup
         BroadcastJob.query.filter_by(status='RUNNING').update({'status': 'PENDING'})
+        # Targets interrupted mid-send are sent again (same as the old cursor behaviour)
+        BroadcastTarget.query.filter_by(status='sending').update({'status': 'pending'})
         db.session.commit()
-        
+
     while True:
-        with app.app_context():
-            try:
-                # 1. Non-blocking query: Look for RUNNING/PENDING jobs that ARE NOT currently locked
-                # This allows other workers to check the job but still ensures sequential processing per job
-                job = BroadcastJob.query.filter(
-                    (BroadcastJob.status.in_(['PENDING', 'RUNNING'])),
-                    (BroadcastJob.locked_until == None) | (BroadcastJob.locked_until <= datetime.utcnow())
-                ).with_for_update(skip_locked=True).first()
-                
-                if job and not get_maintenance_mode() and not get_panic_mode():
-                    from app.services.message_variation import generate_message_variations
-                    
-                    # Mark as running if PENDING
-                    if job.status == 'PENDING':
-                        job.status = 'RUNNING'
-                        logging.info(f"🚀 Job #{job.id} started")
-                    
-                    # Safety Bridge: Lock the job immediately to prevent other workers from picking it up
-                    # when the DB row lock is released by the next commit.
-                    job.locked_until = datetime.utcnow() + timedelta(minutes=1)
-                    db.session.commit() # Row lock released here, but logic lock (locked_until) keeps it safe
-                    
-                    # Refresh targets
-                    targets = json.loads(job.target_list)
-                    
-                    # Check if completed
-                    if job.processed_count >= len(targets):
-                        job.status = 'COMPLETED'
-                        db.session.commit()
-                        
-                        # Notify completion (Phase 8E: Alerts)
-                        from app.feature_flags import FeatureFlags
-                        if FeatureFlags.is_alerts_enabled():
-                            # ... (notification logic) ...
-                            from app.config import Config
-                            toko = Toko.query.get(job.toko_id)
-                            success_rate = 100 # Simplification for notification
-                            completion_msg = (
-                                f"✅ *Broadcast Selesai!*\n\n"
-                                f"📊 Total: {len(targets)}\n"
-                                f"✅ Terkirim: {job.processed_count}\n"
-                                f"🕐 Job ID: #{job.id}"
-                            )
-                            try:
-                                n_session = Config.MASTER_SESSION if job.toko_id == 'SUPERADMIN' else (toko.session_name if toko else Config.MASTER_SESSION)
-                                from app.services.waha import kirim_waha_raw
-                                kirim_waha_raw(job.toko_id, completion_msg, n_session)
-                            except Exception as e:
-                                logging.error(f"Failed to send completion notification: {e}")
-                        continue
-
-                    try:
-                        # 1. Verify Session Status before processing (Smart Guard)
-                        from app.services.waha import check_session_status
-                        from app.config import Config
-                        session_name = Config.MASTER_SESSION
-                        session_name = Config.MASTER_SESSION
-                        if job.toko_id != 'SUPERADMIN':
-                            toko = Toko.query.get(job.toko_id)
-                            if toko: session_name = toko.session_name
-                        
-                        sess_status = check_session_status(session_name)
-                        if sess_status != 'WORKING':
-                            logging.warning(f"⏸️ Job #{job.id} paused: Session {session_name} is {sess_status}")
-                            job.status = 'PENDING'
-                            db.session.commit()
-                            continue 
-
-                        # 2. Sequential Check: Progress Cursor
-                        idx = job.processed_count
-                        
-                        # 3. SELECTIVE RETRY: Skip targets that are already 'success'
-                        while idx < len(targets) and targets[idx].get('status') == 'success':
-                            idx += 1
-                        
-                        if idx >= len(targets):
-                            job.status = 'COMPLETED'
-                            job.updated_at = datetime.utcnow()
-                            db.session.commit()
-                            continue
-                        
-                        # Update cursor for the worker
-                        job.processed_count = idx
-                        db.session.commit()
-
-                        # 4. Generate variations (AI-powered) if not already done
-                        from app.services.message_variation import generate_message_variations
-                        try:
-                            if 'current_job_id' not in locals() or current_job_id != job.id:
-                                global_variations = generate_message_variations(job.pesan, count=10)
-                                current_job_id = job.id
-                            variations = global_variations
-                        except Exception as ai_err:
-                            logging.error(f"AI Variation Error: {ai_err}")
-                            variations = [job.pesan] # Fallback to original
-                        
-                        # Get target details
-                        target = targets[idx]
-                        
-                        # ROBUST FIX: Auto-convert string targets to dicts on the fly
-                        # This prevents "TypeError: 'str' object does not support item assignment"
-                        if isinstance(target, str):
-                            target = {'phone': target, 'name': ''}
-                            targets[idx] = target
-                            # Sync back to DB immediately to fix the data structure permanently
-                            job.target_list = json.dumps(targets)
-                            
-                        from app.utils import normalize_phone_number
-                        phone = normalize_phone_number(target.get('phone', target.get('phone_number', '')))
-                        name = target.get('name', target.get('nama', ''))
-                        is_blacklisted = BroadcastBlacklist.query.filter_by(phone_number=phone).first()
-                        if is_blacklisted:
-                            logging.info(f"Skipping {phone}: blacklisted")
-                            targets[idx]['status'] = 'skipped'
-                            job.target_list = json.dumps(targets)
-                            job.processed_count += 1
-                            job.skipped_count += 1
-                            db.session.commit()
-                            continue
-
-                        # 4. WA Existence Check (Anti-Spam Shield)
-                        from app.services.waha import check_exists
-                        from app.config import Config
-                        
-                        # Get session: SUPERADMIN uses MASTER_SESSION, others use Toko session
-                        session_name = Config.MASTER_SESSION
-                        if job.toko_id != 'SUPERADMIN':
-                            toko = Toko.query.get(job.toko_id)
-                            if toko: session_name = toko.session_name
-
-                        if not check_exists(phone, session_name=session_name):
-                            logging.warning(f"🛡️ Skipping {phone}: Not on WhatsApp. Protecting account.")
-                            targets[idx]['status'] = 'skipped'
-                            job.target_list = json.dumps(targets)
-                            job.processed_count += 1
-                            job.skipped_count += 1
-                            
-                            # Track consecutive skips for emergency pause
-                            if not hasattr(worker_broadcast, 'consecutive_skips'):
-                                worker_broadcast.consecutive_skips = 0
-                            worker_broadcast.consecutive_skips += 1
-                            
-                            if worker_broadcast.consecutive_skips >= 10:
-                                job.status = 'PAUSED' # LOCK IT
-                                logging.critical("🚨 EMERGENCY PAUSE: 10 consecutive non-WA numbers detected!")
-                                try:
-                                    from app.services.waha import kirim_waha_raw
-                                    kirim_waha_raw(job.toko_id, "🚨 *BROADCAST DI-PAUSE*: Terdeteksi 10 nomor non-WA berturut-turut. Mohon cek kualitas daftar kontak Anda demi keamanan akun.", Config.MASTER_SESSION)
-                                except: pass
-                            
-                            db.session.commit()
-                            continue
-                        
-                        # Reset consecutive skips if number exists
-                        worker_broadcast.consecutive_skips = 0
-
-                        # Render and send
-                        variation_idx = idx % len(variations)
-                        message_template = variations[variation_idx]
-                        from app.services.message_variation import render_personalized_message
-                        final_message = render_personalized_message(message_template, {'nama': name})
-                        
-                        # 4.5. MANDATORY HUMANIZER (Anti-Block Shield)
-                        # Apply physical variations (typos, invisible chars) to EVERY SINGLE MESSAGE
-                        # This protects us even if AI Variation fails and returns identical templates.
-                        final_message = Humanizer.humanize_text(final_message)
-
-                        # 5. Tracking: Set 'sending' status and protective lock
-                        targets[idx]['status'] = 'sending'
-                        job.target_list = json.dumps(targets)
-                        # Protect the job from other workers while we are doing the network call
-                        job.locked_until = datetime.utcnow() + timedelta(minutes=2)
-                        db.session.commit() # Lock released, but locked_until protects it
-
-                        from app.services.waha import kirim_waha
-                        # Get session: SUPERADMIN uses MASTER_SESSION, others use Toko session
-                        # This block is redundant as session_name is already determined above, but keeping for consistency with original.
-                        # session_name = Config.MASTER_SESSION
-                        # if job.toko_id != 'SUPERADMIN':
-                        #     toko = Toko.query.get(job.toko_id)
-                        #     if toko: session_name = toko.session_name
-
-                        success = kirim_waha(phone, final_message, session_name=session_name, add_delay=True, use_adaptive_delay=True)
-                        
-                        # 5. Granular Statistics (Phase 10A)
-                        if success:
-                            job.success_count += 1
-                            targets[idx]['status'] = 'success' # Update status
-                            worker_broadcast.consecutive_failures = 0 # Reset on success
-                            
-                            # Update Customer Context for AI Replies (Phase 10B)
-                            try:
-                                from app.models import Customer
-                                customer = Customer.query.filter_by(toko_id=job.toko_id, nomor_hp=phone).first()
-                                if customer:
-                                    customer.last_broadcast_msg = final_message
-                                    customer.last_broadcast_at = datetime.utcnow()
-                                    customer.broadcast_reply_count = 0 # Reset safety fuse
-                                    db.session.commit()
-                            except Exception as context_err:
-                                logging.error(f"Failed to update customer context: {context_err}")
-                                db.session.rollback()
-                        else:
-                            job.failed_count += 1
-                            targets[idx]['status'] = 'failed' # Update status
-                            
-                            # Capture error reason (Enhanced Logging)
-                            # 'success' variable from kirim_waha is just boolean, but we can capture context if needed
-                            # Ideally kirim_waha should return (success, error_msg) tuple, but for now we assume generic Delivery Failed if no exception
-                            targets[idx]['error'] = "Delivery Failed (WAHA Error or Network Issue)"
-                            
-                            # Track consecutive failures for emergency pause (Session Down/Blocked)
-                            if not hasattr(worker_broadcast, 'consecutive_failures'):
-                                worker_broadcast.consecutive_failures = 0
-                            worker_broadcast.consecutive_failures += 1
-                            
-                            # SMART CIRCUIT BREAKER: Pause after 5 consecutive failures (Limit Risk)
-                            if worker_broadcast.consecutive_failures >= 5:
-                                job.status = 'PAUSED' # LOCK IT
-                                logging.critical(f"🚨 EMERGENCY PAUSE: 5 consecutive failures detected for Job #{job.id}!")
-                                
-                                # Add system note to job target list
-                                targets[idx]['error'] = "Delivery Failed & Job Paused (Circuit Breaker Triggered)"
-                                
-                                try:
-                                    from app.services.waha import kirim_waha_raw
-                                    pause_msg = (
-                                        f"🚨 *BROADCAST DI-PAUSE OTOMATIS*\n"
-                                        f"Terdeteksi 5 kegagalan berturut-turut pada Job #{job.id}.\n"
-                                        f"Demi keamanan akun, broadcast dihentikan sementara.\n"
-                                        f"👉 Cek koneksi WAHA / Kualitas nomor tujuan."
-                                    )
-                                    kirim_waha_raw(job.toko_id, pause_msg, Config.MASTER_SESSION)
-                                except: pass
-                                
-                                # COMMIT & CONTINUE to avoid tight loop
-                                job.target_list = json.dumps(targets) 
-                                # Add a 5-minute safety lock even if paused, just in case
-                                job.locked_until = datetime.utcnow() + timedelta(minutes=5)
-                                db.session.commit()
-                                continue # Move to next job or next poll
-
-                        # 6. Serialization Fix: Update target_list with final status (success/failed)
-                        job.target_list = json.dumps(targets)
-                        
-                        # 6. IMMEDIATE PROGRESS UPDATE (Fixes UI Lag)
-                        job.processed_count += 1
-                        
-                        # 7. Calculate safety delay and release the protective lock
-                        delay_seconds = calculate_progressive_delay(idx + 1)
-                        job.locked_until = datetime.utcnow() + timedelta(seconds=delay_seconds)
-                        
-                        # Commit now to show progress and allow next pickup after delay
-                        db.session.commit()
-                        
-                        if success:
-                            logging.info(f"✅ Sent {idx + 1}/{len(targets)} to {phone}")
-                        else:
-                            logging.error(f"❌ Failed to send to {phone}")
-
-                        time.sleep(0.5) # Stability
-
-                    except Exception as e:
-                        logging.error(f"Error processing target index {idx}: {e}")
-                        db.session.rollback()
-                        time.sleep(5)
-                else:
-                    time.sleep(5)  # No job or maintenance mode
-                    
-            except Exception as e:
-                logging.error(f"Worker loop error: {e}")
-                time.sleep(5)
+        try:
+            asyncio.run(BroadcastEngine(app).run())
+        except Exception as e:
+            logging.error(f"Broadcast engine crashed, restarting: {e}")
+            time.sleep(5)
@@ -7,11 +7,13 @@ import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 from app.extensions import db
-from app.models import BroadcastJob, Subscription, Customer
+from app.models import BroadcastJob, BroadcastTarget, Subscription, Customer
 from app.feature_flags import FeatureFlags
 
 class BroadcastManager:
     """Manages broadcast campaigns for superadmin"""
+
+    TARGET_DONE_STATUSES = ('success', 'failed', 'skipped')
     
     @staticmethod
     def get_segment_targets(segment_name: str) -> List[Dict]:
@@ -120,6 +122,8 @@ class BroadcastManager:
                 status='PENDING'
             )
             db.session.add(job)
+            db.session.flush()
+            BroadcastManager.add_targets(job.id, normalized_targets)
             db.session.commit()
             
             logging.info(f"Created broadcast job {job.id} with {len(normalized_targets)} targets (source: {source})")
@@ -130,6 +134,159 @@ class BroadcastManager:
             db.session.rollback()
             return None
     
+    @staticmethod
+    def normalize_target(target) -> Dict:
+        """Normalize a target entry (phone string or dict with phone/phone_number, name/nama)"""
+        if isinstance(target, str):
+            return {'phone': target, 'name': ''}
+        if isinstance(target, dict):
+            return {
+                'phone': str(target.get('phone', target.get('phone_number', '')) or ''),
+                'name': str(target.get('name', target.get('nama', '')) or ''),
+                'status': target.get('status'),
+                'error': target.get('error'),
+            }
+        return {'phone': str(target), 'name': ''}
+
+    @staticmethod
+    def add_targets(job_id: int, targets: List, processed_count: int = 0):
+        """
+        Insert BroadcastTarget rows for a job (caller commits).
+
+        Args:
+            job_id: BroadcastJob ID (flush first for new jobs)
+            targets: Target list as stored in BroadcastJob.target_list
+            processed_count: Legacy cursor; entries before it without a status count as sent
+        """
+        rows = BroadcastManager.build_target_rows(job_id, targets, processed_count)
+        if rows:
+            db.session.execute(db.insert(BroadcastTarget), rows)
+
+    @staticmethod
+    def build_target_rows(job_id: int, targets: List, processed_count: int = 0) -> List[Dict]:
+        """Map a target_list (new or legacy, with per-target status) to broadcast_target rows"""
+        rows = []
+        for idx, target in enumerate(targets):
+            t = BroadcastManager.normalize_target(target)
+            status = t.get('status')
+            if status not in BroadcastManager.TARGET_DONE_STATUSES:
+                # 'sending' was interrupted mid-flight: the old worker would resend it too
+                status = 'success' if (not status and idx < processed_count) else 'pending'
+            rows.append({
+                'job_id': job_id,
+                'idx': idx,
+                'phone': t['phone'][:50],
+                'name': t['name'][:150],
+                'status': status,
+                'error': str(t['error'])[:255] if t.get('error') else None,
+            })
+        return rows
+
+    @staticmethod
+    def ensure_targets(job: BroadcastJob) -> bool:
+        """
+        Migrate a legacy job (targets only in target_list JSON) to BroadcastTarget rows.
+
+        Returns:
+            True if rows were created
+        """
+        if BroadcastTarget.query.filter_by(job_id=job.id).first():
+            return False
+        targets = json.loads(job.target_list) if job.target_list else []
+        BroadcastManager.add_targets(job.id, targets, job.processed_count or 0)
+        logging.info(f"Migrated job #{job.id} targets to broadcast_target ({len(targets)} rows)")
+        return True
+
+    @staticmethod
+    def get_progress(job_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Per-status target counts from BroadcastTarget (one GROUP BY query).
+
+        Returns:
+            Dict job_id -> {'total', 'processed', 'success', 'failed', 'skipped', 'pending', 'sending'}
+            Jobs without target rows (legacy, not migrated yet) are missing.
+        """
+        if not job_ids:
+            return {}
+        rows = db.session.query(
+            BroadcastTarget.job_id, BroadcastTarget.status, db.func.count(BroadcastTarget.id)
+        ).filter(BroadcastTarget.job_id.in_(job_ids)).group_by(BroadcastTarget.job_id, BroadcastTarget.status).all()
+
+        progress = {}
+        for job_id, status, count in rows:
+            p = progress.setdefault(job_id, {
+                'total': 0, 'processed': 0, 'success': 0, 'failed': 0, 'skipped': 0, 'pending': 0, 'sending': 0
+            })
+            p['total'] += count
+            if status in p:
+                p[status] += count
+            if status in BroadcastManager.TARGET_DONE_STATUSES:
+                p['processed'] += count
+        return progress
+
+    @staticmethod
+    def sync_counters(job: BroadcastJob) -> Dict:
+        """Refresh the job's denormalized counters from target aggregates (caller commits)"""
+        progress = BroadcastManager.get_progress([job.id]).get(job.id)
+        if progress:
+            job.processed_count = progress['processed']
+            job.success_count = progress['success']
+            job.failed_count = progress['failed']
+            job.skipped_count = progress['skipped']
+        return progress
+
+    @staticmethod
+    def get_targets(job: BroadcastJob) -> List[Dict]:
+        """Targets with per-target status in list order (falls back to target_list for legacy jobs)"""
+        rows = BroadcastTarget.query.filter_by(job_id=job.id).order_by(BroadcastTarget.idx).all()
+        if not rows:
+            targets = json.loads(job.target_list) if job.target_list else []
+            return [BroadcastManager.normalize_target(t) for t in targets]
+        return [{'phone': r.phone, 'name': r.name, 'status': r.status, 'error': r.error} for r in rows]
+
+    @staticmethod
+    def get_total_targets(jobs: List[BroadcastJob]) -> Dict[int, int]:
+        """Target count per job (aggregate query, JSON fallback for legacy jobs)"""
+        progress = BroadcastManager.get_progress([job.id for job in jobs])
+        totals = {}
+        for job in jobs:
+            if job.id in progress:
+                totals[job.id] = progress[job.id]['total']
+            else:
+                totals[job.id] = len(json.loads(job.target_list)) if job.target_list else 0
+        return totals
+
+    @staticmethod
+    def skip_blacklisted_targets(job: BroadcastJob) -> int:
+        """
+        Mark every pending blacklisted target of a job as skipped (caller commits).
+
+        Returns:
+            Number of targets skipped
+        """
+        from app.services.opt_out_manager import BlacklistCache
+        pending = db.session.query(BroadcastTarget.id, BroadcastTarget.phone).filter_by(
+            job_id=job.id, status='pending'
+        ).all()
+        _, blacklisted = BlacklistCache.filter_targets([{'id': row_id, 'phone': phone} for row_id, phone in pending])
+        if not blacklisted:
+            return 0
+        BroadcastTarget.query.filter(BroadcastTarget.id.in_([t['id'] for t in blacklisted])).update(
+            {'status': 'skipped', 'error': 'Blacklisted'}, synchronize_session=False
+        )
+        BroadcastManager.sync_counters(job)
+        return len(blacklisted)
+
+    @staticmethod
+    def reset_for_retry(job: BroadcastJob):
+        """Requeue every target that was not delivered (failed/skipped/stuck) and refresh counters"""
+        BroadcastManager.ensure_targets(job)
+        BroadcastTarget.query.filter(
+            BroadcastTarget.job_id == job.id,
+            BroadcastTarget.status != 'success'
+        ).update({'status': 'pending', 'error': None}, synchronize_session=False)
+        BroadcastManager.sync_counters(job)
+
     @staticmethod
     def rescue_stuck_jobs():
         """
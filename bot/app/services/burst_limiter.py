@@ -0,0 +1,149 @@
+"""
+Burst Limiter (Ping-Pong Protection)
+Sliding-window count of bot messages sent to a customer, replacing the per-message
+ChatLog COUNT query. Same semantics: at most BURST_LIMIT bot messages per customer
+within BURST_WINDOW_SECONDS, after which the bot stays silent.
+
+Stores:
+  - 'memory': per-process deques (exact when one process handles all chats, e.g. webhook queue mode)
+  - a file path (default): small local SQLite file shared by all gunicorn workers on the host.
+    Falls back to memory if the file cannot be used.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from app.config import Config
+from app.services.metrics import Metrics
+
+PRUNE_INTERVAL = 60  # seconds between sweeps of expired entries
+
+
+class MemoryBurstStore:
+    """Per-process sliding windows: key -> deque of send timestamps"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = {}
+        self._last_prune = time.monotonic()
+
+    def _trim(self, window: deque, cutoff: float):
+        while window and window[0] < cutoff:
+            window.popleft()
+
+    def record(self, key: str, now: float, window_seconds: float):
+        with self._lock:
+            self._windows.setdefault(key, deque()).append(now)
+            if now - self._last_prune > PRUNE_INTERVAL:
+                self._last_prune = now
+                cutoff = now - window_seconds
+                for k in list(self._windows):
+                    self._trim(self._windows[k], cutoff)
+                    if not self._windows[k]:
+                        del self._windows[k]
+
+    def count(self, key: str, now: float, window_seconds: float) -> int:
+        with self._lock:
+            window = self._windows.get(key)
+            if not window:
+                return 0
+            self._trim(window, now - window_seconds)
+            return len(window)
+
+    def size(self) -> int:
+        return len(self._windows)
+
+
+class SharedBurstStore:
+    """Sliding windows in a local SQLite file, shared by every process on the host"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._last_prune = 0.0
+        self._conn().execute("CREATE TABLE IF NOT EXISTS bot_sends (key TEXT NOT NULL, ts REAL NOT NULL)")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS ix_bot_sends_key_ts ON bot_sends (key, ts)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # Counters only: losing the last writes on a crash is fine
+            self._local.conn = conn
+        return conn
+
+    def record(self, key: str, now: float, window_seconds: float):
+        conn = self._conn()
+        conn.execute("INSERT INTO bot_sends (key, ts) VALUES (?, ?)", (key, now))
+        if now - self._last_prune > PRUNE_INTERVAL:
+            self._last_prune = now
+            conn.execute("DELETE FROM bot_sends WHERE ts < ?", (now - window_seconds,))
+
+    def count(self, key: str, now: float, window_seconds: float) -> int:
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM bot_sends WHERE key = ? AND ts >= ?", (key, now - window_seconds)
+        ).fetchone()
+        return row[0]
+
+    def size(self) -> int:
+        return self._conn().execute("SELECT COUNT(DISTINCT key) FROM bot_sends").fetchone()[0]
+
+
+class BurstLimiter:
+    """Bot-send counter per (toko_id, customer_hp)"""
+
+    _store = None
+    _store_lock = threading.Lock()
+
+    @classmethod
+    def store(cls):
+        if cls._store is None:
+            with cls._store_lock:
+                if cls._store is None:
+                    cls._store = cls._build_store(Config.BURST_LIMITER_STORE)
+        return cls._store
+
+    @staticmethod
+    def _build_store(spec: str):
+        if not spec or spec == 'memory':
+            return MemoryBurstStore()
+        try:
+            return SharedBurstStore(spec)
+        except Exception as e:
+            logging.warning(f"Burst limiter store {spec} unavailable, using process memory: {e}")
+            return MemoryBurstStore()
+
+    @classmethod
+    def use_store(cls, store):
+        """Swap the backing store (tests)"""
+        cls._store = store
+
+    @staticmethod
+    def _key(toko_id: str, customer_hp: str) -> str:
+        return f"{toko_id}:{customer_hp}"
+
+    @classmethod
+    def record_send(cls, toko_id: str, customer_hp: str, now: float = None):
+        """Count one bot message to a customer (AI reply, follow-up nudge)"""
+        try:
+            cls.store().record(cls._key(toko_id, customer_hp), now or time.time(), Config.BURST_WINDOW_SECONDS)
+        except Exception as e:
+            logging.error(f"Burst limiter record error: {e}")
+
+    @classmethod
+    def recent_sends(cls, toko_id: str, customer_hp: str, now: float = None) -> int:
+        return cls.store().count(cls._key(toko_id, customer_hp), now or time.time(), Config.BURST_WINDOW_SECONDS)
+
+    @classmethod
+    def is_silenced(cls, toko_id: str, customer_hp: str, now: float = None) -> bool:
+        """True if the bot already sent BURST_LIMIT messages to this customer within the window"""
+        try:
+            silenced = cls.recent_sends(toko_id, customer_hp, now) >= Config.BURST_LIMIT
+        except Exception as e:
+            logging.error(f"Burst limiter check error: {e}")
+            return False  # Fail open, like a missing ChatLog count
+        if silenced:
+            Metrics.incr('burst.silenced')
+        return silenced
@@ -0,0 +1,166 @@
+"""
+ChatLog Maintenance
+- index_statements(): DDL adding the composite ChatLog indexes to existing databases (create_all
+  only creates indexes together with new tables). Run once via scripts/create_chat_log_indexes.py,
+  which builds them CONCURRENTLY on PostgreSQL instead of blocking writes at startup.
+- Optional monthly range partitioning of chat_log on PostgreSQL
+  (one-time conversion: scripts/partition_chat_log.py), with partitions created ahead of time.
+- Retention: rows older than CHATLOG_RETENTION_DAYS are archived (or dropped) by the daily cron.
+  Partitioned tables detach/drop whole months; plain tables move rows in batches.
+"""
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import text, bindparam
+from app.config import Config
+from app.extensions import db
+from app.models import ChatLog
+
+ARCHIVE_BATCH_SIZE = 5000
+PARTITION_PREFIX = 'chat_log_y'
+
+
+def month_start(d: datetime) -> datetime:
+    return datetime(d.year, d.month, 1)
+
+
+def add_months(d: datetime, months: int) -> datetime:
+    index = d.year * 12 + (d.month - 1) + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(d: datetime) -> str:
+    return f"{PARTITION_PREFIX}{d.year:04d}m{d.month:02d}"
+
+
+def partition_month(name: str):
+    """Month start of a partition table name, or None if it is not a monthly partition"""
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        year, month = name[len(PARTITION_PREFIX):].split('m')
+        return datetime(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+def index_ddl(index, concurrently: str = '') -> str:
+    columns = ", ".join(column.name for column in index.columns)
+    return f"CREATE INDEX {concurrently}IF NOT EXISTS {index.name} ON {index.table.name} ({columns})"
+
+
+def partition_ddl(d: datetime) -> str:
+    start = month_start(d)
+    end = add_months(start, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(start)} PARTITION OF chat_log "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    )
+
+
+class ChatLogMaintenance:
+    """Indexes, partitions and retention for chat_log"""
+
+    @staticmethod
+    def is_postgres() -> bool:
+        return db.engine.dialect.name == 'postgresql'
+
+    @classmethod
+    def is_partitioned(cls) -> bool:
+        if not cls.is_postgres():
+            return False
+        return db.session.execute(text(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = 'chat_log'"
+        )).first() is not None
+
+    @classmethod
+    def index_statements(cls) -> list:
+        """
+        Idempotent CREATE INDEX statements for the declared ChatLog indexes.
+        On PostgreSQL they run CONCURRENTLY (outside a transaction).
+        """
+        concurrently = 'CONCURRENTLY ' if cls.is_postgres() else ''
+        return [index_ddl(index, concurrently) for index in ChatLog.__table__.indexes]
+
+    @classmethod
+    def ensure_partitions(cls, months_ahead: int = None) -> list:
+        """Create this month's and the next N months' partitions (no-op unless partitioned)"""
+        if not cls.is_partitioned():
+            return []
+        months_ahead = Config.CHATLOG_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+        current = month_start(datetime.now())
+        created = []
+        for i in range(months_ahead + 1):
+            month = add_months(current, i)
+            db.session.execute(text(partition_ddl(month)))
+            created.append(partition_name(month))
+        db.session.commit()
+        return created
+
+    @classmethod
+    def list_partitions(cls) -> list:
+        rows = db.session.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'chat_log' ORDER BY c.relname"
+        )).all()
+        return [r[0] for r in rows]
+
+    @classmethod
+    def apply_retention(cls, dry_run: bool = False) -> dict:
+        """
+        Archive or drop ChatLog history older than CHATLOG_RETENTION_DAYS (0 = keep forever).
+        Archived partitions stay as standalone tables; archived rows go to chat_log_archive.
+        """
+        if Config.CHATLOG_RETENTION_DAYS <= 0:
+            return {'enabled': False}
+        cutoff = datetime.now() - timedelta(days=Config.CHATLOG_RETENTION_DAYS)
+        if cls.is_partitioned():
+            return cls._retain_partitions(cutoff, dry_run)
+        return cls._retain_rows(cutoff, dry_run)
+
+    @classmethod
+    def _retain_partitions(cls, cutoff: datetime, dry_run: bool) -> dict:
+        # Only whole months that end before the cutoff
+        expired = [
+            name for name in cls.list_partitions()
+            if (month := partition_month(name)) and add_months(month, 1) <= cutoff
+        ]
+        if not dry_run:
+            for name in expired:
+                db.session.execute(text(f"ALTER TABLE chat_log DETACH PARTITION {name}"))
+                if not Config.CHATLOG_ARCHIVE:
+                    db.session.execute(text(f"DROP TABLE {name}"))
+                logging.info(f"🗄️ ChatLog partition {name} {'detached' if Config.CHATLOG_ARCHIVE else 'dropped'}")
+            db.session.commit()
+        return {'enabled': True, 'mode': 'partition', 'cutoff': cutoff.isoformat(), 'partitions': expired}
+
+    @classmethod
+    def _retain_rows(cls, cutoff: datetime, dry_run: bool) -> dict:
+        if dry_run:
+            count = ChatLog.query.filter(ChatLog.created_at < cutoff).count()
+            return {'enabled': True, 'mode': 'rows', 'cutoff': cutoff.isoformat(), 'rows': count}
+
+        moved = 0
+        while True:
+            ids = [r[0] for r in db.session.query(ChatLog.id)
+                   .filter(ChatLog.created_at < cutoff)
+                   .order_by(ChatLog.id).limit(ARCHIVE_BATCH_SIZE).all()]
+            if not ids:
+                break
+            params = {'ids': ids, 'now': datetime.now()}
+            if Config.CHATLOG_ARCHIVE:
+                db.session.execute(text(
+                    "INSERT INTO chat_log_archive (id, toko_id, customer_hp, role, message, created_at, archived_at) "
+                    "SELECT id, toko_id, customer_hp, role, message, created_at, :now FROM chat_log WHERE id IN :ids"
+                ).bindparams(bindparam('ids', expanding=True)), params)
+            db.session.execute(
+                text("DELETE FROM chat_log WHERE id IN :ids").bindparams(bindparam('ids', expanding=True)),
+                {'ids': ids}
+            )
+            db.session.commit()  # Short transactions: one batch at a time
+            moved += len(ids)
+
+        if moved:
+            logging.info(f"🗄️ ChatLog retention: {moved} rows {'archived' if Config.CHATLOG_ARCHIVE else 'deleted'}")
+        return {'enabled': True, 'mode': 'rows', 'cutoff': cutoff.isoformat(), 'rows': moved}
@@ -0,0 +1,162 @@
+"""
+Buffered ChatLog Writer
+Callers enqueue ChatLog rows instead of add()+commit() inline; a background thread
+writes them with one multi-row INSERT every CHATLOG_FLUSH_ROWS rows or CHATLOG_FLUSH_MS.
+Rows are timestamped when enqueued, so ordering by created_at is unchanged.
+
+Flushed on interpreter shutdown (atexit: gunicorn worker exit, SIGTERM on Cloud Run).
+Failed flushes are retried; beyond CHATLOG_BUFFER_MAX rows the oldest are dropped.
+Rows that violate a constraint (e.g. deleted toko) are dropped so they cannot block the buffer.
+CHATLOG_ASYNC=false writes synchronously (one commit per call, like before).
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError, DataError
+from app.config import Config
+from app.extensions import db
+from app.models import ChatLog
+from app.services.metrics import Metrics
+from app.services.store_stats import StoreStats
+
+
+class ChatLogWriter:
+    """Process-wide ChatLog buffer with a background flusher"""
+
+    _lock = threading.Lock()
+    _wakeup = threading.Condition(_lock)
+    _flush_lock = threading.Lock()  # One INSERT at a time (flusher thread vs shutdown/explicit flush)
+    _buffer = []
+    _app = None
+    _thread = None
+    _atexit_registered = False
+
+    @classmethod
+    def log(cls, toko_id: str, customer_hp: str, role: str, message: str):
+        """Queue one ChatLog row (written within CHATLOG_FLUSH_MS)"""
+        row = {
+            'toko_id': toko_id,
+            'customer_hp': customer_hp,
+            'role': role,
+            'message': message,
+            'created_at': datetime.now(),
+        }
+        if not Config.CHATLOG_ASYNC:
+            db.session.execute(insert(ChatLog), [row])
+            db.session.commit()
+            StoreStats.record_chats([row])
+            return
+
+        cls._ensure_started()
+        with cls._wakeup:
+            cls._buffer.append(row)
+            depth = len(cls._buffer)
+            if depth >= Config.CHATLOG_FLUSH_ROWS:
+                cls._wakeup.notify()
+        Metrics.set_gauge('chatlog.buffer_depth', depth)
+
+    @classmethod
+    def _ensure_started(cls):
+        if cls._thread is not None and cls._thread.is_alive():
+            return
+        with cls._lock:
+            if cls._thread is not None and cls._thread.is_alive():
+                return
+            cls._app = current_app._get_current_object()
+            cls._thread = threading.Thread(target=cls._run, name="ChatLogWriter", daemon=True)
+            cls._thread.start()
+            if not cls._atexit_registered:
+                atexit.register(cls.shutdown)
+                cls._atexit_registered = True
+        logging.info("📝 ChatLog writer started")
+
+    @classmethod
+    def _run(cls):
+        interval = Config.CHATLOG_FLUSH_MS / 1000
+        while True:
+            with cls._wakeup:
+                if len(cls._buffer) < Config.CHATLOG_FLUSH_ROWS:
+                    cls._wakeup.wait(timeout=interval)
+            try:
+                if not cls.flush() and cls._buffer:
+                    time.sleep(interval)  # Flush failed: back off before retrying
+            except Exception as e:
+                logging.error(f"ChatLog writer loop error: {e}")
+                time.sleep(interval)
+
+    @classmethod
+    def flush(cls) -> int:
+        """Write everything buffered so far; returns the number of rows written"""
+        with cls._flush_lock:
+            with cls._lock:
+                rows, cls._buffer = cls._buffer, []
+            if not rows:
+                return 0
+
+            start = time.perf_counter()
+            try:
+                with cls._app.app_context():
+                    try:
+                        written = cls._insert(rows)
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                logging.error(f"ChatLog flush failed ({len(rows)} rows, will retry): {e}")
+                Metrics.incr('chatlog.flush_failed')
+                cls._requeue(rows)
+                return 0
+
+            Metrics.observe('chatlog.flush', time.perf_counter() - start)
+            Metrics.incr('chatlog.flushed', written)
+            with cls._lock:
+                Metrics.set_gauge('chatlog.buffer_depth', len(cls._buffer))
+            return written
+
+    @staticmethod
+    def _insert(rows: list) -> int:
+        """Multi-row INSERT; if a row violates a constraint, insert one by one and drop the bad rows"""
+        try:
+            db.session.execute(insert(ChatLog), rows)
+            db.session.commit()
+            StoreStats.record_chats(rows)
+            return len(rows)
+        except (IntegrityError, DataError):
+            db.session.rollback()
+
+        written = []
+        for row in rows:
+            try:
+                db.session.execute(insert(ChatLog), [row])
+                db.session.commit()
+                written.append(row)
+            except (IntegrityError, DataError) as e:
+                db.session.rollback()
+                logging.error(f"ChatLog row rejected ({row['toko_id']}/{row['customer_hp']}): {e}")
+                Metrics.incr('chatlog.rejected')
+        StoreStats.record_chats(written)
+        return len(written)
+
+    @classmethod
+    def _requeue(cls, rows: list):
+        with cls._lock:
+            cls._buffer = rows + cls._buffer
+            overflow = len(cls._buffer) - Config.CHATLOG_BUFFER_MAX
+            if overflow > 0:
+                logging.error(f"ChatLog buffer full, dropping {overflow} oldest rows")
+                Metrics.incr('chatlog.dropped', overflow)
+                cls._buffer = cls._buffer[overflow:]
+
+    @classmethod
+    def shutdown(cls):
+        """Durable flush at process exit"""
+        if cls._app is None:
+            return
+        pending = len(cls._buffer)
+        if pending:
+            logging.info(f"📝 ChatLog writer: flushing {pending} rows on shutdown")
+            if not cls.flush():
+                logging.error(f"ChatLog writer: {len(cls._buffer)} rows lost on shutdown")
@@ -47,6 +47,27 @@ class CircuitBreaker:
             logging.error(f"⚠️ Circuit Breaker [{self.name}] recorded failure: {e}")
             raise e
 
+    async def call_async(self, func, *args, **kwargs):
+        """Await a coroutine function with circuit breaker protection (same state as call())"""
+        if self.state == CircuitState.OPEN:
+            if time.time() - self.last_failure_time > self.recovery_timeout:
+                logging.info(f"🔄 Circuit Breaker [{self.name}] moving to HALF_OPEN state...")
+                self.state = CircuitState.HALF_OPEN
+            else:
+                logging.warning(f"🚫 Circuit Breaker [{self.name}] is OPEN. Fast-failing request.")
+                return None
+
+        try:
+            result = await func(*args, **kwargs)
+            if self.state == CircuitState.HALF_OPEN:
+                logging.info(f"✅ Circuit Breaker [{self.name}] recovered! Closing circuit.")
+                self.reset()
+            return result
+        except Exception as e:
+            self.record_failure()
+            logging.error(f"⚠️ Circuit Breaker [{self.name}] recorded failure: {e}")
+            raise e
+
     def record_failure(self):
         self.failure_count += 1
         self.last_failure_time = time.time()
@@ -0,0 +1,195 @@
+"""
+Conversation Memory
+Per-customer prompt history kept in one conversation_state row:
+  - a ring buffer of the last CONVERSATION_RECENT_MESSAGES messages, updated after each exchange,
+  - a rolling summary of everything older, folded in batches by a background thread.
+
+The webhook only writes recent_json/message_count and the summarizer only writes
+summary/summary_upto (conditional UPDATE), so the two never overwrite each other.
+Messages leave the ring buffer only once they are part of the summary.
+"""
+import json
+import logging
+import threading
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from app.config import Config
+from app.extensions import db
+from app.models import ConversationState, ChatLog
+from app.services.metrics import Metrics
+
+AI_ROLES = ('AI', 'BOT')
+SUMMARY_LINE_CHARS = 150
+
+
+def _role_label(role: str) -> str:
+    return "AI" if role in AI_ROLES else "User"
+
+
+class ConversationMemory:
+    """Rolling summary + ring buffer of recent turns per (toko, customer)"""
+
+    _inflight = set()  # state ids being summarized in this process
+    _inflight_lock = threading.Lock()
+
+    # --- state ---
+
+    @staticmethod
+    def messages(state) -> list:
+        try:
+            return json.loads(state.recent_json or "[]")
+        except ValueError:
+            return []
+
+    @classmethod
+    def get_state(cls, toko_id: str, customer_hp: str):
+        """Conversation state row (created on first use, seeded from the last ChatLog rows)"""
+        state = ConversationState.query.filter_by(toko_id=toko_id, customer_hp=customer_hp).first()
+        if state:
+            return state
+
+        seed = ChatLog.query.filter(
+            ChatLog.toko_id == toko_id,
+            ChatLog.customer_hp == customer_hp,
+            ChatLog.role.in_(('USER',) + AI_ROLES)
+        ).order_by(ChatLog.created_at.desc()).limit(Config.CONVERSATION_RECENT_MESSAGES).all()
+        recent = [{"seq": i, "role": h.role, "text": h.message or ""} for i, h in enumerate(reversed(seed))]
+
+        state = ConversationState(
+            toko_id=toko_id, customer_hp=customer_hp,
+            summary="", summary_upto=0, recent_json=json.dumps(recent), message_count=len(recent)
+        )
+        try:
+            # Savepoint: a concurrent first message may create the same row
+            with db.session.begin_nested():
+                db.session.add(state)
+        except IntegrityError:
+            state = ConversationState.query.filter_by(toko_id=toko_id, customer_hp=customer_hp).first()
+        return state
+
+    @classmethod
+    def append(cls, state, role: str, text: str):
+        """Add a message to the ring buffer (caller commits)"""
+        recent = cls.messages(state)
+        seq = state.message_count or 0
+        recent.append({"seq": seq, "role": role, "text": text or ""})
+        state.message_count = seq + 1
+        state.recent_json = json.dumps(cls.trim(recent, state.summary_upto or 0))
+
+    @staticmethod
+    def trim(recent: list, summary_upto: int) -> list:
+        """Keep the last N messages plus anything not summarized yet (hard-capped)"""
+        keep_recent = Config.CONVERSATION_RECENT_MESSAGES
+        window_start = max(0, len(recent) - keep_recent)
+        kept = [m for i, m in enumerate(recent) if i >= window_start or m["seq"] >= summary_upto]
+
+        hard_cap = keep_recent + 3 * Config.CONVERSATION_SUMMARY_BATCH
+        if len(kept) > hard_cap:
+            # Summarizer is not keeping up (Gemini down): drop the oldest rather than grow the prompt
+            logging.warning(f"Conversation buffer over cap, dropping {len(kept) - hard_cap} unsummarized messages")
+            Metrics.incr('conversation.dropped', len(kept) - hard_cap)
+            kept = kept[-hard_cap:]
+        return kept
+
+    @classmethod
+    def unsummarized(cls, state) -> list:
+        """Messages outside the recent window that are not in the summary yet"""
+        recent = cls.messages(state)
+        older = recent[:max(0, len(recent) - Config.CONVERSATION_RECENT_MESSAGES)]
+        return [m for m in older if m["seq"] >= (state.summary_upto or 0)]
+
+    @classmethod
+    def history_text(cls, state) -> str:
+        """Prompt history: summary of older turns followed by the recent messages"""
+        text = ""
+        if state.summary:
+            text += f"[Ringkasan percakapan sebelumnya]:\n{state.summary}\n\n"
+        for m in cls.messages(state):
+            text += f"{_role_label(m['role'])}: {m['text']}\n"
+        return text
+
+    # --- summarization ---
+
+    @staticmethod
+    def extractive_summary(summary: str, messages: list) -> str:
+        """Fallback fold without Gemini: one truncated line per message, oldest lines dropped first"""
+        lines = [line for line in (summary or "").split("\n") if line]
+        lines += [f"- {_role_label(m['role'])}: {m['text'][:SUMMARY_LINE_CHARS]}" for m in messages]
+        while lines and len("\n".join(lines)) > Config.CONVERSATION_SUMMARY_MAX_CHARS:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    @staticmethod
+    def _gemini_summary(toko_id: str, summary: str, messages: list):
+        from app.services.tenant_cache import TenantCache
+        from app.services.gemini import get_client
+
+        toko = TenantCache.get_toko(toko_id)
+        client = get_client(toko)
+        if not client:
+            return None
+        model = TenantCache.get_config(f"gemini_model_{toko_id}", toko_id) or "gemini-2.0-flash"
+        transcript = "\n".join(f"{_role_label(m['role'])}: {m['text']}" for m in messages)
+        prompt = (
+            "Perbarui ringkasan percakapan WhatsApp antara admin toko (AI) dan pelanggan (User).\n"
+            "Pertahankan fakta penting: nama pelanggan, produk yang diminati, pesanan, jumlah, alamat, "
+            "pembayaran, keluhan, dan janji admin. Tulis poin singkat dalam Bahasa Indonesia, "
+            f"maksimal {Config.CONVERSATION_SUMMARY_MAX_CHARS} karakter. Jawab hanya dengan ringkasannya.\n\n"
+            f"Ringkasan lama:\n{summary or '-'}\n\nPesan baru:\n{transcript}"
+        )
+        res = client.models.generate_content(model=model, contents=prompt)
+        text = (res.text or "").strip()
+        return text[:Config.CONVERSATION_SUMMARY_MAX_CHARS] or None
+
+    @classmethod
+    def schedule_summary(cls, state):
+        """Fold old messages into the summary in the background once a batch has accumulated"""
+        if len(cls.unsummarized(state)) < Config.CONVERSATION_SUMMARY_BATCH:
+            return
+        with cls._inflight_lock:
+            if state.id in cls._inflight:
+                return
+            cls._inflight.add(state.id)
+        try:
+            app_ctx = current_app._get_current_object()
+            threading.Thread(target=cls._summarize, args=(app_ctx, state.id), daemon=True).start()
+        except Exception as e:
+            logging.error(f"Conversation summary trigger error: {e}")
+            with cls._inflight_lock:
+                cls._inflight.discard(state.id)
+
+    @classmethod
+    def _summarize(cls, app, state_id: int):
+        with app.app_context():
+            try:
+                state = db.session.get(ConversationState, state_id)
+                pending = cls.unsummarized(state) if state else []
+                if not pending:
+                    return
+
+                with Metrics.timer('conversation.summarize'):
+                    try:
+                        new_summary = cls._gemini_summary(state.toko_id, state.summary, pending)
+                    except Exception as e:
+                        logging.warning(f"Gemini summary failed for {state.customer_hp}, using extractive fold: {e}")
+                        new_summary = None
+                    if new_summary is None:
+                        Metrics.incr('conversation.summary_fallback')
+                        new_summary = cls.extractive_summary(state.summary, pending)
+
+                # Conditional: only advance if nobody folded these messages meanwhile
+                db.session.execute(
+                    update(ConversationState)
+                    .where(ConversationState.id == state_id, ConversationState.summary_upto == state.summary_upto)
+                    .values(summary=new_summary, summary_upto=pending[-1]["seq"] + 1)
+                )
+                db.session.commit()
+                Metrics.incr('conversation.summarized')
+            except Exception as e:
+                db.session.rollback()
+                logging.error(f"Conversation summary error (state {state_id}): {e}")
+            finally:
+                db.session.remove()
+                with cls._inflight_lock:
+                    cls._inflight.discard(state_id)
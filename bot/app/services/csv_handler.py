@@ -160,11 +160,11 @@ def validate_csv_file(file_url: str, headers: dict) -> Dict:
     Returns:
         Dict with status and targets or error message
     """
-    import requests
+    from app.services.waha import get_http, get_timeout
     
     try:
-        # Download file
-        response = requests.get(file_url, headers=headers, timeout=30)
+        # Download file (WAHA media URL - reuse pooled connection)
+        response = get_http().get(file_url, headers=headers, timeout=get_timeout('media'))
         
         if response.status_code != 200:
             return {
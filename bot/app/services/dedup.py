@@ -0,0 +1,142 @@
+"""
+Webhook Deduplication Service
+WAHA re-sends the same `message` event when our response is slow.
+Each message id is claimed once via a primary-key insert in `processed_message`,
+which is shared by every gunicorn worker, and released again if processing fails. A bounded local TTL cache in front of it
+absorbs retry storms without touching the database.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app.config import Config
+from app.extensions import db
+from app.models import ProcessedMessage
+from app.services.metrics import Metrics
+
+PURGE_INTERVAL = 300  # seconds between purges of expired rows
+
+# Events that carry a customer message (and therefore a payload.id worth deduping)
+MESSAGE_EVENTS = ('message', 'message.any')
+
+
+class MessageDedup:
+    """Bounded, TTL-evicted seen-id store keyed on the WAHA message id"""
+
+    _lock = threading.Lock()
+    _local = OrderedDict()  # message_id -> expires_at (epoch seconds)
+    _last_purge = 0.0
+
+    @staticmethod
+    def get_message_id(data: dict):
+        """Extract the WAHA message id (payload.id) from a webhook body"""
+        if (data.get('event') or 'message') not in MESSAGE_EVENTS:
+            return None
+        payload = data.get('payload') or {}
+        message_id = payload.get('id')
+        if isinstance(message_id, dict):
+            # Some engines send {"id": {"_serialized": "..."}}
+            message_id = message_id.get('_serialized') or message_id.get('id')
+        return str(message_id)[:150] if message_id else None
+
+    @classmethod
+    def _remember(cls, message_id: str, now: float):
+        with cls._lock:
+            cls._local[message_id] = now + Config.DEDUP_TTL_SECONDS
+            cls._local.move_to_end(message_id)
+            while len(cls._local) > Config.DEDUP_LOCAL_MAX:
+                cls._local.popitem(last=False)
+
+    @classmethod
+    def _seen_locally(cls, message_id: str, now: float) -> bool:
+        with cls._lock:
+            expires_at = cls._local.get(message_id)
+            if expires_at is None:
+                return False
+            if expires_at <= now:
+                del cls._local[message_id]
+                return False
+            return True
+
+    @classmethod
+    def is_duplicate(cls, message_id: str) -> bool:
+        """
+        Claim a message id.
+
+        Returns:
+            True if this id was already seen within the TTL (skip the event),
+            False if this call claimed it (process the event)
+        """
+        if not message_id:
+            return False
+
+        now = time.time()
+        if cls._seen_locally(message_id, now):
+            Metrics.incr('dedup.hit_local')
+            return True
+
+        try:
+            db.session.add(ProcessedMessage(message_id=message_id, created_at=datetime.now()))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            existing = ProcessedMessage.query.get(message_id)
+            cutoff = datetime.now() - timedelta(seconds=Config.DEDUP_TTL_SECONDS)
+            if existing and existing.created_at and existing.created_at < cutoff:
+                # Expired but not purged yet: treat as a fresh message
+                existing.created_at = datetime.now()
+                db.session.commit()
+            else:
+                cls._remember(message_id, now)
+                Metrics.incr('dedup.hit_db')
+                return True
+        except Exception as e:
+            # Fail open: a missed dedup is better than a dropped message
+            logging.error(f"Dedup check failed for {message_id}: {e}")
+            db.session.rollback()
+            Metrics.incr('dedup.error')
+            return False
+
+        cls._remember(message_id, now)
+        Metrics.incr('dedup.miss')
+        cls._maybe_purge(now)
+        return False
+
+    @classmethod
+    def release(cls, message_id: str):
+        """
+        Give up a claim after the event failed, so WAHA's retry of it is processed
+        instead of being dropped as a duplicate.
+        """
+        if not message_id:
+            return
+        with cls._lock:
+            cls._local.pop(message_id, None)
+        try:
+            ProcessedMessage.query.filter_by(message_id=message_id).delete(synchronize_session=False)
+            db.session.commit()
+            Metrics.incr('dedup.released')
+        except Exception as e:
+            logging.error(f"Dedup release failed for {message_id}: {e}")
+            db.session.rollback()
+
+    @classmethod
+    def _maybe_purge(cls, now: float):
+        if now - cls._last_purge < PURGE_INTERVAL:
+            return
+        cls._last_purge = now
+        try:
+            cutoff = datetime.now() - timedelta(seconds=Config.DEDUP_TTL_SECONDS)
+            ProcessedMessage.query.filter(ProcessedMessage.created_at < cutoff).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            logging.error(f"Dedup purge failed: {e}")
+            db.session.rollback()
+
+    @classmethod
+    def clear_local(cls):
+        """Drop the process-local cache (tests only)"""
+        with cls._lock:
+            cls._local.clear()
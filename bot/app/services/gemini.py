@@ -1,12 +1,18 @@
 from google import genai
+from google.genai import types
 from datetime import datetime
 import json
 import logging
-from flask import current_app
+import threading
+from collections import OrderedDict
 from tenacity import retry, stop_after_attempt, wait_exponential
 from app.config import Config
 from app.extensions import db
-from app.models import ChatLog, SystemConfig
+from app.services.metrics import Metrics
+from app.services.knowledge_base import KnowledgeBase
+from app.services.menu_index import MenuIndex
+from app.services.conversation_memory import ConversationMemory
+from app.services.chatlog_writer import ChatLogWriter
 import re
 
 def sanitize_input(text):
@@ -20,29 +26,68 @@ def sanitize_input(text):
     # Limit length for prompt injection sanity
     return text[:1000].strip()
 
+class GeminiClientPool:
+    """
+    Process-wide genai.Client instances keyed by API key.
+    Created lazily, shared across threads (each keeps its own HTTP connection pool),
+    least recently used per-store keys are evicted beyond GEMINI_CLIENT_POOL_SIZE.
+    """
+    _lock = threading.Lock()
+    _clients = OrderedDict()  # api_key -> genai.Client
+
+    @classmethod
+    def get(cls, api_key: str):
+        """Client for an API key, or None if the key is empty or the client cannot be built"""
+        if not api_key:
+            return None
+
+        with cls._lock:
+            client = cls._clients.get(api_key)
+            if client is not None:
+                cls._clients.move_to_end(api_key)
+                Metrics.incr('gemini.client_pool.hit')
+                return client
+
+            try:
+                client = genai.Client(api_key=api_key)
+            except Exception as e:
+                logging.error(f"Gemini Init Error: {e}")
+                return None
+
+            Metrics.incr('gemini.client_pool.miss')
+            cls._clients[api_key] = client
+            while len(cls._clients) > max(1, Config.GEMINI_CLIENT_POOL_SIZE):
+                # Dropped, not closed: another thread may still be mid-request on it
+                cls._clients.popitem(last=False)
+                Metrics.incr('gemini.client_pool.evicted')
+            Metrics.set_gauge('gemini.client_pool.size', len(cls._clients))
+            return client
+
+    @classmethod
+    def clear(cls):
+        """Drop all pooled clients (tests only)"""
+        with cls._lock:
+            cls._clients.clear()
+
+
 def get_client(toko=None):
-    """Dynamic client factory supporting per-store discovery"""
+    """Dynamic client factory supporting per-store discovery (pooled per API key)"""
     api_key = Config.GEMINI_API_KEY
     if toko:
-        cfg = SystemConfig.query.get(f"gemini_api_key_{toko.id}")
-        if cfg and cfg.value:
-            api_key = cfg.value
+        from app.services.tenant_cache import TenantCache
+        tenant_key = TenantCache.get_config(f"gemini_api_key_{toko.id}", toko.id)
+        if tenant_key:
+            api_key = tenant_key
     
-    if not api_key:
-        return None
-        
-    try:
-        return genai.Client(api_key=api_key)
-    except Exception as e:
-        logging.error(f"Gemini Init Error: {e}")
-        return None
+    return GeminiClientPool.get(api_key)
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=10), reraise=True)
-def _generate_with_retry(client, model, full_prompt):
+def _generate_with_retry(client, model, full_prompt, config=None):
     """Internal helper to handle retries for Gemini API calls"""
     res = client.models.generate_content(
         model=model,
-        contents=full_prompt
+        contents=full_prompt,
+        config=config
     )
     return res
 
@@ -55,15 +100,14 @@ def get_gemini_response(user_input, toko, customer):
         if not current_client: return "Maaf, sistem AI belum dikonfigurasi."
         
         # Get dynamic model
-        model_cfg = SystemConfig.query.get(f"gemini_model_{toko.id}")
-        target_model = model_cfg.value if model_cfg else "gemini-2.0-flash"
+        from app.services.tenant_cache import TenantCache
+        target_model = TenantCache.get_config(f"gemini_model_{toko.id}", toko.id) or "gemini-2.0-flash"
         
         logging.info(f"Gemini Request: {toko.nama} | Model: {target_model}")
         
         # 1. Build context and history
-        # 1. Build context and history
-        config = SystemConfig.query.get('gemini_prompt')
-        base_prompt = config.value if config else "Anda adalah asisten toko WhatsApp."
+        from app.services.prompt_cache import StorePromptCache
+        prefix = StorePromptCache.get(toko)
         
         # Context Aware Broadcast & Safety Fuse (v3.9.7)
         broadcast_context = ""
@@ -80,87 +124,55 @@ def get_gemini_response(user_input, toko, customer):
                 
                 # Increment counter (will be committed after response generation)
                 customer.broadcast_reply_count += 1
-        
-        context = f"""
-        Nama Toko: {toko.nama}
-        Kategori: {toko.kategori}
-        Link Toko: {toko.link_toko if hasattr(toko, 'link_toko') else '-'}
-        Token Owner: {toko.remote_token}
-        Nama Anda (Admin): {toko.admin_name}
-        
-        Sistem Prompt:
-        Anda adalah {toko.admin_name}, seorang admin manusia yang ramah di toko WhatsApp {toko.nama}.
-        {base_prompt}
-        {broadcast_context}
-        
-        Gaya Bicara Admin WhatsApp (PENTING):
-        1. Gunakan bahasa manusia yang luwes, santai, dan solutif. Hindari gaya bicara robot atau template kaku.
-        2. Sesekali gunakan singkatan manusia (misal: sdh, blm, sy, ok, kak, ready) agar tidak terlihat seperti AI.
-        3. Panggil diri Anda sebagai '{toko.admin_name}' sesekali untuk membangun kedekatan (Contoh: "Sebentar ya Kak, {toko.admin_name} cek stoknya dulu...").
-        4. Berikan variasi jawaban, jangan pernah menjawab dengan kalimat yang sama persis jika ditanya berulang kali.
-        5. Gunakan emoji secara natural (😊, 🙏, 👍).
-        6. **AI Awareness**: Jika lawan bicara terlihat seperti bot atau AI (misal: terus mengulang sapaan basa-basi), berikan respon penutup yang sopan (Contoh: "Ok Kak, saya standby di sini ya jika butuh bantuan lagi!") dan BERHENTI bertanya balik.
-        7. **Command Awareness**: Jika user bertanya tentang cara berhenti, menghapus data, aktivasi ulang, atau perintah teknis lainnya, sarankan mereka secara halus untuk mengetik */help* untuk melihat menu pengaturan teknis. (Contoh: "Untuk berhenti berlangganan atau hapus data, Kakak bisa ketik /help ya untuk bantuan teknis.").
-
-        Daftar Menu/Produk:
-        {toko.format_menu()}
-        """
-        
-        # RAG / Knowledge Base Injection
-        if hasattr(toko, 'knowledge_base_file_id') and toko.knowledge_base_file_id:
-             import os
-             # Assuming 'bot/knowledge_base' directory
-             kb_path = os.path.join(current_app.root_path, '..', 'knowledge_base', toko.knowledge_base_file_id)
-             if os.path.exists(kb_path):
-                 try:
-                     with open(kb_path, 'r', encoding='utf-8') as f:
-                         kb_content = f.read()
-                         # Truncate if too long (approx 2000 chars to save context window)
-                         if len(kb_content) > 5000: kb_content = kb_content[:5000] + "...(truncated)"
-                         
-                         context += f"\n\n[Knowledge Base / Informasi Tambahan Toko]:\n{kb_content}\nNote: Gunakan informasi ini untuk menjawab pertanyaan pelanggan jika relevan."
-                 except Exception as e:
-                     logging.error(f"RAG Error: {e}")
 
-        # Fetch last 10 messages (User & Bot mixed)
-        history_obj = ChatLog.query.filter_by(customer_hp=customer.nomor_hp, toko_id=toko.id).order_by(ChatLog.created_at.desc()).limit(10).all()
-        history_text = ""
-        # Reversed so oldest first
-        for h in reversed(history_obj):
-            role_label = "AI" if (h.role == 'BOT' or h.role == 'AI') else "User"
-            history_text += f"{role_label}: {h.message}\n"
+        # History: rolling summary + recent messages (one conversation_state row)
+        conversation = ConversationMemory.get_state(toko.id, customer.nomor_hp)
+        history_text = ConversationMemory.history_text(conversation)
 
         # 0. Sanitize input
         clean_input = sanitize_input(user_input)
         
-        full_prompt = f"{context}\n\nHistory Chat:\n{history_text}\n\nUser: {clean_input}\nAI:"
+        # RAG: only the KB chunks relevant to this message
+        kb_context = ""
+        kb_chunks = KnowledgeBase.retrieve(toko, clean_input)
+        if kb_chunks:
+            kb_text = "\n---\n".join(kb_chunks)
+            kb_context = f"\n\n[Knowledge Base / Informasi Tambahan Toko]:\n{kb_text}\nNote: Gunakan informasi ini untuk menjawab pertanyaan pelanggan jika relevan."
 
-        # 2. Generate with Smart Retry
-        res = _generate_with_retry(current_client, target_model, full_prompt)
+        # Large catalogs: products matching this message (small ones are fully in the prefix)
+        menu_context = MenuIndex.relevant_items_text(toko, clean_input)
+
+        turn_prompt = f"{menu_context}{kb_context}{broadcast_context}\n\nHistory Chat:\n{history_text}\n\nUser: {clean_input}\nAI:"
+
+        # 2. Generate with Smart Retry (store prefix served from Gemini context cache when available)
+        res = None
+        cache_name = StorePromptCache.remote_cache_name(toko.id, prefix, current_client, target_model)
+        if cache_name:
+            try:
+                # Single attempt: on failure the full-prompt path below does the retrying
+                res = current_client.models.generate_content(
+                    model=target_model,
+                    contents=turn_prompt,
+                    config=types.GenerateContentConfig(cached_content=cache_name)
+                )
+            except Exception as cache_err:
+                logging.warning(f"Gemini cached content {cache_name} rejected, sending full prompt: {cache_err}")
+                StorePromptCache.drop_remote(prefix)
+        if res is None:
+            res = _generate_with_retry(current_client, target_model, prefix.text + turn_prompt)
         
         jawaban = res.text.strip()
         
-        # 3. Log and save (2 separate rows: User Input & AI Response)
+        # 3. Log and save (2 separate rows: User Input & AI Response, written by the buffered ChatLog writer)
         try:
-            # Save User Input
-            user_log = ChatLog(
-                toko_id=toko.id,
-                customer_hp=customer.nomor_hp,
-                role='USER',
-                message=clean_input
-            )
-            db.session.add(user_log)
-            
-            # Save AI Response
-            ai_log = ChatLog(
-                toko_id=toko.id,
-                customer_hp=customer.nomor_hp,
-                role='AI', 
-                message=jawaban
-            )
-            db.session.add(ai_log)
+            ChatLogWriter.log(toko.id, customer.nomor_hp, 'USER', clean_input)
+            ChatLogWriter.log(toko.id, customer.nomor_hp, 'AI', jawaban)
+
+            ConversationMemory.append(conversation, 'USER', clean_input)
+            ConversationMemory.append(conversation, 'AI', jawaban)
             
             db.session.commit()
+            ConversationMemory.schedule_summary(conversation)
         except Exception as db_err:
             logging.error(f"DB Log Error (Gemini): {db_err}")
             db.session.rollback()
@@ -0,0 +1,70 @@
+"""
+Payment Screenshot Preprocessing
+Phone screenshots arrive as 1-3 MB PNGs. Before Gemini Vision they are:
+  - rotated per EXIF orientation, then stripped of all metadata (EXIF/GPS/ICC),
+  - downscaled to PAYMENT_IMAGE_MAX_EDGE on the long edge (LANCZOS keeps digits sharp),
+  - optionally converted to grayscale and re-encoded as JPEG (PAYMENT_IMAGE_JPEG_QUALITY)
+    or lossless PNG, whichever is smaller (flat UI screenshots often compress better as PNG).
+The re-encode is returned even when it is larger than the upload, so the customer's
+EXIF/GPS data never reaches Gemini. Defaults keep amount and bank text readable on
+1080x2400 screenshots; tune with scripts/bench_image_prep.py.
+
+Pillow is optional: without it (or for non-image media such as PDF) bytes pass through unchanged.
+"""
+import io
+import logging
+from app.config import Config
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None  # Preprocessing disabled, originals are sent as-is
+
+
+def is_available() -> bool:
+    return Image is not None
+
+
+def prepare_for_vision(data: bytes, mime: str):
+    """
+    Shrink a payment screenshot for the vision call.
+
+    Returns:
+        (bytes, mime) - the metadata-free re-encode, or the original if preprocessing
+        is unavailable or the image cannot be decoded
+    """
+    if not Config.PAYMENT_IMAGE_PREPROCESS or Image is None or not data:
+        return data, mime
+    if mime and not mime.startswith('image/'):
+        return data, mime
+
+    try:
+        max_edge = Config.PAYMENT_IMAGE_MAX_EDGE
+        img = Image.open(io.BytesIO(data))
+        if img.format == 'JPEG':
+            # Let the JPEG decoder skip detail we would throw away anyway
+            img.draft('L' if Config.PAYMENT_IMAGE_GRAYSCALE else 'RGB', (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+
+        if Config.PAYMENT_IMAGE_GRAYSCALE:
+            img = img.convert('L')
+        elif img.mode != 'RGB':
+            # Flatten transparency onto white (JPEG has no alpha)
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+
+        if max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        # A fresh save without exif=/icc_profile= drops all metadata
+        jpeg, png = io.BytesIO(), io.BytesIO()
+        img.save(jpeg, format='JPEG', quality=Config.PAYMENT_IMAGE_JPEG_QUALITY, optimize=True)
+        img.save(png, format='PNG', optimize=True)
+    except Exception as e:
+        logging.warning(f"Payment image preprocessing failed, sending original: {e}")
+        return data, mime
+
+    if len(png.getvalue()) < len(jpeg.getvalue()):
+        return png.getvalue(), 'image/png'
+    return jpeg.getvalue(), 'image/jpeg'
@@ -0,0 +1,209 @@
+"""
+Inbound Webhook Queue (Ingest Mode)
+/webhook persists the raw WAHA event and returns 200 immediately.
+A dispatcher thread claims PENDING events in arrival order and hands them to a
+fixed pool of consumer threads. Events are routed by a stable hash of their
+chat key, so messages from one chat are always handled in order by the same consumer.
+
+Delivery is at-least-once: PROCESSING events are reset to PENDING on startup.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from app.extensions import db
+from app.models import InboundEvent
+from app.config import Config
+from app.services.metrics import Metrics
+from app.utils import get_parsed_number
+
+CLAIM_BATCH_SIZE = 50
+POLL_INTERVAL = 0.5  # seconds between polls when idle
+RETENTION_HOURS = 24  # DONE events are purged after this
+CLEANUP_INTERVAL = 3600
+
+
+def get_chat_key(data: dict) -> str:
+    """Ordering key for an event: one key per (session, chat)"""
+    session_name = data.get('session', Config.MASTER_SESSION)
+    _, chat_id = get_parsed_number(data)
+    return f"{session_name}:{chat_id or '-'}"
+
+
+def enqueue_event(data: dict) -> int:
+    """
+    Persist a raw webhook event for asynchronous processing.
+
+    Returns:
+        InboundEvent id
+    """
+    event = InboundEvent(
+        session_name=data.get('session', Config.MASTER_SESSION),
+        chat_key=get_chat_key(data)[:120],
+        event_type=(data.get('event') or 'message')[:30],
+        payload=json.dumps(data),
+        status='PENDING'
+    )
+    db.session.add(event)
+    db.session.commit()
+    Metrics.incr('inbound.enqueued')
+    return event.id
+
+
+def get_queue_depth() -> int:
+    """Number of events waiting to be claimed"""
+    try:
+        return InboundEvent.query.filter_by(status='PENDING').count()
+    except Exception as e:
+        logging.error(f"Inbound queue depth error: {e}")
+        return -1
+
+
+class EventRejected(Exception):
+    """handle_webhook_event() returned a 4xx response: retrying cannot help"""
+
+
+def _process_event(app, event_id: int, raw_payload: str, created_at: datetime):
+    """
+    Run the webhook routing logic for one event, retrying inline to keep per-chat order.
+    An exception or a 5xx response is retried; a 4xx response fails the event at once.
+    """
+    from app.routes.webhook import handle_webhook_event, response_status
+
+    Metrics.observe('inbound.queue_wait_seconds', max((datetime.now() - created_at).total_seconds(), 0))
+
+    error = None
+    attempts = 0
+    try:
+        data = json.loads(raw_payload)
+    except Exception as e:
+        data = None
+        error = e
+
+    while data is not None and attempts < Config.INBOUND_MAX_ATTEMPTS:
+        attempts += 1
+        with app.app_context():
+            try:
+                with Metrics.timer('inbound.process_seconds'):
+                    status = response_status(handle_webhook_event(data))
+                if 400 <= status < 500:
+                    raise EventRejected(f"HTTP {status}")
+                if status >= 500:
+                    raise RuntimeError(f"HTTP {status}")
+                error = None
+                break
+            except Exception as e:
+                db.session.rollback()
+                error = e
+                logging.error(f"Inbound event #{event_id} attempt {attempts} failed: {e}")
+                if isinstance(e, EventRejected):
+                    break
+        if attempts < Config.INBOUND_MAX_ATTEMPTS:
+            time.sleep(2 ** attempts)
+
+    with app.app_context():
+        try:
+            event = InboundEvent.query.get(event_id)
+            if event:
+                event.attempts = (event.attempts or 0) + attempts
+                event.processed_at = datetime.now()
+                if error is None:
+                    event.status = 'DONE'
+                    event.last_error = None
+                else:
+                    event.status = 'FAILED'
+                    event.last_error = str(error)[:500]
+                db.session.commit()
+        except Exception as e:
+            logging.error(f"Failed to finalize inbound event #{event_id}: {e}")
+            db.session.rollback()
+
+    Metrics.incr('inbound.processed' if error is None else 'inbound.failed')
+
+
+def _consumer_loop(app, work_queue: queue.Queue):
+    """Consumer thread: processes events from its own partition in FIFO order"""
+    while True:
+        event_id, raw_payload, created_at = work_queue.get()
+        try:
+            _process_event(app, event_id, raw_payload, created_at)
+        except Exception as e:
+            logging.error(f"Inbound consumer error: {e}")
+        finally:
+            work_queue.task_done()
+
+
+def _claim_batch(limit: int = CLAIM_BATCH_SIZE) -> list:
+    """Oldest PENDING events, marked PROCESSING (id order = arrival order)"""
+    batch = InboundEvent.query.filter_by(status='PENDING')\
+        .order_by(InboundEvent.id).limit(limit).all()
+    for event in batch:
+        event.status = 'PROCESSING'
+    db.session.commit()
+    return batch
+
+
+def _cleanup_done_events():
+    cutoff = datetime.now() - timedelta(hours=RETENTION_HOURS)
+    deleted = InboundEvent.query.filter(
+        InboundEvent.status == 'DONE',
+        InboundEvent.created_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    if deleted:
+        logging.info(f"Inbound queue: purged {deleted} processed events")
+
+
+def worker_inbound(app):
+    """
+    Dispatcher for the inbound queue. Starts the consumer pool and keeps it fed.
+    Runs in the single process that holds the worker lock.
+    """
+    num_consumers = max(1, Config.INBOUND_WORKERS)
+    partitions = [queue.Queue() for _ in range(num_consumers)]
+
+    for i, work_queue in enumerate(partitions):
+        threading.Thread(target=_consumer_loop, args=(app, work_queue), name=f"InboundWorker-{i}", daemon=True).start()
+
+    with app.app_context():
+        # At-least-once: anything claimed by a dead process goes back to the queue
+        reset = InboundEvent.query.filter_by(status='PROCESSING').update({'status': 'PENDING'})
+        db.session.commit()
+        if reset:
+            logging.info(f"Inbound queue: re-queued {reset} interrupted events")
+
+    logging.info(f"Inbound Dispatcher Started ({num_consumers} consumers)")
+    last_cleanup = 0
+
+    while True:
+        claimed = 0
+        with app.app_context():
+            try:
+                in_flight = sum(q.qsize() for q in partitions)
+
+                # Backpressure: only claim when consumers have room
+                if in_flight < num_consumers * CLAIM_BATCH_SIZE:
+                    batch = _claim_batch()
+
+                    # Dispatch in id order; same chat_key always lands on the same consumer
+                    for event in batch:
+                        idx = zlib.crc32((event.chat_key or '').encode('utf-8')) % num_consumers
+                        partitions[idx].put((event.id, event.payload, event.created_at or datetime.now()))
+                    claimed = len(batch)
+
+                Metrics.set_gauge('inbound.queue_depth', get_queue_depth())
+                Metrics.set_gauge('inbound.in_flight', sum(q.qsize() for q in partitions))
+
+                if time.time() - last_cleanup > CLEANUP_INTERVAL:
+                    _cleanup_done_events()
+                    last_cleanup = time.time()
+
+            except Exception as e:
+                logging.error(f"Inbound dispatcher error: {e}")
+                db.session.rollback()
+
+        if not claimed:
+            time.sleep(POLL_INTERVAL)
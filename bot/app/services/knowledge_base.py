@@ -0,0 +1,200 @@
+"""
+Knowledge Base Retrieval
+Splits a store's KB file into chunks and ranks them with BM25 (pure Python),
+so each turn injects only the top-k relevant chunks instead of the first 5 000 chars.
+
+The index is stored next to the KB file as `<file>.index.json` and rebuilt when the
+file's mtime/size no longer match (upload, manual edit). Build offline with:
+    python scripts/build_kb_index.py
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from flask import current_app
+from app.config import Config
+from app.services.metrics import Metrics
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.index.json'
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Common Indonesian/English filler words in customer chats and KB prose
+STOPWORDS = frozenset("""
+yang dan di ke dari ini itu untuk dengan ada apa kak ka ya saya aku mau bisa tidak gak ga nggak
+juga atau pada dalam adalah akan sudah sdh blm belum kah dong deh sih nih min admin kami kita
+the and of to is in for on a an
+""".split())
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str) -> list:
+    return [t for t in _TOKEN_RE.findall((text or '').lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def chunk_text(text: str, chunk_chars: int = None) -> list:
+    """Split text into chunks of about chunk_chars, on paragraph then sentence boundaries"""
+    chunk_chars = chunk_chars or Config.KB_CHUNK_CHARS
+    pieces = []
+    for para in re.split(r'\n\s*\n', text or ''):
+        para = para.strip()
+        if not para:
+            continue
+        if len(para) <= chunk_chars:
+            pieces.append(para)
+            continue
+        # Oversized paragraph: split on sentences, hard-split what is still too long
+        for sentence in re.split(r'(?<=[.!?])\s+', para):
+            while len(sentence) > chunk_chars:
+                pieces.append(sentence[:chunk_chars])
+                sentence = sentence[chunk_chars:]
+            if sentence:
+                pieces.append(sentence)
+
+    chunks, current = [], ''
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > chunk_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_index(text: str, chunk_chars: int = None) -> dict:
+    """BM25 inverted index over the chunks of a KB text (JSON-serializable)"""
+    chunks = chunk_text(text, chunk_chars)
+    postings = {}
+    lengths = []
+    for i, chunk in enumerate(chunks):
+        tokens = tokenize(chunk)
+        lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            postings.setdefault(term, []).append([i, tf])
+    return {
+        'version': INDEX_VERSION,
+        'chunks': chunks,
+        'lengths': lengths,
+        'avgdl': (sum(lengths) / len(lengths)) if lengths else 0.0,
+        'postings': postings,
+    }
+
+
+def search(index: dict, query: str, k: int = None) -> list:
+    """Top-k chunks for a query, best first (empty if no query term occurs in the KB)"""
+    k = k or Config.KB_TOP_K
+    chunks = index['chunks']
+    n = len(chunks)
+    if not n:
+        return []
+
+    scores = {}
+    avgdl = index['avgdl'] or 1.0
+    for term in set(tokenize(query)):
+        posting = index['postings'].get(term)
+        if not posting:
+            continue
+        idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+        for i, tf in posting:
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * index['lengths'][i] / avgdl)
+            scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+    best = sorted(scores, key=lambda i: (-scores[i], i))[:k]
+    return [chunks[i] for i in best]
+
+
+class KnowledgeBase:
+    """Per-store KB index, loaded from disk once per file version"""
+
+    _lock = threading.Lock()
+    _indexes = {}  # kb_path -> (signature, index)
+
+    @staticmethod
+    def path_for(toko):
+        if not getattr(toko, 'knowledge_base_file_id', None):
+            return None
+        # Assuming 'bot/knowledge_base' directory
+        return os.path.join(current_app.root_path, '..', 'knowledge_base', toko.knowledge_base_file_id)
+
+    @staticmethod
+    def _signature(kb_path):
+        st = os.stat(kb_path)
+        return [st.st_mtime_ns, st.st_size, Config.KB_CHUNK_CHARS]
+
+    @classmethod
+    def build(cls, kb_path: str) -> dict:
+        """(Re)build and persist the index of a KB file"""
+        start = time.perf_counter()
+        signature = cls._signature(kb_path)
+        with open(kb_path, 'r', encoding='utf-8') as f:
+            index = build_index(f.read())
+        index['source'] = signature
+
+        tmp_path = kb_path + INDEX_SUFFIX + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(tmp_path, kb_path + INDEX_SUFFIX)
+        except OSError as e:
+            # Read-only deploys still get an in-memory index
+            logging.warning(f"KB index not persisted for {kb_path}: {e}")
+
+        Metrics.observe('kb.index_build', time.perf_counter() - start)
+        logging.info(f"📚 KB index built: {kb_path} ({len(index['chunks'])} chunks)")
+        return index
+
+    @classmethod
+    def load(cls, kb_path: str):
+        """Index of a KB file (memory, then disk, then rebuilt if stale), or None if the file is missing"""
+        if not kb_path or not os.path.exists(kb_path):
+            return None
+        signature = cls._signature(kb_path)
+
+        with cls._lock:
+            cached = cls._indexes.get(kb_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        index = None
+        try:
+            with open(kb_path + INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') != INDEX_VERSION or index.get('source') != signature:
+                index = None
+        except (OSError, ValueError):
+            index = None
+        if index is None:
+            index = cls.build(kb_path)
+
+        with cls._lock:
+            cls._indexes[kb_path] = (signature, index)
+        return index
+
+    @classmethod
+    def retrieve(cls, toko, query: str, k: int = None) -> list:
+        """Top-k KB chunks of a store for a customer message (first chunk as overview if nothing matches)"""
+        try:
+            index = cls.load(cls.path_for(toko))
+        except Exception as e:
+            logging.error(f"RAG Error: {e}")
+            return []
+        if not index or not index['chunks']:
+            return []
+
+        with Metrics.timer('kb.search'):
+            chunks = search(index, query, k)
+        Metrics.incr('kb.hit' if chunks else 'kb.no_match')
+        return chunks or index['chunks'][:1]
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._indexes.clear()
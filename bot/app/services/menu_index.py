@@ -0,0 +1,229 @@
+"""
+Menu Search Index
+Per-store in-memory product index with token and prefix matching over
+Menu.item, category and description.
+
+Small catalogs are still sent to Gemini in full. Large ones (more than
+MENU_PROMPT_FULL_LIMIT items) are represented in the cached prompt prefix by a
+category overview plus top sellers, and each turn adds only the items matching
+the customer's message. /list_menu pages through the same index by category.
+
+Rebuilt on change: Menu/Toko writes invalidate the store through TenantCache hooks,
+MENU_INDEX_TTL bounds staleness for writes made by other processes; owner commands
+such as /list_menu always rebuild from the database.
+"""
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from app.config import Config
+from app.models import Menu
+from app.services.metrics import Metrics
+from app.services.tenant_cache import TenantCache
+from app.services.knowledge_base import tokenize
+
+DEFAULT_CATEGORY = 'Umum'
+# Query tokens this short only match whole words ('es' should not match 'espresso')
+MIN_PREFIX_LEN = 3
+# Score weights per field a token matched in
+WEIGHT_ITEM = 3.0
+WEIGHT_CATEGORY = 2.0
+WEIGHT_DESCRIPTION = 1.0
+
+
+@dataclass
+class MenuItem:
+    """Column snapshot of a Menu row (safe to share across threads)"""
+    id: int
+    item: str
+    harga: int
+    stok: int
+    category: str
+    description: str = None
+
+
+def format_item(m) -> str:
+    """Prompt line of a product (same format as Toko.format_menu)"""
+    return f"- {m.item}: Rp{m.harga:,} (Stok: {m.stok})"
+
+
+@dataclass
+class StoreMenuIndex:
+    """Index of one store's catalog"""
+    items: list
+    postings: dict  # token -> {item position: weight}
+    vocab: list  # sorted tokens, for prefix lookups
+    categories: dict  # category -> [item positions] (catalog order)
+    top_sellers: list = field(default_factory=list)  # item positions
+    expires_at: float = 0
+    version: str = None  # MenuIndex.version() read before the items were loaded
+
+    @classmethod
+    def build(cls, items: list, top_seller_names=()):
+        postings = {}
+        categories = {}
+        for pos, m in enumerate(items):
+            categories.setdefault(m.category, []).append(pos)
+            for text, weight in ((m.item, WEIGHT_ITEM), (m.category, WEIGHT_CATEGORY), (m.description, WEIGHT_DESCRIPTION)):
+                for token in tokenize(text):
+                    slot = postings.setdefault(token, {})
+                    slot[pos] = max(slot.get(pos, 0.0), weight)
+
+        by_name = {m.item.lower(): pos for pos, m in enumerate(items) if m.item}
+        top_sellers = [by_name[n.lower()] for n in top_seller_names if n and n.lower() in by_name]
+        return cls(items=items, postings=postings, vocab=sorted(postings), categories=categories, top_sellers=top_sellers)
+
+    def _matching_tokens(self, token: str):
+        if len(token) < MIN_PREFIX_LEN:
+            return [token] if token in self.postings else []
+        matches = []
+        i = bisect_left(self.vocab, token)
+        while i < len(self.vocab) and self.vocab[i].startswith(token):
+            matches.append(self.vocab[i])
+            i += 1
+        return matches
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Items matching the query, best first (exact token beats prefix match)"""
+        scores = {}
+        for token in set(tokenize(query)):
+            for match in self._matching_tokens(token):
+                factor = 1.0 if match == token else 0.5
+                for pos, weight in self.postings[match].items():
+                    scores[pos] = scores.get(pos, 0.0) + weight * factor
+        best = sorted(scores, key=lambda pos: (-scores[pos], pos))[:limit]
+        return [self.items[pos] for pos in best]
+
+    def page(self, category: str = None, page: int = 1, per_page: int = 30):
+        """(items, page, total_pages) of the catalog or of one category (case-insensitive)"""
+        if category:
+            positions = next((p for c, p in self.categories.items() if c.lower() == category.lower()), [])
+        else:
+            positions = [pos for group in self.categories.values() for pos in group]
+        total_pages = max(1, math.ceil(len(positions) / per_page))
+        page = min(max(1, page), total_pages)
+        start = (page - 1) * per_page
+        return [self.items[pos] for pos in positions[start:start + per_page]], page, total_pages
+
+    def find_category(self, name: str):
+        return next((c for c in self.categories if c.lower() == (name or '').lower()), None)
+
+
+class MenuIndex:
+    """Per-process registry of store menu indexes"""
+
+    _lock = threading.Lock()
+    _indexes = {}  # toko_id -> StoreMenuIndex
+    _listening = False
+
+    @classmethod
+    def _listen(cls):
+        if not cls._listening:
+            cls._listening = True
+            TenantCache.on_invalidate(cls._on_tenant_invalidate)
+
+    @classmethod
+    def _on_tenant_invalidate(cls, kind, key):
+        if kind is None:
+            cls.clear()
+        elif kind == 'toko':
+            cls.invalidate(key)
+
+    @staticmethod
+    def _load_items(toko_id: str) -> list:
+        rows = Menu.query.filter_by(toko_id=toko_id).order_by(Menu.id).all()
+        return [
+            MenuItem(id=m.id, item=m.item or '', harga=m.harga or 0, stok=m.stok,
+                     category=m.category or DEFAULT_CATEGORY, description=m.description)
+            for m in rows
+        ]
+
+    @staticmethod
+    def _top_seller_names(toko_id: str) -> list:
+        try:
+            from app.services.analytics_service import get_top_products
+            return [p['name'] for p in get_top_products(toko_id, limit=Config.MENU_PROMPT_TOP_SELLERS)]
+        except Exception as e:
+            logging.error(f"Top sellers unavailable for {toko_id}: {e}")
+            return []
+
+    @staticmethod
+    def version(toko_id: str) -> str:
+        """Menu version token of a store (Toko.menu_version through TenantCache, no query on a hit)"""
+        toko = TenantCache.get_toko(toko_id)
+        return (toko.menu_version or '') if toko else ''
+
+    @classmethod
+    def get(cls, toko_id: str, fresh: bool = False, version: str = None) -> StoreMenuIndex:
+        """
+        Index of a store's catalog, built on first use and after every menu change.
+        fresh=True rebuilds it from the database first (admin commands must not show
+        an index that is stale because another process edited the menu); a version from
+        version() rebuilds it only if the menu changed since it was built.
+        """
+        cls._listen()
+        now = time.monotonic()
+        with cls._lock:
+            index = cls._indexes.get(toko_id)
+        if index and index.expires_at > now and not fresh and (version is None or index.version == version):
+            Metrics.incr('menu_index.hit')
+            return index
+
+        Metrics.incr('menu_index.miss')
+        with Metrics.timer('menu_index.build'):
+            version = cls.version(toko_id)
+            items = cls._load_items(toko_id)
+            # Top sellers only matter once the catalog is too large to send in full
+            top = cls._top_seller_names(toko_id) if len(items) > Config.MENU_PROMPT_FULL_LIMIT else []
+            index = StoreMenuIndex.build(items, top)
+        index.expires_at = now + Config.MENU_INDEX_TTL
+        index.version = version
+        with cls._lock:
+            cls._indexes[toko_id] = index
+        return index
+
+    @classmethod
+    def is_large(cls, toko_id: str) -> bool:
+        return len(cls.get(toko_id).items) > Config.MENU_PROMPT_FULL_LIMIT
+
+    @classmethod
+    def prompt_catalog(cls, toko) -> str:
+        """
+        Static menu section of the store prompt: the full list for small catalogs,
+        otherwise top sellers plus a category overview (matching items are added per turn)
+        """
+        index = cls.get(toko.id)
+        if not index.items:
+            return "- Belum ada menu yang terdaftar."
+        if len(index.items) <= Config.MENU_PROMPT_FULL_LIMIT:
+            return "\n".join(format_item(m) for m in index.items)
+
+        lines = [f"(Katalog besar: {len(index.items)} produk. Produk yang relevan dengan pertanyaan pelanggan dicantumkan per pesan.)"]
+        if index.top_sellers:
+            lines.append("Produk Terlaris:")
+            lines.extend(format_item(index.items[pos]) for pos in index.top_sellers)
+        lines.append("Kategori: " + ", ".join(f"{c} ({len(p)})" for c, p in index.categories.items()))
+        return "\n".join(lines)
+
+    @classmethod
+    def relevant_items_text(cls, toko, query: str) -> str:
+        """Per-turn menu section for large catalogs ('' for small ones, already in the prefix)"""
+        index = cls.get(toko.id)
+        if len(index.items) <= Config.MENU_PROMPT_FULL_LIMIT:
+            return ""
+        matches = index.search(query, limit=Config.MENU_PROMPT_MATCH_LIMIT)
+        if not matches:
+            return ""
+        return "\n\n[Produk yang relevan dengan pesan pelanggan]:\n" + "\n".join(format_item(m) for m in matches)
+
+    @classmethod
+    def invalidate(cls, toko_id: str):
+        with cls._lock:
+            cls._indexes.pop(toko_id, None)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._indexes.clear()
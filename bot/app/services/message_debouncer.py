@@ -0,0 +1,209 @@
+"""
+Message Debouncer
+Customers often send several short messages in a row ("halo", "kak", "mau tanya").
+Instead of one Gemini call and one reply per message, texts from the same chat are
+buffered for MESSAGE_DEBOUNCE_SECONDS; every new message restarts the window and the
+last one merges the whole burst into a single AI turn. MESSAGE_DEBOUNCE_MAX_SECONDS
+caps the wait for customers who keep typing.
+
+Stores (like the burst limiter):
+  - 'memory': per-process buffers (exact when one process handles all chats)
+  - a file path (default): small local SQLite file shared by all gunicorn workers on the host,
+    so a burst split across workers is still merged. Falls back to memory if unusable.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from flask import current_app
+from app.config import Config
+from app.services.metrics import Metrics
+
+STALE_SECONDS = 600  # pending texts left behind by a dead worker are discarded after this
+
+
+class MemoryDebounceStore:
+    """Per-process pending texts: key -> list of (seq, ts, text)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._seq = 0
+
+    def add(self, key: str, text: str, now: float) -> int:
+        with self._lock:
+            self._seq += 1
+            self._pending.setdefault(key, []).append((self._seq, now, text))
+            return self._seq
+
+    def peek(self, key: str):
+        """(latest seq, oldest ts) of the pending texts, or None"""
+        with self._lock:
+            pending = self._pending.get(key)
+            if not pending:
+                return None
+            return pending[-1][0], pending[0][1]
+
+    def take(self, key: str, upto_seq: int) -> list:
+        """Remove and return pending texts up to upto_seq, oldest first"""
+        with self._lock:
+            pending = self._pending.get(key, [])
+            taken = [text for seq, _, text in pending if seq <= upto_seq]
+            rest = [p for p in pending if p[0] > upto_seq]
+            if rest:
+                self._pending[key] = rest
+            else:
+                self._pending.pop(key, None)
+            return taken
+
+    def size(self) -> int:
+        return len(self._pending)
+
+
+class SharedDebounceStore:
+    """Pending texts in a local SQLite file, shared by every process on the host"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS pending_messages "
+            "(seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, ts REAL NOT NULL, text TEXT NOT NULL)"
+        )
+        self._conn().execute("CREATE INDEX IF NOT EXISTS ix_pending_messages_key ON pending_messages (key, seq)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=2, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, key: str, text: str, now: float) -> int:
+        conn = self._conn()
+        conn.execute("DELETE FROM pending_messages WHERE key = ? AND ts < ?", (key, now - STALE_SECONDS))
+        cur = conn.execute("INSERT INTO pending_messages (key, ts, text) VALUES (?, ?, ?)", (key, now, text))
+        return cur.lastrowid
+
+    def peek(self, key: str):
+        row = self._conn().execute(
+            "SELECT MAX(seq), MIN(ts) FROM pending_messages WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row[0] is None else (row[0], row[1])
+
+    def take(self, key: str, upto_seq: int) -> list:
+        conn = self._conn()
+        # Immediate transaction: two workers must not both take the same texts
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT text FROM pending_messages WHERE key = ? AND seq <= ? ORDER BY seq", (key, upto_seq)
+            ).fetchall()
+            conn.execute("DELETE FROM pending_messages WHERE key = ? AND seq <= ?", (key, upto_seq))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [r[0] for r in rows]
+
+    def size(self) -> int:
+        return self._conn().execute("SELECT COUNT(DISTINCT key) FROM pending_messages").fetchone()[0]
+
+
+class MessageDebouncer:
+    """Coalesces consecutive inbound texts per (toko_id, customer_hp) into one AI turn"""
+
+    _store = None
+    _store_lock = threading.Lock()
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        return Config.MESSAGE_DEBOUNCE_SECONDS > 0
+
+    @classmethod
+    def store(cls):
+        if cls._store is None:
+            with cls._store_lock:
+                if cls._store is None:
+                    cls._store = cls._build_store(Config.MESSAGE_DEBOUNCE_STORE)
+        return cls._store
+
+    @staticmethod
+    def _build_store(spec: str):
+        if not spec or spec == 'memory':
+            return MemoryDebounceStore()
+        try:
+            return SharedDebounceStore(spec)
+        except Exception as e:
+            logging.warning(f"Debounce store {spec} unavailable, using process memory: {e}")
+            return MemoryDebounceStore()
+
+    @classmethod
+    def use_store(cls, store):
+        """Swap the backing store (tests)"""
+        cls._store = store
+
+    @staticmethod
+    def _key(toko_id: str, customer_hp: str) -> str:
+        return f"{toko_id}:{customer_hp}"
+
+    @classmethod
+    def submit(cls, toko_id: str, customer_hp: str, text: str, callback) -> bool:
+        """
+        Buffer a customer text. callback(merged_text) runs in a background thread
+        (with an app context) once the chat has been quiet for the debounce window.
+
+        Returns:
+            False if the store failed (caller should process the text inline)
+        """
+        key = cls._key(toko_id, customer_hp)
+        try:
+            seq = cls.store().add(key, text or "", time.time())
+        except Exception as e:
+            logging.error(f"Debounce store error, replying inline: {e}")
+            return False
+
+        Metrics.incr('debounce.buffered')
+        app = current_app._get_current_object()
+        timer = threading.Timer(Config.MESSAGE_DEBOUNCE_SECONDS, cls._fire, args=(app, key, seq, callback))
+        timer.daemon = True
+        timer.start()
+        return True
+
+    @classmethod
+    def collect(cls, key: str, seq: int, now: float = None):
+        """
+        Merged text if this message ends the burst (or the burst hit the max wait), else None.
+        Newer messages in the window have their own timer and will collect this one.
+        """
+        store = cls.store()
+        state = store.peek(key)
+        if state is None:
+            return None  # Already taken by another worker
+        latest_seq, oldest_ts = state
+        waited = (now or time.time()) - oldest_ts
+        if latest_seq != seq and waited < Config.MESSAGE_DEBOUNCE_MAX_SECONDS:
+            Metrics.incr('debounce.coalesced')
+            return None
+
+        texts = [t for t in store.take(key, seq) if t.strip()]
+        if not texts:
+            return None
+        Metrics.observe('debounce.burst_size', len(texts))
+        return "\n".join(texts)
+
+    @classmethod
+    def _fire(cls, app, key: str, seq: int, callback):
+        try:
+            merged = cls.collect(key, seq)
+        except Exception as e:
+            logging.error(f"Debounce collect error ({key}): {e}")
+            return
+        if merged is None:
+            return
+        with app.app_context():
+            try:
+                callback(merged)
+            except Exception as e:
+                logging.error(f"Debounced reply error ({key}): {e}", exc_info=True)
@@ -4,7 +4,6 @@ Generates unique message variations using Gemini AI to prevent spam detection
 """
 import logging
 from typing import List
-from google import genai
 from app.config import Config
 
 import re
@@ -36,7 +35,10 @@ def generate_message_variations(base_message: str, count: int = 10) -> List[str]
         masked_message = masked_message.replace(link, placeholder)
         
     try:
-        client = genai.Client(api_key=Config.GEMINI_API_KEY)
+        from app.services.gemini import GeminiClientPool
+        client = GeminiClientPool.get(Config.GEMINI_API_KEY)
+        if client is None:
+            raise ValueError("GEMINI_API_KEY is not configured")
         
         prompt = f"""Tugas: Buat {count - 1} variasi kalimat dari pesan broadcast ini.
 Tujuan: Agar pesan tidak terdeteksi sebagai spam oleh WhatsApp, tapi makna dan intinya harus TETAP SAMA PERSIS.
@@ -0,0 +1,107 @@
+"""
+In-Process Metrics Registry
+Counters, gauges and latency histograms for hot paths and background workers.
+Values are per-process (each gunicorn worker keeps its own registry).
+Exposed via GET /api/cron/metrics
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Thread-safe metrics registry"""
+
+    # Histogram bucket upper bounds (seconds)
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    _lock = threading.Lock()
+    _counters = {}
+    _gauges = {}
+    _histograms = {}
+
+    @classmethod
+    def incr(cls, name: str, value: int = 1):
+        """Increment a counter"""
+        with cls._lock:
+            cls._counters[name] = cls._counters.get(name, 0) + value
+
+    @classmethod
+    def set_gauge(cls, name: str, value):
+        """Set a gauge to an absolute value"""
+        with cls._lock:
+            cls._gauges[name] = value
+
+    @classmethod
+    def observe(cls, name: str, seconds: float):
+        """Record a latency sample (seconds) into a histogram"""
+        with cls._lock:
+            hist = cls._histograms.get(name)
+            if hist is None:
+                hist = {'count': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * (len(cls.BUCKETS) + 1)}
+                cls._histograms[name] = hist
+
+            hist['count'] += 1
+            hist['sum'] += seconds
+            hist['max'] = max(hist['max'], seconds)
+            for i, bound in enumerate(cls.BUCKETS):
+                if seconds <= bound:
+                    hist['buckets'][i] += 1
+                    break
+            else:
+                hist['buckets'][-1] += 1
+
+    @classmethod
+    @contextmanager
+    def timer(cls, name: str):
+        """Context manager that records elapsed time into a histogram"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.observe(name, time.perf_counter() - start)
+
+    @classmethod
+    def get_counter(cls, name: str) -> int:
+        with cls._lock:
+            return cls._counters.get(name, 0)
+
+    @classmethod
+    def _quantile(cls, hist: dict, q: float) -> float:
+        """Approximate quantile from bucket counts (upper bound of matching bucket)"""
+        if not hist['count']:
+            return 0.0
+        rank = q * hist['count']
+        seen = 0
+        for i, n in enumerate(hist['buckets']):
+            seen += n
+            if seen >= rank:
+                return cls.BUCKETS[i] if i < len(cls.BUCKETS) else hist['max']
+        return hist['max']
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        """Get a JSON-serializable copy of all metrics"""
+        with cls._lock:
+            histograms = {}
+            for name, hist in cls._histograms.items():
+                histograms[name] = {
+                    'count': hist['count'],
+                    'avg': round(hist['sum'] / hist['count'], 4) if hist['count'] else 0.0,
+                    'p50': cls._quantile(hist, 0.50),
+                    'p99': cls._quantile(hist, 0.99),
+                    'max': round(hist['max'], 4),
+                }
+            return {
+                'counters': dict(cls._counters),
+                'gauges': dict(cls._gauges),
+                'histograms': histograms,
+            }
+
+    @classmethod
+    def reset(cls):
+        """Clear all metrics (tests only)"""
+        with cls._lock:
+            cls._counters.clear()
+            cls._gauges.clear()
+            cls._histograms.clear()
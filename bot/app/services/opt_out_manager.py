@@ -3,9 +3,15 @@ Opt-Out Management Service
 Handles broadcast blacklist operations for GDPR compliance
 """
 import logging
-from datetime import datetime
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Tuple
+from sqlalchemy import update
 from app.extensions import db
-from app.models import BroadcastBlacklist
+from app.models import BroadcastBlacklist, SystemConfig
+from app.utils import normalize_phone_number
 
 class OptOutManager:
     """Manages broadcast opt-out/opt-in operations"""
@@ -39,7 +45,9 @@ class OptOutManager:
                 notes=notes
             )
             db.session.add(entry)
+            BlacklistCache.bump_version()
             db.session.commit()
+            BlacklistCache.add_local(phone_number)
             
             logging.info(f"Added {phone_number} to blacklist (reason: {reason})")
             return True
@@ -71,7 +79,9 @@ class OptOutManager:
                 return False
             
             db.session.delete(entry)
+            BlacklistCache.bump_version()
             db.session.commit()
+            BlacklistCache.remove_local(phone_number)
             
             logging.info(f"Removed {phone_number} from blacklist")
             return True
@@ -93,7 +103,7 @@ class OptOutManager:
             True if blacklisted
         """
         try:
-            return BroadcastBlacklist.query.get(phone_number) is not None
+            return BlacklistCache.contains(phone_number)
         except Exception as e:
             logging.error(f"Failed to check blacklist for {phone_number}: {e}")
             return False  # Fail open (allow if check fails)
@@ -124,3 +134,138 @@ class OptOutManager:
             return BroadcastBlacklist.query.count()
         except:
             return 0
+
+
+class BlacklistCache:
+    """
+    Process-local set of blacklisted numbers (normalized 628...).
+    Loaded once, then refreshed when the 'blacklist_version' SystemConfig token
+    changes (checked at most every BLACKLIST_CHECK_INTERVAL seconds).
+    Opt-outs only add rows, so a version change usually loads just the new rows;
+    a full reload happens when the row count shows removals.
+    """
+
+    VERSION_KEY = 'blacklist_version'
+
+    _lock = threading.Lock()
+    _numbers = None  # set of normalized numbers, None until first load
+    _version = None
+    _loaded_until = None  # max opted_out_at seen (incremental watermark)
+    _last_check = 0.0
+
+    @staticmethod
+    def _normalize(phone_number: str) -> str:
+        return normalize_phone_number(phone_number) if phone_number else ''
+
+    @classmethod
+    def bump_version(cls):
+        """
+        Mark the blacklist as changed for every process (call before the caller's commit).
+        Writes a fresh random token in one UPDATE instead of incrementing a counter, so two
+        concurrent bumps can never write the same value and hide a change from other workers.
+        """
+        token = uuid.uuid4().hex
+        result = db.session.execute(
+            update(SystemConfig).where(SystemConfig.key == cls.VERSION_KEY).values(value=token)
+        )
+        if result.rowcount == 0:
+            # Seeded by create_app; only reached on a database that skipped it
+            db.session.add(SystemConfig(key=cls.VERSION_KEY, value=token))
+
+    @classmethod
+    def _read_version(cls) -> str:
+        with db.session.no_autoflush:
+            config = SystemConfig.query.get(cls.VERSION_KEY)
+            return config.value if config else '0'
+
+    @classmethod
+    def _full_reload(cls, version: str):
+        rows = db.session.query(BroadcastBlacklist.phone_number, BroadcastBlacklist.opted_out_at).all()
+        cls._numbers = {cls._normalize(phone) for phone, _ in rows}
+        cls._loaded_until = max((at for _, at in rows if at), default=None)
+        cls._version = version
+        logging.info(f"🚫 Blacklist cache loaded ({len(cls._numbers)} numbers, v{version})")
+
+    @classmethod
+    def _incremental_reload(cls, version: str):
+        query = db.session.query(BroadcastBlacklist.phone_number, BroadcastBlacklist.opted_out_at)
+        if cls._loaded_until:
+            # 1s overlap: entries written in the same second as the watermark
+            query = query.filter(BroadcastBlacklist.opted_out_at >= cls._loaded_until - timedelta(seconds=1))
+        rows = query.all()
+        numbers = cls._numbers | {cls._normalize(phone) for phone, _ in rows}
+
+        total = BroadcastBlacklist.query.count()
+        if len(numbers) != total:
+            # Removals (or out-of-order timestamps): fall back to a full reload
+            cls._full_reload(version)
+            return
+        latest = [at for _, at in rows if at]
+        if cls._loaded_until:
+            latest.append(cls._loaded_until)
+        cls._numbers = numbers
+        cls._loaded_until = max(latest, default=None)
+        cls._version = version
+
+    @classmethod
+    def refresh(cls, force: bool = False):
+        """Reload if the shared version changed (rate-limited unless force=True)"""
+        from app.config import Config
+        now = time.monotonic()
+        if not force and cls._numbers is not None and now - cls._last_check < Config.BLACKLIST_CHECK_INTERVAL:
+            return
+
+        with cls._lock:
+            if not force and cls._numbers is not None and now - cls._last_check < Config.BLACKLIST_CHECK_INTERVAL:
+                return
+            version = cls._read_version()
+            if cls._numbers is None or force:
+                cls._full_reload(version)
+            elif version != cls._version:
+                cls._incremental_reload(version)
+            cls._last_check = now
+
+    @classmethod
+    def contains(cls, phone_number: str) -> bool:
+        """True if the number is blacklisted"""
+        cls.refresh()
+        return cls._normalize(phone_number) in cls._numbers
+
+    @classmethod
+    def filter_targets(cls, targets: List) -> Tuple[List, List]:
+        """
+        Split targets (phone strings or dicts with 'phone'/'phone_number') in one pass.
+
+        Returns:
+            (allowed, blacklisted) lists with the original items
+        """
+        cls.refresh()
+        numbers = cls._numbers
+        allowed, blacklisted = [], []
+        for target in targets:
+            phone = target.get('phone', target.get('phone_number', '')) if isinstance(target, dict) else target
+            (blacklisted if cls._normalize(phone) in numbers else allowed).append(target)
+        return allowed, blacklisted
+
+    @classmethod
+    def add_local(cls, phone_number: str):
+        """Write-through after a local opt-out so this process sees it immediately"""
+        with cls._lock:
+            if cls._numbers is not None:
+                cls._numbers.add(cls._normalize(phone_number))
+
+    @classmethod
+    def remove_local(cls, phone_number: str):
+        """Write-through after a local opt-in"""
+        with cls._lock:
+            if cls._numbers is not None:
+                cls._numbers.discard(cls._normalize(phone_number))
+
+    @classmethod
+    def clear(cls):
+        """Drop the cache (tests only)"""
+        with cls._lock:
+            cls._numbers = None
+            cls._version = None
+            cls._loaded_until = None
+            cls._last_check = 0.0
@@ -12,6 +12,7 @@ GPSF Compliance:
 - Concurrency Safe: Uses appropriate locking for updates
 """
 
+import bisect
 import json
 import logging
 import uuid
@@ -19,6 +20,8 @@ from datetime import datetime, timedelta
 from app.extensions import db
 from app.models import Transaction, Customer
 
+RECONCILE_CHUNK = 200  # amounts per candidate query in match_pending_orders
+
 
 def generate_order_id(toko_id: str) -> str:
     """Generate unique order ID with format: TOKO-YYYYMMDD-XXXX"""
@@ -71,9 +74,11 @@ def find_pending_order(toko_id: str, customer_hp: str, amount: int = None, toler
     Matching logic:
     1. Same toko_id and customer_hp
     2. Status is PENDING
-    3. If amount provided, match within tolerance (default ±Rp1000)
+    3. If amount provided, closest order within tolerance (default ±Rp1000), exact match first
     4. Prefer most recent order if multiple matches
     
+    One indexed query (ix_transaction_pending_lookup); the amount filter and ordering run in SQL.
+    
     Args:
         toko_id: Store ID
         customer_hp: Customer phone number
@@ -88,37 +93,93 @@ def find_pending_order(toko_id: str, customer_hp: str, amount: int = None, toler
             toko_id=toko_id,
             customer_hp=customer_hp,
             status='PENDING'
-        ).order_by(Transaction.created_at.desc())
+        )
         
-        pending_orders = query.all()
+        if amount is not None:
+            distance = db.func.abs(Transaction.nominal - amount)
+            order = query.filter(distance <= tolerance).order_by(
+                distance, Transaction.created_at.desc()
+            ).first()
+            if order:
+                kind = "Exact" if order.nominal == amount else "Tolerance"
+                logging.info(f"{kind} match found: Order {order.order_id} (Rp{order.nominal:,}) ≈ Rp{amount:,}")
+                return order
         
-        if not pending_orders:
+        # No amount (or no amount match): most recent, merchant can review
+        order = query.order_by(Transaction.created_at.desc()).first()
+        if not order:
             logging.info(f"No pending orders for {customer_hp} @ {toko_id}")
-            return None
+        elif amount is not None:
+            logging.info(f"No amount match, returning most recent pending order")
+        return order
         
-        # If no amount specified, return most recent
-        if amount is None:
-            return pending_orders[0]
+    except Exception as e:
+        logging.error(f"Error finding pending order: {e}")
+        return None
+
+
+def match_pending_orders(toko_id: str, amounts: list, tolerance: int = 1000, customer_hp: str = None) -> list:
+    """
+    Match many detected amounts to pending orders at once (merchant bulk reconciliation).
+    
+    Candidates for all amounts are loaded in one query per RECONCILE_CHUNK amounts, then
+    assigned closest-first (most recent order on ties). Each order is matched at most once,
+    so two transfers of the same amount go to two different orders.
+    
+    Args:
+        toko_id: Store ID
+        amounts: Detected amounts, e.g. from a bank statement
+        tolerance: Amount tolerance for matching (default ±1000)
+        customer_hp: Optionally restrict to one customer
+    
+    Returns:
+        List aligned with amounts: Transaction or None for each amount
+    """
+    matches = [None] * len(amounts)
+    wanted = sorted({a for a in amounts if a is not None})
+    if not wanted:
+        return matches
+    
+    try:
+        candidates = {}
+        for i in range(0, len(wanted), RECONCILE_CHUNK):
+            chunk = wanted[i:i + RECONCILE_CHUNK]
+            query = Transaction.query.filter(
+                Transaction.toko_id == toko_id,
+                Transaction.status == 'PENDING',
+                db.or_(*[Transaction.nominal.between(a - tolerance, a + tolerance) for a in chunk])
+            )
+            if customer_hp:
+                query = query.filter(Transaction.customer_hp == customer_hp)
+            for order in query.all():
+                candidates[order.id] = order
         
-        # Try exact match first
-        for order in pending_orders:
-            if order.nominal == amount:
-                logging.info(f"Exact match found: Order {order.order_id} = Rp{amount:,}")
-                return order
+        # Closest pairs first; ties go to the most recent order, then input order
+        ordered = sorted(candidates.values(), key=lambda o: o.nominal)
+        nominals = [o.nominal for o in ordered]
+        pairs = []
+        for idx, amount in enumerate(amounts):
+            if amount is None:
+                continue
+            lo = bisect.bisect_left(nominals, amount - tolerance)
+            hi = bisect.bisect_right(nominals, amount + tolerance)
+            for order in ordered[lo:hi]:
+                created = order.created_at.timestamp() if order.created_at else 0
+                pairs.append((abs(order.nominal - amount), -created, idx, order))
+        pairs.sort(key=lambda p: p[:3])
         
-        # Try tolerance match
-        for order in pending_orders:
-            if abs(order.nominal - amount) <= tolerance:
-                logging.info(f"Tolerance match found: Order {order.order_id} (Rp{order.nominal:,}) ≈ Rp{amount:,}")
-                return order
+        used = set()
+        for distance, _, idx, order in pairs:
+            if matches[idx] is None and order.id not in used:
+                matches[idx] = order
+                used.add(order.id)
         
-        # No match, return most recent anyway (merchant can review)
-        logging.info(f"No amount match, returning most recent pending order")
-        return pending_orders[0]
+        logging.info(f"Reconciled {len(used)}/{len(amounts)} amounts @ {toko_id}")
+        return matches
         
     except Exception as e:
-        logging.error(f"Error finding pending order: {e}")
-        return None
+        logging.error(f"Error matching pending orders: {e}")
+        return [None] * len(amounts)
 
 
 def verify_order(
@@ -154,6 +215,8 @@ def verify_order(
             logging.error(f"Order not found: {order_id}")
             return False
         
+        was_paid = order.status == 'PAID'
+        
         # Update verification fields
         order.verification_status = verification_status
         order.confidence_score = confidence_score
@@ -172,6 +235,10 @@ def verify_order(
         
         db.session.commit()
         logging.info(f"Order {order_id} verified as {verification_status} by {verified_by}")
+        
+        if order.status == 'PAID' and not was_paid:
+            from app.services.store_stats import StoreStats
+            StoreStats.record_paid_order(order)
         return True
         
     except Exception as e:
@@ -0,0 +1,645 @@
+"""
+Payment Verification Pipeline
+Transfer screenshots are verified off the webhook thread in five persisted stages:
+    DOWNLOAD -> PREPROCESS -> VISION -> MATCH -> NOTIFY
+Every stage has its own bounded thread pool (PAYMENT_<STAGE>_WORKERS). A job is handed to the
+next stage's pool as soon as the previous stage commits, so slow Gemini Vision calls do not
+hold up downloads or notifications of other jobs.
+
+Jobs live in payment_verification_job. The dispatcher (process holding the worker lock) claims
+PENDING jobs, including those created by other gunicorn workers. A claim is a lease
+(claimed_at) renewed before every stage; PROCESSING jobs whose lease expired (dispatcher died)
+go back to PENDING and resume at their last completed stage. Images are spooled to PAYMENT_MEDIA_DIR;
+a job whose file is gone starts again at DOWNLOAD.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app.config import Config
+from app.extensions import db
+from app.models import PaymentVerificationJob
+from app.services.chatlog_writer import ChatLogWriter
+from app.services.metrics import Metrics
+from app.services.tenant_cache import TenantCache
+from app.services.waha import kirim_waha
+
+STAGES = ('DOWNLOAD', 'PREPROCESS', 'VISION', 'MATCH', 'NOTIFY')
+CLAIM_BATCH_SIZE = 20
+POLL_INTERVAL = 0.5  # seconds between polls when idle
+RETENTION_HOURS = 72  # DONE/FAILED jobs are purged after this
+CLEANUP_INTERVAL = 3600
+LEASE_CHECK_INTERVAL = 60
+
+ERROR_REPLY = (
+    "❌ Maaf, ada gangguan saat memverifikasi bukti transfer. "
+    "Mohon kirim ulang atau hubungi admin. 🙏"
+)
+
+
+class StageError(Exception):
+    """Permanent failure: reply to the customer with this message, no retry"""
+
+
+def media_path(job_id: int) -> str:
+    return os.path.join(Config.PAYMENT_MEDIA_DIR, f"payment_{job_id}.bin")
+
+
+def _read_media(job) -> bytes:
+    with open(media_path(job.id), 'rb') as f:
+        return f.read()
+
+
+def _write_media(job_id: int, data: bytes):
+    os.makedirs(Config.PAYMENT_MEDIA_DIR, exist_ok=True)
+    tmp_path = media_path(job_id) + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, media_path(job_id))  # Atomic: a resumed job never sees a partial file
+
+
+def _discard_media(job_id: int):
+    try:
+        os.remove(media_path(job_id))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Payment media cleanup failed for job #{job_id}: {e}")
+
+
+# --- stages ---
+
+def _download(job):
+    if not job.media_url:
+        raise StageError("❌ Gagal mengunduh gambar. Mohon kirim ulang.")
+
+    from app.services.waha import get_headers, get_http, get_timeout
+    m_res = get_http().get(job.media_url, headers=get_headers(), timeout=get_timeout('media'))
+    if m_res.status_code != 200:
+        logging.error(f"Failed to download media: {m_res.status_code}")
+        raise StageError("❌ Gagal mengunduh gambar. Coba lagi.")
+
+    _write_media(job.id, m_res.content)
+    job.mime = (m_res.headers.get('Content-Type') or 'image/jpeg')[:100]
+
+
+def _preprocess(job):
+    """Hash the original image, then downscale/re-encode it for the vision call (see image_prep)"""
+    from app.services.image_prep import prepare_for_vision
+    from app.services.proof_hash import dhash, sha256, to_hex
+    original = _read_media(job)
+    if not original:
+        raise StageError("❌ Gagal mengunduh gambar. Mohon kirim ulang.")
+
+    job.proof_sha256 = sha256(original)
+    proof_hash = dhash(original)
+    if proof_hash is not None:
+        job.proof_hash = to_hex(proof_hash)
+
+    processed, mime = prepare_for_vision(original, job.mime)
+    if processed is not original:
+        _write_media(job.id, processed)
+        job.mime = mime
+        Metrics.incr('payment.bytes_saved', max(0, len(original) - len(processed)))
+
+
+def _vision(job):
+    from app.services.gemini import analisa_bukti_transfer
+    toko = TenantCache.get_toko(job.toko_id)
+
+    # Pending order for this customer gives the model an expected amount (contextual matching)
+    order_context = None
+    try:
+        from app.services.order_service import find_pending_order
+        pending_order = find_pending_order(toko_id=job.toko_id, customer_hp=job.customer_hp, amount=None)
+        if pending_order:
+            job.order_id = pending_order.order_id
+            job.expected_amount = pending_order.nominal
+            order_context = {
+                'order_id': pending_order.order_id,
+                'customer_phone': job.customer_hp,
+                'created_at': pending_order.tanggal
+            }
+            logging.info(f"Found pending order {pending_order.order_id} for {job.customer_hp}: Rp{job.expected_amount:,}")
+    except Exception as order_err:
+        logging.warning(f"Order lookup error (non-fatal): {order_err}")
+
+    known = _known_proof_verdict(job)
+    if known:
+        logging.info(f"Proof from {job.customer_hp} matches order {known['duplicate_of']}: {known['match_status']}")
+        job.analysis_json = json.dumps(known)
+        return
+
+    logging.info(f"Calling enhanced payment verification for {job.customer_hp}")
+    analysis = analisa_bukti_transfer(
+        _read_media(job),
+        job.mime or 'image/jpeg',
+        expected_amount=job.expected_amount,
+        order_context=order_context,
+        toko=toko
+    )
+    analysis = _flag_similar_proof(job, analysis)
+    logging.info(f"Payment verification result: {json.dumps(analysis)}")
+    job.analysis_json = json.dumps(analysis)
+
+
+def _is_own_resend(job, trx) -> bool:
+    return trx.customer_hp == job.customer_hp and job.order_id in (None, trx.order_id)
+
+
+def _known_proof_verdict(job):
+    """
+    Analysis for a proof whose exact bytes were already verified in this store, or None to
+    call Gemini.
+
+    The same customer resending the proof of the order it verified gets that order's earlier
+    verdict (DUPLICATE_RESEND). A proof already used by another customer or another order is
+    flagged REUSED_PROOF for manual review.
+    """
+    if not job.proof_sha256:
+        return None
+    from app.services.proof_hash import ProofHashIndex
+    try:
+        trx = ProofHashIndex.find_exact(job.toko_id, job.proof_sha256)
+    except Exception as e:
+        logging.warning(f"Proof hash lookup error (non-fatal): {e}")
+        return None
+    if not trx:
+        return None
+
+    if _is_own_resend(job, trx):
+        Metrics.incr('payment.phash.cached')
+        job.order_id = trx.order_id
+        job.expected_amount = trx.nominal
+        return {
+            'is_valid': trx.verification_status in ('VERIFIED', 'MANUAL_REVIEW'),
+            'confidence_score': trx.confidence_score or 0,
+            'detected_amount': trx.detected_amount or 0,
+            'bank_name': trx.detected_bank or 'Unknown',
+            'match_status': 'DUPLICATE_RESEND',
+            'fraud_hints': json.loads(trx.fraud_hints_json or "[]"),
+            'duplicate_of': trx.order_id,
+        }
+
+    Metrics.incr('payment.phash.reused')
+    owner = "another customer" if trx.customer_hp != job.customer_hp else "an earlier order"
+    return {
+        'is_valid': False,
+        'confidence_score': 0,
+        'detected_amount': trx.detected_amount or 0,
+        'bank_name': trx.detected_bank or 'Unknown',
+        'match_status': 'REUSED_PROOF',
+        'fraud_hints': [f"proof already used for order #{trx.order_id} by {owner}"],
+        'duplicate_of': trx.order_id,
+    }
+
+
+def _flag_similar_proof(job, analysis: dict) -> dict:
+    """
+    Gemini analysis, marked REUSED_PROOF when the image is perceptually close to a proof of
+    another customer or order (re-encoded or cropped copy) and Gemini read the same amount
+    and bank from it. Receipts that merely share a bank app's layout differ in amount or are
+    left to Gemini's verdict.
+    """
+    if not job.proof_hash or not analysis.get('detected_amount'):
+        return analysis
+    from app.services.proof_hash import ProofHashIndex, from_hex
+    try:
+        matches = ProofHashIndex.find_matches(job.toko_id, from_hex(job.proof_hash))
+    except Exception as e:
+        logging.warning(f"Proof hash lookup error (non-fatal): {e}")
+        return analysis
+
+    bank = (analysis.get('bank_name') or '').lower()
+    for distance, trx in matches:
+        if _is_own_resend(job, trx) or trx.detected_amount != analysis['detected_amount']:
+            continue
+        if trx.detected_bank and trx.detected_bank.lower() != bank:
+            continue
+        Metrics.incr('payment.phash.reused')
+        owner = "another customer" if trx.customer_hp != job.customer_hp else "an earlier order"
+        return dict(
+            analysis,
+            match_status='REUSED_PROOF',
+            fraud_hints=[f"proof looks like the one used for order #{trx.order_id} by {owner}"]
+                        + list(analysis.get('fraud_hints') or []),
+            duplicate_of=trx.order_id,
+            hash_distance=distance,
+        )
+    return analysis
+
+
+def _match(job):
+    analysis = json.loads(job.analysis_json or "{}")
+    is_valid = analysis.get('is_valid', False)
+    confidence = analysis.get('confidence_score', 0)
+
+    # Store verification result in ChatLog for audit trail
+    try:
+        ChatLogWriter.log(job.toko_id, job.customer_hp, 'SYSTEM', f"Payment Verification: {job.analysis_json}")
+    except Exception as log_err:
+        logging.error(f"Failed to log verification: {log_err}")
+
+    match_status = analysis.get('match_status')
+    if match_status == 'REUSED_PROOF':
+        job.result = 'MANUAL_REVIEW'  # Possible fraud - merchant decides
+    elif confidence >= 95 and is_valid:
+        job.result = 'VERIFIED'  # HIGH CONFIDENCE - Auto-approve
+    elif confidence >= 70 and is_valid:
+        job.result = 'MANUAL_REVIEW'  # MEDIUM CONFIDENCE - Flag for manual review
+    else:
+        job.result = 'UNCLEAR'  # LOW CONFIDENCE - Request clearer photo
+
+    if match_status == 'DUPLICATE_RESEND':
+        return  # Order already carries this verdict
+
+    if job.order_id and job.result != 'UNCLEAR':
+        from app.services.order_service import verify_order
+        if job.result == 'VERIFIED':
+            notes = None
+        elif match_status == 'REUSED_PROOF':
+            notes = f"Reused payment proof (order #{analysis.get('duplicate_of')})"
+        else:
+            notes = f"Medium confidence ({confidence}%), needs manual review"
+        verify_order(
+            order_id=job.order_id,
+            verification_status=job.result,
+            confidence_score=confidence,
+            detected_amount=analysis.get('detected_amount', 0),
+            detected_bank=analysis.get('bank_name', 'Unknown'),
+            verified_by='AI',
+            fraud_hints=analysis.get('fraud_hints', []),
+            notes=notes
+        )
+        if match_status != 'REUSED_PROOF' and (job.proof_hash or job.proof_sha256):
+            from app.services.proof_hash import ProofHashIndex, from_hex
+            ProofHashIndex.store(job.order_id, from_hex(job.proof_hash) if job.proof_hash else None, job.proof_sha256)
+        logging.info(f"Order {job.order_id} {'auto-verified by AI' if job.result == 'VERIFIED' else 'flagged for manual review'}")
+
+
+def build_reply(job, analysis: dict) -> str:
+    """Customer reply for a matched job"""
+    confidence = analysis.get('confidence_score', 0)
+    detected_amount = analysis.get('detected_amount', 0)
+    bank_name = analysis.get('bank_name', 'Unknown')
+    order_info = f"Order: #{job.order_id}\n" if job.order_id else ""
+
+    if job.result == 'VERIFIED':
+        return (
+            f"✅ *Pembayaran Terverifikasi!*\n\n"
+            f"{order_info}"
+            f"Bank: {bank_name}\n"
+            f"Nominal: Rp {detected_amount:,}\n"
+            f"Kepercayaan: {confidence}%\n\n"
+            f"Terima kasih! Pesanan Anda segera diproses. 🙏"
+        )
+    if job.result == 'MANUAL_REVIEW':
+        return (
+            f"⚠️ *Bukti Transfer Diterima*\n\n"
+            f"{order_info}"
+            f"Bank: {bank_name}\n"
+            f"Nominal: Rp {detected_amount:,}\n"
+            f"Kepercayaan: {confidence}%\n\n"
+            f"Admin kami akan verifikasi manual segera. "
+            f"Mohon tunggu konfirmasi ya Kak! 🙏"
+        )
+
+    fraud_hints = analysis.get('fraud_hints', [])
+    issues = ", ".join(fraud_hints[:3]) if fraud_hints else "unclear image"
+    return (
+        f"⚠️ *Bukti Transfer Kurang Jelas*\n\n"
+        f"Kepercayaan: {confidence}%\n"
+        f"Masalah: {issues}\n\n"
+        f"Mohon kirim foto yang lebih jelas ya Kak:\n"
+        f"✓ Pastikan status transfer 'BERHASIL'\n"
+        f"✓ Nominal terlihat dengan jelas\n"
+        f"✓ Tidak blur/buram\n\n"
+        f"Terima kasih! 🙏"
+    )
+
+
+def _notify(job):
+    analysis = json.loads(job.analysis_json or "{}")
+
+    # Notify merchant/owner about proofs that need a manual check
+    toko = TenantCache.get_toko(job.toko_id)
+    is_resend = analysis.get('match_status') == 'DUPLICATE_RESEND'
+    if job.result == 'MANUAL_REVIEW' and not is_resend and toko and toko.remote_token:
+        order_ref = f"\nOrder: #{job.order_id}" if job.order_id else ""
+        merchant_notif = (
+            f"🔔 *Bukti Transfer Perlu Review*\n\n"
+            f"Dari: {job.customer_hp}{order_ref}\n"
+            f"Bank: {analysis.get('bank_name', 'Unknown')}\n"
+            f"Nominal: Rp {analysis.get('detected_amount', 0):,}\n"
+            f"Confidence: {analysis.get('confidence_score', 0)}%\n"
+            f"Match Status: {analysis.get('match_status', 'NO_EXPECTED_AMOUNT')}\n\n"
+            f"⚠️ Mohon verifikasi manual via dashboard."
+        )
+        try:
+            # Send to store owner's WhatsApp
+            kirim_waha(f"{toko.remote_token}@c.us", merchant_notif, job.session_name)
+        except Exception as e:
+            logging.warning(f"Could not notify merchant {toko.remote_token}: {e}")
+
+    kirim_waha(job.chat_id, build_reply(job, analysis), job.session_name)
+
+
+STAGE_HANDLERS = {
+    'DOWNLOAD': _download,
+    'PREPROCESS': _preprocess,
+    'VISION': _vision,
+    'MATCH': _match,
+    'NOTIFY': _notify,
+}
+
+
+class PaymentPipeline:
+    """Persisted, staged payment proof verification"""
+
+    _pools = {}
+    _app = None
+    _wakeup = threading.Event()
+    _in_flight = 0
+    _in_flight_lock = threading.Lock()
+
+    @classmethod
+    def submit(cls, toko_id: str, customer_hp: str, chat_id: str, session_name: str, media_url: str, caption: str = ""):
+        """Persist a verification job; runs inline when PAYMENT_PIPELINE_ASYNC is off"""
+        inline = not Config.PAYMENT_PIPELINE_ASYNC
+        lease = datetime.now() if inline else None
+        job = PaymentVerificationJob(
+            toko_id=toko_id, customer_hp=customer_hp, chat_id=chat_id, session_name=session_name,
+            media_url=(media_url or "")[:500] or None, caption=(caption or "")[:500],
+            stage=STAGES[0], status='PROCESSING' if inline else 'PENDING', claimed_at=lease
+        )
+        db.session.add(job)
+        db.session.commit()
+        Metrics.incr('payment.enqueued')
+
+        if inline:
+            cls.run_inline(job.id, lease)  # Created leased: the dispatcher never claims it
+        else:
+            cls._wakeup.set()  # Same-process dispatcher picks it up without waiting for the poll
+        return job.id
+
+    @classmethod
+    def run_inline(cls, job_id: int, lease: datetime = None):
+        """
+        Run all remaining stages in the calling thread (requires an app context).
+        Without a lease the job is claimed first, like the dispatcher does; a job that is
+        finished, waiting for a retry or already claimed is left alone.
+        """
+        if lease is None:
+            lease = datetime.now()
+            if not db.session.execute(
+                update(PaymentVerificationJob)
+                .where(PaymentVerificationJob.id == job_id,
+                       PaymentVerificationJob.status == 'PENDING',
+                       PaymentVerificationJob.available_at == None)
+                .values(status='PROCESSING', claimed_at=lease)
+            ).rowcount:
+                db.session.rollback()
+                return
+            db.session.commit()
+
+        while True:
+            lease = cls._renew_lease(job_id, lease)
+            if lease is None:
+                return  # Finished, retrying, or taken over after the lease expired
+            if cls._run_stage(db.session.get(PaymentVerificationJob, job_id)) is None:
+                return
+
+    @classmethod
+    def _run_stage(cls, job):
+        """
+        Run the job's current stage and persist the outcome.
+
+        Returns:
+            the next stage to run, or None if the job left the pipeline (done, failed or retrying)
+        """
+        job_id = job.id
+        stage = job.stage
+        if stage in ('PREPROCESS', 'VISION') and not os.path.exists(media_path(job_id)):
+            stage = job.stage = STAGES[0]  # Spooled image lost (restart on a fresh host)
+            db.session.commit()
+
+        try:
+            with Metrics.timer(f'payment.stage.{stage.lower()}'):
+                STAGE_HANDLERS[stage](job)
+        except StageError as e:
+            db.session.rollback()
+            cls._fail(job_id, str(e), reply=str(e))
+            return None
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Payment job #{job_id} stage {stage} failed: {e}", exc_info=True)
+            job = db.session.get(PaymentVerificationJob, job_id)
+            job.attempts = (job.attempts or 0) + 1
+            if job.attempts >= Config.PAYMENT_MAX_ATTEMPTS:
+                cls._fail(job_id, f"{stage}: {e}", reply=ERROR_REPLY)
+                cls._report_error(job.toko_id, e)
+                return None
+            job.status = 'PENDING'
+            job.last_error = f"{stage}: {e}"[:500]
+            job.available_at = datetime.now() + timedelta(seconds=2 ** job.attempts)
+            db.session.commit()
+            Metrics.incr('payment.retried')
+            return None
+
+        index = STAGES.index(stage)
+        if index + 1 < len(STAGES):
+            job.stage = STAGES[index + 1]
+            db.session.commit()
+            return job.stage
+
+        job.status = 'DONE'
+        job.finished_at = datetime.now()
+        job.last_error = None
+        db.session.commit()
+        _discard_media(job_id)
+        Metrics.incr('payment.completed')
+        Metrics.observe('payment.total_seconds', (job.finished_at - job.created_at).total_seconds())
+        return None
+
+    @staticmethod
+    def _fail(job_id: int, error: str, reply: str = None):
+        job = db.session.get(PaymentVerificationJob, job_id)
+        job.status = 'FAILED'
+        job.last_error = error[:500]
+        job.finished_at = datetime.now()
+        db.session.commit()
+        _discard_media(job_id)
+        Metrics.incr('payment.failed')
+        if reply:
+            kirim_waha(job.chat_id, reply, job.session_name)
+
+    @staticmethod
+    def _report_error(toko_id: str, error: Exception):
+        # Track error for monitoring
+        try:
+            from app.services.error_monitoring import ErrorMonitor
+            ErrorMonitor.log_error(
+                "PAYMENT_VERIFICATION_FAILURE",
+                f"Failed for toko {toko_id}: {str(error)}",
+                severity="ERROR"
+            )
+        except Exception:
+            pass
+
+    # --- background execution ---
+
+    @classmethod
+    def _start_pools(cls):
+        for stage in STAGES:
+            if stage not in cls._pools:
+                workers = max(1, getattr(Config, f'PAYMENT_{stage}_WORKERS'))
+                cls._pools[stage] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"Payment{stage.title()}")
+
+    @staticmethod
+    def _renew_lease(job_id: int, lease: datetime):
+        """New lease if this dispatcher still holds the job, else None (taken over after expiry)"""
+        renewed = datetime.now()
+        if not db.session.execute(
+            update(PaymentVerificationJob)
+            .where(PaymentVerificationJob.id == job_id,
+                   PaymentVerificationJob.status == 'PROCESSING',
+                   PaymentVerificationJob.claimed_at == lease)
+            .values(claimed_at=renewed)
+        ).rowcount:
+            db.session.rollback()
+            return None
+        db.session.commit()
+        return renewed
+
+    @classmethod
+    def _execute(cls, job_id: int, lease: datetime):
+        """Pool task: run one stage, then hand the job to the next stage's pool"""
+        next_stage = None
+        with cls._app.app_context():
+            try:
+                lease = cls._renew_lease(job_id, lease)
+                if lease is None:
+                    logging.warning(f"Payment job #{job_id}: lease lost, another dispatcher owns it")
+                    Metrics.incr('payment.lease_lost')
+                else:
+                    job = db.session.get(PaymentVerificationJob, job_id)
+                    next_stage = cls._run_stage(job)
+            except Exception as e:
+                logging.error(f"Payment pipeline error (job #{job_id}): {e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+        if next_stage:
+            cls._pools[next_stage].submit(cls._execute, job_id, lease)
+        else:
+            with cls._in_flight_lock:
+                cls._in_flight -= 1
+
+    @classmethod
+    def _claim(cls) -> int:
+        with cls._in_flight_lock:
+            room = Config.PAYMENT_MAX_IN_FLIGHT - cls._in_flight
+        if room <= 0:
+            return 0
+
+        now = datetime.now()
+        batch = PaymentVerificationJob.query.filter(
+            PaymentVerificationJob.status == 'PENDING',
+            db.or_(PaymentVerificationJob.available_at == None, PaymentVerificationJob.available_at <= now)
+        ).order_by(PaymentVerificationJob.id).limit(min(room, CLAIM_BATCH_SIZE)).all()
+        if not batch:
+            return 0
+
+        # Conditional claim: a dispatcher in another process must not take the same job
+        claimed = []
+        for job in batch:
+            if db.session.execute(
+                update(PaymentVerificationJob)
+                .where(PaymentVerificationJob.id == job.id, PaymentVerificationJob.status == 'PENDING')
+                .values(status='PROCESSING', available_at=None, claimed_at=now)
+            ).rowcount:
+                claimed.append((job.id, job.stage if job.stage in STAGES else STAGES[0]))
+        db.session.commit()
+
+        with cls._in_flight_lock:
+            cls._in_flight += len(claimed)
+        for job_id, stage in claimed:
+            cls._pools[stage].submit(cls._execute, job_id, now)
+        return len(claimed)
+
+    @staticmethod
+    def _release_expired_leases() -> int:
+        """PROCESSING jobs of a dead dispatcher (lease not renewed in PAYMENT_LEASE_SECONDS) back to PENDING"""
+        expired = datetime.now() - timedelta(seconds=Config.PAYMENT_LEASE_SECONDS)
+        released = PaymentVerificationJob.query.filter(
+            PaymentVerificationJob.status == 'PROCESSING',
+            db.or_(PaymentVerificationJob.claimed_at == None, PaymentVerificationJob.claimed_at < expired)
+        ).update({'status': 'PENDING'}, synchronize_session=False)
+        db.session.commit()
+        if released:
+            logging.info(f"Payment pipeline: resumed {released} interrupted jobs")
+        return released
+
+    @staticmethod
+    def get_queue_depth() -> int:
+        try:
+            return PaymentVerificationJob.query.filter_by(status='PENDING').count()
+        except Exception as e:
+            logging.error(f"Payment queue depth error: {e}")
+            return -1
+
+    @staticmethod
+    def _cleanup_finished_jobs():
+        cutoff = datetime.now() - timedelta(hours=RETENTION_HOURS)
+        deleted = PaymentVerificationJob.query.filter(
+            PaymentVerificationJob.status.in_(('DONE', 'FAILED')),
+            PaymentVerificationJob.created_at < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        if deleted:
+            logging.info(f"Payment pipeline: purged {deleted} finished jobs")
+
+
+def worker_payment_pipeline(app):
+    """
+    Dispatcher for the payment verification pipeline.
+    Normally runs in the process that holds the worker lock, but the heartbeat restart and
+    other instances can start more: jobs are leased, so each one runs in one dispatcher only.
+    """
+    PaymentPipeline._app = app
+    PaymentPipeline._start_pools()
+
+    logging.info("💳 Payment Pipeline Started")
+    last_cleanup = 0
+    last_lease_check = 0
+
+    while True:
+        claimed = 0
+        with app.app_context():
+            try:
+                # Jobs of a dead dispatcher resume at their current stage; live leases are left alone
+                if time.time() - last_lease_check > LEASE_CHECK_INTERVAL:
+                    PaymentPipeline._release_expired_leases()
+                    last_lease_check = time.time()
+
+                claimed = PaymentPipeline._claim()
+                Metrics.set_gauge('payment.queue_depth', PaymentPipeline.get_queue_depth())
+                Metrics.set_gauge('payment.in_flight', PaymentPipeline._in_flight)
+
+                if time.time() - last_cleanup > CLEANUP_INTERVAL:
+                    PaymentPipeline._cleanup_finished_jobs()
+                    last_cleanup = time.time()
+            except Exception as e:
+                logging.error(f"Payment pipeline dispatcher error: {e}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+        if not claimed:
+            PaymentPipeline._wakeup.wait(POLL_INTERVAL)
+            PaymentPipeline._wakeup.clear()
@@ -0,0 +1,185 @@
+"""
+Store Prompt Cache
+Compiles the static part of a store's Gemini prompt (store info, style guide,
+menu or catalog overview) once per toko and reuses it on every message. Knowledge-base chunks depend on
+the customer message and are retrieved per turn (see knowledge_base.py).
+
+An entry is rebuilt when:
+  - the Toko row or one of its Menu rows changes in this process (TenantCache hooks),
+  - the base prompt or store fields, including the Toko.menu_version token that every Menu
+    write replaces (edits made by other processes count once their cached Toko row expires),
+    no longer match its fingerprint,
+  - PROMPT_CACHE_TTL expires.
+
+Long prefixes are additionally uploaded as a Gemini cached content (system instruction)
+so repeated turns only send the per-customer part of the prompt.
+"""
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from google.genai import types
+from app.config import Config
+from app.services.metrics import Metrics
+from app.services.tenant_cache import TenantCache
+from app.services.menu_index import MenuIndex
+
+DEFAULT_BASE_PROMPT = "Anda adalah asisten toko WhatsApp."
+
+
+@dataclass
+class PromptPrefix:
+    """Compiled prompt prefix of one store"""
+    text: str
+    fingerprint: str
+    expires_at: float
+    # Gemini cached content (one per model/client), None when not uploaded
+    remote_name: str = None
+    remote_model: str = None
+    remote_client: object = None
+    remote_expires_at: float = 0
+    remote_retry_at: float = 0
+
+
+def build_store_prompt(toko, base_prompt: str) -> str:
+    """Static system context of a store (no per-customer data)"""
+    context = f"""
+        Nama Toko: {toko.nama}
+        Kategori: {toko.kategori}
+        Link Toko: {toko.link_toko if hasattr(toko, 'link_toko') else '-'}
+        Token Owner: {toko.remote_token}
+        Nama Anda (Admin): {toko.admin_name}
+
+        Sistem Prompt:
+        Anda adalah {toko.admin_name}, seorang admin manusia yang ramah di toko WhatsApp {toko.nama}.
+        {base_prompt}
+
+        Gaya Bicara Admin WhatsApp (PENTING):
+        1. Gunakan bahasa manusia yang luwes, santai, dan solutif. Hindari gaya bicara robot atau template kaku.
+        2. Sesekali gunakan singkatan manusia (misal: sdh, blm, sy, ok, kak, ready) agar tidak terlihat seperti AI.
+        3. Panggil diri Anda sebagai '{toko.admin_name}' sesekali untuk membangun kedekatan (Contoh: "Sebentar ya Kak, {toko.admin_name} cek stoknya dulu...").
+        4. Berikan variasi jawaban, jangan pernah menjawab dengan kalimat yang sama persis jika ditanya berulang kali.
+        5. Gunakan emoji secara natural (😊, 🙏, 👍).
+        6. **AI Awareness**: Jika lawan bicara terlihat seperti bot atau AI (misal: terus mengulang sapaan basa-basi), berikan respon penutup yang sopan (Contoh: "Ok Kak, saya standby di sini ya jika butuh bantuan lagi!") dan BERHENTI bertanya balik.
+        7. **Command Awareness**: Jika user bertanya tentang cara berhenti, menghapus data, aktivasi ulang, atau perintah teknis lainnya, sarankan mereka secara halus untuk mengetik */help* untuk melihat menu pengaturan teknis. (Contoh: "Untuk berhenti berlangganan atau hapus data, Kakak bisa ketik /help ya untuk bantuan teknis.").
+
+        Daftar Menu/Produk:
+        {MenuIndex.prompt_catalog(toko)}
+        """
+
+    return context
+
+
+class StorePromptCache:
+    """Per-process cache of compiled store prompt prefixes"""
+
+    _lock = threading.Lock()
+    _entries = {}  # toko_id -> PromptPrefix
+    _listening = False
+
+    @classmethod
+    def _listen(cls):
+        # Toko and Menu writes invalidate ('toko', toko_id) in TenantCache
+        if not cls._listening:
+            cls._listening = True
+            TenantCache.on_invalidate(cls._on_tenant_invalidate)
+
+    @classmethod
+    def _on_tenant_invalidate(cls, kind, key):
+        if kind is None:
+            cls.clear()
+        elif kind == 'toko':
+            cls.invalidate(key)
+
+    @staticmethod
+    def fingerprint(toko, base_prompt: str) -> str:
+        parts = [
+            toko.id, toko.nama, toko.kategori, getattr(toko, 'link_toko', '-'),
+            toko.remote_token, toko.admin_name, toko.menu_version, base_prompt,
+        ]
+        return hashlib.sha1('\x1f'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def get(cls, toko) -> PromptPrefix:
+        """Compiled prefix of a store, rebuilt only when its inputs changed"""
+        cls._listen()
+        base_prompt = TenantCache.get_config('gemini_prompt', toko.id) or DEFAULT_BASE_PROMPT
+        fingerprint = cls.fingerprint(toko, base_prompt)
+        now = time.monotonic()
+
+        with cls._lock:
+            entry = cls._entries.get(toko.id)
+        if entry and entry.fingerprint == fingerprint and entry.expires_at > now:
+            Metrics.incr('prompt_cache.hit')
+            return entry
+
+        Metrics.incr('prompt_cache.miss')
+        start = time.perf_counter()
+        MenuIndex.get(toko.id, version=toko.menu_version or '')  # Menu edited by another process: reindex first
+        entry = PromptPrefix(
+            text=build_store_prompt(toko, base_prompt),
+            fingerprint=fingerprint,
+            expires_at=now + Config.PROMPT_CACHE_TTL,
+        )
+        Metrics.observe('prompt_cache.build', time.perf_counter() - start)
+        with cls._lock:
+            cls._entries[toko.id] = entry
+        return entry
+
+    @classmethod
+    def remote_cache_name(cls, toko_id: str, entry: PromptPrefix, client, model: str):
+        """
+        Name of a Gemini cached content holding the prefix (system instruction), or None.
+        Created lazily for prefixes long enough to be cacheable; failures back off for one TTL.
+        """
+        if not Config.GEMINI_CONTEXT_CACHE_ENABLED or len(entry.text) < Config.GEMINI_CONTEXT_CACHE_MIN_CHARS:
+            return None
+
+        now = time.monotonic()
+        # Keep a 60s margin so a request never races the server-side expiry
+        if entry.remote_name and entry.remote_model == model and entry.remote_client is client \
+                and entry.remote_expires_at - 60 > now:
+            return entry.remote_name
+        if entry.remote_retry_at > now:
+            return None
+
+        try:
+            cache = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=entry.text,
+                    display_name=f"toko-{toko_id}",
+                    ttl=f"{Config.GEMINI_CONTEXT_CACHE_TTL}s",
+                ),
+            )
+        except Exception as e:
+            logging.warning(f"Gemini context cache unavailable for {toko_id} ({model}): {e}")
+            Metrics.incr('prompt_cache.remote_failed')
+            entry.remote_retry_at = now + Config.GEMINI_CONTEXT_CACHE_TTL
+            return None
+
+        # An outdated cache of the previous prefix simply expires server-side
+        entry.remote_name = cache.name
+        entry.remote_model = model
+        entry.remote_client = client
+        entry.remote_expires_at = now + Config.GEMINI_CONTEXT_CACHE_TTL
+        Metrics.incr('prompt_cache.remote_created')
+        logging.info(f"🧠 Gemini context cache created for {toko_id}: {cache.name}")
+        return cache.name
+
+    @classmethod
+    def drop_remote(cls, entry: PromptPrefix):
+        """Forget a cached content that Gemini rejected (expired or deleted) and back off"""
+        entry.remote_name = None
+        entry.remote_retry_at = time.monotonic() + Config.GEMINI_CONTEXT_CACHE_TTL
+
+    @classmethod
+    def invalidate(cls, toko_id: str):
+        with cls._lock:
+            cls._entries.pop(toko_id, None)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries.clear()
@@ -0,0 +1,133 @@
+"""
+Payment Proof Perceptual Hash
+64-bit dHash of every payment proof (grayscale 9x8 thumbnail, one bit per horizontal gradient),
+stored on the Transaction it verified. Re-encoding, resizing and recompression by WhatsApp
+change only a few bits, so a resent or reused screenshot lands within a small Hamming distance.
+
+Lookup per store uses multi-index hashing: the hash is split into four 16-bit bands stored in
+indexed columns. Two hashes within distance 3 always share at least one band (pigeonhole),
+so an OR of four indexed equality lookups returns every candidate; the exact distance is then
+checked in Python.
+
+A 9x8 dHash cannot tell apart two receipts of the same bank app that differ only in amount
+or reference number, so a near match alone never decides a verdict: only an exact resend
+(same SHA-256 of the image bytes) skips Gemini, and near matches are flagged only when
+Gemini reads the same amount and bank (see payment_pipeline._known_proof_verdict and
+_flag_similar_proof).
+
+Decoding needs Pillow; without it only the SHA-256 is computed.
+"""
+import hashlib
+import io
+import logging
+from app.config import Config
+from app.extensions import db
+from app.models import Transaction
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+BANDS = 4
+BAND_BITS = 16
+BAND_MASK = (1 << BAND_BITS) - 1
+BAND_COLUMNS = ('proof_hash_b0', 'proof_hash_b1', 'proof_hash_b2', 'proof_hash_b3')
+
+
+def dhash(data: bytes):
+    """64-bit difference hash of an image, or None if it cannot be decoded"""
+    if Image is None or not data:
+        return None
+    try:
+        img = Image.open(io.BytesIO(data))
+        if img.format == 'JPEG':
+            img.draft('L', (64, 64))
+        img = ImageOps.exif_transpose(img).convert('L').resize((9, 8), Image.LANCZOS)
+        pixels = list(img.getdata())
+    except Exception as e:
+        logging.warning(f"Proof hash failed: {e}")
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def from_hex(text: str) -> int:
+    return int(text, 16)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def bands(value: int) -> list:
+    """16-bit bands, most significant first"""
+    return [(value >> (BAND_BITS * (BANDS - 1 - i))) & BAND_MASK for i in range(BANDS)]
+
+
+class ProofHashIndex:
+    """Near-duplicate proof lookup over Transaction.proof_hash"""
+
+    @staticmethod
+    def max_distance() -> int:
+        # Beyond BANDS - 1 the band lookup could miss matches
+        return max(0, min(Config.PAYMENT_PHASH_MAX_DISTANCE, BANDS - 1))
+
+    @classmethod
+    def find_matches(cls, toko_id: str, proof_hash: int) -> list:
+        """
+        Transactions of this store with a proof within PAYMENT_PHASH_MAX_DISTANCE.
+
+        Returns:
+            list of (distance, Transaction), closest first
+        """
+        hash_bands = bands(proof_hash)
+        candidates = Transaction.query.filter(
+            Transaction.toko_id == toko_id,
+            db.or_(*[getattr(Transaction, col) == band for col, band in zip(BAND_COLUMNS, hash_bands)])
+        ).all()
+
+        limit = cls.max_distance()
+        matches = []
+        for trx in candidates:
+            if not trx.proof_hash:
+                continue
+            distance = hamming(proof_hash, from_hex(trx.proof_hash))
+            if distance <= limit:
+                matches.append((distance, trx))
+        matches.sort(key=lambda m: (m[0], -m[1].id))
+        return matches
+
+    @staticmethod
+    def find_exact(toko_id: str, digest: str):
+        """Latest Transaction of this store verified with the very same image bytes, or None"""
+        return Transaction.query.filter_by(toko_id=toko_id, proof_sha256=digest)\
+            .order_by(Transaction.id.desc()).first()
+
+    @staticmethod
+    def store(order_id: str, proof_hash: int = None, digest: str = None) -> bool:
+        """Record the proof hashes on the order it verified (caller commits)"""
+        trx = Transaction.query.filter_by(order_id=order_id).first()
+        if not trx:
+            return False
+        if digest:
+            trx.proof_sha256 = digest
+        if proof_hash is not None:
+            trx.proof_hash = to_hex(proof_hash)
+            for col, band in zip(BAND_COLUMNS, bands(proof_hash)):
+                setattr(trx, col, band)
+        return True
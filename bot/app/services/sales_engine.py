@@ -1,73 +1,223 @@
 from app.extensions import db
 from app.models import Customer, Toko, ChatLog
+from app.services.tenant_cache import TenantCache
 from app.services.waha import kirim_waha
 from app.services.gemini import get_client
+from app.services.conversation_memory import ConversationMemory
+from app.services.burst_limiter import BurstLimiter
+from app.services.chatlog_writer import ChatLogWriter
+from app.services.metrics import Metrics
+from app.config import Config
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from flask import current_app
+from pathlib import Path
+from sqlalchemy import update, or_, and_
 import logging
+import threading
+import time
+
+# One engine run at a time per process (timer vs kick vs cron self-heal)
+_run_lock = threading.Lock()
+# Same-process kicks wake the worker immediately; other gunicorn workers touch the kick file
+_kick_event = threading.Event()
+_last_kick = 0.0
+
+
+def kick_followups():
+    """
+    Ask the SalesEngine worker for an early run (cheap, safe to call per webhook).
+    Rate-limited per process; the worker itself never runs more often than
+    SALES_ENGINE_KICK_MIN_INTERVAL.
+    """
+    global _last_kick
+    now = time.time()
+    if now - _last_kick < Config.SALES_ENGINE_KICK_MIN_INTERVAL:
+        return
+    _last_kick = now
+    _kick_event.set()
+    try:
+        Path(Config.SALES_ENGINE_KICK_FILE).touch()
+    except OSError as e:
+        logging.debug(f"SalesEngine kick file error: {e}")
+    Metrics.incr('sales_engine.kicks')
+
+
+def _kicked_since(ts: float) -> bool:
+    if _kick_event.is_set():
+        return True
+    try:
+        return Path(Config.SALES_ENGINE_KICK_FILE).stat().st_mtime > ts
+    except OSError:
+        return False
+
+
+def _rate_limited_wait(now: float, last_run: float) -> float:
+    """
+    Seconds until a pending kick may run. Clears the event first: while it stays set,
+    _kick_event.wait() returns at once and the worker loop spins until the interval passes.
+    """
+    _kick_event.clear()
+    return max(0.0, last_run + Config.SALES_ENGINE_KICK_MIN_INTERVAL - now)
+
 
 def check_and_send_followups(app):
     """
     Checks for idle customers and sends follow-up messages.
     Designed to run in a background thread with app context.
+    Skips if a run is already in progress in this process.
     """
+    if not _run_lock.acquire(blocking=False):
+        Metrics.incr('sales_engine.skipped')
+        return
+    try:
+        with app.app_context(), Metrics.timer('sales_engine.run'):
+            Metrics.incr('sales_engine.runs')
+            _send_followups()
+    finally:
+        _run_lock.release()
+
+
+def _candidate_pages(threshold: datetime):
+    """
+    Keyset pagination over idle customers, oldest interaction first.
+    Served by ix_customer_followup_status_last_interaction; the (last_interaction, id)
+    cursor keeps each page an index range scan no matter how deep the backlog is.
+    """
+    cursor = None
+    while True:
+        query = db.session.query(Customer.id, Customer.toko_id, Customer.last_interaction).filter(
+            Customer.followup_status == 'NONE',
+            Customer.last_interaction < threshold,
+            Customer.last_interaction != None,
+            Customer.nomor_hp != Customer.toko_id  # Identity Guard
+        )
+        if cursor:
+            last_interaction, last_id = cursor
+            query = query.filter(or_(
+                Customer.last_interaction > last_interaction,
+                and_(Customer.last_interaction == last_interaction, Customer.id > last_id)
+            ))
+        page = query.order_by(Customer.last_interaction, Customer.id).limit(Config.SALES_ENGINE_PAGE_SIZE).all()
+        db.session.commit()  # Don't hold a read transaction while nudges are sent
+        if not page:
+            return
+        yield page
+        cursor = (page[-1].last_interaction, page[-1].id)
+
+
+def _release_stale_claims() -> int:
+    """
+    SENDING claims whose nudge never finished (process died or was recycled mid-send) back to NONE.
+    A live nudge commits SENT/NONE within seconds, far inside SALES_ENGINE_CLAIM_TIMEOUT_MINUTES.
+    """
+    expired = datetime.now() - timedelta(minutes=Config.SALES_ENGINE_CLAIM_TIMEOUT_MINUTES)
+    released = db.session.execute(
+        update(Customer)
+        .where(Customer.followup_status == 'SENDING',
+               or_(Customer.followup_claimed_at == None, Customer.followup_claimed_at < expired))
+        .values(followup_status='NONE', followup_claimed_at=None)
+    ).rowcount
+    db.session.commit()
+    if released:
+        logging.info(f"SalesEngine: Released {released} stale follow-up claims.")
+        Metrics.incr('sales_engine.claims_released', released)
+    return released
+
+
+def _send_followups():
+    """One follow-up pass (caller holds the run guard and app context)"""
+    try:
+        _release_stale_claims()
+
+        # "Deep Sleep" logic from brief says >6 hours for Auto Follow-up
+        threshold = datetime.now() - timedelta(hours=6)
+        app = current_app._get_current_object()
+        remaining = Config.SALES_ENGINE_MAX_PER_RUN
+
+        with ThreadPoolExecutor(max_workers=Config.SALES_ENGINE_WORKERS, thread_name_prefix="SalesNudge") as pool:
+            for page in _candidate_pages(threshold):
+                page = page[:remaining]
+                remaining -= len(page)
+                Metrics.incr('sales_engine.candidates', len(page))
+                logging.info(f"SalesEngine: Found {len(page)} candidates for follow-up.")
+
+                # One task per store: its customers are nudged serially with one client/session
+                by_store = defaultdict(list)
+                for row in page:
+                    by_store[row.toko_id].append(row.id)
+                for future in [pool.submit(_nudge_store, app, toko_id, ids) for toko_id, ids in by_store.items()]:
+                    future.result()
+
+                if remaining <= 0:
+                    logging.info("SalesEngine: Per-run limit reached, continuing next cycle.")
+                    break
+
+    except Exception as e:
+        logging.error(f"SalesEngine Fatal: {e}")
+
+
+def _nudge_store(app, toko_id: str, customer_ids: list):
+    """Nudge one store's candidates (runs on the SalesNudge pool)"""
     with app.app_context():
         try:
-            # 1. Configuration
-            # "Deep Sleep" logic from brief says >6 hours for Auto Follow-up
-            # For testing/demo, we can set this lower, but let's stick to 6 hours for prod logic
-            threshold = datetime.now() - timedelta(hours=6)
-            
-            # Batch size to prevent timeouts
-            BATCH_SIZE = 5
-
-            # 2. Query Candidates
-            # - Has chatted before (last_interaction not None)
-            # - Last chat was OLDER than threshold
-            # - Has NOT been followed up yet for this session (status == 'NONE')
-            # - Optional: Ignore if blocked or completed (assuming order_status resets on complete)
-            
-            candidates = Customer.query.filter(
-                Customer.last_interaction < threshold,
-                Customer.followup_status == 'NONE',
-                Customer.last_interaction != None,
-                Customer.nomor_hp != Customer.toko_id # Identity Guard
-            ).limit(BATCH_SIZE).all()
-
-            if not candidates:
-                return
-
-            logging.info(f"SalesEngine: Found {len(candidates)} candidates for follow-up.")
-
-            for cust in candidates:
-                try:
-                    toko = cust.toko
-                    if not toko: continue
-
-                    # 3. Generate Nudge
-                    msg = generate_nudge(toko, cust)
-                    
-                    if msg:
-                        # 4. Send Message
-                        kirim_waha(cust.nomor_hp, msg, toko.session_name)
-                        
-                        # 5. Update State
-                        cust.followup_status = 'SENT'
-                        # Reset interaction time? No, keep it to measure gap.
-                        # Status SENT prevents loop.
-                        
-                        # Log conversation
-                        db.session.add(ChatLog(toko_id=toko.id, customer_hp=cust.nomor_hp, role='BOT', message=msg))
-                        db.session.commit()
-                        logging.info(f"SalesEngine: Sent nudge to {cust.nomor_hp}")
-                    
-                except Exception as e:
-                    logging.error(f"SalesEngine Error {cust.nomor_hp}: {e}")
-                    # Prevent infinite retry on error
-                    cust.followup_status = 'ERROR'
-                    db.session.commit()
-                    
+            customers = Customer.query.filter(Customer.id.in_(customer_ids)).order_by(Customer.last_interaction).all()
+            for cust in customers:
+                _nudge_customer(toko_id, cust)
         except Exception as e:
-            logging.error(f"SalesEngine Fatal: {e}")
+            logging.error(f"SalesEngine Store Error {toko_id}: {e}")
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+
+def _nudge_customer(toko_id: str, cust):
+    try:
+        toko = TenantCache.get_toko(toko_id)
+        if not toko: return
+
+        # Claim: only one engine may nudge this customer
+        claimed = db.session.execute(
+            update(Customer)
+            .where(Customer.id == cust.id, Customer.followup_status == 'NONE')
+            .values(followup_status='SENDING', followup_claimed_at=datetime.now())
+        ).rowcount
+        db.session.commit()
+        if not claimed:
+            return
+        toko = TenantCache.get_toko(toko_id)  # Re-attach after commit
+
+        # Generate Nudge
+        msg = generate_nudge(toko, cust)
+
+        if msg:
+            # Send Message
+            kirim_waha(cust.nomor_hp, msg, toko.session_name)
+            BurstLimiter.record_send(toko.id, cust.nomor_hp)
+
+            # Update State
+            cust.followup_status = 'SENT'
+            # Reset interaction time? No, keep it to measure gap.
+            # Status SENT prevents loop.
+
+            # Log conversation
+            ChatLogWriter.log(toko.id, cust.nomor_hp, 'BOT', msg)
+            ConversationMemory.append(ConversationMemory.get_state(toko.id, cust.nomor_hp), 'BOT', msg)
+            db.session.commit()
+            Metrics.incr('sales_engine.sent')
+            logging.info(f"SalesEngine: Sent nudge to {cust.nomor_hp}")
+        else:
+            cust.followup_status = 'NONE'
+            db.session.commit()
+
+    except Exception as e:
+        logging.error(f"SalesEngine Error {cust.nomor_hp}: {e}")
+        Metrics.incr('sales_engine.errors')
+        # Prevent infinite retry on error
+        db.session.rollback()
+        cust.followup_status = 'ERROR'
+        db.session.commit()
 
 def generate_nudge(toko, cust):
     # Priority 1: Pending Payment
@@ -110,16 +260,18 @@ def generate_nudge(toko, cust):
         return f"Halo Kak! Masih berminat dengan menu kami?"
 
 def worker_sales_engine(app):
-    """Background worker for Sales Engine"""
-    import time
+    """
+    Background worker for Sales Engine (the only place follow-ups run).
+    Runs every 10-30 minutes, or earlier when kicked by incoming traffic.
+    """
     import random
-    
+
     logging.info("SalesEngine Worker Started...")
+    last_run = 0.0
+    next_run = time.time()
+    kick_pending = False
     while True:
         try:
-            # Run every 30 minutes (approx) to avoid spamming validity checks
-            # But sleeping 30 mins blocks thread? No, it's a thread.
-            
             # Check maintenance
             from app.models import SystemConfig
             with app.app_context():
@@ -128,13 +280,24 @@ def worker_sales_engine(app):
                      logging.info("SalesEngine Paused (Maintenance Mode)")
                      time.sleep(300)
                      continue
-            
-            check_and_send_followups(app)
-            
-            # Sleep 10-30 minutes
-            sleep_time = random.uniform(600, 1800) 
-            time.sleep(sleep_time)
-            
+
+            now = time.time()
+            kick_pending = kick_pending or _kicked_since(last_run)
+            if now >= next_run or (kick_pending and now - last_run >= Config.SALES_ENGINE_KICK_MIN_INTERVAL):
+                _kick_event.clear()
+                kick_pending = False
+                last_run = now
+                check_and_send_followups(app)
+                # Sleep 10-30 minutes unless kicked
+                next_run = time.time() + random.uniform(600, 1800)
+                timeout = Config.SALES_ENGINE_KICK_POLL_SECONDS
+            elif kick_pending:
+                timeout = min(_rate_limited_wait(now, last_run), next_run - now)
+            else:
+                timeout = Config.SALES_ENGINE_KICK_POLL_SECONDS
+
+            _kick_event.wait(timeout)
+
         except Exception as e:
             logging.error(f"SalesEngine Worker Crash: {e}")
             time.sleep(300)
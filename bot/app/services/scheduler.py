@@ -65,6 +65,9 @@ def worker_scheduler(app):
                                 status='PENDING'
                             )
                             db.session.add(new_job)
+                            db.session.flush()
+                            from app.services.broadcast_manager import BroadcastManager
+                            BroadcastManager.add_targets(new_job.id, target_list)
                         else:
                             logging.warning(f"⚠️ SchedJob {s_job.id} skipped - Resolved target_list is EMPTY (type={s_job.target_type})")
                             # Optional: mark as failed instead of executed? 
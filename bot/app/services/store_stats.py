@@ -0,0 +1,317 @@
+"""
+Daily Store Stats
+Merchant dashboard numbers are read from daily_store_stats (one row per store per day)
+instead of scanning ChatLog/Transaction on every page view.
+  - Write time: ChatLogWriter (chats in/out), the webhook (new customers) and verify_order
+    (revenue, orders, first/repeat buyers) add their deltas with UPDATE ... SET col = col + n,
+    or INSERT for the first event of the day.
+  - Daily cron: rebuild() recomputes the last STORE_STATS_REPAIR_DAYS closed days from the
+    source tables, repairing increments lost to crashes. Until the 'store_stats_backfilled'
+    SystemConfig marker is set it backfills the whole history instead (increments may have
+    created rows before that); scripts/backfill_store_stats.py does the same on demand.
+Chat counts of days already purged by ChatLog retention are left as they are.
+"""
+import logging
+from datetime import date, datetime, timedelta
+from sqlalchemy import update, insert
+from sqlalchemy.exc import IntegrityError
+from app.config import Config
+from app.extensions import db
+from app.models import DailyStoreStats, Transaction, ChatLog, Customer, SystemConfig
+from app.services.metrics import Metrics
+
+CHAT_IN_ROLES = ('USER',)
+CHAT_OUT_ROLES = ('AI', 'BOT')
+STAT_COLUMNS = ('revenue', 'orders', 'chats_in', 'chats_out', 'new_customers', 'first_buyers', 'repeat_buyers')
+CHAT_COLUMNS = ('chats_in', 'chats_out')
+BACKFILL_KEY = 'store_stats_backfilled'  # SystemConfig marker: full history rebuilt once
+
+
+def as_date(value) -> date:
+    """func.date() result: date (PostgreSQL) or 'YYYY-MM-DD' (SQLite)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+class StoreStats:
+    """Incremental and rebuilt daily rollups per store"""
+
+    # --- Write time ---
+
+    @classmethod
+    def add(cls, updates: dict) -> bool:
+        """
+        Add deltas to daily rows and commit. Call after the caller's own commit.
+
+        Args:
+            updates: {(toko_id, day): {column: delta}}
+        """
+        updates = {key: deltas for key, deltas in updates.items() if key[0] and any(deltas.values())}
+        if not updates:
+            return True
+        for attempt in range(2):
+            try:
+                cls._apply(updates)
+                db.session.commit()
+                return True
+            except IntegrityError:
+                # Another worker inserted the same (toko, day) first: the retry updates its row
+                db.session.rollback()
+            except Exception as e:
+                db.session.rollback()
+                logging.warning(f"Store stats update failed (nightly rebuild repairs it): {e}")
+                break
+        Metrics.incr('store_stats.update_failed')
+        return False
+
+    @staticmethod
+    def _apply(updates: dict):
+        table = DailyStoreStats.__table__
+        now = datetime.now()
+        for (toko_id, day), deltas in updates.items():
+            result = db.session.execute(
+                update(table)
+                .where(table.c.toko_id == toko_id, table.c.day == day)
+                .values(updated_at=now, **{col: table.c[col] + delta for col, delta in deltas.items()})
+            )
+            if result.rowcount == 0:
+                values = {col: 0 for col in STAT_COLUMNS}
+                values.update(deltas)
+                db.session.execute(insert(table).values(toko_id=toko_id, day=day, updated_at=now, **values))
+
+    @classmethod
+    def record_chats(cls, rows: list) -> bool:
+        """ChatLog rows just written (dicts with toko_id, role, created_at)"""
+        updates = {}
+        for row in rows:
+            if row['role'] in CHAT_IN_ROLES:
+                col = 'chats_in'
+            elif row['role'] in CHAT_OUT_ROLES:
+                col = 'chats_out'
+            else:
+                continue
+            deltas = updates.setdefault((row['toko_id'], row['created_at'].date()), {})
+            deltas[col] = deltas.get(col, 0) + 1
+        return cls.add(updates)
+
+    @classmethod
+    def record_new_customer(cls, toko_id: str, when: datetime = None) -> bool:
+        return cls.add({(toko_id, (when or datetime.now()).date()): {'new_customers': 1}})
+
+    @classmethod
+    def record_paid_order(cls, order: Transaction) -> bool:
+        """Order that just became PAID"""
+        paid_at = order.verified_at or datetime.now()
+        deltas = {'revenue': order.nominal or 0, 'orders': 1}
+        # Which paid order of this customer is it (by verified_at, like rebuild)
+        nth = Transaction.query.filter(
+            Transaction.toko_id == order.toko_id,
+            Transaction.customer_hp == order.customer_hp,
+            Transaction.status == 'PAID',
+            Transaction.verified_at <= paid_at
+        ).count()
+        if nth == 1:
+            deltas['first_buyers'] = 1
+        elif nth == 2:
+            deltas['repeat_buyers'] = 1
+        return cls.add({(order.toko_id, paid_at.date()): deltas})
+
+    # --- Read ---
+
+    @staticmethod
+    def series(toko_id: str, start_day: date, end_day: date) -> dict:
+        """{day: DailyStoreStats} for start_day..end_day (days without activity are missing)"""
+        rows = DailyStoreStats.query.filter(
+            DailyStoreStats.toko_id == toko_id,
+            DailyStoreStats.day >= start_day,
+            DailyStoreStats.day <= end_day
+        ).all()
+        return {as_date(r.day): r for r in rows}
+
+    @staticmethod
+    def totals(toko_id: str) -> dict:
+        """All-time sums of every stat column"""
+        row = db.session.query(
+            *[db.func.coalesce(db.func.sum(getattr(DailyStoreStats, col)), 0) for col in STAT_COLUMNS]
+        ).filter(DailyStoreStats.toko_id == toko_id).one()
+        return {col: int(value) for col, value in zip(STAT_COLUMNS, row)}
+
+    # --- Backfill ---
+
+    @staticmethod
+    def chat_cutoff():
+        """First day whose ChatLog rows are still complete (None = history kept forever)"""
+        if Config.CHATLOG_RETENTION_DAYS <= 0:
+            return None
+        return date.today() - timedelta(days=Config.CHATLOG_RETENTION_DAYS - 1)
+
+    @classmethod
+    def compute(cls, start_day: date, end_day: date, toko_id: str = None) -> dict:
+        """Stats recomputed from the source tables: {(toko_id, day): {column: value}}"""
+        start = datetime.combine(start_day, datetime.min.time())
+        end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+        result = {}
+
+        def put(key, col, value):
+            toko, day = key
+            if toko:
+                result.setdefault((toko, as_date(day)), {})[col] = int(value or 0)
+
+        paid_day = db.func.date(Transaction.verified_at)
+        query = db.session.query(
+            Transaction.toko_id, paid_day, db.func.sum(Transaction.nominal), db.func.count(Transaction.id)
+        ).filter(Transaction.status == 'PAID', Transaction.verified_at >= start, Transaction.verified_at < end)
+        if toko_id:
+            query = query.filter(Transaction.toko_id == toko_id)
+        for toko, day, revenue, orders in query.group_by(Transaction.toko_id, paid_day):
+            put((toko, day), 'revenue', revenue)
+            put((toko, day), 'orders', orders)
+
+        cutoff = cls.chat_cutoff()
+        chat_start = max(start, datetime.combine(cutoff, datetime.min.time())) if cutoff else start
+        chat_day = db.func.date(ChatLog.created_at)
+        query = db.session.query(ChatLog.toko_id, chat_day, ChatLog.role, db.func.count(ChatLog.id)).filter(
+            ChatLog.created_at >= chat_start, ChatLog.created_at < end,
+            ChatLog.role.in_(CHAT_IN_ROLES + CHAT_OUT_ROLES)
+        )
+        if toko_id:
+            query = query.filter(ChatLog.toko_id == toko_id)
+        chats = {}
+        for toko, day, role, count in query.group_by(ChatLog.toko_id, chat_day, ChatLog.role):
+            col = 'chats_in' if role in CHAT_IN_ROLES else 'chats_out'
+            chats[(toko, day, col)] = chats.get((toko, day, col), 0) + count
+        for (toko, day, col), count in chats.items():
+            put((toko, day), col, count)
+
+        joined_day = db.func.date(Customer.created_at)
+        query = db.session.query(Customer.toko_id, joined_day, db.func.count(Customer.id)).filter(
+            Customer.created_at >= start, Customer.created_at < end
+        )
+        if toko_id:
+            query = query.filter(Customer.toko_id == toko_id)
+        for toko, day, count in query.group_by(Customer.toko_id, joined_day):
+            put((toko, day), 'new_customers', count)
+
+        # First/second paid order per customer; only customers who paid inside the window matter
+        paid = [Transaction.status == 'PAID', Transaction.verified_at.isnot(None)]
+        if toko_id:
+            paid.append(Transaction.toko_id == toko_id)
+        window_customers = db.session.query(Transaction.customer_hp).filter(
+            *paid, Transaction.verified_at >= start, Transaction.verified_at < end
+        ).distinct()
+        nth = db.func.row_number().over(
+            partition_by=(Transaction.toko_id, Transaction.customer_hp),
+            order_by=(Transaction.verified_at, Transaction.id)
+        ).label('nth')
+        ranked = db.session.query(
+            Transaction.toko_id.label('toko_id'), Transaction.verified_at.label('verified_at'), nth
+        ).filter(*paid, Transaction.customer_hp.in_(window_customers)).subquery()
+        buyer_day = db.func.date(ranked.c.verified_at)
+        query = db.session.query(ranked.c.toko_id, buyer_day, ranked.c.nth, db.func.count()).filter(
+            ranked.c.nth <= 2, ranked.c.verified_at >= start, ranked.c.verified_at < end
+        ).group_by(ranked.c.toko_id, buyer_day, ranked.c.nth)
+        for toko, day, rank, count in query:
+            put((toko, day), 'first_buyers' if rank == 1 else 'repeat_buyers', count)
+
+        return result
+
+    @classmethod
+    def rebuild(cls, start_day: date, end_day: date, toko_id: str = None) -> int:
+        """
+        Replace the rows of start_day..end_day with recomputed values; returns rows written.
+        Only for closed days: write-time increments of a day still in progress would be
+        overwritten by the absolute values.
+        """
+        for attempt in range(2):
+            try:
+                return cls._rebuild(start_day, end_day, toko_id)
+            except IntegrityError:
+                # A late increment inserted one of the rows first: the retry updates it
+                db.session.rollback()
+                if attempt:
+                    raise
+            except Exception:
+                db.session.rollback()
+                raise
+
+    @classmethod
+    def _rebuild(cls, start_day: date, end_day: date, toko_id: str = None) -> int:
+        computed = cls.compute(start_day, end_day, toko_id)
+        cutoff = cls.chat_cutoff()
+        table = DailyStoreStats.__table__
+        now = datetime.now()
+
+        query = db.session.query(DailyStoreStats.toko_id, DailyStoreStats.day).filter(
+            DailyStoreStats.day >= start_day, DailyStoreStats.day <= end_day
+        )
+        if toko_id:
+            query = query.filter(DailyStoreStats.toko_id == toko_id)
+        existing = {(toko, as_date(day)) for toko, day in query}
+
+        written = 0
+        for key in existing | set(computed):
+            values = {col: computed.get(key, {}).get(col, 0) for col in STAT_COLUMNS}
+            if key in existing:
+                if cutoff is not None and key[1] < cutoff:
+                    for col in CHAT_COLUMNS:
+                        values.pop(col)  # Source rows are gone, keep the rolled-up count
+                db.session.execute(
+                    update(table)
+                    .where(table.c.toko_id == key[0], table.c.day == key[1])
+                    .values(updated_at=now, **values)
+                )
+            elif any(values.values()):
+                db.session.execute(insert(table).values(toko_id=key[0], day=key[1], updated_at=now, **values))
+            else:
+                continue
+            written += 1
+        db.session.commit()
+        return written
+
+    @staticmethod
+    def is_backfilled() -> bool:
+        return SystemConfig.query.get(BACKFILL_KEY) is not None
+
+    @classmethod
+    def mark_backfilled(cls):
+        if not cls.is_backfilled():
+            db.session.add(SystemConfig(key=BACKFILL_KEY, value=date.today().isoformat()))
+            db.session.commit()
+
+    @staticmethod
+    def first_activity_day():
+        """Earliest day with any source data, or None"""
+        firsts = [
+            db.session.query(db.func.min(Transaction.verified_at)).scalar(),
+            db.session.query(db.func.min(ChatLog.created_at)).scalar(),
+            db.session.query(db.func.min(Customer.created_at)).scalar(),
+        ]
+        firsts = [as_date(f) for f in firsts if f is not None]
+        return min(firsts) if firsts else None
+
+    @classmethod
+    def nightly(cls, dry_run: bool = False) -> dict:
+        """
+        Daily cron: backfill the whole history until the BACKFILL_KEY marker is set, then
+        repair the last STORE_STATS_REPAIR_DAYS days. Both stop at yesterday; today's row
+        is only written by increments until the next run repairs it.
+        """
+        yesterday = date.today() - timedelta(days=1)
+        if not cls.is_backfilled():
+            start_day, end_day, mode = cls.first_activity_day(), yesterday, 'backfill'
+        else:
+            start_day, end_day, mode = date.today() - timedelta(days=Config.STORE_STATS_REPAIR_DAYS), yesterday, 'repair'
+
+        if start_day is None or start_day > end_day:
+            return {'mode': mode, 'rows': 0}
+        if dry_run:
+            return {'mode': mode, 'start': str(start_day), 'end': str(end_day), 'rows': 0}
+
+        rows = cls.rebuild(start_day, end_day)
+        if mode == 'backfill':
+            cls.mark_backfilled()
+        logging.info(f"📊 Store stats {mode} {start_day}..{end_day}: {rows} rows")
+        return {'mode': mode, 'start': str(start_day), 'end': str(end_day), 'rows': rows}
@@ -86,13 +86,16 @@ def permanently_delete_subscription(phone_number: str) -> bool:
         # 3. Delete Database Records (Manual Cascade)
         if toko:
             # Delete children
-            from app.models import Menu, Customer, ChatLog, Transaction, BroadcastJob
+            from app.models import Menu, Customer, ChatLog, Transaction, BroadcastJob, BroadcastTarget, ConversationState
             
             logging.info("🗑️ Deleting related data (ChatLog, Transaction, Menu, Customer, BroadcastJob)...")
             ChatLog.query.filter_by(toko_id=toko.id).delete()
+            ConversationState.query.filter_by(toko_id=toko.id).delete()
             Transaction.query.filter_by(toko_id=toko.id).delete()
             Menu.query.filter_by(toko_id=toko.id).delete()
             Customer.query.filter_by(toko_id=toko.id).delete()
+            job_ids = db.select(BroadcastJob.id).where(BroadcastJob.toko_id == toko.id)
+            BroadcastTarget.query.filter(BroadcastTarget.job_id.in_(job_ids)).delete(synchronize_session=False)
             BroadcastJob.query.filter_by(toko_id=toko.id).delete()
             
             logging.info(f"🗑️ Deleting Toko record: {toko.id}")
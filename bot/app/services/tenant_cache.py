@@ -0,0 +1,223 @@
+"""
+Tenant Context Cache
+Read-through, per-process TTL cache for what one webhook message needs:
+Toko, Subscription and SystemConfig rows.
+Entities are cached as detached copies and re-attached with session.merge(load=False),
+so callers get normal session-bound objects (lazy relationships keep working) without a SELECT.
+Local writes invalidate entries on flush/commit (mapper events); other processes
+see changes after TENANT_CACHE_TTL seconds. Menu writes also store a new Toko.menu_version
+token, so caches derived from the menu can tell a changed catalog from the cached Toko row.
+"""
+import logging
+import threading
+import time
+import uuid
+from sqlalchemy import event, update, inspect as sa_inspect
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from app.config import Config
+from app.extensions import db
+from app.models import Toko, Subscription, SystemConfig, Menu
+from app.services.metrics import Metrics
+
+_MISSING = object()
+
+# SystemConfig keys read while answering a store message, prefetched in one query
+GLOBAL_CONFIG_KEYS = ('maintenance_mode', 'panic_mode', 'gemini_prompt')
+TENANT_CONFIG_KEYS = ('gemini_api_key_{toko_id}', 'gemini_model_{toko_id}', 'system_instructions_{toko_id}')
+
+
+class TenantCache:
+    """Per-process TTL cache for tenant configuration"""
+
+    _lock = threading.Lock()
+    _entries = {}  # (kind, key) -> (expires_at, value)
+    _hooks_registered = False
+    _listeners = []  # callbacks(kind, key) for caches derived from tenant data
+
+    # --- core ---
+
+    @classmethod
+    def _get(cls, kind: str, key):
+        now = time.monotonic()
+        with cls._lock:
+            entry = cls._entries.get((kind, key))
+            if entry and entry[0] > now:
+                value = entry[1]
+            else:
+                value = _MISSING
+        cls._record(kind, value is not _MISSING)
+        return value
+
+    @classmethod
+    def _put(cls, kind: str, key, value):
+        with cls._lock:
+            cls._entries[(kind, key)] = (time.monotonic() + Config.TENANT_CACHE_TTL, value)
+
+    @staticmethod
+    def _record(kind: str, hit: bool):
+        Metrics.incr(f"tenant_cache.{'hit' if hit else 'miss'}.{kind}")
+        hits = Metrics.get_counter(f'tenant_cache.hit.{kind}')
+        misses = Metrics.get_counter(f'tenant_cache.miss.{kind}')
+        Metrics.set_gauge(f'tenant_cache.hit_rate.{kind}', round(hits / (hits + misses), 3))
+
+    @classmethod
+    def on_invalidate(cls, callback):
+        """Call callback(kind, key) on every invalidation; (None, None) on clear()"""
+        if callback not in cls._listeners:
+            cls._listeners.append(callback)
+
+    @classmethod
+    def _notify(cls, kind, key):
+        for callback in cls._listeners:
+            try:
+                callback(kind, key)
+            except Exception as e:
+                logging.error(f"Tenant cache listener error: {e}")
+
+    @classmethod
+    def invalidate(cls, kind: str, key):
+        with cls._lock:
+            cls._entries.pop((kind, key), None)
+        cls._notify(kind, key)
+
+    @classmethod
+    def clear(cls):
+        """Drop every entry (tests, or after bulk writes that bypass the ORM)"""
+        with cls._lock:
+            cls._entries.clear()
+        cls._notify(None, None)
+
+    # --- entities ---
+
+    @staticmethod
+    def _detached_copy(obj):
+        """Column-only copy of a loaded row, safe to share across sessions and threads"""
+        model = type(obj)
+        copy = model()
+        for attr in sa_inspect(model).column_attrs:
+            setattr(copy, attr.key, getattr(obj, attr.key))
+        make_transient_to_detached(copy)
+        return copy
+
+    @classmethod
+    def _get_entity(cls, kind: str, key, loader):
+        cached = cls._get(kind, key)
+        if cached is not _MISSING:
+            return db.session.merge(cached, load=False)
+
+        obj = loader()
+        # Misses are not cached: registration creates these rows at any time
+        if obj is not None:
+            cls._put(kind, key, cls._detached_copy(obj))
+        return obj
+
+    @classmethod
+    def get_toko(cls, toko_id: str):
+        """Toko by id (session-bound). Call again after a commit to re-attach without a refresh SELECT"""
+        if not toko_id:
+            return None
+        return cls._get_entity('toko', toko_id, lambda: Toko.query.get(toko_id))
+
+    @classmethod
+    def get_subscription(cls, phone_number: str):
+        """Subscription by owner phone number (session-bound) or None"""
+        if not phone_number:
+            return None
+        return cls._get_entity(
+            'subscription', phone_number,
+            lambda: Subscription.query.filter_by(phone_number=phone_number).first()
+        )
+
+    # --- SystemConfig ---
+
+    @classmethod
+    def _load_config(cls, toko_id: str = None, extra_key: str = None) -> dict:
+        """Fetch all hot config keys (global + tenant) in one query and cache them, including misses"""
+        keys = set(GLOBAL_CONFIG_KEYS)
+        if toko_id:
+            keys.update(k.format(toko_id=toko_id) for k in TENANT_CONFIG_KEYS)
+        if extra_key:
+            keys.add(extra_key)
+
+        rows = dict(db.session.query(SystemConfig.key, SystemConfig.value).filter(SystemConfig.key.in_(keys)).all())
+        for key in keys:
+            cls._put('config', key, rows.get(key))
+        return rows
+
+    @classmethod
+    def get_config(cls, key: str, toko_id: str = None):
+        """SystemConfig value, or None if the key is not set"""
+        value = cls._get('config', key)
+        if value is _MISSING:
+            value = cls._load_config(toko_id, extra_key=key).get(key)
+        return value
+
+    @classmethod
+    def is_enabled(cls, key: str, toko_id: str = None) -> bool:
+        """'true' flag in SystemConfig (e.g. panic_mode, maintenance_mode)"""
+        value = cls.get_config(key, toko_id)
+        return bool(value) and value.lower() == 'true'
+
+    @classmethod
+    def prefetch(cls, toko_id: str):
+        """Warm every hot config key of a tenant with a single query (no-op when already cached)"""
+        keys = list(GLOBAL_CONFIG_KEYS) + [k.format(toko_id=toko_id) for k in TENANT_CONFIG_KEYS]
+        now = time.monotonic()
+        with cls._lock:
+            warm = all(
+                (entry := cls._entries.get(('config', key))) and entry[0] > now
+                for key in keys
+            )
+        if not warm:
+            cls._load_config(toko_id)
+
+    # --- invalidation ---
+
+    @classmethod
+    def register_hooks(cls):
+        """Invalidate entries when Toko/Subscription/SystemConfig/Menu rows change in this process"""
+        if cls._hooks_registered:
+            return
+        cls._hooks_registered = True
+
+        targets = {
+            Toko: lambda obj: [('toko', obj.id)],
+            Subscription: lambda obj: [('subscription', obj.phone_number)],
+            SystemConfig: lambda obj: [('config', obj.key)],
+            # Menu changes (/tambah_menu, dashboard) invalidate the tenant's derived data (prompt prefix)
+            Menu: lambda obj: [('toko', obj.toko_id)],
+        }
+
+        for model, keys_of in targets.items():
+            def _on_change(mapper, connection, target, keys_of=keys_of):
+                keys = keys_of(target)
+                for kind, key in keys:
+                    cls.invalidate(kind, key)
+                # Invalidate again after commit: a concurrent reader may re-cache the old row meanwhile
+                session = object_session(target)
+                if session is not None:
+                    session.info.setdefault('tenant_cache_invalidate', set()).update(keys)
+
+            for event_name in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(model, event_name, _on_change)
+
+        # Same transaction as the menu write: other processes see the token with the Toko row
+        def _bump_menu_version(mapper, connection, target):
+            connection.execute(
+                update(Toko.__table__).where(Toko.__table__.c.id == target.toko_id)
+                .values(menu_version=uuid.uuid4().hex)
+            )
+
+        for event_name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(Menu, event_name, _bump_menu_version)
+
+        @event.listens_for(Session, 'after_commit')
+        def _after_commit(session):
+            for kind, key in session.info.pop('tenant_cache_invalidate', ()):
+                cls.invalidate(kind, key)
+
+        @event.listens_for(Session, 'after_soft_rollback')
+        def _after_rollback(session, previous_transaction):
+            session.info.pop('tenant_cache_invalidate', None)
+
+        logging.info("🗄️ Tenant cache invalidation hooks registered")
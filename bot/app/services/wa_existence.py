@@ -0,0 +1,76 @@
+"""
+WhatsApp Existence Cache
+Persists WAHA check-exists results (phone -> on WhatsApp?) so repeat campaigns
+do not re-check the same numbers. Shared by every worker through the database.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from app.config import Config
+from app.extensions import db
+from app.models import WaExistence
+from app.services.metrics import Metrics
+
+CHUNK_SIZE = 500  # max phones per IN (...) query
+
+
+class WaExistenceCache:
+    """Database-backed existence cache with a TTL (WA_EXISTS_TTL_HOURS)"""
+
+    @staticmethod
+    def _fresh_after() -> datetime:
+        return datetime.utcnow() - timedelta(hours=Config.WA_EXISTS_TTL_HOURS)
+
+    @staticmethod
+    def get(phone: str) -> Optional[bool]:
+        """Cached result for one number, or None if unknown/expired"""
+        row = WaExistence.query.get(phone)
+        if row and row.checked_at and row.checked_at >= WaExistenceCache._fresh_after():
+            Metrics.incr('wa_exists.hit')
+            return row.on_whatsapp
+        Metrics.incr('wa_exists.miss')
+        return None
+
+    @staticmethod
+    def get_many(phones: List[str]) -> Dict[str, bool]:
+        """Cached results for the numbers that have a fresh entry"""
+        fresh_after = WaExistenceCache._fresh_after()
+        unique = list(dict.fromkeys(p for p in phones if p))
+        results = {}
+        for i in range(0, len(unique), CHUNK_SIZE):
+            rows = db.session.query(WaExistence.phone, WaExistence.on_whatsapp).filter(
+                WaExistence.phone.in_(unique[i:i + CHUNK_SIZE]),
+                WaExistence.checked_at >= fresh_after
+            ).all()
+            results.update({phone: on_whatsapp for phone, on_whatsapp in rows})
+        return results
+
+    @staticmethod
+    def get_uncached(phones: List[str]) -> List[str]:
+        """Numbers without a fresh cache entry (deduplicated, order kept)"""
+        cached = WaExistenceCache.get_many(phones)
+        return [p for p in dict.fromkeys(phones) if p and p not in cached]
+
+    @staticmethod
+    def store(results: Dict[str, Optional[bool]]):
+        """
+        Save check results and commit. None values (WAHA could not answer) are not cached.
+        """
+        now = datetime.utcnow()
+        rows = [
+            {'phone': phone, 'on_whatsapp': bool(exists), 'checked_at': now}
+            for phone, exists in results.items() if phone and exists is not None
+        ]
+        if not rows:
+            return
+        try:
+            for i in range(0, len(rows), CHUNK_SIZE):
+                chunk = rows[i:i + CHUNK_SIZE]
+                WaExistence.query.filter(WaExistence.phone.in_([r['phone'] for r in chunk])).delete(synchronize_session=False)
+                db.session.execute(db.insert(WaExistence), chunk)
+            db.session.commit()
+            Metrics.incr('wa_exists.stored', len(rows))
+        except Exception as e:
+            # Concurrent writer stored the same number first: the cache is best effort
+            db.session.rollback()
+            logging.warning(f"Failed to store WA existence results: {e}")
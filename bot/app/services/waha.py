@@ -3,6 +3,9 @@ import time
 import base64
 import logging
 import random
+import os
+import threading
+from requests.adapters import HTTPAdapter
 from tenacity import retry, stop_after_attempt, wait_exponential
 from app.config import Config
 
@@ -15,6 +18,33 @@ def get_headers():
         h['X-Api-Key'] = WAHA_API_KEY
     return h
 
+_http_lock = threading.Lock()
+_http_session = None
+_http_pid = None
+
+def get_http():
+    """
+    Shared keep-alive HTTP session for all WAHA calls (one per process).
+    Reuses pooled TCP+TLS connections instead of a new handshake per request.
+    Re-created after fork so gunicorn workers never share sockets.
+    """
+    global _http_session, _http_pid
+    pid = os.getpid()
+    if _http_session is None or _http_pid != pid:
+        with _http_lock:
+            if _http_session is None or _http_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=Config.WAHA_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+                _http_pid = pid
+    return _http_session
+
+def get_timeout(endpoint):
+    """(connect, read) timeout for a WAHA endpoint group (see Config.WAHA_TIMEOUTS)"""
+    return (Config.WAHA_CONNECT_TIMEOUT, Config.WAHA_TIMEOUTS.get(endpoint, 30))
+
 def format_nomor(chat_id): 
     # WAHA Standard usually expects 12345@c.us or 12345@s.whatsapp.net
     if '@' not in str(chat_id):
@@ -29,7 +59,7 @@ def mark_seen(chat_id, session_name="default"):
         # Try different variations based on WAHA 2025 docs
         chat_id_formatted = format_nomor(chat_id)
         url = f"{WAHA_BASE_URL}/api/{session_name}/chats/{chat_id_formatted}/messages/read"
-        res = requests.post(url, headers=get_headers(), timeout=10)
+        res = get_http().post(url, headers=get_headers(), timeout=get_timeout('seen'))
         # logging.info(f"Mark Seen: {res.status_code}")
     except Exception as e:
         logging.error(f"Error mark_seen: {e}")
@@ -49,7 +79,7 @@ def set_presence(chat_id, presence="composing", session_name="default"):
         if presence == "available": val = "paused"
         
         payload = {"chatId": chat_id_formatted, "presence": val}
-        requests.post(url, json=payload, headers=get_headers(), timeout=10)
+        get_http().post(url, json=payload, headers=get_headers(), timeout=get_timeout('presence'))
     except Exception as e:
         logging.error(f"Error set_presence: {e}")
 
@@ -72,7 +102,7 @@ def kirim_waha_raw(chat_id, message, session_name="default"):
         }
         
         logging.info(f"Sending to WAHA: {chat_id}")
-        response = requests.post(url, json=payload, headers=get_headers(), timeout=60)
+        response = get_http().post(url, json=payload, headers=get_headers(), timeout=get_timeout('send'))
         
         if response.status_code not in [200, 201]:
              logging.error(f"WAHA Error: {response.text}")
@@ -149,7 +179,7 @@ def check_session_status(session_name="default"):
     """Check session status from WAHA"""
     try:
         url = f"{WAHA_BASE_URL}/api/sessions/{session_name}"
-        res = requests.get(url, headers=get_headers(), timeout=5)
+        res = get_http().get(url, headers=get_headers(), timeout=get_timeout('status'))
         if res.status_code == 200:
             return res.json().get('status', 'UNKNOWN')
     except: pass
@@ -166,7 +196,7 @@ def check_exists(phone, session_name="default"):
             "session": session_name,
             "phone": phone
         }
-        res = requests.post(url, json=payload, headers=get_headers(), timeout=15)
+        res = get_http().post(url, json=payload, headers=get_headers(), timeout=get_timeout('check_exists'))
         
         if res.status_code == 200:
             data = res.json()
@@ -201,7 +231,7 @@ def create_waha_session(session_name, pairing_method="qr"):
 
         # 2. Check if exists
         url_all = f"{WAHA_BASE_URL}/api/sessions?all=true"
-        res = requests.get(url_all, headers=get_headers())
+        res = get_http().get(url_all, headers=get_headers(), timeout=get_timeout('session'))
         
         if res.status_code == 200:
             sessions = res.json()
@@ -210,12 +240,12 @@ def create_waha_session(session_name, pairing_method="qr"):
                     status = s.get('status')
                     if status == 'FAILED':
                         logging.warning(f"Session '{session_name}' is FAILED. Deleting and recreating...")
-                        requests.delete(f"{WAHA_BASE_URL}/api/sessions/{session_name}", headers=get_headers())
+                        get_http().delete(f"{WAHA_BASE_URL}/api/sessions/{session_name}", headers=get_headers(), timeout=get_timeout('session'))
                         time.sleep(1)
                         break # Go to create logic
                     elif status == 'STOPPED':
                         logging.info(f"Session '{session_name}' is STOPPED. Starting...")
-                        requests.post(f"{WAHA_BASE_URL}/api/sessions/{session_name}/start", headers=get_headers())
+                        get_http().post(f"{WAHA_BASE_URL}/api/sessions/{session_name}/start", headers=get_headers(), timeout=get_timeout('session'))
                         return True
                     else:
                         return True 
@@ -236,11 +266,11 @@ def create_waha_session(session_name, pairing_method="qr"):
         else:
             logging.info(f"Creating Session '{session_name}' with QR code...")
         
-        res = requests.post(url_create, json=payload, headers=get_headers())
+        res = get_http().post(url_create, json=payload, headers=get_headers(), timeout=get_timeout('session'))
         if res.status_code in [200, 201]:
              logging.info("Session created. Starting it...")
              # Usually POST /sessions automatically starts it in some config, but let's be explicit
-             requests.post(f"{WAHA_BASE_URL}/api/sessions/{session_name}/start", headers=get_headers())
+             get_http().post(f"{WAHA_BASE_URL}/api/sessions/{session_name}/start", headers=get_headers(), timeout=get_timeout('session'))
              return True
         else:
              logging.error(f"Failed to create session: {res.text}")
@@ -255,7 +285,7 @@ def get_waha_qr_retry(session_name, retries=5):
     url = f"{WAHA_BASE_URL}/api/{session_name}/auth/qr?format=image"
     for _ in range(retries):
         try:
-            res = requests.get(url, headers=get_headers(), timeout=10)
+            res = get_http().get(url, headers=get_headers(), timeout=get_timeout('qr'))
             if res.status_code == 200 and 'image' in res.headers.get('content-type', ''):
                 return res.content
             time.sleep(2)
@@ -273,7 +303,7 @@ def request_pairing_code(session_name):
         url = f"{WAHA_BASE_URL}/api/{session_name}/auth/request-code"
         logging.info(f"Requesting pairing code for session: {session_name}")
         
-        res = requests.post(url, headers=get_headers(), timeout=10)
+        res = get_http().post(url, headers=get_headers(), timeout=get_timeout('session'))
         if res.status_code in [200, 201]:
             data = res.json()
             # WAHA returns the code in response
@@ -294,7 +324,7 @@ def get_session_status(session_name):
     """
     try:
         url = f"{WAHA_BASE_URL}/api/sessions/{session_name}"
-        res = requests.get(url, headers=get_headers(), timeout=10)
+        res = get_http().get(url, headers=get_headers(), timeout=get_timeout('status'))
         
         if res.status_code == 200:
             data = res.json()
@@ -326,7 +356,7 @@ def kirim_waha_image_raw(chat_id, image_binary, caption, session_name="default")
             },
             "caption": caption
         }
-        requests.post(url, json=payload, headers=get_headers(), timeout=20)
+        get_http().post(url, json=payload, headers=get_headers(), timeout=get_timeout('media'))
     except Exception as e:
         logging.error(f"Error sending image: {e}")
 
@@ -344,7 +374,7 @@ def kirim_waha_image_url(chat_id, url, caption, session_name="default"):
             },
             "caption": caption
         }
-        requests.post(endpoint, json=payload, headers=get_headers(), timeout=20)
+        get_http().post(endpoint, json=payload, headers=get_headers(), timeout=get_timeout('media'))
     except Exception as e:
         logging.error(f"Error sending image url: {e}")
 
@@ -386,11 +416,11 @@ def configure_session_webhook(session_name: str) -> bool:
         url = f"{WAHA_BASE_URL}/api/sessions/{session_name}"
         
         # Send PATCH request to configure webhook
-        response = requests.patch(
+        response = get_http().patch(
             url,
             headers=get_headers(),
             json=config,
-            timeout=10
+            timeout=get_timeout('session')
         )
         
         if response.status_code == 200:
@@ -398,7 +428,7 @@ def configure_session_webhook(session_name: str) -> bool:
             
             # Verify configuration
             time.sleep(2)  # Wait for config to propagate
-            verify_response = requests.get(url, headers=get_headers(), timeout=5)
+            verify_response = get_http().get(url, headers=get_headers(), timeout=get_timeout('status'))
             if verify_response.status_code == 200:
                 verify_data = verify_response.json()
                 webhooks = verify_data.get('config', {}).get('webhooks', [])
@@ -422,7 +452,7 @@ def stop_waha_session(session_name: str) -> bool:
     """
     try:
         url = f"{WAHA_BASE_URL}/api/sessions/{session_name}/stop"
-        response = requests.post(url, headers=get_headers(), timeout=10)
+        response = get_http().post(url, headers=get_headers(), timeout=get_timeout('session'))
         
         if response.status_code == 200:
             logging.info(f"✅ Session {session_name} stopped successfully.")
@@ -445,7 +475,7 @@ def delete_waha_session(session_name: str) -> bool:
             return False
 
         url = f"{WAHA_BASE_URL}/api/sessions/{session_name}"
-        response = requests.delete(url, headers=get_headers(), timeout=10)
+        response = get_http().delete(url, headers=get_headers(), timeout=get_timeout('session'))
         
         if response.status_code == 200:
             logging.info(f"✅ Session {session_name} deleted successfully.")
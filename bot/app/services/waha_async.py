@@ -0,0 +1,117 @@
+"""
+Async WAHA Client
+asyncio counterpart of waha.py used by the broadcast engine.
+One client (one keep-alive connection pool) is shared by every session lane
+running on the engine's event loop, so N sessions need N coroutines, not N threads.
+"""
+import asyncio
+import logging
+import httpx
+from app.config import Config
+from app.services.waha import get_headers, format_nomor
+from app.services.circuit_breaker import get_breaker
+
+
+class WahaDeliveryError(Exception):
+    """Non-2xx response from WAHA sendText"""
+
+
+class AsyncWahaClient:
+    """Async client for sendText, check-exists and sendSeen"""
+
+    def __init__(self, base_url: str = None, pool_size: int = None):
+        pool_size = pool_size or Config.WAHA_POOL_SIZE
+        self.base_url = base_url or Config.WAHA_BASE_URL
+        self.breaker = get_breaker("WAHA_API")
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=get_headers(),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    @staticmethod
+    def _timeout(endpoint: str) -> httpx.Timeout:
+        return httpx.Timeout(Config.WAHA_TIMEOUTS.get(endpoint, 30), connect=Config.WAHA_CONNECT_TIMEOUT)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _post_send_text(self, chat_id: str, text: str, session_name: str):
+        payload = {
+            "session": session_name,
+            "chatId": format_nomor(chat_id),
+            "text": text
+        }
+        response = await self._client.post("/api/sendText", json=payload, timeout=self._timeout('send'))
+        if response.status_code not in (200, 201):
+            raise WahaDeliveryError(f"WAHA Delivery Failure: {response.status_code} - {response.text[:200]}")
+        return response
+
+    async def send_text(self, chat_id: str, text: str, session_name: str = "default", retries: int = 3) -> bool:
+        """
+        Send a text message (POST /api/sendText).
+        Retries with exponential backoff and shares the WAHA_API circuit breaker with waha.py.
+
+        Returns:
+            True if WAHA accepted the message
+        """
+        for attempt in range(retries):
+            try:
+                response = await self.breaker.call_async(self._post_send_text, chat_id, text, session_name)
+                if response is None:
+                    return False  # Circuit open: fail fast
+                return True
+            except Exception as e:
+                if attempt < retries - 1:
+                    wait = min(2 ** attempt, 5)
+                    logging.warning(f"Async send retry {attempt + 1}/{retries} for {chat_id} in {wait}s: {e}")
+                    await asyncio.sleep(wait)
+                else:
+                    logging.error(f"Async send failed for {chat_id} after {retries} attempts: {e}")
+        return False
+
+    async def lookup_exists(self, phone: str, session_name: str = "default"):
+        """
+        Check if a phone number is registered on WhatsApp (POST /api/contacts/check-exists).
+
+        Returns:
+            True/False, or None if WAHA could not answer
+        """
+        try:
+            payload = {"session": session_name, "phone": phone}
+            res = await self._client.post("/api/contacts/check-exists", json=payload, timeout=self._timeout('check_exists'))
+            if res.status_code == 200:
+                return bool(res.json().get('numberExists', False))
+            logging.warning(f"Existence check failed for {phone} (Status {res.status_code})")
+        except Exception as e:
+            logging.error(f"Error checking existence for {phone}: {e}")
+        return None
+
+    async def check_exists_many(self, phones: list, session_name: str = "default", concurrency: int = 5) -> dict:
+        """
+        Check many numbers with bounded concurrency.
+
+        Returns:
+            Dict phone -> True/False, or None where the check failed
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def _check(phone):
+            async with semaphore:
+                return phone, await self.lookup_exists(phone, session_name)
+
+        results = await asyncio.gather(*[_check(p) for p in phones])
+        return dict(results)
+
+    async def send_seen(self, chat_id: str, session_name: str = "default") -> bool:
+        """
+        Mark chat as read (POST /api/{session}/chats/{chatId}/messages/read).
+        For reply flows (like kirim_waha's mark_as_seen); broadcasts have no unread message to mark.
+        """
+        try:
+            url = f"/api/{session_name}/chats/{format_nomor(chat_id)}/messages/read"
+            res = await self._client.post(url, timeout=self._timeout('seen'))
+            return res.status_code in (200, 201)
+        except Exception as e:
+            logging.error(f"Error send_seen: {e}")
+            return False
@@ -0,0 +1,53 @@
+"""
+Daily Store Stats Backfill
+Recomputes daily_store_stats from Transaction, ChatLog and Customer for a range of days
+(default: the whole history up to yesterday; today's row belongs to the write-time
+increments). The daily cron backfills once and then repairs the last
+STORE_STATS_REPAIR_DAYS days on its own; run this to do it right away or to fix older days.
+
+Run from saas_bot root directory:
+    python scripts/backfill_store_stats.py [--days 90] [--toko TOKO_ID] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, help='Only the last N days (default: full history)')
+    parser.add_argument('--toko', help='Only this store')
+    parser.add_argument('--dry-run', action='store_true', help='Show the recomputed rows without writing them')
+    args = parser.parse_args()
+
+    from datetime import date, timedelta
+    from app import create_app
+    from app.services.store_stats import StoreStats
+
+    app = create_app()
+    with app.app_context():
+        end_day = date.today() - timedelta(days=1)
+        start_day = end_day - timedelta(days=args.days - 1) if args.days else StoreStats.first_activity_day()
+        if start_day is None:
+            print("[SKIP] No orders, chats or customers yet")
+            return
+
+        start = time.perf_counter()
+        if args.dry_run:
+            computed = StoreStats.compute(start_day, end_day, args.toko)
+            for (toko_id, day), values in sorted(computed.items()):
+                print(f"{toko_id:<20} {day}  {values}")
+            print(f"\n[DRY RUN] {len(computed)} rows for {start_day}..{end_day}")
+            return
+
+        rows = StoreStats.rebuild(start_day, end_day, args.toko)
+        if not args.days and not args.toko:
+            StoreStats.mark_backfilled()  # The cron can skip straight to repairs
+        print(f"[OK] {rows} rows rebuilt for {start_day}..{end_day} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
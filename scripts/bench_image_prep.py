@@ -0,0 +1,152 @@
+"""
+Payment Screenshot Preprocessing Benchmark
+Runs prepare_for_vision() over sample receipts and reports bytes saved and preprocessing time.
+With --vision, also calls analisa_bukti_transfer() on the original and the processed image
+and compares end-to-end vision latency and the detected amount/bank (needs GEMINI_API_KEY).
+
+Samples: every image in --dir (default test_data/receipts). If none are found, --synthetic N
+renders N receipt-like 1080x2400 PNG screenshots so the size numbers can be reproduced offline.
+
+Run from saas_bot root directory:
+    python scripts/bench_image_prep.py [--dir test_data/receipts] [--synthetic 5] [--vision]
+        [--max-edge 1600] [--quality 85] [--color]
+"""
+import argparse
+import io
+import mimetypes
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'bot'))
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+def load_samples(directory):
+    samples = []
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                with open(os.path.join(directory, name), 'rb') as f:
+                    samples.append((name, f.read(), mimetypes.guess_type(name)[0] or 'image/png'))
+    return samples
+
+
+def synthetic_receipts(count):
+    """Receipt-like mobile banking screenshots (status bar, header, amount, details)"""
+    from PIL import Image, ImageDraw, ImageFont
+    banks = ['BCA', 'Mandiri', 'BRI', 'BNI', 'GoPay', 'DANA']
+    try:
+        font = ImageFont.load_default(size=44)
+    except TypeError:
+        font = ImageFont.load_default()  # Pillow < 10.1
+
+    samples = []
+    for i in range(count):
+        rng = random.Random(i)
+        bank = banks[i % len(banks)]
+        amount = rng.randrange(10, 2000) * 1000
+        img = Image.new('RGB', (1080, 2400), (245, 247, 250))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((0, 0, 1080, 90), fill=(20, 20, 20))
+        draw.rectangle((0, 90, 1080, 420), fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        draw.text((60, 200), f"{bank} Mobile", fill=(255, 255, 255), font=font)
+        lines = [
+            "Transfer BERHASIL",
+            f"Rp {amount:,}".replace(',', '.'),
+            f"Tanggal: {rng.randrange(1, 28):02d}/06/2025 {rng.randrange(24):02d}:{rng.randrange(60):02d}",
+            f"Ke: TOKO SAMPLE {i}",
+            f"Rekening: {rng.randrange(10**9, 10**10)}",
+            f"Dari: PELANGGAN {rng.randrange(1000)}",
+            f"No. Ref: {rng.randrange(10**11, 10**12)}",
+        ]
+        for row, line in enumerate(lines):
+            draw.text((60, 520 + row * 130), line, fill=(30, 30, 30), font=font)
+        # Photo-like promo banner and icons: what makes real screenshot PNGs 1-3 MB
+        banner = Image.merge('RGB', [Image.effect_noise((1080, 700), 60 + 10 * c) for c in range(3)])
+        img.paste(banner, (0, 1500))
+        for _ in range(200):
+            x, y = rng.randrange(1080), rng.randrange(2200, 2400)
+            draw.ellipse((x, y, x + 24, y + 24), fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        out = io.BytesIO()
+        img.save(out, format='PNG')
+        samples.append((f"synthetic_{i}_{bank}.png", out.getvalue(), 'image/png'))
+    return samples
+
+
+def timed_vision(data, mime):
+    from app.services.gemini import analisa_bukti_transfer
+    start = time.perf_counter()
+    result = analisa_bukti_transfer(data, mime)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'test_data', 'receipts'))
+    parser.add_argument('--synthetic', type=int, default=5, help='Synthetic samples when --dir has none')
+    parser.add_argument('--vision', action='store_true', help='Also measure Gemini Vision latency and accuracy')
+    parser.add_argument('--max-edge', type=int, help='Override PAYMENT_IMAGE_MAX_EDGE')
+    parser.add_argument('--quality', type=int, help='Override PAYMENT_IMAGE_JPEG_QUALITY')
+    parser.add_argument('--color', action='store_true', help='Keep colour (PAYMENT_IMAGE_GRAYSCALE=false)')
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+
+    from app.config import Config
+    from app.services import image_prep
+    if not image_prep.is_available():
+        print("[ERROR] Pillow is not installed (pip install Pillow)")
+        return
+    if args.max_edge:
+        Config.PAYMENT_IMAGE_MAX_EDGE = args.max_edge
+    if args.quality:
+        Config.PAYMENT_IMAGE_JPEG_QUALITY = args.quality
+    if args.color:
+        Config.PAYMENT_IMAGE_GRAYSCALE = False
+
+    samples = load_samples(args.dir)
+    if not samples:
+        print(f"No images in {args.dir}, rendering {args.synthetic} synthetic receipts\n")
+        samples = synthetic_receipts(args.synthetic)
+
+    print(f"max_edge={Config.PAYMENT_IMAGE_MAX_EDGE} quality={Config.PAYMENT_IMAGE_JPEG_QUALITY} "
+          f"grayscale={Config.PAYMENT_IMAGE_GRAYSCALE}\n")
+    print(f"{'sample':<32} {'original':>10} {'processed':>10} {'saved':>7} {'prep':>8}")
+
+    total_in = total_out = 0
+    prep_ms, vision_rows = [], []
+    for name, data, mime in samples:
+        start = time.perf_counter()
+        processed, processed_mime = image_prep.prepare_for_vision(data, mime)
+        prep_ms.append((time.perf_counter() - start) * 1000)
+        total_in += len(data)
+        total_out += len(processed)
+        saved = 100 * (1 - len(processed) / len(data))
+        print(f"{name[:32]:<32} {len(data) / 1024:>8.0f}KB {len(processed) / 1024:>8.0f}KB "
+              f"{saved:>6.1f}% {prep_ms[-1]:>6.1f}ms")
+        if args.vision:
+            vision_rows.append((name, timed_vision(data, mime), timed_vision(processed, processed_mime)))
+
+    print(f"\nTotal: {total_in / 1024:.0f}KB -> {total_out / 1024:.0f}KB "
+          f"({100 * (1 - total_out / total_in):.1f}% saved), prep median {statistics.median(prep_ms):.1f}ms")
+
+    if vision_rows:
+        print(f"\n{'sample':<32} {'orig ms':>8} {'prep ms':>8}  amount (orig / prep)  bank (orig / prep)")
+        for name, (ms_a, res_a), (ms_b, res_b) in vision_rows:
+            print(f"{name[:32]:<32} {ms_a:>8.0f} {ms_b:>8.0f}  "
+                  f"{res_a.get('detected_amount')} / {res_b.get('detected_amount')}  "
+                  f"{res_a.get('bank_name')} / {res_b.get('bank_name')}")
+        agree = sum(a[1].get('detected_amount') == b[1].get('detected_amount') for _, a, b in vision_rows)
+        print(f"\nVision median: original {statistics.median(r[1][0] for r in vision_rows):.0f}ms, "
+              f"processed {statistics.median(r[2][0] for r in vision_rows):.0f}ms; "
+              f"amount agreement {agree}/{len(vision_rows)}")
+
+
+if __name__ == '__main__':
+    main()
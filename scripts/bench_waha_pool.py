@@ -0,0 +1,101 @@
+"""
+WAHA Send Latency Benchmark (pooled vs unpooled)
+Starts a local stub WAHA server and compares p50/p99 latency of:
+  - pooled:   kirim_waha_raw() via the shared keep-alive session
+  - unpooled: bare requests.post() (new TCP connection per message)
+
+Run from saas_bot root directory:
+    python scripts/bench_waha_pool.py [--requests 500] [--latency-ms 2]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubWahaHandler(BaseHTTPRequestHandler):
+    """Minimal WAHA /api/sendText stub with HTTP/1.1 keep-alive"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Like Node/WAHA; avoids 40ms delayed-ACK stalls on reused sockets
+    latency = 0.0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+        body = b'{"id": "stub", "sent": true}'
+        self.send_response(201)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[k]
+
+
+def run(label, send, n):
+    samples = []
+    for i in range(n):
+        start = time.perf_counter()
+        send(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<10} n={n:<5} p50={percentile(samples, 50):7.2f}ms  "
+          f"p99={percentile(samples, 99):7.2f}ms  mean={statistics.mean(samples):7.2f}ms")
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Artificial server-side latency')
+    args = parser.parse_args()
+
+    StubWahaHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubWahaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # Point the app at the stub before importing the WAHA service
+    os.environ['WAHA_BASE_URL'] = base_url
+    os.environ.setdefault('WAHA_API_KEY', 'bench')
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot'))
+
+    import logging
+    logging.disable(logging.CRITICAL)
+
+    import requests
+    from app.services.waha import kirim_waha_raw, get_headers, format_nomor
+
+    def send_unpooled(i):
+        payload = {"session": "default", "chatId": format_nomor("6281234567890"), "text": f"bench {i}"}
+        requests.post(f"{base_url}/api/sendText", json=payload, headers=get_headers(), timeout=10)
+
+    def send_pooled(i):
+        kirim_waha_raw("6281234567890", f"bench {i}", "default")
+
+    print(f"Stub WAHA at {base_url} (server latency {args.latency_ms}ms)\n")
+    # Warm up both paths
+    send_unpooled(0)
+    send_pooled(0)
+
+    unpooled = run('unpooled', send_unpooled, args.requests)
+    pooled = run('pooled', send_pooled, args.requests)
+
+    speedup = statistics.median(unpooled) / max(statistics.median(pooled), 1e-9)
+    print(f"\np50 speedup (unpooled / pooled): {speedup:.2f}x")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Knowledge Base Index Builder
+Chunks every store's KB file and writes its BM25 index next to it (<file>.index.json).
+Indexes are also rebuilt lazily on the first message after a KB file changes;
+run this after uploading KB files to keep that cost off the webhook path.
+
+Run from saas_bot root directory:
+    python scripts/build_kb_index.py [--toko TOKO_ID]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--toko', help='Only index this store')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.models import Toko
+    from app.services.knowledge_base import KnowledgeBase
+
+    app = create_app()
+    with app.app_context():
+        query = Toko.query.filter(Toko.knowledge_base_file_id.isnot(None))
+        if args.toko:
+            query = query.filter(Toko.id == args.toko)
+
+        for toko in query.all():
+            kb_path = KnowledgeBase.path_for(toko)
+            if not os.path.exists(kb_path):
+                print(f"[SKIP] {toko.id}: {kb_path} not found")
+                continue
+            index = KnowledgeBase.build(kb_path)
+            print(f"[OK] {toko.id}: {len(index['chunks'])} chunks, {len(index['postings'])} terms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+ChatLog Composite Indexes (one-time)
+Adds the composite indexes declared on ChatLog to an existing chat_log table.
+On PostgreSQL every statement runs as CREATE INDEX CONCURRENTLY, so webhooks keep
+writing chat logs while the index builds; it is safe to re-run (IF NOT EXISTS).
+
+A partitioned chat_log already got its indexes from scripts/partition_chat_log.py.
+
+Run from saas_bot root directory:
+    python scripts/create_chat_log_indexes.py [--dry-run]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='Print the SQL without executing it')
+    args = parser.parse_args()
+
+    from sqlalchemy import text
+    from app import create_app
+    from app.extensions import db
+    from app.services.chatlog_maintenance import ChatLogMaintenance
+
+    app = create_app()
+    with app.app_context():
+        if ChatLogMaintenance.is_partitioned():
+            print("[SKIP] chat_log is partitioned: indexes were created with the partitions")
+            return
+
+        statements = ChatLogMaintenance.index_statements()
+        if args.dry_run:
+            print(";\n".join(statements) + ";")
+            return
+
+        db.session.rollback()
+        # CONCURRENTLY cannot run inside a transaction block
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for sql in statements:
+                start = time.perf_counter()
+                conn.execute(text(sql))
+                print(f"[OK] {sql} ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+ChatLog Monthly Partitioning (PostgreSQL only, one-time)
+Converts chat_log into a table range-partitioned by created_at (one partition per month,
+plus a DEFAULT partition), copying existing rows. Afterwards the daily cron keeps
+creating partitions ahead of time and applies CHATLOG_RETENTION_DAYS per partition.
+
+Takes an ACCESS EXCLUSIVE lock on chat_log for the duration of the copy: run it
+during a quiet window (workers stopped).
+
+Run from saas_bot root directory:
+    python scripts/partition_chat_log.py [--dry-run] [--keep-old]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bot'))
+
+
+def build_statements(min_created, now, months_ahead, keep_old):
+    from app.services.chatlog_maintenance import add_months, month_start, partition_ddl
+
+    statements = [
+        "LOCK TABLE chat_log IN ACCESS EXCLUSIVE MODE",
+        "ALTER TABLE chat_log RENAME TO chat_log_unpartitioned",
+        # Keep the id sequence when the old table is dropped
+        "ALTER SEQUENCE chat_log_id_seq OWNED BY NONE",
+        # Free the index names for the new parent table
+        """DO $$ DECLARE r record; BEGIN
+             FOR r IN SELECT indexname FROM pg_indexes WHERE tablename = 'chat_log_unpartitioned' LOOP
+               EXECUTE format('ALTER INDEX %I RENAME TO %I', r.indexname, left(r.indexname, 50) || '_unpart');
+             END LOOP; END $$""",
+        """CREATE TABLE chat_log (
+             id INTEGER NOT NULL DEFAULT nextval('chat_log_id_seq'),
+             toko_id VARCHAR(50) REFERENCES toko(id),
+             customer_hp VARCHAR(50),
+             role VARCHAR(10),
+             message TEXT,
+             created_at TIMESTAMP NOT NULL DEFAULT now(),
+             PRIMARY KEY (id, created_at)
+           ) PARTITION BY RANGE (created_at)""",
+        "ALTER SEQUENCE chat_log_id_seq OWNED BY chat_log.id",
+        "CREATE TABLE chat_log_default PARTITION OF chat_log DEFAULT",
+    ]
+
+    month = month_start(min_created or now)
+    last = add_months(month_start(now), months_ahead)
+    while month <= last:
+        statements.append(partition_ddl(month))
+        month = add_months(month, 1)
+
+    statements.append(
+        "INSERT INTO chat_log (id, toko_id, customer_hp, role, message, created_at) "
+        "SELECT id, toko_id, customer_hp, role, message, COALESCE(created_at, now()) FROM chat_log_unpartitioned"
+    )
+    if not keep_old:
+        statements.append("DROP TABLE chat_log_unpartitioned")
+    return statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help='Print the SQL without executing it')
+    parser.add_argument('--keep-old', action='store_true', help='Keep chat_log_unpartitioned after the copy')
+    args = parser.parse_args()
+
+    from datetime import datetime
+    from sqlalchemy import text
+    from app import create_app
+    from app.config import Config
+    from app.extensions import db
+    from app.models import ChatLog
+    from app.services.chatlog_maintenance import ChatLogMaintenance
+
+    app = create_app()
+    with app.app_context():
+        if not ChatLogMaintenance.is_postgres():
+            print("[SKIP] Partitioning requires PostgreSQL")
+            return
+        if ChatLogMaintenance.is_partitioned():
+            print("[OK] chat_log is already partitioned")
+            return
+
+        min_created = db.session.query(db.func.min(ChatLog.created_at)).scalar()
+        statements = build_statements(min_created, datetime.now(), Config.CHATLOG_PARTITION_MONTHS_AHEAD, args.keep_old)
+        if args.dry_run:
+            print(";\n\n".join(statements) + ";")
+            return
+
+        db.session.rollback()
+        with db.engine.begin() as conn:
+            for sql in statements:
+                conn.execute(text(sql))
+            # Composite indexes on the parent cascade to every partition
+            for index in ChatLog.__table__.indexes:
+                index.create(bind=conn)
+        print(f"[OK] chat_log partitioned ({len(ChatLogMaintenance.list_partitions())} partitions)")
+
+
+if __name__ == '__main__':
+    main()
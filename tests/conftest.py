@@ -0,0 +1,33 @@
+"""
+Shared test setup: import paths and the Flask app fixture
+"""
+import pytest
+import sys
+import os
+
+# Add project root and bot directory to path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bot')))
+
+
+@pytest.fixture
+def app_config():
+    """Config patches applied before the app is created (override in a test class or module)"""
+
+
+@pytest.fixture
+def fresh_db(monkeypatch, tmp_path):
+    """Point the app at an empty SQLite database (request it from an app_config override)"""
+    from app.config import Config
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+
+
+@pytest.fixture
+def app(app_config):
+    """Flask app with an app context pushed for the whole test"""
+    from bot.app import create_app
+    from app.extensions import db
+    app = create_app()
+    with app.app_context():
+        yield app
+        db.session.remove()
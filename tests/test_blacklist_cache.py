@@ -0,0 +1,77 @@
+"""
+Unit Tests for the Process-Local Blacklist Cache
+Run with: pytest tests/test_blacklist_cache.py -v
+"""
+import pytest
+import uuid
+
+from app.services.opt_out_manager import OptOutManager, BlacklistCache
+
+
+def random_phone():
+    return '628' + str(uuid.uuid4().int)[:9]
+
+
+class TestBlacklistCache:
+    """Test blacklist cache loading and version-based refresh"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from app.extensions import db
+        from app.models import BroadcastBlacklist
+        BlacklistCache.clear()
+        self.phones = []
+        yield
+        db.session.rollback()
+        BroadcastBlacklist.query.filter(BroadcastBlacklist.phone_number.in_(self.phones)).delete(synchronize_session=False)
+        db.session.commit()
+        BlacklistCache.clear()
+
+    def test_opt_out_and_opt_in(self):
+        phone = random_phone()
+        self.phones.append(phone)
+        assert OptOutManager.is_blacklisted(phone) is False
+        assert OptOutManager.add_to_blacklist(phone)
+        assert OptOutManager.is_blacklisted(phone) is True
+        assert OptOutManager.is_blacklisted('0' + phone[2:]) is True  # Local format is normalized
+        assert OptOutManager.remove_from_blacklist(phone)
+        assert OptOutManager.is_blacklisted(phone) is False
+
+    def test_change_from_other_process(self):
+        """Rows written elsewhere are picked up once the version counter moves"""
+        from app.extensions import db
+        from app.models import BroadcastBlacklist
+        phone = random_phone()
+        self.phones.append(phone)
+        BlacklistCache.refresh(force=True)
+
+        db.session.add(BroadcastBlacklist(phone_number=phone))
+        BlacklistCache.bump_version()
+        db.session.commit()
+        BlacklistCache._last_check = 0  # Skip the check interval
+        assert BlacklistCache.contains(phone) is True
+
+        BroadcastBlacklist.query.filter_by(phone_number=phone).delete()
+        BlacklistCache.bump_version()
+        db.session.commit()
+        BlacklistCache._last_check = 0
+        assert BlacklistCache.contains(phone) is False
+
+    def test_every_bump_writes_a_new_version(self):
+        from app.extensions import db
+        seen = {BlacklistCache._read_version()}
+        for _ in range(3):
+            BlacklistCache.bump_version()
+            db.session.commit()
+            seen.add(BlacklistCache._read_version())
+        assert len(seen) == 4
+
+    def test_filter_targets(self):
+        blocked, ok = random_phone(), random_phone()
+        self.phones.append(blocked)
+        OptOutManager.add_to_blacklist(blocked)
+
+        targets = [{'phone': blocked, 'name': 'A'}, {'phone': ok, 'name': 'B'}, ok]
+        allowed, blacklisted = BlacklistCache.filter_targets(targets)
+        assert allowed == [{'phone': ok, 'name': 'B'}, ok]
+        assert blacklisted == [{'phone': blocked, 'name': 'A'}]
@@ -92,12 +92,8 @@ class TestBroadcastManager:
     """Test Broadcast Manager functions"""
 
     @pytest.fixture(autouse=True)
-    def app_context(self):
+    def app_context(self, app):
         """Provide app context for DB tests"""
-        from bot.app import create_app
-        app = create_app()
-        with app.app_context():
-            yield
     
     def test_segment_map(self):
         """Test that segment map has expected keys"""
@@ -116,6 +112,196 @@ class TestBroadcastManager:
         assert 'Semua Merchant' in menu
         assert 'CSV' in menu
 
+class TestSessionScheduling:
+    """Test per-session rate limiting and tenant round-robin"""
+
+    def test_round_robin_tenants(self):
+        from bot.app.services.broadcast import pick_next_tenant
+        tokos = ['628222', '628111', '628222', '628333']
+        assert pick_next_tenant(tokos) == '628111'
+        assert pick_next_tenant(tokos, '628111') == '628222'
+        assert pick_next_tenant(tokos, '628222') == '628333'
+        assert pick_next_tenant(tokos, '628333') == '628111'  # Wrap around
+        assert pick_next_tenant([]) is None
+
+    def test_rate_limiter_window(self):
+        from bot.app.services.broadcast import SessionRateLimiter
+        limiter = SessionRateLimiter(max_per_window=2, window_seconds=60)
+        assert limiter.wait_time(now=0) == 0
+        limiter.record(now=0)
+        limiter.record(now=10)
+        assert limiter.wait_time(now=20) == 40  # Oldest send leaves the window at t=60
+        assert limiter.wait_time(now=60) == 0
+
+class TestSessionClaim:
+    """Test that each session lane only sees and claims its own jobs"""
+
+    @pytest.fixture
+    def app_config(self, fresh_db):
+        pass
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from app.config import Config
+        from app.extensions import db
+        from app.models import BroadcastJob, Toko
+        db.session.add_all([
+            Toko(id='628111', nama='A', session_name='session_a'),
+            Toko(id='628222', nama='B', session_name='session_b'),
+            Toko(id='628333', nama='C', session_name=None),
+        ])
+        db.session.add_all([
+            BroadcastJob(id=1, toko_id='628111', pesan='a1', status='PENDING'),
+            BroadcastJob(id=2, toko_id='628222', pesan='b1', status='RUNNING'),
+            BroadcastJob(id=3, toko_id='628111', pesan='a2', status='PENDING'),
+            BroadcastJob(id=4, toko_id='SUPERADMIN', pesan='m1', status='PENDING'),
+            BroadcastJob(id=5, toko_id='628333', pesan='c1', status='PENDING'),
+            BroadcastJob(id=6, toko_id='628222', pesan='b2', status='COMPLETED'),
+        ])
+        db.session.commit()
+        return Config.MASTER_SESSION
+
+    def test_sessions_resolved_in_one_query(self, app_context):
+        from bot.app.services.broadcast import find_runnable_sessions
+        assert find_runnable_sessions() == {'session_a', 'session_b', app_context}
+
+    def test_session_filter_in_sql(self, app_context):
+        from app.models import BroadcastJob
+        from bot.app.services.broadcast import _runnable_jobs, _job_session_column
+        def jobs_of(session_name):
+            rows = _runnable_jobs(BroadcastJob.id).filter(_job_session_column() == session_name).all()
+            return sorted(job_id for job_id, in rows)
+        assert jobs_of('session_a') == [1, 3]
+        assert jobs_of('session_b') == [2]
+        assert jobs_of(app_context) == [4, 5]  # SUPERADMIN and stores without a session
+
+    def test_claim_order_round_robin(self):
+        from bot.app.services.broadcast import _claim_order
+        candidates = [(1, '628111'), (2, '628222'), (3, '628111'), (4, '628333')]
+        assert _claim_order(candidates) == [1, 3, 2, 4]
+        assert _claim_order(candidates, '628111') == [2, 4, 1, 3]
+        assert _claim_order([]) == []
+
+class TestBroadcastTargets:
+    """Test target_list -> broadcast_target row mapping"""
+
+    def test_legacy_target_rows(self):
+        rows = BroadcastManager.build_target_rows(7, [
+            '628111',                                  # Before cursor, no status: already sent
+            {'phone': '628222', 'status': 'failed', 'error': 'Timeout'},
+            {'phone': '628333', 'status': 'sending'},  # Interrupted: send again
+            {'nama': 'Budi', 'phone_number': '628444'},
+        ], processed_count=3)
+
+        assert [r['idx'] for r in rows] == [0, 1, 2, 3]
+        assert [r['status'] for r in rows] == ['success', 'failed', 'pending', 'pending']
+        assert rows[1]['error'] == 'Timeout'
+        assert rows[3] == {'job_id': 7, 'idx': 3, 'phone': '628444', 'name': 'Budi', 'status': 'pending', 'error': None}
+
+    def test_new_job_rows_all_pending(self):
+        rows = BroadcastManager.build_target_rows(1, [{'phone': '628111', 'name': 'A'}, '628222'])
+        assert all(r['status'] == 'pending' for r in rows)
+
+class FakeWahaClient:
+    """AsyncWahaClient stand-in recording every WAHA call"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def check_exists_many(self, phones, session_name, concurrency=5):
+        self.calls.append(('check_exists_many', sorted(phones)))
+        return {phone: phone != '628000000002' for phone in phones}
+
+    async def lookup_exists(self, phone, session_name):
+        self.calls.append(('lookup_exists', phone))
+        return True
+
+    async def send_text(self, phone, text, session_name):
+        self.calls.append(('send_text', phone))
+        return True
+
+
+class TestPrecheckPreflight:
+    """Test that a job's numbers are checked in bulk before its first send"""
+
+    @pytest.fixture
+    def app_config(self, fresh_db):
+        pass
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, monkeypatch, app):
+        from app.extensions import db
+        from app.models import BroadcastJob, BroadcastTarget, Toko
+        from app.services import broadcast, message_variation, waha
+        monkeypatch.setattr(waha, 'check_session_status', lambda session_name: 'WORKING')
+        monkeypatch.setattr(message_variation, 'generate_message_variations', lambda pesan, count: [pesan])
+        monkeypatch.setattr(broadcast.Humanizer, 'get_adaptive_delay', lambda message: {'latency': 0, 'typing': 0})
+        monkeypatch.setattr(broadcast, 'kirim_waha_raw', lambda *args: None)
+        db.session.add(Toko(id='628111', nama='A', session_name='session_a'))
+        db.session.add(BroadcastJob(id=1, toko_id='628111', pesan='Promo', status='PENDING'))
+        db.session.add_all([
+            BroadcastTarget(job_id=1, idx=i, phone=f'62800000000{i + 1}', status='pending') for i in range(3)
+        ])
+        db.session.commit()
+
+    def _engine(self):
+        from app.services.broadcast import BroadcastEngine, SessionRateLimiter
+
+        async def in_app(func, *args):
+            return func(*args)  # The test already runs inside an app context
+
+        engine = BroadcastEngine(app=None)
+        engine.in_app = in_app
+        engine.client = FakeWahaClient()
+        return engine, SessionRateLimiter(100)
+
+    def test_precheck_runs_before_first_send(self):
+        import asyncio
+        from app.extensions import db
+        from app.models import BroadcastJob, BroadcastTarget
+        engine, limiter = self._engine()
+        lane = {'last_toko_id': None, 'skips': 0, 'failures': 0}
+
+        async def serve():
+            pauses = []
+            for _ in range(6):
+                pause = await engine._serve_one('session_a', lane, limiter)
+                pauses.append(pause)
+                db.session.query(BroadcastJob).update({'locked_until': None})  # Skip the pacing wait
+                db.session.commit()
+                if pause is None:
+                    break
+            return pauses
+
+        asyncio.run(serve())
+        phones = ['628000000001', '628000000002', '628000000003']
+        assert engine.client.calls == [
+            ('check_exists_many', phones),  # Pre-flight, ahead of every send
+            ('send_text', '628000000001'),
+            ('send_text', '628000000003'),
+        ]
+        statuses = {t.phone: t.status for t in BroadcastTarget.query.filter_by(job_id=1)}
+        assert statuses == {'628000000001': 'success', '628000000002': 'skipped', '628000000003': 'success'}
+        assert engine.prechecked == set()  # Forgotten once the job completed
+
+    def test_precheck_keeps_job_locked_then_releases(self):
+        import asyncio
+        from datetime import datetime
+        from app.models import BroadcastJob
+        from app.services.broadcast import prepare_next_target
+
+        plan = prepare_next_target('session_a', {}, None, set())
+        assert plan == {'action': 'precheck', 'job_id': 1, 'toko_id': '628111'}
+        job = BroadcastJob.query.get(1)
+        assert job.locked_until > datetime.utcnow()  # Nothing else claims it during the check
+        assert prepare_next_target('session_a', {}, None, set()) == {'action': 'idle'}
+
+        engine, _ = self._engine()
+        asyncio.run(engine.precheck_job(1, 'session_a'))
+        assert BroadcastJob.query.get(1).locked_until <= datetime.utcnow()
+        assert prepare_next_target('session_a', {}, None, {1})['action'] == 'send'
+
+
 if __name__ == "__main__":
     # Run tests
     pytest.main([__file__, '-v'])
@@ -0,0 +1,45 @@
+"""
+Unit Tests for the Burst Limiter (ping-pong protection)
+Run with: pytest tests/test_burst_limiter.py -v
+"""
+import pytest
+
+from app.config import Config
+from app.services.burst_limiter import BurstLimiter, MemoryBurstStore, SharedBurstStore
+from app.services.metrics import Metrics
+
+
+class TestBurstLimiter:
+    """Test 3-per-minute sliding window semantics on both stores"""
+
+    @pytest.fixture(autouse=True)
+    def limits(self, monkeypatch):
+        monkeypatch.setattr(Config, 'BURST_LIMIT', 3)
+        monkeypatch.setattr(Config, 'BURST_WINDOW_SECONDS', 60)
+        yield
+        BurstLimiter.use_store(None)
+
+    def test_sliding_window(self):
+        BurstLimiter.use_store(MemoryBurstStore())
+        for t in (1000, 1010, 1020):
+            BurstLimiter.record_send('toko_a', '6281', now=t)
+
+        silenced_before = Metrics.get_counter('burst.silenced')
+        assert BurstLimiter.is_silenced('toko_a', '6281', now=1030)
+        assert Metrics.get_counter('burst.silenced') == silenced_before + 1
+        assert not BurstLimiter.is_silenced('toko_b', '6281', now=1030)  # Keyed per toko
+        assert not BurstLimiter.is_silenced('toko_a', '6281', now=1061)  # First send left the window
+
+    def test_shared_store_across_processes(self, tmp_path):
+        path = str(tmp_path / 'burst.db')
+        worker_1, worker_2 = SharedBurstStore(path), SharedBurstStore(path)
+
+        BurstLimiter.use_store(worker_1)
+        BurstLimiter.record_send('toko_a', '6281', now=1000)
+        BurstLimiter.record_send('toko_a', '6281', now=1001)
+        BurstLimiter.use_store(worker_2)
+        BurstLimiter.record_send('toko_a', '6281', now=1002)
+
+        BurstLimiter.use_store(worker_1)
+        assert BurstLimiter.recent_sends('toko_a', '6281', now=1003) == 3
+        assert BurstLimiter.is_silenced('toko_a', '6281', now=1003)
@@ -0,0 +1,30 @@
+"""
+Unit Tests for ChatLog Maintenance (partition helpers)
+Run with: pytest tests/test_chatlog_maintenance.py -v
+"""
+from datetime import datetime
+
+from app.models import ChatLog
+from app.services.chatlog_maintenance import add_months, index_ddl, partition_ddl, partition_month, partition_name
+
+
+class TestChatLogMaintenance:
+    """Test monthly partition naming/ranges and the declared composite indexes"""
+
+    def test_partition_ranges(self):
+        assert add_months(datetime(2026, 11, 1), 2) == datetime(2027, 1, 1)
+        assert add_months(datetime(2026, 1, 1), -1) == datetime(2025, 12, 1)
+        assert partition_name(datetime(2026, 3, 17)) == 'chat_log_y2026m03'
+        assert partition_month('chat_log_y2026m03') == datetime(2026, 3, 1)
+        assert partition_month('chat_log_default') is None
+        assert partition_ddl(datetime(2026, 12, 5)).endswith("FROM ('2026-12-01') TO ('2027-01-01')")
+
+    def test_composite_indexes_cover_hot_queries(self):
+        columns = {ix.name: [c.name for c in ix.columns] for ix in ChatLog.__table__.indexes}
+        assert columns['ix_chat_log_toko_customer_created'] == ['toko_id', 'customer_hp', 'created_at']
+        assert columns['ix_chat_log_toko_created'] == ['toko_id', 'created_at']
+
+    def test_index_ddl_is_idempotent_and_concurrent(self):
+        index = next(ix for ix in ChatLog.__table__.indexes if ix.name == 'ix_chat_log_toko_created')
+        assert index_ddl(index, 'CONCURRENTLY ') == \
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_log_toko_created ON chat_log (toko_id, created_at)"
@@ -0,0 +1,52 @@
+"""
+Unit Tests for the Buffered ChatLog Writer
+Run with: pytest tests/test_chatlog_writer.py -v
+"""
+import pytest
+import uuid
+
+from app.config import Config
+from app.services.chatlog_writer import ChatLogWriter
+from app.services.metrics import Metrics
+
+
+class TestChatLogWriter:
+    """Test buffering, batched flush and rejected rows"""
+
+    @pytest.fixture
+    def app_config(self, monkeypatch):
+        # Long interval: flushes in these tests are explicit
+        monkeypatch.setattr(Config, 'CHATLOG_FLUSH_MS', 60000)
+        monkeypatch.setattr(Config, 'CHATLOG_ASYNC', True)
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from app.extensions import db
+        from app.models import ChatLog
+        self.customer = 'test_' + uuid.uuid4().hex[:10]
+        yield
+        ChatLogWriter.flush()
+        ChatLog.query.filter_by(customer_hp=self.customer).delete()
+        db.session.commit()
+
+    def test_rows_buffered_until_flush(self):
+        from app.models import ChatLog
+        ChatLogWriter.log(None, self.customer, 'USER', 'halo')
+        ChatLogWriter.log(None, self.customer, 'AI', 'halo kak')
+        assert ChatLog.query.filter_by(customer_hp=self.customer).count() == 0
+
+        assert ChatLogWriter.flush() == 2
+        rows = ChatLog.query.filter_by(customer_hp=self.customer).order_by(ChatLog.id).all()
+        assert [(r.role, r.message) for r in rows] == [('USER', 'halo'), ('AI', 'halo kak')]
+        assert rows[0].created_at <= rows[1].created_at
+
+    def test_rejected_row_does_not_block_batch(self):
+        from app.models import ChatLog
+        rejected = Metrics.get_counter('chatlog.rejected')
+        ChatLogWriter.log(None, self.customer, 'USER', 'ok 1')
+        ChatLogWriter.log('toko_does_not_exist', self.customer, 'BOT', 'orphan')  # FK violation
+        ChatLogWriter.log(None, self.customer, 'AI', 'ok 2')
+
+        assert ChatLogWriter.flush() == 2
+        assert Metrics.get_counter('chatlog.rejected') == rejected + 1
+        assert [r.message for r in ChatLog.query.filter_by(customer_hp=self.customer).order_by(ChatLog.id)] == ['ok 1', 'ok 2']
@@ -0,0 +1,55 @@
+"""
+Unit Tests for Conversation Memory (ring buffer + rolling summary)
+Run with: pytest tests/test_conversation_memory.py -v
+"""
+
+from app.config import Config
+from app.models import ConversationState
+from app.services.conversation_memory import ConversationMemory
+
+
+def make_state(**fields):
+    values = dict(summary="", summary_upto=0, recent_json="[]", message_count=0)
+    values.update(fields)
+    return ConversationState(toko_id='toko_a', customer_hp='6281', **values)
+
+
+class TestConversationMemory:
+    """Test buffer trimming, unsummarized tracking and prompt history"""
+
+    def test_buffer_keeps_unsummarized_messages(self, monkeypatch):
+        monkeypatch.setattr(Config, 'CONVERSATION_RECENT_MESSAGES', 4)
+        monkeypatch.setattr(Config, 'CONVERSATION_SUMMARY_BATCH', 2)
+        state = make_state()
+        for i in range(6):
+            ConversationMemory.append(state, 'USER', f'm{i}')
+
+        # Nothing summarized yet: older messages stay until folded
+        assert [m['seq'] for m in ConversationMemory.unsummarized(state)] == [0, 1]
+        assert len(ConversationMemory.messages(state)) == 6
+
+        state.summary, state.summary_upto = "- User: m0\n- User: m1", 2
+        ConversationMemory.append(state, 'AI', 'm6')
+        assert [m['seq'] for m in ConversationMemory.messages(state)] == [2, 3, 4, 5, 6]
+
+    def test_buffer_hard_cap(self, monkeypatch):
+        monkeypatch.setattr(Config, 'CONVERSATION_RECENT_MESSAGES', 2)
+        monkeypatch.setattr(Config, 'CONVERSATION_SUMMARY_BATCH', 1)
+        state = make_state()
+        for i in range(10):
+            ConversationMemory.append(state, 'USER', f'm{i}')
+        assert [m['seq'] for m in ConversationMemory.messages(state)] == [5, 6, 7, 8, 9]
+        assert state.message_count == 10
+
+    def test_history_and_extractive_summary(self, monkeypatch):
+        monkeypatch.setattr(Config, 'CONVERSATION_SUMMARY_MAX_CHARS', 40)
+        state = make_state(summary="- User: mau pesan kue")
+        ConversationMemory.append(state, 'AI', 'Siap kak')
+        assert ConversationMemory.history_text(state) == (
+            "[Ringkasan percakapan sebelumnya]:\n- User: mau pesan kue\n\nAI: Siap kak\n"
+        )
+
+        summary = ConversationMemory.extractive_summary(
+            "- User: lama sekali", [{"seq": 0, "role": "USER", "text": "alamat Jl. Merdeka 1"}]
+        )
+        assert summary == "- User: alamat Jl. Merdeka 1"
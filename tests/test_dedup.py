@@ -0,0 +1,97 @@
+"""
+Unit Tests for Webhook Deduplication
+Run with: pytest tests/test_dedup.py -v
+"""
+import pytest
+import uuid
+
+from app.services.dedup import MessageDedup
+from app.services.metrics import Metrics
+
+
+class TestMessageId:
+    """Test message id extraction"""
+
+    def test_extract_payload_id(self):
+        data = {'event': 'message', 'payload': {'id': 'false_628111@c.us_ABC'}}
+        assert MessageDedup.get_message_id(data) == 'false_628111@c.us_ABC'
+
+    def test_extract_serialized_id(self):
+        data = {'event': 'message', 'payload': {'id': {'_serialized': 'true_628111@c.us_XYZ'}}}
+        assert MessageDedup.get_message_id(data) == 'true_628111@c.us_XYZ'
+
+    def test_non_message_event_ignored(self):
+        data = {'event': 'session.status', 'payload': {'id': 'x', 'status': 'WORKING'}}
+        assert MessageDedup.get_message_id(data) is None
+
+
+class TestDuplicateDetection:
+    """Test seen-id store (DB + local cache)"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        MessageDedup.clear_local()
+
+    def test_first_seen_then_duplicate(self):
+        message_id = f"test_{uuid.uuid4().hex}"
+        assert MessageDedup.is_duplicate(message_id) is False
+        assert MessageDedup.is_duplicate(message_id) is True
+
+    def test_duplicate_across_workers(self):
+        """A fresh process (empty local cache) still sees the DB claim"""
+        message_id = f"test_{uuid.uuid4().hex}"
+        assert MessageDedup.is_duplicate(message_id) is False
+        MessageDedup.clear_local()
+        hits_before = Metrics.get_counter('dedup.hit_db')
+        assert MessageDedup.is_duplicate(message_id) is True
+        assert Metrics.get_counter('dedup.hit_db') == hits_before + 1
+
+    def test_released_id_can_be_claimed_again(self):
+        message_id = f"test_{uuid.uuid4().hex}"
+        assert MessageDedup.is_duplicate(message_id) is False
+        MessageDedup.release(message_id)
+        assert MessageDedup.is_duplicate(message_id) is False
+        assert MessageDedup.is_duplicate(message_id) is True
+
+    def test_missing_id_never_duplicate(self):
+        assert MessageDedup.is_duplicate(None) is False
+        assert MessageDedup.is_duplicate('') is False
+
+
+class TestWebhookClaimRelease:
+    """Test that a failed webhook gives its message id back for WAHA's retry"""
+
+    @pytest.fixture(autouse=True)
+    def client(self, monkeypatch, app):
+        from app.config import Config
+        from app.feature_flags import FeatureFlags
+        from app.routes import webhook
+        monkeypatch.setattr(Config, 'WEBHOOK_SECRET', '')
+        monkeypatch.setattr(FeatureFlags, 'FEATURE_WEBHOOK_QUEUE', False)
+        self.results = []
+
+        def fake_handler(data):
+            result = self.results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        monkeypatch.setattr(webhook, 'handle_webhook_event', fake_handler)
+        self.client = app.test_client()
+        MessageDedup.clear_local()
+
+    def _post(self, message_id):
+        return self.client.post('/webhook', json={'event': 'message', 'payload': {'id': message_id}})
+
+    def test_exception_releases_claim(self):
+        message_id = f"test_{uuid.uuid4().hex}"
+        self.results = [RuntimeError("boom"), ("OK", 200), ("OK", 200)]
+        assert self._post(message_id).status_code == 500
+        assert self._post(message_id).status_code == 200  # Retry processed
+        assert self._post(message_id).get_json()['reason'] == 'duplicate'
+
+    def test_error_response_releases_claim(self):
+        message_id = f"test_{uuid.uuid4().hex}"
+        self.results = [("Database error", 503), ("OK", 200)]
+        assert self._post(message_id).status_code == 503
+        assert self._post(message_id).status_code == 200
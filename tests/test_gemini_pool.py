@@ -0,0 +1,38 @@
+"""
+Unit Tests for the Gemini Client Pool
+Run with: pytest tests/test_gemini_pool.py -v
+"""
+import threading
+
+from app.config import Config
+from app.services.gemini import GeminiClientPool
+
+
+class TestGeminiClientPool:
+    """Test client reuse and LRU eviction"""
+
+    def setup_method(self):
+        GeminiClientPool.clear()
+
+    def test_same_key_reuses_client(self):
+        assert GeminiClientPool.get('key-a') is GeminiClientPool.get('key-a')
+        assert GeminiClientPool.get('key-a') is not GeminiClientPool.get('key-b')
+        assert GeminiClientPool.get('') is None
+
+    def test_lru_eviction(self, monkeypatch):
+        monkeypatch.setattr(Config, 'GEMINI_CLIENT_POOL_SIZE', 2)
+        a = GeminiClientPool.get('key-a')
+        GeminiClientPool.get('key-b')
+        GeminiClientPool.get('key-a')  # Touch: key-b is now least recently used
+        GeminiClientPool.get('key-c')
+        assert list(GeminiClientPool._clients) == ['key-a', 'key-c']
+        assert GeminiClientPool.get('key-a') is a
+
+    def test_concurrent_get_builds_one_client(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(GeminiClientPool.get('key-x'))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len({id(c) for c in results}) == 1
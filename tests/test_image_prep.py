@@ -0,0 +1,80 @@
+"""
+Unit Tests for Payment Screenshot Preprocessing
+Run with: pytest tests/test_image_prep.py -v
+"""
+import pytest
+import io
+
+from app.config import Config
+from app.services import image_prep
+from app.services.image_prep import prepare_for_vision
+
+
+class TestImagePrep:
+    """Test downscale/re-encode and pass-through cases"""
+
+    @pytest.fixture(autouse=True)
+    def settings(self, monkeypatch):
+        monkeypatch.setattr(Config, 'PAYMENT_IMAGE_PREPROCESS', True)
+        monkeypatch.setattr(Config, 'PAYMENT_IMAGE_MAX_EDGE', 1600)
+        monkeypatch.setattr(Config, 'PAYMENT_IMAGE_GRAYSCALE', True)
+        monkeypatch.setattr(Config, 'PAYMENT_IMAGE_JPEG_QUALITY', 85)
+
+    def test_pass_through_without_pillow(self, monkeypatch):
+        monkeypatch.setattr(image_prep, 'Image', None)
+        data = b'\x89PNG raw screenshot'
+        assert prepare_for_vision(data, 'image/png') == (data, 'image/png')
+
+    def test_pass_through_non_image_and_corrupt(self):
+        pdf = b'%PDF-1.4 receipt'
+        assert prepare_for_vision(pdf, 'application/pdf') == (pdf, 'application/pdf')
+        corrupt = b'not really a png'
+        assert prepare_for_vision(corrupt, 'image/png') == (corrupt, 'image/png')
+
+    def test_downscale_reencode_strip_exif(self):
+        Image = pytest.importorskip('PIL.Image')
+        img = Image.effect_noise((1080, 2400), 64).convert('RGB')
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'  # Make
+        exif[0x0112] = 6  # Orientation: rotate 90 CW on display
+        out = io.BytesIO()
+        img.save(out, format='JPEG', quality=100, exif=exif.tobytes())
+        original = out.getvalue()
+
+        processed, mime = prepare_for_vision(original, 'image/jpeg')
+
+        assert mime == 'image/jpeg' and len(processed) < len(original)
+        result = Image.open(io.BytesIO(processed))
+        assert result.mode == 'L'
+        assert result.size == (1600, 720)  # Orientation applied, long edge capped
+        assert not result.getexif()
+
+    def test_metadata_stripped_even_when_not_smaller(self):
+        Image = pytest.importorskip('PIL.Image')
+        img = Image.new('RGB', (200, 100), (240, 240, 240))
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'  # Make
+        exif[0x8825] = {1: 'S', 2: (6.0, 10.0, 0.0)}  # GPS IFD
+        out = io.BytesIO()
+        img.save(out, format='JPEG', quality=5, exif=exif.tobytes())
+        original = out.getvalue()
+
+        processed, mime = prepare_for_vision(original, 'image/jpeg')
+
+        assert processed != original
+        assert not Image.open(io.BytesIO(processed)).getexif()
+        assert mime in ('image/jpeg', 'image/png')
+
+    def test_flat_screenshot_picks_smaller_format(self, monkeypatch):
+        Image = pytest.importorskip('PIL.Image')
+        ImageDraw = pytest.importorskip('PIL.ImageDraw')
+        monkeypatch.setattr(Config, 'PAYMENT_IMAGE_JPEG_QUALITY', 95)
+        img = Image.new('RGB', (1080, 2400), (255, 255, 255))
+        ImageDraw.Draw(img).rectangle((0, 0, 1080, 300), fill=(0, 90, 170))
+        out = io.BytesIO()
+        img.save(out, format='BMP')
+
+        processed, mime = prepare_for_vision(out.getvalue(), 'image/bmp')
+
+        assert mime == 'image/png'  # Two flat colors: lossless PNG beats JPEG
+        assert Image.open(io.BytesIO(processed)).size == (720, 1600)
@@ -0,0 +1,106 @@
+"""
+Unit Tests for the Inbound Webhook Queue
+Run with: pytest tests/test_inbound_queue.py -v
+"""
+import pytest
+import json
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from app.config import Config
+from app.services import inbound_queue
+from app.services.metrics import Metrics
+
+
+def message_event(chat='6281111', text='halo'):
+    return {'event': 'message', 'session': 'session_a',
+            'payload': {'id': f'false_{chat}@c.us_X', 'from': f'{chat}@c.us', 'body': text}}
+
+
+class TestInboundQueue:
+    """Test enqueue, claim order, retries and failure of queued webhook events"""
+
+    @pytest.fixture
+    def app_config(self, fresh_db):
+        pass
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, monkeypatch, app):
+        monkeypatch.setattr(Config, 'INBOUND_MAX_ATTEMPTS', 3)
+        self.sleeps = []
+        monkeypatch.setattr(inbound_queue, 'time', SimpleNamespace(sleep=self.sleeps.append, time=time.time))
+        self.results = []
+        monkeypatch.setattr('app.routes.webhook.handle_webhook_event', self._handler)
+        self.app = app
+
+    def _handler(self, data):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _process(self, event_id):
+        from app.extensions import db
+        from app.models import InboundEvent
+        event = db.session.get(InboundEvent, event_id)
+        inbound_queue._process_event(self.app, event.id, event.payload, event.created_at or datetime.now())
+        db.session.expire_all()
+        return db.session.get(InboundEvent, event_id)
+
+    def test_enqueue_and_claim_in_arrival_order(self):
+        from app.extensions import db
+        from app.models import InboundEvent
+        first = inbound_queue.enqueue_event(message_event('6281111'))
+        second = inbound_queue.enqueue_event(message_event('6282222'))
+        third = inbound_queue.enqueue_event(message_event('6281111'))
+
+        event = db.session.get(InboundEvent, first)
+        assert (event.status, event.session_name) == ('PENDING', 'session_a')
+        assert json.loads(event.payload) == message_event('6281111')
+        assert inbound_queue.get_queue_depth() == 3
+
+        batch = inbound_queue._claim_batch(limit=2)
+        assert [e.id for e in batch] == [first, second]
+        assert {e.status for e in batch} == {'PROCESSING'}
+        assert [e.id for e in inbound_queue._claim_batch()] == [third]
+        assert inbound_queue._claim_batch() == []
+        assert inbound_queue.get_queue_depth() == 0
+
+    def test_success_marks_done(self):
+        event_id = inbound_queue.enqueue_event(message_event())
+        self.results = [("OK", 200)]
+        event = self._process(event_id)
+        assert (event.status, event.attempts, event.last_error) == ('DONE', 1, None)
+        assert self.sleeps == []
+
+    def test_transient_failure_is_retried(self):
+        event_id = inbound_queue.enqueue_event(message_event())
+        self.results = [RuntimeError("db locked"), ("Internal error", 500), ("OK", 200)]
+        event = self._process(event_id)
+        assert (event.status, event.attempts) == ('DONE', 3)
+        assert self.sleeps == [2, 4]
+
+    def test_exhausted_retries_mark_failed(self):
+        failed = Metrics.get_counter('inbound.failed')
+        event_id = inbound_queue.enqueue_event(message_event())
+        self.results = [("Internal error", 500)] * 3
+        event = self._process(event_id)
+        assert (event.status, event.attempts, event.last_error) == ('FAILED', 3, 'HTTP 500')
+        assert Metrics.get_counter('inbound.failed') == failed + 1
+
+    def test_client_error_fails_without_retry(self):
+        event_id = inbound_queue.enqueue_event(message_event())
+        self.results = [("Bad payload", 400)]
+        event = self._process(event_id)
+        assert (event.status, event.attempts, event.last_error) == ('FAILED', 1, 'HTTP 400')
+        assert self.sleeps == []
+
+    def test_unreadable_payload_fails(self):
+        from app.extensions import db
+        from app.models import InboundEvent
+        event_id = inbound_queue.enqueue_event(message_event())
+        db.session.get(InboundEvent, event_id).payload = '{not json'
+        db.session.commit()
+        event = self._process(event_id)
+        assert (event.status, event.attempts) == ('FAILED', 0)
@@ -0,0 +1,51 @@
+"""
+Unit Tests for Knowledge Base Retrieval
+Run with: pytest tests/test_knowledge_base.py -v
+"""
+import os
+import json
+
+from app.services.knowledge_base import (
+    KnowledgeBase, INDEX_SUFFIX, build_index, chunk_text, search, tokenize
+)
+
+KB_TEXT = "\n\n".join([
+    "Toko Kue Sari buka setiap hari jam 08.00 sampai 21.00.",
+    "Pengiriman dengan kurir lokal untuk area Bandung, ongkir mulai 10 ribu.",
+    "Kue ulang tahun harus dipesan minimal 2 hari sebelumnya. Bisa custom tulisan.",
+    "Pembayaran melalui transfer BCA atau QRIS. Kirim bukti transfer ke admin.",
+] + ["Paragraf pengisi tentang sejarah toko. " * 10] * 20 + [
+    "Garansi: kue yang rusak saat pengiriman diganti gratis.",
+])
+
+
+class TestKnowledgeBase:
+    """Test chunking, BM25 ranking and the on-disk index"""
+
+    def setup_method(self):
+        KnowledgeBase.clear()
+
+    def test_chunks_respect_size(self):
+        chunks = chunk_text(KB_TEXT, chunk_chars=300)
+        assert len(chunks) > 5
+        assert all(len(c) <= 300 for c in chunks)
+        assert tokenize("Apa ada Kue ULANG tahun?") == ['kue', 'ulang', 'tahun']
+
+    def test_search_reaches_beyond_first_5000_chars(self):
+        assert len(KB_TEXT) > 5000
+        index = build_index(KB_TEXT, chunk_chars=300)
+        top = search(index, "kalau kuenya rusak ada garansi?", k=2)
+        assert 'Garansi' in top[0]
+        assert search(index, "halo kak", k=2) == []
+
+    def test_index_persisted_and_rebuilt_when_stale(self, tmp_path):
+        kb = tmp_path / 'kb.txt'
+        kb.write_text(KB_TEXT, encoding='utf-8')
+
+        index = KnowledgeBase.load(str(kb))
+        stored = json.loads((tmp_path / ('kb.txt' + INDEX_SUFFIX)).read_text(encoding='utf-8'))
+        assert stored['chunks'] == index['chunks']
+
+        kb.write_text("Promo spesial: diskon 50% untuk brownies.", encoding='utf-8')
+        os.utime(kb, ns=(1, 1))  # Make sure the signature changes even on coarse-mtime filesystems
+        assert search(KnowledgeBase.load(str(kb)), "diskon brownies") == ["Promo spesial: diskon 50% untuk brownies."]
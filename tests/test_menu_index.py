@@ -0,0 +1,99 @@
+"""
+Unit Tests for the Menu Search Index
+Run with: pytest tests/test_menu_index.py -v
+"""
+import pytest
+
+from app.services.menu_index import MenuIndex, MenuItem, StoreMenuIndex
+
+
+def make_catalog():
+    items = [
+        MenuItem(1, 'Es Teh Manis', 5000, -1, 'Minuman'),
+        MenuItem(2, 'Kopi Susu Gula Aren', 18000, 20, 'Minuman', 'Espresso dengan susu segar'),
+        MenuItem(3, 'Nasi Goreng Spesial', 25000, -1, 'Makanan', 'Pakai telur dan ayam suwir'),
+        MenuItem(4, 'Mie Ayam Bakso', 20000, 10, 'Makanan'),
+    ]
+    items += [MenuItem(10 + i, f'Kerupuk Varian {i}', 2000, -1, 'Snack') for i in range(25)]
+    return items
+
+
+class TestMenuIndex:
+    """Test token/prefix search, top sellers and category paging"""
+
+    def test_search_by_token_prefix_and_field(self):
+        index = StoreMenuIndex.build(make_catalog())
+        assert [m.id for m in index.search('ada nasi goreng?')][0] == 3
+        assert [m.id for m in index.search('kop')] == [2]  # Prefix of 'kopi'
+        # Name match outranks description match
+        assert [m.id for m in index.search('ayam')] == [4, 3]
+        assert index.search('es') == [index.items[0]]  # Short token: whole word only
+        assert index.search('pizza') == []
+
+    def test_top_sellers_mapped_by_name(self):
+        index = StoreMenuIndex.build(make_catalog(), top_seller_names=['kopi susu gula aren', 'Tidak Ada'])
+        assert [index.items[pos].id for pos in index.top_sellers] == [2]
+
+    def test_paging_by_category(self):
+        index = StoreMenuIndex.build(make_catalog())
+        items, page, total = index.page('snack', page=2, per_page=10)
+        assert (page, total) == (2, 3)
+        assert [m.item for m in items][0] == 'Kerupuk Varian 10'
+
+        items, page, total = index.page(None, page=99, per_page=10)
+        assert (page, total) == (3, 3)
+        assert index.find_category('MINUMAN') == 'Minuman'
+
+
+class TestMenuIndexRefresh:
+    """Test that owner commands see menu edits made by another process"""
+
+    @pytest.fixture
+    def app_config(self, fresh_db):
+        pass
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        MenuIndex.clear()
+        yield
+        MenuIndex.clear()
+
+    def test_fresh_rebuilds_stale_index(self):
+        from sqlalchemy import text
+        from app.extensions import db
+        db.session.execute(text("INSERT INTO toko (id, nama) VALUES ('menu_test', 'Menu Test')"))
+        db.session.commit()
+        assert MenuIndex.get('menu_test').items == []
+
+        # Written by another worker: no invalidation hook fires in this process
+        db.session.execute(text("INSERT INTO menu (toko_id, item, harga, stok) VALUES ('menu_test', 'Es Teh', 5000, -1)"))
+        db.session.commit()
+
+        assert MenuIndex.get('menu_test').items == []  # Still cached
+        assert [m.item for m in MenuIndex.get('menu_test', fresh=True).items] == ['Es Teh']
+        assert [m.item for m in MenuIndex.get('menu_test').items] == ['Es Teh']
+
+    def test_version_follows_menu_writes(self):
+        from sqlalchemy import text
+        from app.extensions import db
+        from app.models import Menu
+        db.session.execute(text("INSERT INTO toko (id, nama) VALUES ('menu_test', 'Menu Test')"))
+        db.session.commit()
+        versions = [MenuIndex.version('menu_test')]
+
+        menu = Menu(toko_id='menu_test', item='Es Teh', harga=5000)
+        db.session.add_all([menu, Menu(toko_id='menu_test', item='Kopi', harga=8000)])
+        db.session.commit()
+        versions.append(MenuIndex.version('menu_test'))
+        index = MenuIndex.get('menu_test')
+        assert index.version == versions[-1]
+
+        menu.harga = 6000
+        db.session.commit()
+        versions.append(MenuIndex.version('menu_test'))
+        assert MenuIndex.get('menu_test', version=versions[-1]).items[0].harga == 6000  # Rebuilt
+
+        db.session.delete(menu)
+        db.session.commit()
+        versions.append(MenuIndex.version('menu_test'))
+        assert len(set(versions)) == 4
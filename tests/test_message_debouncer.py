@@ -0,0 +1,71 @@
+"""
+Unit Tests for the Message Debouncer (burst coalescing)
+Run with: pytest tests/test_message_debouncer.py -v
+"""
+import pytest
+import threading
+
+from flask import Flask
+from app.config import Config
+from app.services.message_debouncer import MessageDebouncer, MemoryDebounceStore, SharedDebounceStore
+
+
+class TestMessageDebouncer:
+    """Test that a burst of texts becomes one merged turn"""
+
+    @pytest.fixture(autouse=True)
+    def window(self, monkeypatch):
+        monkeypatch.setattr(Config, 'MESSAGE_DEBOUNCE_SECONDS', 3)
+        monkeypatch.setattr(Config, 'MESSAGE_DEBOUNCE_MAX_SECONDS', 10)
+        yield
+        MessageDebouncer.use_store(None)
+
+    def test_last_message_collects_burst(self):
+        store = MemoryDebounceStore()
+        MessageDebouncer.use_store(store)
+        seqs = [store.add('toko_a:6281', text, 1000 + i) for i, text in enumerate(['halo', 'kak', 'mau tanya'])]
+
+        # Earlier timers fire while newer messages are pending: they step aside
+        assert MessageDebouncer.collect('toko_a:6281', seqs[0], now=1003) is None
+        assert MessageDebouncer.collect('toko_a:6281', seqs[2], now=1005) == "halo\nkak\nmau tanya"
+        assert store.size() == 0
+
+    def test_max_wait_flushes_long_burst(self):
+        store = MemoryDebounceStore()
+        MessageDebouncer.use_store(store)
+        first = store.add('toko_a:6281', 'satu', 1000)
+        store.add('toko_a:6281', 'dua', 1011)
+
+        # Oldest text waited past MESSAGE_DEBOUNCE_MAX_SECONDS: reply now, newer text stays pending
+        assert MessageDebouncer.collect('toko_a:6281', first, now=1011) == "satu"
+        assert store.peek('toko_a:6281') is not None
+
+    def test_shared_store_across_processes(self, tmp_path):
+        path = str(tmp_path / 'debounce.db')
+        worker_a, worker_b = SharedDebounceStore(path), SharedDebounceStore(path)
+        first = worker_a.add('toko_a:6281', 'halo', 1000)
+        last = worker_b.add('toko_a:6281', 'ada stok?', 1001)
+
+        MessageDebouncer.use_store(worker_a)
+        assert MessageDebouncer.collect('toko_a:6281', first, now=1004) is None
+        MessageDebouncer.use_store(worker_b)
+        assert MessageDebouncer.collect('toko_a:6281', last, now=1004) == "halo\nada stok?"
+        assert worker_a.peek('toko_a:6281') is None
+
+    def test_submit_calls_back_once(self, monkeypatch):
+        monkeypatch.setattr(Config, 'MESSAGE_DEBOUNCE_SECONDS', 0.2)
+        MessageDebouncer.use_store(MemoryDebounceStore())
+        replies = []
+        done = threading.Event()
+
+        def reply(merged):
+            replies.append(merged)
+            done.set()
+
+        with Flask(__name__).app_context():
+            for text in ('halo', 'kak'):
+                assert MessageDebouncer.submit('toko_a', '6281', text, reply)
+
+        assert done.wait(2)
+        threading.Event().wait(0.3)  # The first timer must not reply as well
+        assert replies == ["halo\nkak"]
@@ -0,0 +1,52 @@
+"""
+Unit Tests for the In-Process Metrics Registry
+Run with: pytest tests/test_metrics.py -v
+"""
+import pytest
+import threading
+
+from app.services.metrics import Metrics
+
+
+class TestMetrics:
+    """Test counters, gauges and histograms (names are unique: the registry is shared)"""
+
+    def test_counter_increments(self):
+        Metrics.incr('test.counter')
+        Metrics.incr('test.counter', 4)
+        assert Metrics.get_counter('test.counter') == 5
+        assert Metrics.get_counter('test.never_set') == 0
+
+    def test_counter_is_thread_safe(self):
+        def bump():
+            for _ in range(1000):
+                Metrics.incr('test.threaded')
+        threads = [threading.Thread(target=bump) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert Metrics.get_counter('test.threaded') == 8000
+
+    def test_gauge_keeps_last_value(self):
+        Metrics.set_gauge('test.gauge', 3)
+        Metrics.set_gauge('test.gauge', 7)
+        assert Metrics.snapshot()['gauges']['test.gauge'] == 7
+
+    def test_histogram_summary(self):
+        for seconds in (0.004, 0.02, 0.02, 0.3, 120.0):
+            Metrics.observe('test.hist', seconds)
+        hist = Metrics.snapshot()['histograms']['test.hist']
+        assert hist['count'] == 5
+        assert hist['avg'] == pytest.approx(120.344 / 5, abs=1e-4)
+        assert hist['p50'] == 0.025  # Upper bound of the bucket holding the median
+        assert hist['p99'] == 120.0  # Beyond the last bucket: the observed max
+        assert hist['max'] == 120.0
+
+    def test_timer_records_even_on_error(self):
+        with pytest.raises(ValueError):
+            with Metrics.timer('test.timer'):
+                raise ValueError("boom")
+        with Metrics.timer('test.timer'):
+            pass
+        assert Metrics.snapshot()['histograms']['test.timer']['count'] == 2
@@ -0,0 +1,64 @@
+"""
+Unit Tests for Pending Order Matching
+Run with: pytest tests/test_order_matching.py -v
+"""
+import pytest
+from datetime import datetime, timedelta
+
+from app.services.order_service import find_pending_order, match_pending_orders
+
+TOKO_ID = 'match_test_toko'
+
+
+class TestOrderMatching:
+    """Test single and batch amount matching against pending orders"""
+
+    @pytest.fixture
+    def app_config(self, fresh_db):
+        pass
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from app.extensions import db
+        from app.models import Transaction
+        from sqlalchemy import text
+        db.session.execute(text("INSERT INTO toko (id, nama) VALUES (:id, 'Match Test')"), {'id': TOKO_ID})
+        now = datetime.now()
+        rows = [
+            ('A-OLD', '6281', 50000, 'PENDING', 30),
+            ('A-NEW', '6281', 50500, 'PENDING', 10),
+            ('A-PAID', '6281', 75000, 'PAID', 5),
+            ('B-1', '6282', 50000, 'PENDING', 20),
+            ('B-2', '6282', 120000, 'PENDING', 1),
+        ]
+        for order_id, hp, nominal, status, minutes_ago in rows:
+            db.session.add(Transaction(
+                toko_id=TOKO_ID, customer_hp=hp, nominal=nominal, status=status, order_id=order_id,
+                created_at=now - timedelta(minutes=minutes_ago)
+            ))
+        db.session.commit()
+
+    def test_pending_lookup_index(self):
+        from app.extensions import db
+        from sqlalchemy import inspect
+        names = {ix['name'] for ix in inspect(db.engine).get_indexes('transaction')}
+        assert 'ix_transaction_pending_lookup' in names
+
+    def test_closest_amount_wins(self):
+        assert find_pending_order(TOKO_ID, '6281', amount=50000).order_id == 'A-OLD'
+        assert find_pending_order(TOKO_ID, '6281', amount=50400).order_id == 'A-NEW'
+
+    def test_no_amount_or_no_match_returns_most_recent(self):
+        assert find_pending_order(TOKO_ID, '6281').order_id == 'A-NEW'
+        assert find_pending_order(TOKO_ID, '6281', amount=75000).order_id == 'A-NEW'
+        assert find_pending_order(TOKO_ID, '6289') is None
+
+    def test_batch_assigns_each_order_once(self):
+        matches = match_pending_orders(TOKO_ID, [50000, 50000, 50000, 120500, 999000])
+        ids = [m.order_id if m else None for m in matches]
+        # Two exact 50000 orders, most recent first; third transfer takes the 50500 order
+        assert ids == ['B-1', 'A-OLD', 'A-NEW', 'B-2', None]
+
+    def test_batch_for_one_customer(self):
+        matches = match_pending_orders(TOKO_ID, [50000, 120000], customer_hp='6282')
+        assert [m.order_id for m in matches] == ['B-1', 'B-2']
@@ -0,0 +1,126 @@
+"""
+Unit Tests for the Payment Verification Pipeline
+Run with: pytest tests/test_payment_pipeline.py -v
+"""
+import pytest
+import os
+import json
+
+from app.config import Config
+from app.services import payment_pipeline
+from app.services.payment_pipeline import PaymentPipeline, media_path
+
+
+class TestPaymentPipeline:
+    """Test stage progression, resume and retry of persisted jobs"""
+
+    @pytest.fixture
+    def app_config(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(Config, 'PAYMENT_MEDIA_DIR', str(tmp_path))
+        monkeypatch.setattr(Config, 'PAYMENT_MAX_ATTEMPTS', 3)
+        self.sent = []
+        monkeypatch.setattr(payment_pipeline, 'kirim_waha', lambda chat_id, text, session: self.sent.append((chat_id, text)))
+        # The dispatcher started by create_app must not claim the jobs under test
+        monkeypatch.setattr(PaymentPipeline, '_claim', classmethod(lambda cls: 0))
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from app.extensions import db
+        from app.models import PaymentVerificationJob
+        yield
+        PaymentVerificationJob.query.filter_by(customer_hp='pipeline_test').delete()
+        db.session.commit()
+
+    def _job(self, status='PENDING', **fields):
+        from app.extensions import db
+        from app.models import PaymentVerificationJob
+        job = PaymentVerificationJob(
+            toko_id=None, customer_hp='pipeline_test', chat_id='6281@c.us', session_name='session_test',
+            media_url='http://waha/media.jpg', status=status, **fields
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+    def test_resumes_at_persisted_stage(self):
+        from app.extensions import db
+        from app.models import PaymentVerificationJob
+        analysis = {'is_valid': True, 'confidence_score': 80, 'detected_amount': 25000, 'bank_name': 'BCA'}
+        job_id = self._job(stage='MATCH', analysis_json=json.dumps(analysis))
+
+        PaymentPipeline.run_inline(job_id)
+
+        job = db.session.get(PaymentVerificationJob, job_id)
+        assert (job.stage, job.status, job.result) == ('NOTIFY', 'DONE', 'MANUAL_REVIEW')
+        assert len(self.sent) == 1 and 'Bukti Transfer Diterima' in self.sent[0][1]
+
+    def test_lost_media_restarts_download(self, monkeypatch):
+        from app.extensions import db
+        from app.models import PaymentVerificationJob
+
+        def fail_download(job):
+            raise ConnectionError("WAHA unreachable")
+        monkeypatch.setitem(payment_pipeline.STAGE_HANDLERS, 'DOWNLOAD', fail_download)
+        job_id = self._job(stage='VISION')  # No spooled file for this job
+        assert not os.path.exists(media_path(job_id))
+
+        PaymentPipeline.run_inline(job_id)
+
+        # Transient error: back to PENDING with backoff, no reply yet
+        job = db.session.get(PaymentVerificationJob, job_id)
+        assert (job.stage, job.status, job.attempts) == ('DOWNLOAD', 'PENDING', 1)
+        assert job.available_at is not None
+        assert self.sent == []
+
+    def test_permanent_failure_replies_once(self):
+        from app.extensions import db
+        from app.models import PaymentVerificationJob
+        job_id = self._job(stage='DOWNLOAD')
+        db.session.get(PaymentVerificationJob, job_id).media_url = None
+        db.session.commit()
+
+        PaymentPipeline.run_inline(job_id)
+
+        job = db.session.get(PaymentVerificationJob, job_id)
+        assert job.status == 'FAILED'
+        assert self.sent == [('6281@c.us', "❌ Gagal mengunduh gambar. Mohon kirim ulang.")]
+
+    def test_only_expired_leases_are_released(self):
+        from datetime import datetime, timedelta
+        from app.extensions import db
+        from app.models import PaymentVerificationJob
+        now = datetime.now()
+        live = self._job(stage='VISION', status='PROCESSING', claimed_at=now)
+        dead = self._job(stage='VISION', status='PROCESSING',
+                         claimed_at=now - timedelta(seconds=Config.PAYMENT_LEASE_SECONDS + 1))
+
+        PaymentPipeline._release_expired_leases()
+
+        assert db.session.get(PaymentVerificationJob, live).status == 'PROCESSING'
+        assert db.session.get(PaymentVerificationJob, dead).status == 'PENDING'
+
+    def test_lease_renewed_only_by_its_holder(self):
+        from datetime import datetime, timedelta
+        from app.extensions import db
+        from app.models import PaymentVerificationJob
+        lease = datetime.now() - timedelta(seconds=5)
+        job_id = self._job(stage='VISION', status='PROCESSING', claimed_at=lease)
+
+        renewed = PaymentPipeline._renew_lease(job_id, lease)
+        assert renewed is not None and renewed > lease
+        # The old lease is gone: a second holder of it (e.g. after a takeover) must stop
+        assert PaymentPipeline._renew_lease(job_id, lease) is None
+        assert db.session.get(PaymentVerificationJob, job_id).claimed_at == renewed
+
+
+    def test_inline_run_skips_job_claimed_by_dispatcher(self):
+        from datetime import datetime
+        from app.extensions import db
+        from app.models import PaymentVerificationJob
+        job_id = self._job(stage='MATCH', status='PROCESSING', claimed_at=datetime.now())
+
+        PaymentPipeline.run_inline(job_id)
+
+        job = db.session.get(PaymentVerificationJob, job_id)
+        assert (job.stage, job.status) == ('MATCH', 'PROCESSING')
+        assert self.sent == []
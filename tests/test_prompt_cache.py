@@ -0,0 +1,126 @@
+"""
+Unit Tests for the Store Prompt Cache
+Run with: pytest tests/test_prompt_cache.py -v
+"""
+import pytest
+import time
+from types import SimpleNamespace
+
+from app.config import Config
+from app.services.menu_index import MenuIndex
+from app.services.prompt_cache import StorePromptCache, PromptPrefix
+from app.services.tenant_cache import TenantCache
+
+
+def make_toko(**overrides):
+    fields = dict(id='toko_a', nama='Toko A', kategori='Kuliner', link_toko='-',
+                  remote_token='tok', admin_name='Sari', menu_version=None)
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+class FakeCaches:
+    def __init__(self, fail=False):
+        self.created = 0
+        self.fail = fail
+
+    def create(self, model, config):
+        if self.fail:
+            raise RuntimeError('cached content too small')
+        self.created += 1
+        return SimpleNamespace(name=f'cachedContents/{self.created}')
+
+
+class TestStorePromptCache:
+    """Test fingerprinting, invalidation and Gemini context cache reuse"""
+
+    def setup_method(self):
+        StorePromptCache.clear()
+
+    def test_fingerprint_tracks_inputs(self):
+        base = StorePromptCache.fingerprint(make_toko(), 'prompt')
+        assert base == StorePromptCache.fingerprint(make_toko(), 'prompt')
+        assert base != StorePromptCache.fingerprint(make_toko(admin_name='Budi'), 'prompt')
+        assert base != StorePromptCache.fingerprint(make_toko(), 'prompt baru')
+        assert base != StorePromptCache.fingerprint(make_toko(menu_version='5f0c'), 'prompt')
+
+    def test_tenant_invalidation_drops_entry(self):
+        StorePromptCache._listen()
+        StorePromptCache._entries['toko_a'] = PromptPrefix('x', 'f', time.monotonic() + 60)
+        StorePromptCache._entries['toko_b'] = PromptPrefix('y', 'f', time.monotonic() + 60)
+
+        TenantCache.invalidate('toko', 'toko_a')  # e.g. a Menu row of toko_a changed
+        assert set(StorePromptCache._entries) == {'toko_b'}
+
+    def test_remote_cache_reused_per_model(self, monkeypatch):
+        monkeypatch.setattr(Config, 'GEMINI_CONTEXT_CACHE_ENABLED', True)
+        monkeypatch.setattr(Config, 'GEMINI_CONTEXT_CACHE_MIN_CHARS', 100)
+        client = SimpleNamespace(caches=FakeCaches())
+
+        short = PromptPrefix('x' * 10, 'f', time.monotonic() + 60)
+        assert StorePromptCache.remote_cache_name('toko_a', short, client, 'm1') is None
+        assert client.caches.created == 0
+
+        entry = PromptPrefix('x' * 200, 'f', time.monotonic() + 60)
+        first = StorePromptCache.remote_cache_name('toko_a', entry, client, 'm1')
+        assert StorePromptCache.remote_cache_name('toko_a', entry, client, 'm1') == first
+        assert client.caches.created == 1
+        assert StorePromptCache.remote_cache_name('toko_a', entry, client, 'm2') != first
+
+    def test_remote_cache_failure_backs_off(self, monkeypatch):
+        monkeypatch.setattr(Config, 'GEMINI_CONTEXT_CACHE_ENABLED', True)
+        monkeypatch.setattr(Config, 'GEMINI_CONTEXT_CACHE_MIN_CHARS', 100)
+        caches = FakeCaches(fail=True)
+        client = SimpleNamespace(caches=caches)
+        entry = PromptPrefix('x' * 200, 'f', time.monotonic() + 60)
+
+        assert StorePromptCache.remote_cache_name('toko_a', entry, client, 'm1') is None
+        caches.fail = False
+        assert StorePromptCache.remote_cache_name('toko_a', entry, client, 'm1') is None
+        assert caches.created == 0
+
+
+class TestPromptCacheVersion:
+    """Test that a cache hit costs no query and a menu write still rebuilds the prefix"""
+
+    @pytest.fixture
+    def app_config(self, fresh_db):
+        pass
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from app.extensions import db
+        from app.models import Menu, Toko
+        StorePromptCache.clear()
+        TenantCache.clear()
+        db.session.add(Toko(id='toko_v', nama='Toko V', admin_name='Sari'))
+        db.session.add(Menu(toko_id='toko_v', item='Es Teh', harga=5000))
+        db.session.commit()
+        TenantCache.prefetch('toko_v')
+
+    def test_hit_without_query_and_rebuild_after_menu_write(self):
+        from sqlalchemy import event
+        from app.extensions import db
+        from app.models import Menu
+        first = StorePromptCache.get(TenantCache.get_toko('toko_v'))
+        assert 'Es Teh' in first.text
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            assert StorePromptCache.get(TenantCache.get_toko('toko_v')) is first
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        assert statements == []
+
+        old_index = MenuIndex.get('toko_v')
+        db.session.add(Menu(toko_id='toko_v', item='Kopi Susu', harga=8000))
+        db.session.commit()
+        # Written by another process: its prefix and index stay cached, only the token tells
+        StorePromptCache._entries['toko_v'] = first
+        MenuIndex._indexes['toko_v'] = old_index
+        second = StorePromptCache.get(TenantCache.get_toko('toko_v'))
+        assert second.fingerprint != first.fingerprint
+        assert 'Kopi Susu' in second.text
+
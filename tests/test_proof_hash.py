@@ -0,0 +1,156 @@
+"""
+Unit Tests for Payment Proof Perceptual Hashing
+Run with: pytest tests/test_proof_hash.py -v
+"""
+import pytest
+import io
+import json
+
+from app.services import payment_pipeline
+from app.services.proof_hash import ProofHashIndex, bands, hamming, dhash, sha256, to_hex
+
+TOKO_ID = 'phash_test_toko'
+PROOF_BYTES = b"verified proof image"
+
+
+class TestHashing:
+    """Test hash arithmetic and robustness to re-encoding"""
+
+    def test_bands_and_hamming(self):
+        value = 0x0123456789abcdef
+        assert bands(value) == [0x0123, 0x4567, 0x89ab, 0xcdef]
+        assert hamming(value, value ^ 0b1011) == 3
+
+    def test_any_three_bit_change_keeps_a_band(self):
+        value = 0x0123456789abcdef
+        # Worst case: flipped bits in three different bands
+        changed = value ^ (1 << 3) ^ (1 << 20) ^ (1 << 40)
+        assert sum(a == b for a, b in zip(bands(value), bands(changed))) >= 1
+
+    def test_reencoded_screenshot_stays_close(self):
+        Image = pytest.importorskip('PIL.Image')
+        ImageDraw = pytest.importorskip('PIL.ImageDraw')
+        img = Image.new('RGB', (540, 1200), (245, 247, 250))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((0, 0, 540, 200), fill=(0, 90, 170))
+        draw.rectangle((40, 500, 500, 620), fill=(30, 30, 30))
+        original, resent = io.BytesIO(), io.BytesIO()
+        img.save(original, format='PNG')
+        img.resize((360, 800)).save(resent, format='JPEG', quality=60)
+
+
+        a, b = dhash(original.getvalue()), dhash(resent.getvalue())
+        assert hamming(a, b) <= 3
+        assert dhash(b"not an image") is None
+
+    def test_same_template_receipts_are_not_exact_matches(self):
+        """Two receipts of one bank app differ only in text: the coarse hash cannot tell, SHA-256 can"""
+        Image = pytest.importorskip('PIL.Image')
+        ImageDraw = pytest.importorskip('PIL.ImageDraw')
+
+        def receipt(amount):
+            img = Image.new('RGB', (540, 1200), (245, 247, 250))
+            draw = ImageDraw.Draw(img)
+            draw.rectangle((0, 0, 540, 200), fill=(0, 90, 170))
+            draw.text((60, 540), f"Rp {amount}", fill=(30, 30, 30))
+            out = io.BytesIO()
+            img.save(out, format='PNG')
+            return out.getvalue()
+
+        first, second = receipt('50.000'), receipt('75.000')
+        assert hamming(dhash(first), dhash(second)) <= 3  # Same layout: a near match
+        assert sha256(first) != sha256(second)
+
+
+class TestProofReuse:
+    """Test band lookup and the pipeline short-circuit before Gemini"""
+
+    @pytest.fixture
+    def app_config(self, fresh_db, monkeypatch, tmp_path):
+        # Fresh schema: proof columns sit next to the order verification columns
+        from app.config import Config
+        monkeypatch.setattr(Config, 'PAYMENT_MEDIA_DIR', str(tmp_path))
+        self.sent = []
+        # The shared ChatLog writer stays bound to the app that started it
+        monkeypatch.setattr(payment_pipeline.ChatLogWriter, 'log', lambda *args, **kwargs: None)
+        monkeypatch.setattr(payment_pipeline, 'kirim_waha', lambda chat_id, msg, session: self.sent.append((chat_id, msg)))
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from app.extensions import db
+        from app.models import Transaction
+        from sqlalchemy import text
+        db.session.execute(text("INSERT INTO toko (id, nama) VALUES (:id, 'Phash Test')"), {'id': TOKO_ID})
+        db.session.add(Transaction(
+            toko_id=TOKO_ID, customer_hp='6281111', nominal=50000, status='PAID', order_id='PHASH-1',
+            verification_status='VERIFIED', confidence_score=97, detected_amount=50000, detected_bank='BCA'
+        ))
+        db.session.commit()
+        ProofHashIndex.store('PHASH-1', 0x0123456789abcdef, sha256(PROOF_BYTES))
+        db.session.commit()
+
+    def test_find_matches_within_distance(self):
+        near = 0x0123456789abcdef ^ (1 << 3) ^ (1 << 20) ^ (1 << 40)
+        matches = ProofHashIndex.find_matches(TOKO_ID, near)
+        assert [(d, t.order_id) for d, t in matches] == [(3, 'PHASH-1')]
+        assert ProofHashIndex.find_matches(TOKO_ID, near ^ (1 << 60)) == []
+        assert ProofHashIndex.find_matches('other_toko', 0x0123456789abcdef) == []
+
+    def _run_from_vision(self, customer_hp, monkeypatch, proof=PROOF_BYTES, gemini=None):
+        from app.extensions import db
+        from app.models import PaymentVerificationJob
+        self.gemini_calls = 0
+
+        def fake_gemini(*args, **kwargs):
+            if gemini is None:
+                raise AssertionError("Gemini must not be called for a known proof")
+            self.gemini_calls += 1
+            return dict(gemini)
+        monkeypatch.setattr('app.services.gemini.analisa_bukti_transfer', fake_gemini)
+        monkeypatch.setattr('app.services.order_service.find_pending_order', lambda **kwargs: None)
+
+        job = PaymentVerificationJob(
+            toko_id=TOKO_ID, customer_hp=customer_hp, chat_id=f'{customer_hp}@c.us', session_name='session_test',
+            media_url='http://waha/media.jpg', status='PENDING', stage='VISION',
+            proof_hash=to_hex(0x0123456789abcdee), proof_sha256=sha256(proof)
+        )
+        db.session.add(job)
+        db.session.commit()
+        with open(payment_pipeline.media_path(job.id), 'wb') as f:
+            f.write(proof)
+        payment_pipeline.PaymentPipeline.run_inline(job.id)
+        return db.session.get(PaymentVerificationJob, job.id)
+
+    def test_resend_reuses_verdict(self, monkeypatch):
+        job = self._run_from_vision('6281111', monkeypatch)
+        analysis = json.loads(job.analysis_json)
+        assert (job.status, job.result, job.order_id) == ('DONE', 'VERIFIED', 'PHASH-1')
+        assert analysis['match_status'] == 'DUPLICATE_RESEND'
+        assert len(self.sent) == 1 and 'Pembayaran Terverifikasi' in self.sent[0][1]
+
+    def test_reuse_by_other_customer_needs_review(self, monkeypatch):
+        job = self._run_from_vision('6282222', monkeypatch)
+        analysis = json.loads(job.analysis_json)
+        assert (job.status, job.result) == ('DONE', 'MANUAL_REVIEW')
+        assert analysis['match_status'] == 'REUSED_PROOF'
+        assert 'PHASH-1' in analysis['fraud_hints'][0]
+
+    def test_same_template_receipt_is_not_reuse(self, monkeypatch):
+        """Near hash, different bytes and a different amount: Gemini's verdict stands"""
+        other_receipt = {'is_valid': True, 'confidence_score': 97, 'detected_amount': 75000,
+                         'bank_name': 'BCA', 'match_status': 'NO_EXPECTED_AMOUNT', 'fraud_hints': []}
+        job = self._run_from_vision('6282222', monkeypatch, proof=b"another receipt", gemini=other_receipt)
+        analysis = json.loads(job.analysis_json)
+        assert self.gemini_calls == 1
+        assert (job.status, job.result) == ('DONE', 'VERIFIED')
+        assert analysis['match_status'] == 'NO_EXPECTED_AMOUNT'
+
+    def test_recompressed_copy_flagged_after_gemini(self, monkeypatch):
+        """Near hash, different bytes, same amount and bank as the earlier proof: manual review"""
+        same_receipt = {'is_valid': True, 'confidence_score': 97, 'detected_amount': 50000,
+                        'bank_name': 'bca', 'match_status': 'NO_EXPECTED_AMOUNT', 'fraud_hints': []}
+        job = self._run_from_vision('6282222', monkeypatch, proof=b"recompressed copy", gemini=same_receipt)
+        analysis = json.loads(job.analysis_json)
+        assert self.gemini_calls == 1
+        assert (job.status, job.result) == ('DONE', 'MANUAL_REVIEW')
+        assert analysis['match_status'] == 'REUSED_PROOF' and analysis['duplicate_of'] == 'PHASH-1'
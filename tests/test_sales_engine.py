@@ -0,0 +1,203 @@
+"""
+Unit Tests for the Sales Engine run guard and kick signal
+Run with: pytest tests/test_sales_engine.py -v
+"""
+import pytest
+import os
+import threading
+import time
+
+from app.config import Config
+from app.services import sales_engine
+from app.services.metrics import Metrics
+
+
+class TestSalesEngineSignals:
+    """Test that webhooks only signal the engine and overlapping runs are skipped"""
+
+    @pytest.fixture(autouse=True)
+    def kick_file(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(Config, 'SALES_ENGINE_KICK_FILE', str(tmp_path / 'kick'))
+        monkeypatch.setattr(Config, 'SALES_ENGINE_KICK_MIN_INTERVAL', 60)
+        monkeypatch.setattr(sales_engine, '_last_kick', 0.0)
+        sales_engine._kick_event.clear()
+        yield
+        sales_engine._kick_event.clear()
+
+    def test_kick_is_rate_limited(self):
+        before = time.time() - 1
+        kicks = Metrics.get_counter('sales_engine.kicks')
+        for _ in range(5):
+            sales_engine.kick_followups()
+
+        assert Metrics.get_counter('sales_engine.kicks') == kicks + 1
+        assert os.path.exists(Config.SALES_ENGINE_KICK_FILE)
+        assert sales_engine._kicked_since(before)
+
+    def test_kick_visible_to_other_processes(self):
+        before = time.time() - 1
+        sales_engine.kick_followups()
+        sales_engine._kick_event.clear()  # Another worker only sees the file
+        assert sales_engine._kicked_since(before)
+        assert not sales_engine._kicked_since(time.time() + 1)
+
+    def test_overlapping_run_is_skipped(self):
+        skipped = Metrics.get_counter('sales_engine.skipped')
+        with sales_engine._run_lock:
+            sales_engine.check_and_send_followups(app=None)  # Returns before touching the app
+        assert Metrics.get_counter('sales_engine.skipped') == skipped + 1
+
+
+class StopWorker(BaseException):
+    """Ends the worker loop (not caught by its Exception handler)"""
+
+
+class TestWorkerLoop:
+    """Test that a rate-limited kick does not make the worker loop spin"""
+
+    @pytest.fixture(autouse=True)
+    def worker_env(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(Config, 'SALES_ENGINE_KICK_FILE', str(tmp_path / 'kick'))
+        monkeypatch.setattr(Config, 'SALES_ENGINE_KICK_MIN_INTERVAL', 60)
+        monkeypatch.setattr(Config, 'SALES_ENGINE_KICK_POLL_SECONDS', 15)
+        self.runs = []
+        test_thread = threading.current_thread()
+
+        def fake_run(app):
+            # The SalesEngine worker started by create_app runs the same loop; count only this test's runs
+            if threading.current_thread() is test_thread:
+                self.runs.append(time.time())
+
+        monkeypatch.setattr(sales_engine, 'check_and_send_followups', fake_run)
+
+    def test_rate_limited_kick_waits_for_interval(self, monkeypatch, app):
+        timeouts = []
+        event = threading.Event()
+
+        def fake_wait(timeout=None):
+            timeouts.append(timeout)
+            if len(timeouts) == 1:
+                event.set()  # A webhook kicks right after the scheduled run
+                return True
+            raise StopWorker()
+
+        monkeypatch.setattr(event, 'wait', fake_wait)
+        monkeypatch.setattr(sales_engine, '_kick_event', event)
+        with pytest.raises(StopWorker):
+            sales_engine.worker_sales_engine(app)
+
+        assert len(self.runs) == 1
+        assert timeouts[0] == 15
+        assert 50 < timeouts[1] <= 60  # Sleeps until the kick may run instead of spinning
+        assert not event.is_set()
+
+    def test_rate_limited_wait(self):
+        sales_engine._kick_event.set()
+        assert sales_engine._rate_limited_wait(now=100.0, last_run=90.0) == 50.0
+        assert not sales_engine._kick_event.is_set()
+        assert sales_engine._rate_limited_wait(now=200.0, last_run=90.0) == 0.0
+
+
+class TestCandidatePages:
+    """Test keyset pagination over idle customers"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, monkeypatch, app):
+        from datetime import datetime, timedelta
+        from sqlalchemy import text
+        from app.extensions import db
+        monkeypatch.setattr(Config, 'SALES_ENGINE_PAGE_SIZE', 2)
+        old = datetime.now() - timedelta(hours=7)
+        db.session.execute(text("INSERT INTO toko (id, nama) VALUES ('toko_sales_test', 'Test')"))
+        rows = [
+            ('6281', old, 'NONE'), ('6282', old, 'NONE'),  # Same timestamp: ordered by id
+            ('6283', old + timedelta(minutes=1), 'NONE'),
+            ('6284', old, 'SENT'),  # Already followed up
+            ('6285', datetime.now(), 'NONE'),  # Not idle yet
+            ('toko_sales_test', old, 'NONE'),  # Identity Guard
+        ]
+        for hp, last, status in rows:
+            db.session.execute(text(
+                "INSERT INTO customer (toko_id, nomor_hp, last_interaction, followup_status) "
+                "VALUES ('toko_sales_test', :hp, :last, :status)"
+            ), {'hp': hp, 'last': last, 'status': status})
+        db.session.commit()
+        yield
+        db.session.execute(text("DELETE FROM customer WHERE toko_id = 'toko_sales_test'"))
+        db.session.execute(text("DELETE FROM toko WHERE id = 'toko_sales_test'"))
+        db.session.commit()
+
+    def test_pages_cover_all_idle_customers_once(self):
+        from datetime import datetime, timedelta
+        from sqlalchemy import text
+        from app.extensions import db
+        threshold = datetime.now() - timedelta(hours=6)
+        pages = list(sales_engine._candidate_pages(threshold))
+        ids = [row.id for page in pages for row in page if row.toko_id == 'toko_sales_test']
+
+        assert all(len(page) <= 2 for page in pages)
+        phones = {r.id: r.nomor_hp for r in db.session.execute(
+            text("SELECT id, nomor_hp FROM customer WHERE toko_id = 'toko_sales_test'"))}
+        assert [phones[i] for i in ids] == ['6281', '6282', '6283']
+
+
+class TestStrandedClaims:
+    """Test that a SENDING claim left by a dead process is followed up again"""
+
+    @pytest.fixture
+    def app_config(self, fresh_db, monkeypatch):
+        monkeypatch.setattr(Config, 'SALES_ENGINE_CLAIM_TIMEOUT_MINUTES', 15)
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from datetime import datetime, timedelta
+        from app.extensions import db
+        from app.models import Customer, Toko
+        now = datetime.now()
+        old = now - timedelta(hours=7)
+        db.session.add(Toko(id='toko_claim_test', nama='Test'))
+        db.session.add_all([
+            Customer(toko_id='toko_claim_test', nomor_hp='6281', last_interaction=old,
+                     followup_status='SENDING', followup_claimed_at=now - timedelta(minutes=20)),  # Died mid-nudge
+            Customer(toko_id='toko_claim_test', nomor_hp='6282', last_interaction=old,
+                     followup_status='SENDING', followup_claimed_at=now - timedelta(minutes=1)),  # Still sending
+            Customer(toko_id='toko_claim_test', nomor_hp='6283', last_interaction=old,
+                     followup_status='SENDING'),  # Claimed before the lease column existed
+        ])
+        db.session.commit()
+
+    def test_stale_claims_are_requeued(self):
+        from datetime import datetime, timedelta
+        from app.models import Customer
+        assert sales_engine._release_stale_claims() == 2
+
+        status = {c.nomor_hp: c.followup_status for c in Customer.query.filter_by(toko_id='toko_claim_test')}
+        assert status == {'6281': 'NONE', '6282': 'SENDING', '6283': 'NONE'}
+        pages = list(sales_engine._candidate_pages(datetime.now() - timedelta(hours=6)))
+        assert sorted(row.id for page in pages for row in page) == sorted(
+            c.id for c in Customer.query.filter_by(followup_status='NONE'))
+        assert sales_engine._release_stale_claims() == 0
+
+    def test_claim_dies_mid_nudge(self, monkeypatch):
+        from datetime import datetime, timedelta
+        from app.extensions import db
+        from app.models import Customer
+
+        def die(toko, cust):
+            raise StopWorker()  # Worker killed while Gemini/WAHA run (not caught like an error)
+
+        monkeypatch.setattr(sales_engine, 'generate_nudge', die)
+        cust = Customer.query.filter_by(nomor_hp='6281').first()
+        cust.followup_status, cust.followup_claimed_at = 'NONE', None
+        db.session.commit()
+        with pytest.raises(StopWorker):
+            sales_engine._nudge_customer('toko_claim_test', cust)
+        db.session.rollback()
+
+        cust = db.session.get(Customer, cust.id)
+        assert cust.followup_status == 'SENDING' and cust.followup_claimed_at is not None
+        assert sales_engine._release_stale_claims() == 1  # Only the pre-lease row; this claim is fresh
+        cust.followup_claimed_at = datetime.now() - timedelta(minutes=16)
+        db.session.commit()
+        assert sales_engine._release_stale_claims() == 1
+        assert db.session.get(Customer, cust.id).followup_status == 'NONE'
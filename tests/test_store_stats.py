@@ -0,0 +1,118 @@
+"""
+Unit Tests for Daily Store Stats Rollups
+Run with: pytest tests/test_store_stats.py -v
+"""
+import pytest
+from datetime import datetime, timedelta
+
+from app.services.store_stats import StoreStats, STAT_COLUMNS
+
+TOKO_ID = 'stats_test_toko'
+
+
+class TestStoreStats:
+    """Test that write-time increments and the nightly rebuild agree"""
+
+    @pytest.fixture
+    def app_config(self, fresh_db, monkeypatch):
+        from app.config import Config
+        monkeypatch.setattr(Config, 'CHATLOG_RETENTION_DAYS', 0)
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from app.extensions import db
+        from sqlalchemy import text
+        db.session.execute(text("INSERT INTO toko (id, nama) VALUES (:id, 'Stats Test')"), {'id': TOKO_ID})
+        db.session.commit()
+        self.today = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.yesterday = self.today - timedelta(days=1)
+
+    def _activity(self, record: bool):
+        """Two days of chats, customers and paid orders; optionally recorded as they happen"""
+        from app.extensions import db
+        from app.models import ChatLog, Customer, Transaction
+
+        chats = [('USER', self.yesterday), ('AI', self.yesterday), ('SYSTEM', self.yesterday),
+                 ('USER', self.today), ('BOT', self.today)]
+        rows = [{'toko_id': TOKO_ID, 'customer_hp': '6281', 'role': role, 'message': 'x', 'created_at': at}
+                for role, at in chats]
+        db.session.add_all([ChatLog(**row) for row in rows])
+        for hp, at in [('6281', self.yesterday), ('6282', self.today)]:
+            db.session.add(Customer(toko_id=TOKO_ID, nomor_hp=hp, created_at=at))
+        db.session.commit()
+        if record:
+            StoreStats.record_chats(rows)
+            StoreStats.record_new_customer(TOKO_ID, self.yesterday)
+            StoreStats.record_new_customer(TOKO_ID, self.today)
+
+        # 6281 pays twice (first + repeat), 6282 once
+        for i, (hp, nominal, at) in enumerate([('6281', 10000, self.yesterday), ('6281', 25000, self.today),
+                                               ('6282', 40000, self.today)]):
+            order = Transaction(toko_id=TOKO_ID, customer_hp=hp, nominal=nominal, status='PAID',
+                                order_id=f'STATS-{i}', verified_at=at + timedelta(minutes=i))
+            db.session.add(order)
+            db.session.commit()
+            if record:
+                StoreStats.record_paid_order(order)
+
+    def _values(self):
+        daily = StoreStats.series(TOKO_ID, self.yesterday.date(), self.today.date())
+        return {day: {col: getattr(row, col) for col in STAT_COLUMNS} for day, row in daily.items()}
+
+    def test_increments_match_rebuild(self):
+        self._activity(record=True)
+        incremental = self._values()
+
+        assert incremental[self.yesterday.date()] == {
+            'revenue': 10000, 'orders': 1, 'chats_in': 1, 'chats_out': 1,
+            'new_customers': 1, 'first_buyers': 1, 'repeat_buyers': 0
+        }
+        assert incremental[self.today.date()] == {
+            'revenue': 65000, 'orders': 2, 'chats_in': 1, 'chats_out': 1,
+            'new_customers': 1, 'first_buyers': 1, 'repeat_buyers': 1
+        }
+
+        StoreStats.rebuild(self.yesterday.date(), self.today.date())
+        assert self._values() == incremental
+
+    def test_nightly_backfills_until_marked_and_dashboard_reads_it(self):
+        from app.services.analytics_service import get_key_metrics, get_sales_chart_data
+        self._activity(record=False)
+        StoreStats.record_new_customer(TOKO_ID)  # Increments already created today's row
+        assert StoreStats.nightly()['mode'] == 'backfill'
+
+        metrics = get_key_metrics(TOKO_ID)
+        assert (metrics['total_revenue'], metrics['total_orders']) == (10000, 1)  # Closed days only
+        chart = get_sales_chart_data(TOKO_ID, days=7)
+        assert sum(chart['revenue']) == 10000  # Chart days run up to yesterday
+        assert StoreStats.nightly()['mode'] == 'repair'
+
+    def test_nightly_leaves_today_to_increments(self):
+        self._activity(record=True)
+        StoreStats.record_new_customer(TOKO_ID)  # Increment the backfill's own source does not see
+        before = self._values()
+        StoreStats.nightly()
+        StoreStats.nightly()
+        assert self._values() == before
+
+    def test_rebuild_updates_row_inserted_meanwhile(self, monkeypatch):
+        """A first-of-day increment racing the rebuild must not make it fail"""
+        from app.extensions import db
+        from app.services import store_stats
+        self._activity(record=False)
+        day = self.yesterday.date()
+        real_insert = store_stats.insert
+        raced = []
+
+        def insert_after_other_worker(table):
+            if not raced:
+                raced.append(True)
+                with db.engine.begin() as conn:  # Another worker's increment commits first
+                    values = {col: 0 for col in STAT_COLUMNS}
+                    conn.execute(real_insert(table).values(toko_id=TOKO_ID, day=day, **values))
+            return real_insert(table)
+
+        monkeypatch.setattr(store_stats, 'insert', insert_after_other_worker)
+        assert StoreStats.rebuild(day, day) == 1
+        assert raced
+        assert self._values()[day]['revenue'] == 10000
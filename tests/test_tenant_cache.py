@@ -0,0 +1,49 @@
+"""
+Unit Tests for the Tenant Context Cache
+Run with: pytest tests/test_tenant_cache.py -v
+"""
+import pytest
+import uuid
+
+from app.services.tenant_cache import TenantCache
+from app.services.metrics import Metrics
+
+
+class TestTenantCache:
+    """Test read-through caching and write invalidation"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from app.extensions import db
+        from app.models import SystemConfig
+        TenantCache.clear()
+        self.toko_id = 'test_' + uuid.uuid4().hex[:10]
+        yield
+        db.session.rollback()
+        SystemConfig.query.filter(SystemConfig.key.like(f'%{self.toko_id}')).delete(synchronize_session=False)
+        db.session.commit()
+        TenantCache.clear()
+
+    def test_config_read_through_and_invalidation(self):
+        from app.extensions import db
+        from app.models import SystemConfig
+        key = f'gemini_model_{self.toko_id}'
+        assert TenantCache.get_config(key, self.toko_id) is None  # Miss is cached too
+
+        db.session.add(SystemConfig(key=key, value='gemini-a'))
+        db.session.commit()
+        assert TenantCache.get_config(key, self.toko_id) == 'gemini-a'  # Insert invalidated the miss
+
+        SystemConfig.query.get(key).value = 'gemini-b'
+        db.session.commit()
+        hits = Metrics.get_counter('tenant_cache.hit.config')
+        assert TenantCache.get_config(key, self.toko_id) == 'gemini-b'
+        assert TenantCache.get_config(key, self.toko_id) == 'gemini-b'
+        assert Metrics.get_counter('tenant_cache.hit.config') == hits + 1
+
+    def test_prefetch_warms_tenant_keys(self):
+        TenantCache.prefetch(self.toko_id)
+        misses = Metrics.get_counter('tenant_cache.miss.config')
+        TenantCache.get_config('panic_mode', self.toko_id)
+        TenantCache.get_config(f'gemini_api_key_{self.toko_id}', self.toko_id)
+        assert Metrics.get_counter('tenant_cache.miss.config') == misses
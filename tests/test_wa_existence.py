@@ -0,0 +1,43 @@
+"""
+Unit Tests for the WhatsApp Existence Cache
+Run with: pytest tests/test_wa_existence.py -v
+"""
+import pytest
+import uuid
+from datetime import datetime, timedelta
+
+from app.services.wa_existence import WaExistenceCache
+
+
+class TestWaExistenceCache:
+    """Test cached check-exists results and TTL"""
+
+    @pytest.fixture(autouse=True)
+    def app_context(self, app):
+        from app.extensions import db
+        from app.models import WaExistence
+        self.phones = ['628' + str(uuid.uuid4().int)[:9] for _ in range(3)]
+        yield
+        db.session.rollback()
+        WaExistence.query.filter(WaExistence.phone.in_(self.phones)).delete(synchronize_session=False)
+        db.session.commit()
+
+    def test_store_and_get(self):
+        on_wa, not_on_wa, failed = self.phones
+        WaExistenceCache.store({on_wa: True, not_on_wa: False, failed: None})
+
+        assert WaExistenceCache.get(on_wa) is True
+        assert WaExistenceCache.get(not_on_wa) is False
+        assert WaExistenceCache.get(failed) is None  # API errors are not cached
+        assert WaExistenceCache.get_uncached(self.phones + [on_wa]) == [failed]
+
+    def test_expired_entry_is_unknown(self):
+        from app.extensions import db
+        from app.models import WaExistence
+        phone = self.phones[0]
+        WaExistenceCache.store({phone: True})
+        WaExistence.query.get(phone).checked_at = datetime.utcnow() - timedelta(days=365)
+        db.session.commit()
+
+        assert WaExistenceCache.get(phone) is None
+        assert WaExistenceCache.get_many([phone]) == {}
@@ -0,0 +1,116 @@
+"""
+Unit Tests for the WAHA Clients (pooled sync session and async client)
+Run with: pytest tests/test_waha_client.py -v
+"""
+import pytest
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+
+from app.config import Config
+from app.services import waha, waha_async
+from app.services.circuit_breaker import get_breaker
+from app.services.waha_async import AsyncWahaClient
+
+
+@pytest.fixture(autouse=True)
+def closed_breaker():
+    """Failures recorded here must not open the shared WAHA_API breaker for other tests"""
+    get_breaker("WAHA_API").reset()
+    yield
+    get_breaker("WAHA_API").reset()
+
+
+class TestSyncPool:
+    """Test the shared keep-alive session of waha.py"""
+
+    def test_session_shared_and_recreated_after_fork(self, monkeypatch):
+        monkeypatch.setattr(Config, 'WAHA_POOL_SIZE', 7)
+        monkeypatch.setattr(waha, '_http_session', None)
+        session = waha.get_http()
+        assert waha.get_http() is session
+        assert session.get_adapter('http://waha:3000')._pool_maxsize == 7
+
+        monkeypatch.setattr(waha, '_http_pid', -1)  # As seen by a forked gunicorn worker
+        assert waha.get_http() is not session
+
+    def test_timeout_per_endpoint(self, monkeypatch):
+        monkeypatch.setattr(Config, 'WAHA_CONNECT_TIMEOUT', 3.0)
+        assert waha.get_timeout('seen') == (3.0, Config.WAHA_TIMEOUTS['seen'])
+        assert waha.get_timeout('unknown') == (3.0, 30)
+
+    def test_send_text_uses_pooled_session(self, monkeypatch):
+        calls = []
+
+        def post(url, json=None, headers=None, timeout=None):
+            calls.append((url, json, timeout))
+            return SimpleNamespace(status_code=201, text='')
+        monkeypatch.setattr(waha, 'get_http', lambda: SimpleNamespace(post=post))
+
+        assert waha.kirim_waha_raw('08123456789', 'halo', 'session_a') is not None
+        url, payload, timeout = calls[0]
+        assert url.endswith('/api/sendText')
+        assert payload == {'session': 'session_a', 'chatId': '628123456789@c.us', 'text': 'halo'}
+        assert timeout == waha.get_timeout('send')
+
+
+class TestAsyncClient:
+    """Test AsyncWahaClient against a mock transport"""
+
+    @pytest.fixture(autouse=True)
+    def no_backoff(self, monkeypatch):
+        self.sleeps = []
+
+        async def fake_sleep(seconds):
+            self.sleeps.append(seconds)
+        monkeypatch.setattr(waha_async, 'asyncio', SimpleNamespace(
+            sleep=fake_sleep, Semaphore=asyncio.Semaphore, gather=asyncio.gather))
+
+    def _run(self, handler, coro_fn):
+        async def main():
+            client = AsyncWahaClient(base_url='http://waha.test', pool_size=2)
+            await client.aclose()
+            client._client = httpx.AsyncClient(base_url='http://waha.test', transport=httpx.MockTransport(handler))
+            try:
+                return await coro_fn(client)
+            finally:
+                await client.aclose()
+        return asyncio.run(main())
+
+    def test_send_text_retries_then_succeeds(self):
+        requests_seen = []
+
+        def handler(request):
+            requests_seen.append(json.loads(request.content))
+            return httpx.Response(500 if len(requests_seen) < 3 else 201, text='busy')
+
+        assert self._run(handler, lambda c: c.send_text('628111', 'promo', 'session_a')) is True
+        assert len(requests_seen) == 3
+        assert requests_seen[0] == {'session': 'session_a', 'chatId': '628111@c.us', 'text': 'promo'}
+        assert self.sleeps == [1, 2]
+
+    def test_send_text_gives_up(self):
+        def handler(request):
+            return httpx.Response(400, text='invalid chat')
+
+        assert self._run(handler, lambda c: c.send_text('628111', 'promo', retries=2)) is False
+        assert self.sleeps == [1]
+
+    def test_check_exists_many(self):
+        def handler(request):
+            phone = json.loads(request.content)['phone']
+            if phone == '628333':
+                return httpx.Response(503)
+            return httpx.Response(200, json={'numberExists': phone == '628111'})
+
+        result = self._run(handler, lambda c: c.check_exists_many(['628111', '628222', '628333'], concurrency=2))
+        assert result == {'628111': True, '628222': False, '628333': None}
+
+    def test_send_seen(self):
+        def handler(request):
+            assert request.url.path == '/api/session_a/chats/628111@c.us/messages/read'
+            return httpx.Response(200)
+
+        assert self._run(handler, lambda c: c.send_seen('628111', 'session_a')) is True